@@ -1,10 +1,38 @@
-from flask import Flask, jsonify, request
+from flask import Flask, g, has_request_context, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
 import sqlite3
 import os
-from datetime import datetime
+import atexit
+import base64
+import csv
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 import hashlib
+import io
+import mimetypes
+import queue
+import re
+import secrets
+import sys
+import unicodedata
+import zlib
 from functools import wraps
+from types import MappingProxyType
+from urllib.parse import quote, urlencode
+from werkzeug.exceptions import RequestEntityTooLarge
+
+try:
+    import brotli
+except ImportError:  # sem o pacote Brotli as respostas vão só em gzip
+    brotli = None
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock, vale só a troca atômica de nome
+    fcntl = None
 
 app = Flask(__name__)
 
@@ -13,7 +41,8 @@ CORS(app, supports_credentials=True, resources={
     r"/*": {
         "origins": [
             "https://decidiu-online-front-end.onrender.com"
-        ]
+        ],
+        "expose_headers": ["X-Proximo-Cursor", "Link", "X-Total-Aproximado", "X-Cache", "ETag"]
     }
 })
 
@@ -25,6 +54,69 @@ def set_json_content_type(response):
             response.headers['Content-Type'] = 'application/json'
     return response
 
+# Compressão: respostas JSON/CSV/texto acima de LIMITE_COMPRESSAO bytes vão em
+# brotli ou gzip, conforme o Accept-Encoding. As listas em streaming são
+# comprimidas aos poucos, sem juntar o corpo.
+LIMITE_COMPRESSAO = 1024
+TIPOS_COMPRIMIVEIS = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain'}
+NIVEL_GZIP = 6
+QUALIDADE_BROTLI = 5
+
+def codificacoes_aceitas():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def novo_compressor(codificacao):
+    """(comprimir, finalizar) para a codificação."""
+    if codificacao == 'br':
+        compressor = brotli.Compressor(quality=QUALIDADE_BROTLI)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+def comprimir_em_partes(partes, codificacao):
+    comprimir, finalizar = novo_compressor(codificacao)
+    try:
+        for parte in partes:
+            dados = comprimir(parte.encode() if isinstance(parte, str) else parte)
+            if dados:
+                yield dados
+        yield finalizar()
+    finally:
+        if hasattr(partes, 'close'):
+            partes.close()
+
+@app.after_request
+def preparar_resposta(response):
+    """ETag do corpo nas respostas GET que não têm um, e compressão."""
+    if not request.path.startswith('/api/') or request.method != 'GET' or response.direct_passthrough:
+        return response
+
+    if response.status_code == 200 and not response.is_streamed and 'ETag' not in response.headers:
+        response.add_etag(weak=True)
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        response.make_conditional(request)
+
+    if response.mimetype not in TIPOS_COMPRIMIVEIS:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    codificacao = request.accept_encodings.best_match(codificacoes_aceitas())
+    if codificacao is None:
+        return response
+
+    if response.is_streamed:
+        response.response = comprimir_em_partes(response.response, codificacao)
+        response.headers.pop('Content-Length', None)
+    else:
+        dados = response.get_data()
+        if len(dados) < LIMITE_COMPRESSAO:
+            return response
+        comprimir, finalizar = novo_compressor(codificacao)
+        response.set_data(comprimir(dados) + finalizar())
+    response.headers['Content-Encoding'] = codificacao
+    return response
+
 # Handler para 404 - SEMPRE retorna JSON
 @app.errorhandler(404)
 def not_found(error):
@@ -36,6 +128,13 @@ def not_found(error):
         }), 404
     return error
 
+# Handler para 413 - arquivo acima de LIMITE_ARQUIVO
+@app.errorhandler(413)
+def request_too_large(error):
+    if request.path.startswith('/api/'):
+        return jsonify({'error': error.description}), 413
+    return error
+
 # Handler para 500 - SEMPRE retorna JSON
 @app.errorhandler(500)
 def internal_error(error):
@@ -48,11 +147,504 @@ def internal_error(error):
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'database.db')
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# PRAGMAs aplicados uma única vez, quando a conexão é criada
+DB_PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -65536),       # 64 MB de cache de páginas
+    ('mmap_size', 268435456),     # 256 MB mapeados em memória
+    ('temp_store', 'MEMORY'),
+]
+DB_TIMEOUT = 30
+
+# Callback opcional registrado em cada conexão nova (set_trace_callback);
+# usado por test_planos_consulta.py para capturar o SQL emitido pelas rotas
+DB_TRACE = None
+
+class ConexaoReutilizavel(sqlite3.Connection):
+    """Conexão SQLite que volta para o pool em close() em vez de ser fechada.
+
+    As rotas continuam chamando conn.close() ao final; a conexão só é fechada
+    de fato por fechar() (ou quando a thread/worker termina)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.em_uso = 0
+
+    def close(self):
+        if self.em_uso > 0:
+            self.em_uso -= 1
+        if self.em_uso == 0 and self.in_transaction:
+            # Descarta alterações não confirmadas antes de devolver ao pool
+            self.rollback()
+
+    def fechar(self):
+        super().close()
+
+_pool_local = threading.local()
+
+# Serializa as transações de escrita das threads deste processo: esperar nesta
+# trava custa menos que o busy handler do SQLite, que dorme em intervalos
+# crescentes enquanto outra conexão segura o lock de escrita
+trava_escrita = threading.RLock()
+
+def _criar_conexao():
+    conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT, factory=ConexaoReutilizavel)
     conn.row_factory = sqlite3.Row
+    for pragma, valor in DB_PRAGMAS:
+        conn.execute(f'PRAGMA {pragma} = {valor}')
+    if DB_TRACE is not None:
+        conn.set_trace_callback(DB_TRACE)
+    return conn
+
+def get_db():
+    # Uma conexão por thread e por processo: após o fork do gunicorn cada
+    # worker abre a sua, e as requisições seguintes da mesma thread a reutilizam.
+    conn = getattr(_pool_local, 'conn', None)
+    if conn is None or _pool_local.pid != os.getpid() or _pool_local.db_path != DB_PATH:
+        conn = _criar_conexao()
+        _pool_local.conn = conn
+        _pool_local.pid = os.getpid()
+        _pool_local.db_path = DB_PATH
+    conn.em_uso += 1
     return conn
 
+def fechar_conexoes():
+    conn = getattr(_pool_local, 'conn', None)
+    if conn is not None:
+        _pool_local.conn = None
+        conn.fechar()
+
+@app.teardown_request
+def liberar_conexao(exc):
+    # Garante que uma rota que falhou antes de conn.close() não deixe
+    # transação aberta (e o lock de escrita) na conexão reutilizada
+    conn = getattr(_pool_local, 'conn', None)
+    if conn is not None and _pool_local.pid == os.getpid():
+        conn.em_uso = 0
+        if conn.in_transaction:
+            conn.rollback()
+    # Depois do rollback: só conta a referência que a rota chegou a confirmar
+    descartar_blobs_novos()
+
+# Geração de escrita por tabela: triggers somam 1 em geracoes_escrita a cada
+# INSERT/UPDATE/DELETE (ver migracao_geracoes_escrita). Como fica no banco, a
+# geração é a mesma para todos os workers. Só as tabelas declaradas em
+# @versionada(...) ou @em_cache(...) têm esses triggers (TABELAS_GERACAO,
+# preenchido pelos próprios decoradores).
+TABELAS_GERACAO = set()
+
+def ler_geracoes(cursor, tabelas):
+    marcadores = ', '.join('?' for _ in tabelas)
+    cursor.execute(f'SELECT tabela, geracao FROM geracoes_escrita WHERE tabela IN ({marcadores})', tabelas)
+    geracoes = {row['tabela']: row['geracao'] for row in cursor.fetchall()}
+    return tuple(geracoes.get(tabela, 0) for tabela in tabelas)
+
+# GET condicional: o ETag (fraco) das rotas que declaram as tabelas que leem
+# é montado com as gerações de escrita delas, mais a rota, os parâmetros, o
+# usuário e a data do dia (há totais que dependem dela). Uma requisição com
+# If-None-Match igual responde 304 sem executar a rota nem gerar o corpo. As
+# demais respostas recebem um ETag do próprio corpo em preparar_resposta().
+CACHE_CONTROL = 'private, no-cache'  # o navegador guarda, mas sempre revalida
+
+def etag_geracoes(tabelas, geracoes):
+    partes = [
+        DB_PATH, request.endpoint, sorted(request.view_args.items()),
+        sorted(request.args.items(multi=True)),
+        request.headers.get('Authorization', ''), request.headers.get('X-User-Id', ''),
+        datetime.now().date().isoformat(), list(zip(tabelas, geracoes)),
+    ]
+    return hashlib.sha256(json.dumps(partes, default=str).encode()).hexdigest()[:32]
+
+def nao_modificada(etag):
+    """Resposta 304 se o cliente já tem a versão `etag`, senão None."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    resposta = app.response_class(status=304)
+    resposta.set_etag(etag, weak=True)
+    resposta.headers['Cache-Control'] = CACHE_CONTROL
+    return resposta
+
+def marcar_versao(resposta, etag):
+    if resposta.status_code == 200:
+        resposta.set_etag(etag, weak=True)
+        resposta.headers['Cache-Control'] = CACHE_CONTROL
+    return resposta
+
+def versionada(*tabelas):
+    """ETag da rota (só no GET) pelas gerações de escrita das tabelas lidas."""
+    TABELAS_GERACAO.update(tabelas)
+    def decorador(f):
+        @wraps(f)
+        def rota(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            conn = get_db()
+            etag = etag_geracoes(tabelas, ler_geracoes(conn.cursor(), tabelas))
+            conn.close()
+            return nao_modificada(etag) or marcar_versao(app.make_response(f(*args, **kwargs)), etag)
+        return rota
+    return decorador
+
+class CacheResultados:
+    """Cache LRU de respostas em memória, por processo.
+
+    Cada item guarda as gerações de escrita das tabelas lidas pela rota; se
+    alguma mudou desde então, o item é descartado. O TTL limita o tempo de
+    vida mesmo sem escritas (ex.: idades calculadas com a data atual)."""
+
+    def __init__(self, tamanho_maximo, ttl):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.itens = OrderedDict()
+        self.lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.invalidados = 0
+        self.expirados = 0
+        self.removidos = 0
+
+    def obter(self, chave, geracoes):
+        with self.lock:
+            item = self.itens.get(chave)
+            if item is None:
+                self.faltas += 1
+                return None
+            geracoes_item, criado_em, valor = item
+            if geracoes_item != geracoes:
+                self.invalidados += 1
+            elif time.monotonic() - criado_em > self.ttl:
+                self.expirados += 1
+            else:
+                self.itens.move_to_end(chave)
+                self.acertos += 1
+                return valor
+            del self.itens[chave]
+            self.faltas += 1
+            return None
+
+    def guardar(self, chave, geracoes, valor):
+        with self.lock:
+            self.itens[chave] = (geracoes, time.monotonic(), valor)
+            self.itens.move_to_end(chave)
+            while len(self.itens) > self.tamanho_maximo:
+                self.itens.popitem(last=False)
+                self.removidos += 1
+
+    def remover(self, chave):
+        with self.lock:
+            if self.itens.pop(chave, None) is not None:
+                self.invalidados += 1
+
+    def descartar(self, condicao):
+        """Remove os itens cujo valor satisfaz condicao(valor)."""
+        with self.lock:
+            for chave in [chave for chave, (_, _, valor) in self.itens.items() if condicao(valor)]:
+                del self.itens[chave]
+                self.invalidados += 1
+
+    def limpar(self):
+        with self.lock:
+            self.itens.clear()
+
+    def estatisticas(self):
+        with self.lock:
+            consultas = self.acertos + self.faltas
+            return {
+                'acertos': self.acertos,
+                'faltas': self.faltas,
+                'taxa_acerto': round(self.acertos / consultas, 4) if consultas else 0,
+                'invalidados': self.invalidados,
+                'expirados': self.expirados,
+                'removidos': self.removidos,
+                'itens': len(self.itens),
+                'tamanho_maximo': self.tamanho_maximo,
+                'ttl': self.ttl,
+            }
+
+CACHE_TTL = 60             # segundos
+CACHE_TAMANHO_MAXIMO = 256  # respostas guardadas por processo
+cache_respostas = CacheResultados(CACHE_TAMANHO_MAXIMO, CACHE_TTL)
+
+def em_cache(*tabelas):
+    """Guarda a resposta 200 da rota até uma das tabelas lidas ser alterada.
+
+    A chave é o banco, a rota e os parâmetros da URL. As gerações são lidas
+    antes de executar a rota: uma escrita concorrente deixa o item já velho e
+    a próxima requisição recalcula."""
+    TABELAS_GERACAO.update(tabelas)
+    def decorador(f):
+        @wraps(f)
+        def rota(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            chave = (DB_PATH, request.endpoint, tuple(sorted(kwargs.items())),
+                     tuple(sorted(request.args.items(multi=True))))
+            conn = get_db()
+            geracoes = ler_geracoes(conn.cursor(), tabelas)
+            conn.close()
+
+            etag = etag_geracoes(tabelas, geracoes)
+            resposta = nao_modificada(etag)
+            if resposta is not None:
+                return resposta
+
+            guardado = cache_respostas.obter(chave, geracoes)
+            if guardado is not None:
+                corpo, mimetype = guardado
+                resposta = app.response_class(corpo, status=200, mimetype=mimetype)
+                resposta.headers['X-Cache'] = 'HIT'
+                return marcar_versao(resposta, etag)
+
+            resposta = app.make_response(f(*args, **kwargs))
+            if resposta.status_code == 200:
+                cache_respostas.guardar(chave, geracoes, (resposta.get_data(), resposta.mimetype))
+            resposta.headers['X-Cache'] = 'MISS'
+            return marcar_versao(resposta, etag)
+        return rota
+    return decorador
+
+# Listas em streaming: o corpo da resposta é gerado item a item e as linhas saem
+# do banco em lotes de fetchmany(), então linhas, dicts e o JSON da lista
+# inteira nunca ficam em memória ao mesmo tempo - a memória de uma listagem não
+# cresce com a tabela. Com ?formato=ndjson vai um objeto JSON por linha.
+LOTE_STREAMING = 500
+
+def consulta_em_lotes(sql, parametros=(), transformar=dict):
+    """Itens da consulta, lidos em lotes de LOTE_STREAMING numa conexão do pool.
+
+    A consulta só roda quando a resposta começa a ser enviada, e a conexão
+    volta ao pool depois do último lote (ou se o cliente desconectar)."""
+    conn = get_db()
+    try:
+        cursor = conn.execute(sql, parametros)
+        while True:
+            linhas = cursor.fetchmany(LOTE_STREAMING)
+            if not linhas:
+                return
+            for linha in linhas:
+                yield transformar(linha)
+    finally:
+        conn.close()
+
+def resposta_lista(itens):
+    """Resposta em streaming com os itens (qualquer iterável): array JSON, ou
+    NDJSON com ?formato=ndjson."""
+    formato = request.args.get('formato', 'json')
+    if formato not in ('json', 'ndjson'):
+        return jsonify({'error': 'formato deve ser json ou ndjson'}), 400
+
+    def codificar(item):
+        return app.json.dumps(item, separators=(',', ':'))
+
+    def gerar_json():
+        separador = '['
+        for item in itens:
+            yield separador + codificar(item)
+            separador = ','
+        yield '[]\n' if separador == '[' else ']\n'
+
+    def gerar_ndjson():
+        for item in itens:
+            yield codificar(item) + '\n'
+
+    if formato == 'ndjson':
+        return app.response_class(stream_with_context(gerar_ndjson()), mimetype='application/x-ndjson')
+    return app.response_class(stream_with_context(gerar_json()), mimetype='application/json')
+
+# Paginação por cursor (keyset): o cliente recebe um cursor opaco - a chave de
+# ordenação e o id da última linha, em JSON/base64 - e a página seguinte começa
+# logo depois dela, sem OFFSET. O corpo continua sendo a lista de itens; o
+# cursor da próxima página vai no cabeçalho X-Proximo-Cursor e em Link.
+LIMITE_PAGINA_PADRAO = 100
+LIMITE_PAGINA_MAXIMO = 1000
+
+def codificar_cursor(valores):
+    texto = json.dumps(list(valores), separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+def decodificar_cursor(cursor, tamanho):
+    """Valores do cursor; levanta ValueError se ele não for válido."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+    if not isinstance(valores, list) or len(valores) != tamanho:
+        raise ValueError('Cursor inválido')
+    return valores
+
+def limite_pagina():
+    """?limite= da requisição, entre 1 e LIMITE_PAGINA_MAXIMO; ValueError se inválido."""
+    try:
+        limite = int(request.args.get('limite', LIMITE_PAGINA_PADRAO))
+    except ValueError:
+        raise ValueError('limite deve ser um número inteiro')
+    return max(1, min(limite, LIMITE_PAGINA_MAXIMO))
+
+def resposta_paginada(itens, proximo_cursor, total=None):
+    resposta = resposta_lista(itens)
+    if isinstance(resposta, tuple):
+        return resposta
+    if proximo_cursor:
+        parametros = [(chave, valor) for chave, valor in request.args.items(multi=True) if chave != 'cursor']
+        parametros.append(('cursor', proximo_cursor))
+        resposta.headers['X-Proximo-Cursor'] = proximo_cursor
+        resposta.headers['Link'] = f'<{request.base_url}?{urlencode(parametros)}>; rel="next"'
+    if total is not None:
+        resposta.headers['X-Total-Aproximado'] = f'{LIMITE_CONTAGEM}+' if total > LIMITE_CONTAGEM else str(total)
+    return resposta
+
+# Projeção de colunas (?fields=campo1,campo2): as rotas de listagem e de
+# detalhe montam um SELECT explícito só com as colunas pedidas, validadas
+# contra as colunas da tabela. Sem ?fields= vão todas as colunas públicas.
+# Hashes de senha nunca saem na resposta, e o conteúdo dos arquivos
+# (<prefixo>_content, em base64) só vem quando pedido.
+COLUNAS_OCULTAS = {'senha_hash', 'temporary_password_hash'}
+
+_colunas_publicas = {}
+
+def colunas_publicas(cursor, tabela):
+    """Colunas da tabela que podem sair na resposta, na ordem do esquema."""
+    chave = (DB_PATH, tabela)
+    if chave not in _colunas_publicas:
+        # table_xinfo inclui as colunas geradas (hidden 2 e 3); hidden 1 são as
+        # colunas internas de tabelas virtuais
+        cursor.execute(f'PRAGMA table_xinfo({tabela})')
+        _colunas_publicas[chave] = tuple(
+            coluna[1] for coluna in cursor.fetchall() if coluna[1] not in COLUNAS_OCULTAS and coluna[6] != 1
+        )
+    return _colunas_publicas[chave]
+
+def campos_pedidos(cursor, tabela, calculados=()):
+    """Campos de ?fields=, ou None se a requisição não pediu projeção.
+
+    Aceita as colunas públicas da tabela e os campos calculados pela rota;
+    levanta ValueError com os nomes desconhecidos."""
+    campos = [campo.strip() for campo in request.args.get('fields', '').split(',') if campo.strip()]
+    if not campos:
+        return None
+    validos = set(colunas_publicas(cursor, tabela)) | set(calculados)
+    desconhecidos = [campo for campo in campos if campo not in validos]
+    if desconhecidos:
+        raise ValueError(f"Campo(s) desconhecido(s) em fields: {', '.join(desconhecidos)}")
+    return list(dict.fromkeys(campos))
+
+def colunas_select(cursor, tabela, campos=None, alias=None, sempre=('id',)):
+    """Lista do SELECT: as colunas pedidas (todas as públicas se `campos` for
+    None) mais as de `sempre`, que a rota precisa para montar a resposta."""
+    prefixo = f'{alias}.' if alias else ''
+    return ', '.join(
+        prefixo + coluna for coluna in colunas_publicas(cursor, tabela)
+        if campos is None or coluna in campos or coluna in sempre
+    )
+
+def projetar(item, campos):
+    """Só os campos pedidos do item (ele inteiro se `campos` for None)."""
+    if campos is None:
+        return item
+    return {campo: item[campo] for campo in campos if campo in item}
+
+def ler_registro(cursor, tabela, id, campos=None, sempre=('id',)):
+    """A linha `id` da tabela como dict, só com as colunas pedidas; None se não existir."""
+    cursor.execute(f'SELECT {colunas_select(cursor, tabela, campos, sempre=sempre)} FROM {tabela} WHERE id = ?', (id,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+def pede_campo(campos, campo):
+    """Se o campo calculado `campo` deve ser montado. Arquivos (`*_content`) só
+    quando pedidos explicitamente em ?fields=."""
+    if campos is None:
+        return not campo.endswith('_content')
+    return campo in campos
+
+# Listagens paginadas: `origem` é o FROM (com JOINs), `chave` a coluna de
+# ordenação. A página segue a ordem (chave, id) e começa depois do cursor, sem
+# OFFSET. A chave precisa de índice (um índice de uma coluna já termina no
+# rowid, então atende (chave, id)) e não pode ser NULL.
+LIMITE_CONTAGEM = 10000  # o total aproximado conta no máximo isto de linhas
+
+def _montar_where(condicoes):
+    return f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+
+def ler_pagina(cursor, colunas, origem, chave, condicoes=(), parametros=(), crescente=False,
+               limite=None, deslocamento=0, transformar=dict):
+    """Uma página da listagem, pelo ?cursor= e ?limite= da requisição.
+
+    Retorna (itens, proximo_cursor), com `itens` lido em lotes por
+    consulta_em_lotes() só quando a resposta é enviada. O cabeçalho sai antes
+    do corpo, então o cursor vem antes, de uma consulta só das chaves; a página
+    vai até a linha do cursor, inclusive, e uma inserção entre as duas consultas
+    não abre buraco nem repete linha. Levanta ValueError se o cursor ou o
+    limite forem inválidos. `deslocamento` só vale para a primeira página,
+    sem cursor."""
+    if limite is None:
+        limite = limite_pagina()
+    identificador = f"{chave.rsplit('.', 1)[0]}.id" if '.' in chave else 'id'
+    condicoes = list(condicoes)
+    parametros = list(parametros)
+    if request.args.get('cursor'):
+        condicoes.append(f"({chave}, {identificador}) {'>' if crescente else '<'} (?, ?)")
+        parametros.extend(decodificar_cursor(request.args['cursor'], 2))
+        deslocamento = 0
+
+    direcao = 'ASC' if crescente else 'DESC'
+    ordem = f'ORDER BY {chave} {direcao}, {identificador} {direcao}'
+    # A última linha da página e a seguinte, que indica se existe próxima página
+    cursor.execute(f'''
+        SELECT {chave} AS chave, {identificador} AS id
+        FROM {origem}
+        {_montar_where(condicoes)}
+        {ordem}
+        LIMIT 2 OFFSET ?
+    ''', parametros + [deslocamento + limite - 1])
+    ultimas = cursor.fetchall()
+    proximo_cursor = None
+    if len(ultimas) == 2:
+        ultima = [ultimas[0]['chave'], ultimas[0]['id']]
+        proximo_cursor = codificar_cursor(ultima)
+        condicoes.append(f"({chave}, {identificador}) {'<=' if crescente else '>='} (?, ?)")
+        parametros.extend(ultima)
+
+    itens = consulta_em_lotes(f'''
+        SELECT {colunas}
+        FROM {origem}
+        {_montar_where(condicoes)}
+        {ordem}
+        LIMIT -1 OFFSET ?
+    ''', parametros + [deslocamento], transformar)
+    return itens, proximo_cursor
+
+def contar_ate_limite(cursor, origem, chave, condicoes=(), parametros=()):
+    """Total de linhas da listagem, contando no máximo LIMITE_CONTAGEM + 1."""
+    cursor.execute(f'''
+        SELECT COUNT(*) AS total FROM (
+            SELECT 1 FROM {origem} {_montar_where(condicoes)} ORDER BY {chave} LIMIT ?
+        )
+    ''', list(parametros) + [LIMITE_CONTAGEM + 1])
+    return cursor.fetchone()['total']
+
+def lista_paginada(cursor, tabela, chave, condicoes=(), parametros=(), alias=None, juncoes='',
+                   calculados=None):
+    """Resposta de uma rota de listagem: a página (ver ler_pagina), mais recentes
+    primeiro, só com os campos de ?fields= e com ?total=1 o cabeçalho
+    X-Total-Aproximado. `calculados` mapeia campos extras, vindos de
+    `juncoes`, para a expressão SQL de cada um."""
+    calculados = calculados or {}
+    origem = f'{tabela} {alias} {juncoes}'.strip() if alias else tabela
+    try:
+        campos = campos_pedidos(cursor, tabela, calculados)
+        # id e a chave sempre vêm: o cursor da próxima página é feito deles
+        colunas = [colunas_select(cursor, tabela, campos, alias, ('id', chave.rsplit('.', 1)[-1]))]
+        colunas += [f'{expressao} AS {nome}' for nome, expressao in calculados.items() if pede_campo(campos, nome)]
+        itens, proximo_cursor = ler_pagina(cursor, ', '.join(colunas), origem, chave, condicoes, parametros,
+                                           transformar=lambda row: projetar(dict(row), campos))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    total = None
+    if request.args.get('total') in ('1', 'true'):
+        total = contar_ate_limite(cursor, origem, chave, condicoes, parametros)
+    return resposta_paginada(itens, proximo_cursor, total)
+
 def get_usuario_by_id(usuario_id):
     conn = get_db()
     cursor = conn.cursor()
@@ -61,18 +653,412 @@ def get_usuario_by_id(usuario_id):
     conn.close()
     return dict(usuario) if usuario else None
 
-def verificar_permissao_gestao(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        usuario_id = request.headers.get('X-User-Id') or request.args.get('usuario_id') or (request.json.get('usuario_id') if request.json else None)
+# Sessões: login() emite um token opaco e o banco guarda só o SHA-256 dele.
+# A resolução token -> usuário passa por um cache LRU com TTL, descartado por
+# invalidar_autenticacao() quando o usuário é alterado; em outros workers a
+# mudança vale no máximo AUTH_CACHE_TTL segundos depois.
+SESSAO_DURACAO = timedelta(hours=12)
+AUTH_CACHE_TTL = 30               # segundos
+AUTH_CACHE_TAMANHO_MAXIMO = 1024  # sessões/usuários guardados por processo
+cache_autenticacao = CacheResultados(AUTH_CACHE_TAMANHO_MAXIMO, AUTH_CACHE_TTL)
 
-        if not usuario_id:
-            return jsonify({'error': 'Não autenticado'}), 401
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
 
+def criar_sessao(cursor, usuario_id):
+    """Grava uma sessão nova (sem commit) e retorna (token, expira_em)."""
+    agora = datetime.now()
+    token = secrets.token_urlsafe(32)
+    expira_em = (agora + SESSAO_DURACAO).isoformat()
+    cursor.execute('DELETE FROM sessoes WHERE expira_em <= ?', (agora.isoformat(),))
+    cursor.execute(
+        'INSERT INTO sessoes (token_hash, usuario_id, expira_em) VALUES (?, ?, ?)',
+        (hash_token(token), usuario_id, expira_em)
+    )
+    return token, expira_em
+
+def token_da_requisicao():
+    autorizacao = request.headers.get('Authorization', '')
+    if autorizacao.startswith('Bearer '):
+        return autorizacao[len('Bearer '):].strip() or None
+    return None
+
+def revogar_sessoes(cursor, usuario_id, exceto=None):
+    """Apaga as sessões do usuário (sem commit), menos a do token `exceto`."""
+    if exceto:
+        cursor.execute('DELETE FROM sessoes WHERE usuario_id = ? AND token_hash != ?',
+                       (usuario_id, hash_token(exceto)))
+    else:
+        cursor.execute('DELETE FROM sessoes WHERE usuario_id = ?', (usuario_id,))
+
+def invalidar_autenticacao(usuario_id):
+    """Descarta do cache de autenticação tudo que aponta para o usuário."""
+    cache_autenticacao.descartar(lambda guardado: guardado[0]['id'] == int(usuario_id))
+
+# Identificação antiga, só pelo id do usuário (X-User-Id, ?usuario_id ou
+# usuario_id no corpo JSON). Quem souber um id age como aquele usuário, então
+# fica desligada; DECIDIU_AUTH_ID_LEGADO=1 religa durante a migração de um
+# cliente que ainda não manda o token.
+AUTH_ID_LEGADO = os.environ.get('DECIDIU_AUTH_ID_LEGADO') == '1'
+
+def autenticar_requisicao():
+    """Resolve o usuário da requisição; retorna (usuario, erro).
+
+    Usa o token de sessão (Authorization: Bearer) e, só com AUTH_ID_LEGADO, o
+    id enviado por clientes antigos. Usuário que não está ativo não passa por
+    nenhum dos dois. Com o cache quente, não há acesso ao banco."""
+    token = token_da_requisicao()
+    if token:
+        chave = ('sessao', hash_token(token))
+        guardado = cache_autenticacao.obter(chave, None)
+        if guardado is None:
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT u.*, s.expira_em AS sessao_expira_em
+                FROM sessoes s
+                JOIN usuarios u ON u.id = s.usuario_id
+                WHERE s.token_hash = ? AND u.status = 'ativo'
+            ''', (chave[1],))
+            row = cursor.fetchone()
+            conn.close()
+            if not row:
+                return None, 'Sessão inválida ou expirada'
+            usuario = dict(row)
+            guardado = (usuario, usuario.pop('sessao_expira_em'))
+            cache_autenticacao.guardar(chave, None, guardado)
+        usuario, expira_em = guardado
+        if expira_em <= datetime.now().isoformat():
+            return None, 'Sessão inválida ou expirada'
+        return dict(usuario), None
+
+    if not AUTH_ID_LEGADO:
+        return None, 'Não autenticado'
+
+    usuario_id = request.headers.get('X-User-Id') or request.args.get('usuario_id') or (request.json.get('usuario_id') if request.is_json and request.json else None)
+
+    if not usuario_id:
+        return None, 'Não autenticado'
+
+    chave = ('usuario', str(usuario_id))
+    guardado = cache_autenticacao.obter(chave, None)
+    if guardado is None:
         usuario = get_usuario_by_id(usuario_id)
-
         if not usuario:
-            return jsonify({'error': 'Usuário não encontrado'}), 401
+            return None, 'Usuário não encontrado'
+        guardado = (usuario, None)
+        cache_autenticacao.guardar(chave, None, guardado)
+    if guardado[0].get('status') != 'ativo':
+        return None, 'Usuário inativo'
+    return dict(guardado[0]), None
+
+# Auditoria gravada fora da requisição: registrar_auditoria() só enfileira a
+# entrada, e uma thread própria grava em logs_auditoria em grupos - um
+# executemany numa transação a cada AUDITORIA_INTERVALO segundos ou
+# AUDITORIA_LOTE_MAXIMO entradas. Se o banco continuar travado depois de
+# AUDITORIA_TIMEOUT, o grupo vai para um arquivo JSONL ao lado do banco e é
+# reimportado após a próxima gravação bem-sucedida. Chame registrar_auditoria()
+# depois do commit da alteração auditada. created_at é fixado na chamada, no
+# mesmo formato de CURRENT_TIMESTAMP (UTC).
+AUDITORIA_INTERVALO = 0.2      # segundos
+AUDITORIA_LOTE_MAXIMO = 500    # entradas por transação
+AUDITORIA_TIMEOUT = 5          # segundos esperando o lock de escrita
+
+SQL_AUDITORIA = '''
+    INSERT INTO logs_auditoria (usuario_id, acao, tabela_afetada, registro_id, descricao, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+_fila_auditoria = queue.Queue()
+_gravador_auditoria = None
+_gravador_auditoria_lock = threading.Lock()
+_FIM_AUDITORIA = object()
+
+def registrar_auditoria(usuario_id, acao, descricao=None, tabela_afetada=None, registro_id=None):
+    _iniciar_gravador_auditoria()
+    _fila_auditoria.put((DB_PATH, (
+        usuario_id, acao, tabela_afetada, registro_id, descricao,
+        datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+    )))
+
+def descarregar_auditoria():
+    """Espera a gravação de tudo o que já foi enfileirado."""
+    _fila_auditoria.join()
+
+def encerrar_auditoria(timeout=10):
+    """Grava o que está na fila e encerra a thread (chamado na saída do processo)."""
+    if _gravador_auditoria is not None and _gravador_auditoria.is_alive():
+        _fila_auditoria.put(_FIM_AUDITORIA)
+        _gravador_auditoria.join(timeout)
+
+atexit.register(encerrar_auditoria)
+
+def arquivo_auditoria_pendente(caminho):
+    return os.path.join(os.path.dirname(os.path.abspath(caminho)), 'auditoria-pendente.jsonl')
+
+def _iniciar_gravador_auditoria():
+    global _gravador_auditoria
+    with _gravador_auditoria_lock:
+        if _gravador_auditoria is None or not _gravador_auditoria.is_alive():
+            _gravador_auditoria = threading.Thread(target=_gravar_auditoria, name='auditoria', daemon=True)
+            _gravador_auditoria.start()
+
+def _gravar_auditoria():
+    conexoes = {}
+    ativo = True
+    while ativo:
+        retirados = [_fila_auditoria.get()]
+        limite = time.monotonic() + AUDITORIA_INTERVALO
+        while retirados[-1] is not _FIM_AUDITORIA and len(retirados) < AUDITORIA_LOTE_MAXIMO:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                retirados.append(_fila_auditoria.get(timeout=restante))
+            except queue.Empty:
+                break
+        ativo = retirados[-1] is not _FIM_AUDITORIA
+
+        pendentes = [item for item in retirados if item is not _FIM_AUDITORIA]
+        try:
+            for caminho in dict.fromkeys(caminho for caminho, _ in pendentes):
+                try:
+                    _gravar_lote_auditoria(conexoes, caminho, [entrada for destino, entrada in pendentes if destino == caminho])
+                except Exception as e:
+                    # Um erro inesperado não pode encerrar a thread: as entradas
+                    # seguintes continuam sendo gravadas
+                    print(f"Auditoria: erro ao gravar {len(pendentes)} entrada(s) em {caminho}: {e}")
+        finally:
+            for _ in retirados:
+                _fila_auditoria.task_done()
+
+    for conn in conexoes.values():
+        conn.close()
+
+def _gravar_lote_auditoria(conexoes, caminho, entradas):
+    try:
+        if caminho not in conexoes:
+            conexoes[caminho] = sqlite3.connect(caminho, timeout=AUDITORIA_TIMEOUT, check_same_thread=False)
+        conn = conexoes[caminho]
+        with trava_escrita:
+            conn.executemany(SQL_AUDITORIA, entradas)
+            conn.commit()
+    except sqlite3.Error as e:
+        if caminho in conexoes and conexoes[caminho].in_transaction:
+            conexoes[caminho].rollback()
+        arquivo = arquivo_auditoria_pendente(caminho)
+        with trava_auditoria_pendente(caminho):
+            with open(arquivo, 'a', encoding='utf-8') as destino:
+                for entrada in entradas:
+                    destino.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+                destino.flush()
+                os.fsync(destino.fileno())
+        print(f"Auditoria: banco indisponível ({e}); {len(entradas)} entrada(s) guardada(s) em {arquivo}")
+        return
+    _reimportar_auditoria_pendente(conn, caminho)
+
+@contextmanager
+def trava_auditoria_pendente(caminho):
+    """Lock entre processos (flock) do arquivo de auditoria pendente.
+
+    Com vários workers, só um por vez acrescenta entradas ao arquivo ou o
+    reimporta; sem isso dois workers podiam importar o mesmo arquivo."""
+    if fcntl is None:
+        yield
+        return
+    with open(arquivo_auditoria_pendente(caminho) + '.lock', 'a') as trava:
+        fcntl.flock(trava.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(trava.fileno(), fcntl.LOCK_UN)
+
+def _reimportar_auditoria_pendente(conn, caminho):
+    """Grava no banco as entradas desviadas para o arquivo, se houver."""
+    arquivo = arquivo_auditoria_pendente(caminho)
+    importando = arquivo + '.importando'
+    with trava_auditoria_pendente(caminho):
+        try:
+            if not os.path.exists(importando):
+                # Renomear antes de ler: o que for desviado depois vai para um
+                # arquivo novo
+                os.replace(arquivo, importando)
+            with open(importando, encoding='utf-8') as origem:
+                entradas = [tuple(json.loads(linha)) for linha in origem if linha.strip()]
+        except FileNotFoundError:
+            # Nada pendente, ou outro worker já importou
+            return
+        try:
+            with trava_escrita:
+                conn.executemany(SQL_AUDITORIA, entradas)
+                conn.commit()
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"Auditoria: reimportação de {importando} adiada ({e})")
+            return
+        os.remove(importando)
+    print(f"Auditoria: {len(entradas)} entrada(s) reimportada(s) de {arquivo}")
+
+# Arquivamento da auditoria: os meses inteiros mais antigos que
+# AUDITORIA_RETENCAO_DIAS saem de logs_auditoria e vão para um arquivo SQLite
+# por mês (logs-auditoria-AAAA-MM.db em ARQUIVO_AUDITORIA_DIR). Cada arquivo é
+# compactado com VACUUM e fica somente leitura. Um mês arquivado não muda mais
+# e só precisa entrar no backup uma vez. consultar_auditoria() anexa (ATTACH)
+# os arquivos só quando o período pedido chega a esses meses. Para rodar:
+# "python app.py arquivar-auditoria [dias]", por exemplo pelo cron uma vez por mês.
+ARQUIVO_AUDITORIA_DIR = None   # padrão: pasta "arquivo-auditoria" ao lado do banco
+AUDITORIA_RETENCAO_DIAS = 180
+
+ESQUEMA_ARQUIVO_AUDITORIA = [
+    '''
+    CREATE TABLE {banco}.logs_auditoria (
+        id INTEGER PRIMARY KEY,
+        usuario_id INTEGER,
+        acao TEXT NOT NULL,
+        tabela_afetada TEXT,
+        registro_id TEXT,
+        dados_anteriores TEXT,
+        dados_novos TEXT,
+        ip_address TEXT,
+        descricao TEXT,
+        created_at TIMESTAMP
+    )
+    ''',
+    # Os mesmos índices da consulta paginada no banco principal
+    'CREATE INDEX {banco}.idx_logs_criacao ON logs_auditoria (created_at, id)',
+    'CREATE INDEX {banco}.idx_logs_usuario_criacao ON logs_auditoria (usuario_id, created_at, id)',
+    'CREATE INDEX {banco}.idx_logs_acao_criacao ON logs_auditoria (acao, created_at, id)',
+    'CREATE INDEX {banco}.idx_logs_tabela_criacao ON logs_auditoria (tabela_afetada, created_at, id)',
+]
+COLUNAS_ARQUIVO_AUDITORIA = (
+    'id, usuario_id, acao, tabela_afetada, registro_id, dados_anteriores, '
+    'dados_novos, ip_address, descricao, created_at'
+)
+
+def diretorio_arquivo_auditoria():
+    return ARQUIVO_AUDITORIA_DIR or os.path.join(os.path.dirname(DB_PATH), 'arquivo-auditoria')
+
+def arquivo_auditoria_mes(mes):
+    return os.path.join(diretorio_arquivo_auditoria(), f'logs-auditoria-{mes}.db')
+
+def meses_arquivados():
+    """Meses (AAAA-MM) com arquivo de auditoria, do mais recente ao mais antigo."""
+    try:
+        nomes = os.listdir(diretorio_arquivo_auditoria())
+    except FileNotFoundError:
+        return []
+    meses = []
+    for nome in nomes:
+        encontrado = re.fullmatch(r'logs-auditoria-(\d{4}-\d{2})\.db', nome)
+        if encontrado:
+            meses.append(encontrado.group(1))
+    return sorted(meses, reverse=True)
+
+def proximo_mes(mes):
+    ano, numero = map(int, mes.split('-'))
+    return f'{ano + numero // 12:04d}-{numero % 12 + 1:02d}'
+
+def anexar_arquivo_auditoria(cursor, mes, nome):
+    # URI com mode=ro: o arquivo mensal é aberto só para leitura
+    caminho = f'file:{quote(os.path.abspath(arquivo_auditoria_mes(mes)))}?mode=ro'
+    cursor.execute(f'ATTACH DATABASE ? AS {nome}', (caminho,))
+
+def arquivar_auditoria(dias=None):
+    """Arquiva os meses completos mais antigos que `dias`.
+
+    Devolve [(mês, entradas removidas do banco principal)]."""
+    if dias is None:
+        dias = AUDITORIA_RETENCAO_DIAS
+    # Só meses inteiros: o mês do corte e os seguintes ficam no banco principal
+    corte = (datetime.now(timezone.utc) - timedelta(days=dias)).strftime('%Y-%m')
+    os.makedirs(diretorio_arquivo_auditoria(), exist_ok=True)
+
+    conn = get_db()
+    cursor = conn.cursor()
+    arquivados = []
+    try:
+        while True:
+            cursor.execute('SELECT substr(MIN(created_at), 1, 7) AS mes FROM logs_auditoria')
+            mes = cursor.fetchone()['mes']
+            if mes is None or mes >= corte:
+                break
+            removidas = _arquivar_mes_auditoria(conn, mes)
+            if removidas == 0:
+                raise RuntimeError(f'nenhuma entrada de {mes} saiu do banco principal')
+            arquivados.append((mes, removidas))
+    finally:
+        conn.close()
+    return arquivados
+
+def _arquivar_mes_auditoria(conn, mes):
+    inicio, fim = f'{mes}-01', f'{proximo_mes(mes)}-01'
+    destino = arquivo_auditoria_mes(mes)
+    temporario = destino + '.tmp'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+    cursor = conn.cursor()
+
+    # 1. Monta o arquivo num caminho temporário. Se o mês já tem arquivo (uma
+    #    execução interrompida, ou entradas antigas reimportadas de
+    #    auditoria-pendente.jsonl depois do arquivamento), junta as duas partes.
+    cursor.execute('ATTACH DATABASE ? AS arquivo_novo', (temporario,))
+    try:
+        for comando in ESQUEMA_ARQUIVO_AUDITORIA:
+            cursor.execute(comando.format(banco='arquivo_novo'))
+        if os.path.exists(destino):
+            anexar_arquivo_auditoria(cursor, mes, 'arquivo_anterior')
+            cursor.execute(f'''
+                INSERT INTO arquivo_novo.logs_auditoria ({COLUNAS_ARQUIVO_AUDITORIA})
+                SELECT {COLUNAS_ARQUIVO_AUDITORIA} FROM arquivo_anterior.logs_auditoria
+            ''')
+            conn.commit()
+            cursor.execute('DETACH DATABASE arquivo_anterior')
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO arquivo_novo.logs_auditoria ({COLUNAS_ARQUIVO_AUDITORIA})
+            SELECT {COLUNAS_ARQUIVO_AUDITORIA} FROM main.logs_auditoria
+            WHERE created_at >= ? AND created_at < ?
+        ''', (inicio, fim))
+        conn.commit()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        cursor.execute('DETACH DATABASE arquivo_novo')
+
+    # 2. Compacta, protege contra escrita e troca pelo arquivo definitivo
+    arquivo = sqlite3.connect(temporario)
+    arquivo.execute('VACUUM')
+    arquivo.close()
+    os.chmod(temporario, 0o444)
+    os.replace(temporario, destino)
+
+    # 3. Só então remove do banco principal o que está no arquivo. As páginas
+    #    liberadas são reaproveitadas pelas próximas entradas, então o banco
+    #    para de crescer sem precisar de VACUUM.
+    anexar_arquivo_auditoria(cursor, mes, 'arquivo_mes')
+    try:
+        with trava_escrita:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                DELETE FROM main.logs_auditoria
+                WHERE created_at >= ? AND created_at < ?
+                AND id IN (SELECT id FROM arquivo_mes.logs_auditoria)
+            ''', (inicio, fim))
+            removidas = cursor.rowcount
+            conn.commit()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        cursor.execute('DETACH DATABASE arquivo_mes')
+    return removidas
+
+def verificar_permissao_gestao(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        usuario, erro = autenticar_requisicao()
+
+        if erro:
+            return jsonify({'error': erro}), 401
 
         cargo = usuario.get('cargo', '')
 
@@ -89,15 +1075,10 @@ def verificar_permissao_gestao(f):
 def verificar_permissao_admin(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        usuario_id = request.headers.get('X-User-Id') or request.args.get('usuario_id') or (request.json.get('usuario_id') if request.json else None)
-
-        if not usuario_id:
-            return jsonify({'error': 'Não autenticado'}), 401
-
-        usuario = get_usuario_by_id(usuario_id)
+        usuario, erro = autenticar_requisicao()
 
-        if not usuario:
-            return jsonify({'error': 'Usuário não encontrado'}), 401
+        if erro:
+            return jsonify({'error': erro}), 401
 
         if usuario.get('cargo') != 'Administrador':
             return jsonify({'error': 'Acesso negado. Apenas administradores podem realizar esta ação.'}), 403
@@ -181,10 +1162,319 @@ def decode_base64_safe(data):
         print(f"Erro ao decodificar base64: {e}")
         return None
 
-def init_db():
+def sem_acentos(texto):
+    """Texto sem acentos e em minúsculas, para comparações ("Conceição" -> "conceicao")."""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+# Arquivos enviados (fichas, diplomas e certificados) ficam fora do banco, em
+# disco, endereçados pelo SHA-256 do conteúdo: envios idênticos são gravados
+# uma única vez. As linhas guardam só <prefixo>_ref, _tamanho e _mime.
+BLOB_DIR = None  # padrão: pasta "blobs" ao lado do banco
+
+# Tamanho máximo de um arquivo enviado e tamanho dos blocos de leitura/escrita
+LIMITE_ARQUIVO = 20 * 1024 * 1024
+TAMANHO_BLOCO = 64 * 1024
+
+# Arquivo referenciado há menos tempo que isso não é apagado, para não remover
+# um conteúdo que outra requisição acabou de reaproveitar e ainda não gravou.
+# Os que ficam sem referência são apagados depois por
+# "python app.py limpar-arquivos" (ver limpar_blobs_orfaos).
+BLOB_CARENCIA = 300
+
+# (tabela, prefixo das colunas, coluna com o nome do arquivo)
+ARQUIVOS_EXTERNOS = [
+    ('fichas_atendimento_pdf', 'pdf', 'nome_arquivo'),
+    ('enfermeiras_instrutoras', 'diploma', 'diploma_filename'),
+    ('enfermeiras_instrutoras_ambulatorial', 'diploma', 'diploma_filename'),
+    ('enfermeiras_alunas', 'certificado', 'certificado_filename'),
+]
+
+def diretorio_blobs():
+    return BLOB_DIR or os.path.join(os.path.dirname(DB_PATH), 'blobs')
+
+def caminho_blob(ref):
+    return os.path.join(diretorio_blobs(), ref[:2], ref[2:])
+
+def detectar_mime(conteudo, nome_arquivo=None):
+    if conteudo[:5] == b'%PDF-':
+        return 'application/pdf'
+    tipo, _ = mimetypes.guess_type(nome_arquivo or '')
+    return tipo or 'application/octet-stream'
+
+def salvar_blob_stream(stream, nome_arquivo=None, limite=None):
+    """Copia o stream para o armazenamento em blocos, calculando o SHA-256 no
+    caminho. Retorna (ref, tamanho, mime); ref é None se o stream veio vazio."""
+    limite = limite or LIMITE_ARQUIVO
+    os.makedirs(diretorio_blobs(), exist_ok=True)
+    temporario = os.path.join(diretorio_blobs(), f'envio.{os.getpid()}.{threading.get_ident()}.tmp')
+    sha = hashlib.sha256()
+    tamanho = 0
+    inicio = b''
+    try:
+        with open(temporario, 'wb') as f:
+            while True:
+                bloco = stream.read(TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                tamanho += len(bloco)
+                if tamanho > limite:
+                    raise RequestEntityTooLarge(f'Arquivo maior que o limite de {limite // (1024 * 1024)} MB')
+                if len(inicio) < 8:
+                    inicio += bloco[:8]
+                sha.update(bloco)
+                f.write(bloco)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if not tamanho:
+            return None, None, None
+
+        ref = sha.hexdigest()
+        caminho = caminho_blob(ref)
+        if os.path.exists(caminho):
+            marcar_blob_reaproveitado(caminho)
+        else:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            os.replace(temporario, caminho)
+            if has_request_context():
+                g.setdefault('blobs_novos', []).append((ref, os.path.getmtime(caminho)))
+        return ref, tamanho, detectar_mime(inicio, nome_arquivo)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+def marcar_blob_reaproveitado(caminho):
+    """Renova o mtime do arquivo, avançando-o pelo menos 1 s: a requisição que
+    o gravou (ver descartar_blobs_novos) percebe o reaproveitamento mesmo em
+    sistemas de arquivos que guardam o mtime em segundos."""
+    mtime = max(time.time(), os.path.getmtime(caminho) + 1)
+    os.utime(caminho, (mtime, mtime))
+
+def salvar_blob(conteudo, nome_arquivo=None):
+    """Grava o conteúdo no armazenamento e retorna (ref, tamanho, mime)."""
+    return salvar_blob_stream(io.BytesIO(conteudo), nome_arquivo, limite=len(conteudo) or None)
+
+def ler_blob(ref):
+    if not ref:
+        return None
+    with open(caminho_blob(ref), 'rb') as f:
+        return f.read()
+
+def guardar_arquivo(conteudo_base64, nome_arquivo):
+    """Grava o arquivo recebido em base64; retorna (ref, tamanho, mime)."""
+    conteudo = decode_base64_safe(conteudo_base64)
+    if not conteudo:
+        return None, None, None
+    return salvar_blob_stream(io.BytesIO(conteudo), nome_arquivo)
+
+def dados_envio():
+    """Campos enviados junto com um arquivo.
+
+    Rotas que recebem arquivo aceitam três formatos: JSON com o arquivo em
+    base64 (o formato antigo); multipart/form-data com o arquivo numa parte
+    própria; ou application/octet-stream com o arquivo no corpo e os demais
+    campos na query string. Nos dois últimos o arquivo não passa inteiro pela
+    memória.
+    """
+    if request.mimetype == 'multipart/form-data':
+        return request.form.to_dict()
+    if request.mimetype == 'application/octet-stream':
+        return request.args.to_dict()
+    return request.json
+
+def guardar_arquivo_enviado(data, campo, campo_nome, nome_padrao):
+    """Grava o arquivo da requisição; retorna (nome, ref, tamanho, mime)."""
+    nome_arquivo = data.get(campo_nome)
+
+    if request.mimetype == 'multipart/form-data':
+        arquivo = request.files.get(campo)
+        if not arquivo:
+            return None, None, None, None
+        nome_arquivo = nome_arquivo or arquivo.filename
+        ref, tamanho, mime = salvar_blob_stream(arquivo.stream, nome_arquivo)
+    elif request.mimetype == 'application/octet-stream':
+        if request.content_length and request.content_length > LIMITE_ARQUIVO:
+            raise RequestEntityTooLarge(f'Arquivo maior que o limite de {LIMITE_ARQUIVO // (1024 * 1024)} MB')
+        ref, tamanho, mime = salvar_blob_stream(request.stream, nome_arquivo)
+    elif data.get(campo):
+        ref, tamanho, mime = guardar_arquivo(data.get(campo), nome_arquivo)
+    else:
+        return None, None, None, None
+
+    if not ref:
+        return None, None, None, None
+    return nome_arquivo or nome_padrao, ref, tamanho, mime
+
+def conteudo_base64(ref):
+    try:
+        return encode_base64_safe(ler_blob(ref))
+    except FileNotFoundError:
+        print(f"Arquivo {ref} não encontrado em {diretorio_blobs()}")
+        return None
+
+def ref_arquivo(cursor, tabela, prefixo, id):
+    cursor.execute(f'SELECT {prefixo}_ref FROM {tabela} WHERE id = ?', (id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def blob_referenciado(cursor, ref):
+    for tabela, prefixo, _ in ARQUIVOS_EXTERNOS:
+        cursor.execute(f'SELECT 1 FROM {tabela} WHERE {prefixo}_ref = ? LIMIT 1', (ref,))
+        if cursor.fetchone():
+            return True
+    return False
+
+def remover_blobs_orfaos(cursor, refs):
+    """Apaga do disco os arquivos que nenhuma linha referencia mais."""
+    for ref in set(r for r in refs if r):
+        em_uso = blob_referenciado(cursor, ref)
+        caminho = caminho_blob(ref)
+        try:
+            if not em_uso and os.path.getmtime(caminho) < datetime.now().timestamp() - BLOB_CARENCIA:
+                os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+def descartar_blobs_novos():
+    """Apaga os arquivos gravados pela requisição que nenhuma linha passou a
+    referenciar (o INSERT/UPDATE falhou ou não foi confirmado).
+
+    Um arquivo que outra requisição reaproveitou nesse meio-tempo teve o mtime
+    avançado em pelo menos 1 s (ver marcar_blob_reaproveitado) e fica."""
+    if not has_request_context():
+        return
+    novos = g.pop('blobs_novos', None)
+    if not novos:
+        return
     conn = get_db()
     cursor = conn.cursor()
+    try:
+        for ref, mtime in novos:
+            if blob_referenciado(cursor, ref):
+                continue
+            caminho = caminho_blob(ref)
+            try:
+                if abs(os.path.getmtime(caminho) - mtime) < 0.5:
+                    os.remove(caminho)
+            except FileNotFoundError:
+                pass
+    finally:
+        conn.close()
 
+def limpar_blobs_orfaos(carencia=None):
+    """Apaga de diretorio_blobs() os arquivos que nenhuma linha referencia e
+    os temporários de envios interrompidos, com mais de `carencia` segundos
+    (padrão BLOB_CARENCIA). Retorna quantos arquivos foram apagados.
+
+    Cobre o que remover_blobs_orfaos() deixa para trás: arquivos de linhas
+    apagadas ou trocadas ainda dentro da carência."""
+    if carencia is None:
+        carencia = BLOB_CARENCIA
+    diretorio = diretorio_blobs()
+    limite = time.time() - carencia
+    conn = get_db()
+    cursor = conn.cursor()
+    apagados = 0
+    try:
+        for raiz, _, nomes in os.walk(diretorio):
+            for nome in nomes:
+                caminho = os.path.join(raiz, nome)
+                if raiz == diretorio:
+                    # envio.<pid>.<thread>.tmp de um processo que caiu no meio
+                    if not nome.endswith('.tmp'):
+                        continue
+                else:
+                    ref = os.path.basename(raiz) + nome
+                    if not re.fullmatch(r'[0-9a-f]{64}', ref) or blob_referenciado(cursor, ref):
+                        continue
+                try:
+                    # mtime lido por último: um reaproveitamento agora o renova
+                    if os.path.getmtime(caminho) < limite:
+                        os.remove(caminho)
+                        apagados += 1
+                except FileNotFoundError:
+                    pass
+    finally:
+        conn.close()
+    return apagados
+
+# Colunas acrescentadas às tabelas depois da sua criação original. Bancos
+# antigos (anteriores ao controle de versão) recebem as que faltarem na
+# migração inicial.
+COLUNAS_ADICIONADAS = {
+    'consultas_capacitacao': [('observacoes', 'TEXT')],
+    'pacientes_capacitacao': [
+        ('quantidade_componentes_familia', 'TEXT'),
+        ('qual_comorbidade_especifique', 'TEXT'),
+    ],
+    'enfermeiras_instrutoras': [
+        ('coren', 'TEXT'), ('senha_hash', 'TEXT'), ('unidade_saude', 'TEXT'),
+        ('diploma_filename', 'TEXT'), ('diploma_content', 'BLOB'),
+        ('cep', 'TEXT'), ('logradouro', 'TEXT'), ('municipio', 'TEXT'),
+        ('bairro', 'TEXT'), ('numero', 'TEXT'), ('complemento', 'TEXT'),
+    ],
+    'enfermeiras_alunas': [
+        ('coren', 'TEXT'), ('certificado_filename', 'TEXT'), ('certificado_content', 'BLOB'),
+        ('cep', 'TEXT'), ('logradouro', 'TEXT'), ('bairro', 'TEXT'),
+        ('numero', 'TEXT'), ('complemento', 'TEXT'),
+    ],
+    'dados_ginecologicos': [('enfermeira_responsavel_id', 'INTEGER')],
+    'dados_ginecologicos_capacitacao': [('enfermeira_aluna_id', 'INTEGER')],
+    'pacientes_ambulatorial': [
+        ('municipio_nascimento', 'TEXT'), ('etnia', 'TEXT'), ('qual_comorbidade', 'TEXT'),
+        ('qual_comorbidade_especifique', 'TEXT'), ('recebe_cartao_cria', 'TEXT'),
+        ('tipo_familia', 'TEXT'), ('tipo_familia_outro', 'TEXT'),
+        ('data_nascimento_responsavel', 'TEXT'),
+    ],
+    'dados_ginecologicos_obstetricos': [
+        ('enfermeira_responsavel_id', 'INTEGER'), ('realizou_usg', 'TEXT'),
+    ],
+    'consultas_ambulatorial': [
+        ('observacoes', 'TEXT'), ('houve_retirada', 'TEXT'),
+        ('metodo_retirado', 'TEXT'), ('motivo_retirada', 'TEXT'),
+    ],
+    'enfermeiras_instrutoras_ambulatorial': [
+        ('unidade_saude', 'TEXT'), ('diploma_filename', 'TEXT'), ('diploma_content', 'BLOB'),
+        ('senha_hash', 'TEXT'), ('cep', 'TEXT'), ('logradouro', 'TEXT'), ('municipio', 'TEXT'),
+        ('bairro', 'TEXT'), ('numero', 'TEXT'), ('complemento', 'TEXT'),
+    ],
+    'fichas_atendimento_pdf': [
+        ('metodo_inserido', 'TEXT'), ('nome_paciente', 'TEXT'), ('cpf_paciente', 'TEXT'),
+        ('data_nascimento_paciente', 'TEXT'), ('municipio_paciente', 'TEXT'),
+    ],
+    'usuarios': [
+        ('email', 'TEXT'), ('cpf', 'TEXT'), ('cargo', 'TEXT'), ('nome_completo', 'TEXT'),
+        ('telefone', 'TEXT'), ('status', "TEXT DEFAULT 'ativo'"),
+        ('primeiro_acesso', 'INTEGER DEFAULT 1'), ('criado_por', 'INTEGER'),
+        ('updated_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
+        ('data_nascimento', 'TEXT'),
+        ('password_last_changed_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
+        ('password_expires_at', 'TIMESTAMP'),
+        ('must_change_password', 'INTEGER DEFAULT 1'),
+        ('temporary_password_hash', 'TEXT'),
+        ('temporary_password_expires_at', 'TIMESTAMP'),
+        ('temporary_password_used', 'INTEGER DEFAULT 0'),
+    ],
+}
+
+def colunas_tabela(cursor, tabela):
+    cursor.execute(f'PRAGMA table_xinfo({tabela})')
+    return {coluna[1] for coluna in cursor.fetchall()}
+
+def adicionar_colunas(cursor, tabela, colunas):
+    existentes = colunas_tabela(cursor, tabela)
+    for coluna, tipo in colunas:
+        if coluna in existentes:
+            continue
+        try:
+            cursor.execute(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}')
+            print(f"Coluna '{coluna}' adicionada à tabela {tabela}")
+        except sqlite3.OperationalError as e:
+            # Ex.: DEFAULT CURRENT_TIMESTAMP não é aceito em tabela com registros
+            print(f"Aviso ao adicionar coluna '{coluna}' em {tabela}: {e}")
+
+def migracao_esquema_inicial(cursor):
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS pacientes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -356,52 +1646,6 @@ def init_db():
         )
     ''')
 
-    try:
-        cursor.execute("SELECT observacoes FROM consultas_capacitacao LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE consultas_capacitacao ADD COLUMN observacoes TEXT")
-        print("Coluna 'observacoes' adicionada à tabela consultas_capacitacao")
-
-    # Adicionar coluna quantidade_componentes_familia se não existir
-    try:
-        cursor.execute("SELECT quantidade_componentes_familia FROM pacientes_capacitacao LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE pacientes_capacitacao ADD COLUMN quantidade_componentes_familia TEXT")
-        print("Coluna 'quantidade_componentes_familia' adicionada à tabela pacientes_capacitacao")
-
-    # Adicionar coluna coren na tabela enfermeiras_instrutoras se não existir
-    try:
-        cursor.execute("SELECT coren FROM enfermeiras_instrutoras LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_instrutoras ADD COLUMN coren TEXT")
-        print("Coluna 'coren' adicionada à tabela enfermeiras_instrutoras")
-
-    # Adicionar coluna coren na tabela enfermeiras_alunas se não existir
-    try:
-        cursor.execute("SELECT coren FROM enfermeiras_alunas LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_alunas ADD COLUMN coren TEXT")
-        print("Coluna 'coren' adicionada à tabela enfermeiras_alunas")
-
-    try:
-        cursor.execute("SELECT certificado_filename FROM enfermeiras_alunas LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_alunas ADD COLUMN certificado_filename TEXT")
-        print("Coluna 'certificado_filename' adicionada à tabela enfermeiras_alunas")
-
-    try:
-        cursor.execute("SELECT certificado_content FROM enfermeiras_alunas LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_alunas ADD COLUMN certificado_content BLOB")
-        print("Coluna 'certificado_content' adicionada à tabela enfermeiras_alunas")
-
-    # Adicionar coluna qual_comorbidade_especifique na tabela pacientes_capacitacao se não existir
-    try:
-        cursor.execute("SELECT qual_comorbidade_especifique FROM pacientes_capacitacao LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE pacientes_capacitacao ADD COLUMN qual_comorbidade_especifique TEXT")
-        print("Coluna 'qual_comorbidade_especifique' adicionada à tabela pacientes_capacitacao")
-
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS insercoes_diu (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -456,46 +1700,6 @@ def init_db():
         )
     ''')
 
-    try:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN municipio_nascimento TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN etnia TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN qual_comorbidade TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN qual_comorbidade_especifique TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN recebe_cartao_cria TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN tipo_familia TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN tipo_familia_outro TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN data_nascimento_responsavel TEXT")
-    except sqlite3.OperationalError:
-        pass
-
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS dados_ginecologicos_obstetricos (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -533,30 +1737,6 @@ def init_db():
         )
     ''')
 
-    try:
-        cursor.execute("SELECT observacoes FROM consultas_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE consultas_ambulatorial ADD COLUMN observacoes TEXT")
-        print("Coluna 'observacoes' adicionada à tabela consultas_ambulatorial")
-
-    try:
-        cursor.execute("SELECT houve_retirada FROM consultas_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE consultas_ambulatorial ADD COLUMN houve_retirada TEXT")
-        print("Coluna 'houve_retirada' adicionada à tabela consultas_ambulatorial")
-
-    try:
-        cursor.execute("SELECT metodo_retirado FROM consultas_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE consultas_ambulatorial ADD COLUMN metodo_retirado TEXT")
-        print("Coluna 'metodo_retirado' adicionada à tabela consultas_ambulatorial")
-
-    try:
-        cursor.execute("SELECT motivo_retirada FROM consultas_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE consultas_ambulatorial ADD COLUMN motivo_retirada TEXT")
-        print("Coluna 'motivo_retirada' adicionada à tabela consultas_ambulatorial")
-
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS enfermeiras_instrutoras_ambulatorial (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -571,105 +1751,6 @@ def init_db():
         )
     ''')
 
-    try:
-        cursor.execute("SELECT senha_hash FROM enfermeiras_instrutoras LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_instrutoras ADD COLUMN senha_hash TEXT")
-        print("Coluna 'senha_hash' adicionada à tabela enfermeiras_instrutoras")
-
-    try:
-        cursor.execute("SELECT unidade_saude FROM enfermeiras_instrutoras LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_instrutoras ADD COLUMN unidade_saude TEXT")
-        print("Coluna 'unidade_saude' adicionada à tabela enfermeiras_instrutoras")
-
-    try:
-        cursor.execute("SELECT diploma_filename FROM enfermeiras_instrutoras LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_instrutoras ADD COLUMN diploma_filename TEXT")
-        print("Coluna 'diploma_filename' adicionada à tabela enfermeiras_instrutoras")
-
-    try:
-        cursor.execute("SELECT diploma_content FROM enfermeiras_instrutoras LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_instrutoras ADD COLUMN diploma_content BLOB")
-        print("Coluna 'diploma_content' adicionada à tabela enfermeiras_instrutoras")
-
-    try:
-        cursor.execute("SELECT unidade_saude FROM enfermeiras_instrutoras_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_instrutoras_ambulatorial ADD COLUMN unidade_saude TEXT")
-        print("Coluna 'unidade_saude' adicionada à tabela enfermeiras_instrutoras_ambulatorial")
-
-    try:
-        cursor.execute("SELECT diploma_filename FROM enfermeiras_instrutoras_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_instrutoras_ambulatorial ADD COLUMN diploma_filename TEXT")
-        print("Coluna 'diploma_filename' adicionada à tabela enfermeiras_instrutoras_ambulatorial")
-
-    try:
-        cursor.execute("SELECT diploma_content FROM enfermeiras_instrutoras_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_instrutoras_ambulatorial ADD COLUMN diploma_content BLOB")
-        print("Coluna 'diploma_content' adicionada à tabela enfermeiras_instrutoras_ambulatorial")
-
-    try:
-        cursor.execute("SELECT senha_hash FROM enfermeiras_instrutoras_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE enfermeiras_instrutoras_ambulatorial ADD COLUMN senha_hash TEXT")
-        print("Coluna 'senha_hash' adicionada à tabela enfermeiras_instrutoras_ambulatorial")
-
-    # Adicionar campos de endereço para enfermeiras_instrutoras (Capacitação)
-    for coluna in ['cep', 'logradouro', 'municipio', 'bairro', 'numero', 'complemento']:
-        try:
-            cursor.execute(f"SELECT {coluna} FROM enfermeiras_instrutoras LIMIT 1")
-        except sqlite3.OperationalError:
-            cursor.execute(f"ALTER TABLE enfermeiras_instrutoras ADD COLUMN {coluna} TEXT")
-            print(f"Coluna '{coluna}' adicionada à tabela enfermeiras_instrutoras")
-
-    # Adicionar campos de endereço para enfermeiras_instrutoras_ambulatorial
-    for coluna in ['cep', 'logradouro', 'municipio', 'bairro', 'numero', 'complemento']:
-        try:
-            cursor.execute(f"SELECT {coluna} FROM enfermeiras_instrutoras_ambulatorial LIMIT 1")
-        except sqlite3.OperationalError:
-            cursor.execute(f"ALTER TABLE enfermeiras_instrutoras_ambulatorial ADD COLUMN {coluna} TEXT")
-            print(f"Coluna '{coluna}' adicionada à tabela enfermeiras_instrutoras_ambulatorial")
-
-    # Adicionar campos de endereço para enfermeiras_alunas
-    for coluna in ['cep', 'logradouro', 'bairro', 'numero', 'complemento']:
-        try:
-            cursor.execute(f"SELECT {coluna} FROM enfermeiras_alunas LIMIT 1")
-        except sqlite3.OperationalError:
-            cursor.execute(f"ALTER TABLE enfermeiras_alunas ADD COLUMN {coluna} TEXT")
-            print(f"Coluna '{coluna}' adicionada à tabela enfermeiras_alunas")
-
-    # Adicionar coluna qual_comorbidade na tabela pacientes_ambulatorial se não existir
-    try:
-        cursor.execute("SELECT qual_comorbidade FROM pacientes_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN qual_comorbidade TEXT")
-        print("Coluna 'qual_comorbidade' adicionada à tabela pacientes_ambulatorial")
-
-    # Adicionar coluna qual_comorbidade_especifique na tabela pacientes_ambulatorial se não existir
-    try:
-        cursor.execute("SELECT qual_comorbidade_especifique FROM pacientes_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN qual_comorbidade_especifique TEXT")
-        print("Coluna 'qual_comorbidade_especifique' adicionada à tabela pacientes_ambulatorial")
-
-    # Adicionar coluna recebe_cartao_cria na tabela pacientes_ambulatorial se não existir
-    try:
-        cursor.execute("SELECT recebe_cartao_cria FROM pacientes_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN recebe_cartao_cria TEXT")
-        print("Coluna 'recebe_cartao_cria' adicionada à tabela pacientes_ambulatorial")
-
-    try:
-        cursor.execute("SELECT municipio_nascimento FROM pacientes_ambulatorial LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE pacientes_ambulatorial ADD COLUMN municipio_nascimento TEXT")
-        print("Coluna 'municipio_nascimento' adicionada à tabela pacientes_ambulatorial")
-
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS fichas_atendimento_pdf (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -685,12 +1766,6 @@ def init_db():
         )
     ''')
 
-    try:
-        cursor.execute("SELECT metodo_inserido FROM fichas_atendimento_pdf LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE fichas_atendimento_pdf ADD COLUMN metodo_inserido TEXT")
-        print("Coluna 'metodo_inserido' adicionada à tabela fichas_atendimento_pdf")
-
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS municipios (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -720,34 +1795,82 @@ def init_db():
         )
     ''')
 
-    try:
-        cursor.execute("SELECT nome_paciente FROM fichas_atendimento_pdf LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE fichas_atendimento_pdf ADD COLUMN nome_paciente TEXT")
-        print("Coluna 'nome_paciente' adicionada à tabela fichas_atendimento_pdf")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_completo TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            senha_hash TEXT NOT NULL,
+            cpf TEXT UNIQUE NOT NULL,
+            telefone TEXT,
+            profissao TEXT,
+            vinculo_empregaticio TEXT,
+            cep TEXT,
+            municipio TEXT,
+            logradouro TEXT,
+            bairro TEXT,
+            numero TEXT,
+            complemento TEXT,
+            cargo TEXT NOT NULL CHECK (cargo IN (
+                'Administrador',
+                'Coordenador',
+                'Enfermeiro(a) Instrutor(a)',
+                'Enfermeiro(a) Aluno(a)',
+                'Médico(a) / Enfermeiro(a) Ambulatorial',
+                'Responsável por Insumos',
+                'Visitante'
+            )),
+            status TEXT DEFAULT 'ativo' CHECK (status IN ('ativo', 'inativo', 'bloqueado')),
+            primeiro_acesso INTEGER DEFAULT 1,
+            criado_por INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (criado_por) REFERENCES usuarios(id)
+        )
+    ''')
 
-    try:
-        cursor.execute("SELECT cpf_paciente FROM fichas_atendimento_pdf LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE fichas_atendimento_pdf ADD COLUMN cpf_paciente TEXT")
-        print("Coluna 'cpf_paciente' adicionada à tabela fichas_atendimento_pdf")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS logs_auditoria (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER,
+            acao TEXT NOT NULL,
+            tabela_afetada TEXT,
+            registro_id TEXT,
+            dados_anteriores TEXT,
+            dados_novos TEXT,
+            ip_address TEXT,
+            descricao TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+    ''')
 
-    try:
-        cursor.execute("SELECT data_nascimento_paciente FROM fichas_atendimento_pdf LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE fichas_atendimento_pdf ADD COLUMN data_nascimento_paciente TEXT")
-        print("Coluna 'data_nascimento_paciente' adicionada à tabela fichas_atendimento_pdf")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS responsaveis_municipios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            cpf TEXT UNIQUE NOT NULL,
+            cargo TEXT,
+            telefone TEXT,
+            email TEXT,
+            municipio TEXT NOT NULL,
+            status TEXT DEFAULT 'ativo',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
 
-    try:
-        cursor.execute("SELECT municipio_paciente FROM fichas_atendimento_pdf LIMIT 1")
-    except sqlite3.OperationalError:
-        cursor.execute("ALTER TABLE fichas_atendimento_pdf ADD COLUMN municipio_paciente TEXT")
-        print("Coluna 'municipio_paciente' adicionada à tabela fichas_atendimento_pdf")
+    for tabela, colunas in COLUNAS_ADICIONADAS.items():
+        adicionar_colunas(cursor, tabela, colunas)
 
-    cursor.execute("SELECT COUNT(*) as count FROM municipios WHERE estado = 'AL'")
-    municipios_count = cursor.fetchone()['count']
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_email ON usuarios(email)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_cpf ON usuarios(cpf)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_cargo ON usuarios(cargo)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_usuario_id ON logs_auditoria(usuario_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_created_at ON logs_auditoria(created_at)')
 
-    if municipios_count == 0:
+    cursor.execute("SELECT COUNT(*) as count FROM municipios WHERE estado = 'AL'")
+    if cursor.fetchone()['count'] == 0:
         print("Carregando municípios de Alagoas...")
         municipios_alagoas = [
             ('Água Branca', '2700102', 'AL'), ('Anadia', '2700201', 'AL'), ('Arapiraca', '2700300', 'AL'),
@@ -788,179 +1911,1312 @@ def init_db():
         cursor.executemany('INSERT INTO municipios (nome, codigo_ibge, estado) VALUES (?, ?, ?)', municipios_alagoas)
         print(f"{len(municipios_alagoas)} municípios de Alagoas inseridos com sucesso")
 
-    # Tabela de usuários do sistema
+    # Criar usuário administrador padrão se não existir
+    cursor.execute("SELECT COUNT(*) as count FROM usuarios WHERE cpf = '12345678909'")
+    if cursor.fetchone()['count'] == 0:
+        # CPF: 123.456.789-09 | Senha: Admin@123
+        senha_hash = hashlib.sha256('Admin@123'.encode()).hexdigest()
+        cursor.execute('''
+            INSERT INTO usuarios (nome_completo, email, senha_hash, cpf, telefone, cargo, status, primeiro_acesso)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', ('Administrador do Sistema', 'admin@decidiu.com', senha_hash, '12345678909', '(82) 99999-9999', 'Administrador', 'ativo', 1))
+        print("Usuário administrador padrão criado com sucesso - CPF: 123.456.789-09")
+
+# Índices para chaves estrangeiras, filtros e ordenações usados pelas rotas.
+# test_planos_consulta.py falha se alguma consulta voltar a ler por inteiro
+# uma tabela que cresce com o uso.
+INDICES = [
+    ('idx_pacientes_created_at', 'pacientes', 'created_at'),
+    ('idx_pacientes_cpf', 'pacientes', 'cpf'),
+    ('idx_pacientes_cartao_sus', 'pacientes', 'cartao_sus'),
+    ('idx_consultas_paciente', 'consultas', 'paciente_id, data_consulta'),
+    ('idx_agendamentos_data', 'agendamentos_municipios', 'data_agendamento'),
+    ('idx_agendamentos_municipio', 'agendamentos_municipios', 'municipio'),
+    ('idx_agendamentos_status', 'agendamentos_municipios', 'status'),
+    ('idx_instrutoras_nome', 'enfermeiras_instrutoras', 'nome'),
+    ('idx_instrutoras_email', 'enfermeiras_instrutoras', 'email'),
+    ('idx_instrutoras_coren', 'enfermeiras_instrutoras', 'coren'),
+    ('idx_alunas_nome', 'enfermeiras_alunas', 'nome'),
+    ('idx_alunas_municipio', 'enfermeiras_alunas', 'municipio'),
+    ('idx_alunas_instrutora', 'enfermeiras_alunas', 'enfermeira_instrutora_id'),
+    ('idx_pacientes_capacitacao_created_at', 'pacientes_capacitacao', 'created_at'),
+    ('idx_dgc_aluna', 'dados_ginecologicos_capacitacao', 'enfermeira_aluna_id'),
+    ('idx_dgc_metodo_aluna', 'dados_ginecologicos_capacitacao', 'metodo_escolhido, enfermeira_aluna_id, paciente_id'),
+    ('idx_consultas_capacitacao_paciente', 'consultas_capacitacao', 'paciente_id, data_consulta'),
+    ('idx_consultas_capacitacao_insercao', 'consultas_capacitacao', 'houve_insercao, paciente_id'),
+    ('idx_insercoes_paciente', 'insercoes_diu', 'paciente_id, data_insercao'),
+    ('idx_insercoes_aluna', 'insercoes_diu', 'enfermeira_aluna_id'),
+    ('idx_insercoes_instrutora', 'insercoes_diu', 'enfermeira_instrutora_id'),
+    ('idx_insercoes_metodo', 'insercoes_diu',
+     'metodo_contraceptivo, tipo_diu, enfermeira_aluna_id, enfermeira_instrutora_id, paciente_id'),
+    ('idx_pacientes_ambulatorial_created_at', 'pacientes_ambulatorial', 'created_at'),
+    ('idx_pacientes_ambulatorial_nascimento', 'pacientes_ambulatorial', 'data_nascimento'),
+    ('idx_pacientes_ambulatorial_comorbidade', 'pacientes_ambulatorial', 'possui_comorbidade'),
+    ('idx_dgo_paciente', 'dados_ginecologicos_obstetricos', 'paciente_id'),
+    ('idx_dgo_usg', 'dados_ginecologicos_obstetricos', 'realizou_usg, created_at'),
+    ('idx_consultas_ambulatorial_paciente', 'consultas_ambulatorial', 'paciente_id, data_consulta'),
+    ('idx_consultas_ambulatorial_insercao', 'consultas_ambulatorial', 'houve_insercao, tipo_insercao, paciente_id'),
+    ('idx_consultas_ambulatorial_intercorrencia', 'consultas_ambulatorial', 'nova_intercorrencia'),
+    ('idx_instrutoras_amb_nome', 'enfermeiras_instrutoras_ambulatorial', 'nome'),
+    ('idx_instrutoras_amb_email', 'enfermeiras_instrutoras_ambulatorial', 'email'),
+    ('idx_instrutoras_amb_registro', 'enfermeiras_instrutoras_ambulatorial', 'numero_registro'),
+    ('idx_fichas_aluna_data', 'fichas_atendimento_pdf', 'enfermeira_aluna_id, data_anexacao'),
+    ('idx_fichas_aluna_cpf', 'fichas_atendimento_pdf', 'enfermeira_aluna_id, cpf_paciente'),
+    ('idx_fichas_metodo_aluna', 'fichas_atendimento_pdf', 'metodo_inserido, enfermeira_aluna_id'),
+    ('idx_solicitacoes_municipio', 'solicitacoes_insumos', 'municipio_id, data_solicitacao'),
+    ('idx_solicitacoes_data', 'solicitacoes_insumos', 'data_solicitacao'),
+    ('idx_solicitacoes_status', 'solicitacoes_insumos', 'status'),
+    ('idx_solicitacoes_tipo_status', 'solicitacoes_insumos',
+     'tipo_insumo, status, quantidade_solicitada, quantidade_autorizada'),
+    ('idx_responsaveis_nome', 'responsaveis_municipios', 'nome'),
+    ('idx_usuarios_created_at', 'usuarios', 'created_at'),
+    ('idx_usuarios_nome', 'usuarios', 'nome_completo'),
+    ('idx_usuarios_status_cargo', 'usuarios', 'status, cargo, profissao'),
+]
+
+def migracao_indices(cursor):
+    for nome, tabela, colunas in INDICES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON {tabela}({colunas})')
+    # Estatísticas para o planejador escolher entre os índices
+    cursor.execute('ANALYZE')
+
+def migracao_arquivos_externos(cursor):
+    """Move os BLOBs das linhas para o armazenamento em disco."""
+    movidos = 0
+    for tabela, prefixo, coluna_nome in ARQUIVOS_EXTERNOS:
+        adicionar_colunas(cursor, tabela, [
+            (f'{prefixo}_ref', 'TEXT'), (f'{prefixo}_tamanho', 'INTEGER'), (f'{prefixo}_mime', 'TEXT'),
+        ])
+        coluna = f'{prefixo}_content'
+        cursor.execute(f'SELECT id FROM {tabela} WHERE length({coluna}) > 0')
+        ids = [row[0] for row in cursor.fetchall()]
+
+        # Uma linha por vez, para não carregar todos os arquivos na memória
+        for id in ids:
+            cursor.execute(f'SELECT {coluna}, {coluna_nome} FROM {tabela} WHERE id = ?', (id,))
+            conteudo, nome_arquivo = cursor.fetchone()
+            if isinstance(conteudo, str):
+                conteudo = decode_base64_safe(conteudo) or conteudo.encode()
+            ref, tamanho, mime = salvar_blob(bytes(conteudo), nome_arquivo)
+            cursor.execute(f'''
+                UPDATE {tabela} SET {prefixo}_ref = ?, {prefixo}_tamanho = ?, {prefixo}_mime = ?
+                WHERE id = ?
+            ''', (ref, tamanho, mime, id))
+            movidos += 1
+
+        cursor.execute(f'ALTER TABLE {tabela} DROP COLUMN {coluna}')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_{prefixo}_ref ON {tabela}({prefixo}_ref)')
+
+    if movidos:
+        print(f"{movidos} arquivo(s) movido(s) para {diretorio_blobs()}")
+
+# O banco encolhe bastante depois dessa migração
+migracao_arquivos_externos.compactar = True
+
+# Agregados dos painéis mantidos por triggers, para que os totais sejam lidos
+# em O(1) em vez de recontados a cada requisição. Linhas zeradas são apagadas:
+# chave ausente vale 0. Cada entrada é
+# (tabela de origem, tabela de destino, chave, condição); chave e condição são
+# expressões SQL sobre a linha "R", trocada por NEW/OLD nos triggers.
+#   contadores              - totais nomeados; a chave é um literal
+#   fichas_por_aluna        - fichas de cada enfermeira aluna
+#   agendamentos_por_status - agendamentos de cada status
+#   pacientes_distintos     - pacientes de cada tabela de origem, com o número
+#                             de ocorrências; o tamanho de cada conjunto fica
+#                             em contadores como 'pacientes:<origem>'
+CAPACITACAO_INSERCAO = '(R.enfermeira_aluna_id IS NOT NULL OR R.enfermeira_instrutora_id IS NOT NULL)'
+
+AGREGADOS = [
+    ('enfermeiras_instrutoras', 'contadores', "'enfermeiras_instrutoras'", '1'),
+    ('enfermeiras_alunas', 'contadores', "'enfermeiras_alunas'", '1'),
+    ('pacientes', 'contadores', "'pacientes'", '1'),
+    ('pacientes_capacitacao', 'contadores', "'pacientes_capacitacao'", '1'),
+    ('agendamentos_municipios', 'contadores', "'agendamentos_municipios'", '1'),
+    ('agendamentos_municipios', 'agendamentos_por_status', 'R.status', 'R.status IS NOT NULL'),
+
+    ('fichas_atendimento_pdf', 'contadores', "'fichas_atendimento_pdf:DIU'",
+     "R.metodo_inserido = 'DIU' AND R.enfermeira_aluna_id IS NOT NULL"),
+    ('fichas_atendimento_pdf', 'contadores', "'fichas_atendimento_pdf:Implanon'",
+     "R.metodo_inserido = 'Implanon' AND R.enfermeira_aluna_id IS NOT NULL"),
+    ('fichas_atendimento_pdf', 'fichas_por_aluna', 'R.enfermeira_aluna_id', 'R.enfermeira_aluna_id IS NOT NULL'),
+    ('fichas_atendimento_pdf', 'pacientes_distintos', 'R.cpf_paciente',
+     "R.cpf_paciente IS NOT NULL AND R.cpf_paciente != '' AND R.enfermeira_aluna_id IS NOT NULL"),
+
+    ('insercoes_diu', 'contadores', "'insercoes_diu:DIU'",
+     f"(R.metodo_contraceptivo = 'DIU' OR R.tipo_diu != '') AND {CAPACITACAO_INSERCAO}"),
+    ('insercoes_diu', 'contadores', "'insercoes_diu:Implanon'",
+     f"R.metodo_contraceptivo = 'Implanon' AND {CAPACITACAO_INSERCAO}"),
+    ('insercoes_diu', 'pacientes_distintos', 'R.paciente_id',
+     f'R.paciente_id IS NOT NULL AND {CAPACITACAO_INSERCAO}'),
+
+    ('dados_ginecologicos_capacitacao', 'contadores', "'dados_ginecologicos_capacitacao:DIU'",
+     "R.metodo_escolhido = 'DIU' AND R.enfermeira_aluna_id IS NOT NULL"),
+    ('dados_ginecologicos_capacitacao', 'contadores', "'dados_ginecologicos_capacitacao:Implanon'",
+     "R.metodo_escolhido = 'Implanon' AND R.enfermeira_aluna_id IS NOT NULL"),
+    ('dados_ginecologicos_capacitacao', 'pacientes_distintos', 'R.paciente_id',
+     "R.paciente_id IS NOT NULL AND R.metodo_escolhido IN ('DIU', 'Implanon') AND R.enfermeira_aluna_id IS NOT NULL"),
+
+    ('consultas_capacitacao', 'pacientes_distintos', 'R.paciente_id',
+     "R.paciente_id IS NOT NULL AND R.houve_insercao = 'Sim'"),
+]
+
+# Tabela de destino: (coluna da chave, coluna do valor)
+TABELAS_AGREGADOS = {
+    'contadores': ('chave', 'valor'),
+    'fichas_por_aluna': ('enfermeira_aluna_id', 'total'),
+    'agendamentos_por_status': ('status', 'total'),
+}
+
+def _sobre_linha(expressao, linha):
+    return re.sub(r'\bR\.', f'{linha}.', expressao)
+
+def _comandos_agregado(origem, destino, chave, condicao, linha, sinal):
+    """SQL que soma (sinal '+') ou retira (sinal '-') a linha NEW/OLD do agregado."""
+    chave = _sobre_linha(chave, linha)
+    condicao = _sobre_linha(condicao, linha)
+
+    if destino == 'pacientes_distintos':
+        filtro = f"conjunto = '{origem}' AND paciente = {chave}"
+        ocorrencias = f'(SELECT ocorrencias FROM pacientes_distintos WHERE {filtro})'
+        # O conjunto só muda de tamanho quando o paciente entra (1 ocorrência)
+        # ou sai (nenhuma ocorrência restante)
+        if sinal == '+':
+            return [
+                f"INSERT INTO pacientes_distintos (conjunto, paciente, ocorrencias) "
+                f"SELECT '{origem}', {chave}, 1 WHERE ({condicao}) "
+                f"ON CONFLICT(conjunto, paciente) DO UPDATE SET ocorrencias = ocorrencias + 1",
+            ] + _comandos_agregado(
+                origem, 'contadores', f"'pacientes:{origem}'", f'({condicao}) AND {ocorrencias} = 1', linha, sinal
+            )
+        return [
+            f'UPDATE pacientes_distintos SET ocorrencias = ocorrencias - 1 WHERE {filtro} AND ({condicao})',
+        ] + _comandos_agregado(
+            origem, 'contadores', f"'pacientes:{origem}'", f'({condicao}) AND {ocorrencias} = 0', linha, sinal
+        ) + [
+            f'DELETE FROM pacientes_distintos WHERE {filtro} AND ocorrencias = 0',
+        ]
+
+    coluna_chave, coluna_valor = TABELAS_AGREGADOS[destino]
+    if sinal == '+':
+        return [
+            f'INSERT INTO {destino} ({coluna_chave}, {coluna_valor}) '
+            f'SELECT {chave}, 1 WHERE ({condicao}) '
+            f'ON CONFLICT({coluna_chave}) DO UPDATE SET {coluna_valor} = {coluna_valor} + 1'
+        ]
+    return [
+        f'UPDATE {destino} SET {coluna_valor} = {coluna_valor} - 1 WHERE {coluna_chave} = {chave} AND ({condicao})',
+        f'DELETE FROM {destino} WHERE {coluna_chave} = {chave} AND {coluna_valor} = 0',
+    ]
+
+def criar_triggers_agregados(cursor):
+    origens = []
+    for origem, _, _, _ in AGREGADOS:
+        if origem not in origens:
+            origens.append(origem)
+
+    for origem in origens:
+        agregados = [a for a in AGREGADOS if a[0] == origem]
+        eventos = [
+            ('insert', 'INSERT', [('NEW', '+')]),
+            ('delete', 'DELETE', [('OLD', '-')]),
+        ]
+        # Só dispara em UPDATE das colunas usadas nas chaves e condições
+        colunas = sorted(set(
+            coluna
+            for _, _, chave, condicao in agregados
+            for coluna in re.findall(r'\bR\.(\w+)', f'{chave} {condicao}')
+        ))
+        if colunas:
+            eventos.append(('update', f"UPDATE OF {', '.join(colunas)}", [('OLD', '-'), ('NEW', '+')]))
+
+        for sufixo, evento, passos in eventos:
+            comandos = [
+                comando
+                for linha, sinal in passos
+                for _, destino, chave, condicao in agregados
+                for comando in _comandos_agregado(origem, destino, chave, condicao, linha, sinal)
+            ]
+            cursor.execute(f'DROP TRIGGER IF EXISTS agregados_{origem}_{sufixo}')
+            cursor.execute(
+                f'CREATE TRIGGER agregados_{origem}_{sufixo} AFTER {evento} ON {origem}\n'
+                f'BEGIN\n' + ''.join(f'    {comando};\n' for comando in comandos) + 'END'
+            )
+
+def calcular_agregados(cursor):
+    """Recalcula os agregados direto das tabelas de origem.
+
+    Retorna {(tabela de destino, chave...): valor}, no mesmo formato de
+    ler_agregados().
+    """
+    valores = {}
+    for origem, destino, chave, condicao in AGREGADOS:
+        if destino == 'pacientes_distintos':
+            cursor.execute(f'''
+                SELECT CAST({chave} AS TEXT), COUNT(*) FROM {origem} R
+                WHERE {condicao}
+                GROUP BY CAST({chave} AS TEXT)
+            ''')
+            conjunto = cursor.fetchall()
+            for paciente, ocorrencias in conjunto:
+                valores[(destino, origem, paciente)] = ocorrencias
+            if conjunto:
+                valores[('contadores', f'pacientes:{origem}')] = len(conjunto)
+        else:
+            cursor.execute(f'SELECT {chave}, COUNT(*) FROM {origem} R WHERE {condicao} GROUP BY 1')
+            for valor_chave, total in cursor.fetchall():
+                valores[(destino, valor_chave)] = total
+    return valores
+
+def ler_agregados(cursor):
+    valores = {}
+    for destino, (coluna_chave, coluna_valor) in TABELAS_AGREGADOS.items():
+        cursor.execute(f'SELECT {coluna_chave}, {coluna_valor} FROM {destino}')
+        for valor_chave, total in cursor.fetchall():
+            valores[(destino, valor_chave)] = total
+    cursor.execute('SELECT conjunto, paciente, ocorrencias FROM pacientes_distintos')
+    for conjunto, paciente, ocorrencias in cursor.fetchall():
+        valores[('pacientes_distintos', conjunto, paciente)] = ocorrencias
+    return valores
+
+def verificar_agregados(cursor):
+    """Compara os agregados gravados com as tabelas de origem.
+
+    Retorna a lista de divergências (chave, gravado, esperado).
+    """
+    esperado = calcular_agregados(cursor)
+    gravado = ler_agregados(cursor)
+    return [
+        (chave, gravado.get(chave), esperado.get(chave))
+        for chave in sorted(set(esperado) | set(gravado), key=repr)
+        if gravado.get(chave) != esperado.get(chave)
+    ]
+
+def reconstruir_agregados(cursor):
+    """Apaga e regrava todos os agregados a partir das tabelas de origem."""
+    for destino in list(TABELAS_AGREGADOS) + ['pacientes_distintos']:
+        cursor.execute(f'DELETE FROM {destino}')
+    for chave, valor in calcular_agregados(cursor).items():
+        destino = chave[0]
+        if destino == 'pacientes_distintos':
+            cursor.execute(
+                'INSERT INTO pacientes_distintos (conjunto, paciente, ocorrencias) VALUES (?, ?, ?)',
+                (chave[1], chave[2], valor)
+            )
+        else:
+            coluna_chave, coluna_valor = TABELAS_AGREGADOS[destino]
+            cursor.execute(f'INSERT INTO {destino} ({coluna_chave}, {coluna_valor}) VALUES (?, ?)', (chave[1], valor))
+
+def ler_contadores(cursor):
+    cursor.execute('SELECT chave, valor FROM contadores')
+    return {row['chave']: row['valor'] for row in cursor.fetchall()}
+
+def migracao_agregados(cursor):
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome_completo TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            senha_hash TEXT NOT NULL,
-            cpf TEXT UNIQUE NOT NULL,
-            telefone TEXT,
-            profissao TEXT,
-            vinculo_empregaticio TEXT,
-            cep TEXT,
-            municipio TEXT,
-            logradouro TEXT,
-            bairro TEXT,
-            numero TEXT,
-            complemento TEXT,
-            cargo TEXT NOT NULL CHECK (cargo IN (
-                'Administrador',
-                'Coordenador',
-                'Enfermeiro(a) Instrutor(a)',
-                'Enfermeiro(a) Aluno(a)',
-                'Médico(a) / Enfermeiro(a) Ambulatorial',
-                'Responsável por Insumos',
-                'Visitante'
-            )),
-            status TEXT DEFAULT 'ativo' CHECK (status IN ('ativo', 'inativo', 'bloqueado')),
-            primeiro_acesso INTEGER DEFAULT 1,
-            criado_por INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (criado_por) REFERENCES usuarios(id)
+        CREATE TABLE IF NOT EXISTS contadores (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
         )
     ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fichas_por_aluna (
+            enfermeira_aluna_id INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS agendamentos_por_status (
+            status TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pacientes_distintos (
+            conjunto TEXT NOT NULL,
+            paciente TEXT NOT NULL,
+            ocorrencias INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (conjunto, paciente)
+        )
+    ''')
+    criar_triggers_agregados(cursor)
+    reconstruir_agregados(cursor)
+
+# Estatísticas de capacitação por município, em estatisticas_municipios. Cada
+# escrita nas tabelas de origem recalcula, por trigger, só a linha do município
+# afetado; a leitura é uma busca pela chave. As colunas usam exatamente as
+# consultas de capacitacao_stats_municipio(), sobre o município "x.municipio".
+ESTATISTICAS_MUNICIPIO = [
+    ('agendamentos', 'SELECT COUNT(*) FROM agendamentos_municipios WHERE municipio = x.municipio'),
+    ('alunas', 'SELECT COUNT(*) FROM enfermeiras_alunas WHERE municipio = x.municipio'),
+    ('profissionais_capacitados', '''
+        SELECT COUNT(*) FROM enfermeiras_alunas ea
+        WHERE ea.municipio = x.municipio
+        AND (SELECT COUNT(*) FROM fichas_atendimento_pdf WHERE enfermeira_aluna_id = ea.id) >= 20
+    '''),
+    ('dius', '''
+        (SELECT COUNT(*) FROM fichas_atendimento_pdf fap
+         JOIN enfermeiras_alunas ea ON fap.enfermeira_aluna_id = ea.id
+         WHERE ea.municipio = x.municipio AND fap.metodo_inserido = 'DIU')
+        + (SELECT COUNT(*) FROM insercoes_diu id
+           JOIN enfermeiras_alunas ea ON id.enfermeira_aluna_id = ea.id
+           WHERE ea.municipio = x.municipio AND (id.metodo_contraceptivo = 'DIU' OR id.tipo_diu != ''))
+        + (SELECT COUNT(*) FROM dados_ginecologicos_capacitacao dgc
+           JOIN enfermeiras_alunas ea ON dgc.enfermeira_aluna_id = ea.id
+           WHERE ea.municipio = x.municipio AND dgc.metodo_escolhido = 'DIU')
+    '''),
+    ('implanons', '''
+        (SELECT COUNT(*) FROM fichas_atendimento_pdf fap
+         JOIN enfermeiras_alunas ea ON fap.enfermeira_aluna_id = ea.id
+         WHERE ea.municipio = x.municipio AND fap.metodo_inserido = 'Implanon')
+        + (SELECT COUNT(*) FROM insercoes_diu id
+           JOIN enfermeiras_alunas ea ON id.enfermeira_aluna_id = ea.id
+           WHERE ea.municipio = x.municipio AND id.metodo_contraceptivo = 'Implanon')
+        + (SELECT COUNT(*) FROM dados_ginecologicos_capacitacao dgc
+           JOIN enfermeiras_alunas ea ON dgc.enfermeira_aluna_id = ea.id
+           WHERE ea.municipio = x.municipio AND dgc.metodo_escolhido = 'Implanon')
+    '''),
+    ('pacientes_com_insercao', '''
+        (SELECT COUNT(DISTINCT fap.cpf_paciente) FROM fichas_atendimento_pdf fap
+         JOIN enfermeiras_alunas ea ON fap.enfermeira_aluna_id = ea.id
+         WHERE ea.municipio = x.municipio AND fap.cpf_paciente IS NOT NULL AND fap.cpf_paciente != '')
+        + (SELECT COUNT(DISTINCT id.paciente_id) FROM insercoes_diu id
+           JOIN enfermeiras_alunas ea ON id.enfermeira_aluna_id = ea.id
+           WHERE ea.municipio = x.municipio AND id.paciente_id IS NOT NULL)
+        + (SELECT COUNT(DISTINCT dgc.paciente_id) FROM dados_ginecologicos_capacitacao dgc
+           JOIN enfermeiras_alunas ea ON dgc.enfermeira_aluna_id = ea.id
+           WHERE ea.municipio = x.municipio AND dgc.metodo_escolhido IN ('DIU', 'Implanon'))
+    '''),
+]
+
+# (tabela, SELECT do município afetado pela linha R, colunas que importam em UPDATE)
+GATILHOS_MUNICIPIOS = [
+    ('agendamentos_municipios', 'SELECT R.municipio AS municipio', ['municipio']),
+    ('enfermeiras_alunas', 'SELECT R.municipio AS municipio', ['municipio']),
+    ('fichas_atendimento_pdf',
+     'SELECT municipio FROM enfermeiras_alunas WHERE id = R.enfermeira_aluna_id',
+     ['enfermeira_aluna_id', 'metodo_inserido', 'cpf_paciente']),
+    ('insercoes_diu',
+     'SELECT municipio FROM enfermeiras_alunas WHERE id = R.enfermeira_aluna_id',
+     ['enfermeira_aluna_id', 'metodo_contraceptivo', 'tipo_diu', 'paciente_id']),
+    ('dados_ginecologicos_capacitacao',
+     'SELECT municipio FROM enfermeiras_alunas WHERE id = R.enfermeira_aluna_id',
+     ['enfermeira_aluna_id', 'metodo_escolhido', 'paciente_id']),
+]
+
+def _select_estatisticas_municipio(municipios):
+    valores = ', '.join(f'({sql.strip()})' for _, sql in ESTATISTICAS_MUNICIPIO)
+    return (
+        f'SELECT x.municipio, {valores} FROM ({municipios}) x '
+        f"WHERE x.municipio IS NOT NULL AND x.municipio != ''"
+    )
+
+def _recalcular_estatisticas_municipio(municipios):
+    colunas = ', '.join(coluna for coluna, _ in ESTATISTICAS_MUNICIPIO)
+    atualizacao = ', '.join(f'{coluna} = excluded.{coluna}' for coluna, _ in ESTATISTICAS_MUNICIPIO)
+    return (
+        f'INSERT INTO estatisticas_municipios (municipio, {colunas}) '
+        f'{_select_estatisticas_municipio(municipios)} '
+        f'ON CONFLICT(municipio) DO UPDATE SET {atualizacao}'
+    )
+
+def criar_triggers_estatisticas_municipios(cursor):
+    for tabela, municipio, colunas in GATILHOS_MUNICIPIOS:
+        eventos = [
+            ('insert', 'INSERT', _sobre_linha(municipio, 'NEW')),
+            ('delete', 'DELETE', _sobre_linha(municipio, 'OLD')),
+            # Mudança de aluna ou de município afeta a linha antiga e a nova
+            ('update', f"UPDATE OF {', '.join(colunas)}",
+             f"{_sobre_linha(municipio, 'OLD')} UNION {_sobre_linha(municipio, 'NEW')}"),
+        ]
+        for sufixo, evento, municipios in eventos:
+            cursor.execute(f'DROP TRIGGER IF EXISTS estatisticas_municipios_{tabela}_{sufixo}')
+            cursor.execute(
+                f'CREATE TRIGGER estatisticas_municipios_{tabela}_{sufixo} AFTER {evento} ON {tabela}\n'
+                f'BEGIN\n    {_recalcular_estatisticas_municipio(municipios)};\nEND'
+            )
 
-    # Adicionar campos de controle de senha se não existirem
-    campos_senha = [
-        ('data_nascimento', 'TEXT'),
-        ('password_last_changed_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
-        ('password_expires_at', 'TIMESTAMP'),
-        ('must_change_password', 'INTEGER DEFAULT 1'),
-        ('temporary_password_hash', 'TEXT'),
-        ('temporary_password_expires_at', 'TIMESTAMP'),
-        ('temporary_password_used', 'INTEGER DEFAULT 0')
+# Todos os municípios citados nas tabelas de origem
+MUNICIPIOS_COM_DADOS = '''
+    SELECT municipio FROM agendamentos_municipios
+    UNION SELECT municipio FROM enfermeiras_alunas
+'''
+
+def verificar_estatisticas_municipios(cursor):
+    """Compara estatisticas_municipios com um recálculo completo.
+
+    Retorna a lista de divergências (município, gravado, esperado).
+    """
+    cursor.execute(_select_estatisticas_municipio(
+        f'{MUNICIPIOS_COM_DADOS} UNION SELECT municipio FROM estatisticas_municipios'
+    ))
+    esperado = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    colunas = ', '.join(coluna for coluna, _ in ESTATISTICAS_MUNICIPIO)
+    cursor.execute(f'SELECT municipio, {colunas} FROM estatisticas_municipios')
+    gravado = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    return [
+        (municipio, gravado.get(municipio), esperado[municipio])
+        for municipio in sorted(esperado)
+        if gravado.get(municipio, (0,) * len(ESTATISTICAS_MUNICIPIO)) != esperado[municipio]
     ]
 
-    for campo, tipo in campos_senha:
-        try:
-            cursor.execute(f'ALTER TABLE usuarios ADD COLUMN {campo} {tipo}')
-        except sqlite3.OperationalError:
-            pass
+def reconstruir_estatisticas_municipios(cursor):
+    cursor.execute('DELETE FROM estatisticas_municipios')
+    cursor.execute(_recalcular_estatisticas_municipio(MUNICIPIOS_COM_DADOS))
 
-    # Tabela de logs de auditoria
+def migracao_estatisticas_municipios(cursor):
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs_auditoria (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usuario_id INTEGER,
-            acao TEXT NOT NULL,
-            tabela_afetada TEXT,
-            registro_id TEXT,
-            dados_anteriores TEXT,
-            dados_novos TEXT,
-            ip_address TEXT,
-            descricao TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        CREATE TABLE IF NOT EXISTS estatisticas_municipios (
+            municipio TEXT PRIMARY KEY,
+            agendamentos INTEGER NOT NULL DEFAULT 0,
+            alunas INTEGER NOT NULL DEFAULT 0,
+            profissionais_capacitados INTEGER NOT NULL DEFAULT 0,
+            dius INTEGER NOT NULL DEFAULT 0,
+            implanons INTEGER NOT NULL DEFAULT 0,
+            pacientes_com_insercao INTEGER NOT NULL DEFAULT 0
         )
     ''')
+    criar_triggers_estatisticas_municipios(cursor)
+    reconstruir_estatisticas_municipios(cursor)
+
+# Agregação condicional em uma só passada por tabela. Cada fonte descreve a
+# origem (com a linha principal como "R", igual em AGREGADOS), as expressões
+# de município e mês e as métricas (nome, valor, condição). agregar() monta um
+# único SELECT com SUM(CASE WHEN condição THEN valor END) para todas as
+# métricas e, quando pedido, agrupa por município e/ou mês na mesma leitura.
+# O índice de cada fonte cobre todas as colunas lidas, para a passada correr
+# só pelo índice.
+DIMENSOES_AGREGACAO = ('municipio', 'mes')
+
+def metricas_contadores(origem):
+    """Métricas com as mesmas chaves e condições dos contadores de AGREGADOS."""
+    return [
+        (chave.strip("'"), '1', condicao)
+        for tabela, destino, chave, condicao in AGREGADOS
+        if tabela == origem and destino == 'contadores'
+    ]
 
-    # Verificar e adicionar colunas necessárias na tabela usuarios antes de criar índices
-    cursor.execute("PRAGMA table_info(usuarios)")
-    colunas_existentes = [coluna[1] for coluna in cursor.fetchall()]
+FONTES_AGREGACAO = {
+    'solicitacoes_insumos': {
+        'origem': 'solicitacoes_insumos R LEFT JOIN municipios m ON m.id = R.municipio_id',
+        'municipio': 'm.nome',
+        'mes': 'substr(R.data_solicitacao, 1, 7)',
+        'metricas': [
+            ('totalSolicitacoes', '1', '1'),
+            ('totalAutorizadas', '1', "R.status = 'Autorizado'"),
+            ('totalNegadas', '1', "R.status = 'Não autorizado'"),
+            ('totalAguardando', '1', "R.status = 'Aguardando confirmação'"),
+            ('totalDiusSolicitados', 'R.quantidade_solicitada', "R.tipo_insumo = 'DIU'"),
+            ('totalDiusAutorizados', 'R.quantidade_autorizada', "R.tipo_insumo = 'DIU' AND R.status = 'Autorizado'"),
+            ('totalImplanonsSolicitados', 'R.quantidade_solicitada', "R.tipo_insumo = 'Implanon'"),
+            ('totalImplanonsAutorizados', 'R.quantidade_autorizada', "R.tipo_insumo = 'Implanon' AND R.status = 'Autorizado'"),
+        ],
+        'indice': 'municipio_id, data_solicitacao, tipo_insumo, status, quantidade_solicitada, quantidade_autorizada',
+    },
+    'agendamentos_municipios': {
+        'origem': 'agendamentos_municipios R',
+        'municipio': 'R.municipio',
+        'mes': 'substr(R.data_agendamento, 1, 7)',
+        'metricas': metricas_contadores('agendamentos_municipios'),
+        'indice': 'municipio, data_agendamento',
+    },
+    'fichas_atendimento_pdf': {
+        'origem': 'fichas_atendimento_pdf R LEFT JOIN enfermeiras_alunas ea ON ea.id = R.enfermeira_aluna_id',
+        'municipio': 'ea.municipio',
+        'mes': 'substr(R.data_anexacao, 1, 7)',
+        'metricas': metricas_contadores('fichas_atendimento_pdf'),
+        'indice': 'enfermeira_aluna_id, metodo_inserido, data_anexacao',
+    },
+    'insercoes_diu': {
+        'origem': 'insercoes_diu R LEFT JOIN enfermeiras_alunas ea ON ea.id = R.enfermeira_aluna_id',
+        'municipio': 'ea.municipio',
+        'mes': 'substr(R.data_insercao, 1, 7)',
+        'metricas': metricas_contadores('insercoes_diu'),
+        'indice': 'enfermeira_aluna_id, enfermeira_instrutora_id, metodo_contraceptivo, tipo_diu, data_insercao',
+    },
+    'dados_ginecologicos_capacitacao': {
+        'origem': 'dados_ginecologicos_capacitacao R LEFT JOIN enfermeiras_alunas ea ON ea.id = R.enfermeira_aluna_id',
+        'municipio': 'ea.municipio',
+        'mes': 'substr(R.data_consulta, 1, 7)',
+        'metricas': metricas_contadores('dados_ginecologicos_capacitacao'),
+        'indice': 'enfermeira_aluna_id, metodo_escolhido, data_consulta',
+    },
+}
+
+def agregar(cursor, fonte, agrupar=()):
+    """Calcula todas as métricas da fonte numa única consulta.
+
+    Retorna {'total': {métrica: valor}} e, para cada dimensão de agrupar,
+    {dimensão: {valor da dimensão: {métrica: valor}}}. Linhas sem município
+    ou sem data entram só no total.
+    """
+    definicao = FONTES_AGREGACAO[fonte]
+    nomes = [nome for nome, _, _ in definicao['metricas']]
+    grupos = [definicao[dimensao] for dimensao in agrupar]
+    colunas = grupos + [
+        f'COALESCE(SUM(CASE WHEN {condicao} THEN {valor} END), 0)'
+        for _, valor, condicao in definicao['metricas']
+    ]
+    sql = f"SELECT {', '.join(colunas)} FROM {definicao['origem']}"
+    if grupos:
+        sql += f" GROUP BY {', '.join(str(i + 1) for i in range(len(grupos)))}"
+    cursor.execute(sql)
+
+    resultado = {'total': dict.fromkeys(nomes, 0)}
+    for dimensao in agrupar:
+        resultado[dimensao] = {}
+    for row in cursor.fetchall():
+        chaves, valores = tuple(row)[:len(grupos)], tuple(row)[len(grupos):]
+        destinos = [resultado['total']] + [
+            resultado[dimensao].setdefault(chave, dict.fromkeys(nomes, 0))
+            for dimensao, chave in zip(agrupar, chaves)
+            if chave not in (None, '')
+        ]
+        for destino in destinos:
+            for nome, valor in zip(nomes, valores):
+                destino[nome] += valor
+    return resultado
+
+def agregar_fontes(cursor, fontes, agrupar=()):
+    """agregar() de várias fontes, juntando os resultados num só dicionário."""
+    resultado = {'total': {}}
+    for dimensao in agrupar:
+        resultado[dimensao] = {}
+    for fonte in fontes:
+        parcial = agregar(cursor, fonte, agrupar)
+        resultado['total'].update(parcial['total'])
+        for dimensao in agrupar:
+            for chave, valores in parcial[dimensao].items():
+                resultado[dimensao].setdefault(chave, {}).update(valores)
+    return resultado
+
+def dimensoes_pedidas():
+    """Dimensões de ?agrupar=municipio,mes; levanta ValueError se inválidas."""
+    agrupar = tuple(d.strip() for d in request.args.get('agrupar', '').split(',') if d.strip())
+    invalidas = [d for d in agrupar if d not in DIMENSOES_AGREGACAO]
+    if invalidas:
+        raise ValueError(f"agrupar aceita apenas: {', '.join(DIMENSOES_AGREGACAO)}")
+    return agrupar
+
+def detalhamento(agregado, dimensao, formatar):
+    """Lista ordenada [{dimensão: chave, ...totais formatados}] de uma dimensão."""
+    return [
+        {dimensao: chave, **formatar(valores)}
+        for chave, valores in sorted(agregado[dimensao].items())
+    ]
 
-    if 'email' not in colunas_existentes:
-        print("Adicionando coluna 'email' à tabela usuarios...")
-        cursor.execute("ALTER TABLE usuarios ADD COLUMN email TEXT")
-        conn.commit()
-        print("Coluna 'email' adicionada com sucesso")
+def migracao_indices_agregacao(cursor):
+    for fonte, definicao in FONTES_AGREGACAO.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{fonte}_agregacao ON {fonte} ({definicao['indice']})")
+    cursor.execute('ANALYZE')
+
+def criar_triggers_geracao(cursor, tabelas):
+    """Triggers que somam 1 à geração de escrita da tabela a cada alteração.
+
+    Só cria os das tabelas de TABELAS_GERACAO; as demais são ignoradas."""
+    for tabela in tabelas:
+        if tabela not in TABELAS_GERACAO:
+            continue
+        cursor.execute('INSERT OR IGNORE INTO geracoes_escrita (tabela, geracao) VALUES (?, 0)', (tabela,))
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS geracao_{tabela}_{evento.lower()}')
+            cursor.execute(f'''
+                CREATE TRIGGER geracao_{tabela}_{evento.lower()} AFTER {evento} ON {tabela}
+                BEGIN
+                    UPDATE geracoes_escrita SET geracao = geracao + 1 WHERE tabela = '{tabela}';
+                END
+            ''')
 
-    if 'cpf' not in colunas_existentes:
-        print("Adicionando coluna 'cpf' à tabela usuarios...")
-        cursor.execute("ALTER TABLE usuarios ADD COLUMN cpf TEXT")
-        conn.commit()
-        print("Coluna 'cpf' adicionada com sucesso")
+def migracao_geracoes_escrita(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS geracoes_escrita (
+            tabela TEXT PRIMARY KEY,
+            geracao INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name != 'geracoes_escrita'
+        ORDER BY name
+    ''')
+    criar_triggers_geracao(cursor, [row['name'] for row in cursor.fetchall()])
 
-    if 'cargo' not in colunas_existentes:
-        print("Adicionando coluna 'cargo' à tabela usuarios...")
-        cursor.execute("ALTER TABLE usuarios ADD COLUMN cargo TEXT")
-        conn.commit()
-        print("Coluna 'cargo' adicionada com sucesso")
+def migracao_sessoes(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessoes (
+            token_hash TEXT PRIMARY KEY,
+            usuario_id INTEGER NOT NULL,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expira_em TEXT NOT NULL,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessoes_usuario ON sessoes (usuario_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessoes_expira ON sessoes (expira_em)')
+    criar_triggers_geracao(cursor, ['sessoes'])
+
+def migracao_indices_auditoria(cursor):
+    # Um índice por filtro da consulta de auditoria, já na ordem da paginação;
+    # (usuario_id, created_at, id) torna idx_logs_usuario_id redundante
+    for nome, coluna in [
+        ('idx_logs_usuario_criacao', 'usuario_id'),
+        ('idx_logs_acao_criacao', 'acao'),
+        ('idx_logs_tabela_criacao', 'tabela_afetada'),
+    ]:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON logs_auditoria ({coluna}, created_at, id)')
+    cursor.execute('DROP INDEX IF EXISTS idx_logs_usuario_id')
+    cursor.execute('ANALYZE logs_auditoria')
+
+# Busca textual (FTS5): uma tabela busca_<origem> por tabela de origem, com o
+# rowid igual ao id da linha, mantida por triggers. O tokenizador unicode61 com
+# remove_diacritics ignora acentos e maiúsculas ("conceicao" encontra
+# "Conceição"). CPF e cartão do SUS entram só com os dígitos, num único termo.
+# A busca é por prefixo de palavra, e prefix='2 3' guarda no índice os prefixos
+# de 2 e 3 letras para que os mais curtos também sejam uma consulta direta.
+def _so_digitos(expressao):
+    return f"replace(replace(replace(replace({expressao}, '.', ''), '-', ''), '/', ''), ' ', '')"
+
+def _documentos(*expressoes):
+    return " || ' ' || ".join(f"coalesce({expressao}, '')" for expressao in expressoes)
+
+BUSCA_TEXTUAL = [
+    # (tabela de origem, tipo no resultado, nome, documentos)
+    ('usuarios', 'usuario', 'R.nome_completo', _documentos(_so_digitos('R.cpf'))),
+    ('pacientes_ambulatorial', 'paciente_ambulatorial', 'R.nome_completo',
+     _documentos(_so_digitos('R.cpf'), _so_digitos('R.cartao_sus'))),
+    ('pacientes_capacitacao', 'paciente_capacitacao', 'R.nome_completo',
+     _documentos(_so_digitos('R.cpf'), _so_digitos('R.cartao_sus'))),
+    ('enfermeiras_alunas', 'enfermeira_aluna', 'R.nome', _documentos(_so_digitos('R.cpf'), 'R.coren')),
+    ('enfermeiras_instrutoras', 'enfermeira_instrutora', 'R.nome', _documentos(_so_digitos('R.cpf'), 'R.coren')),
+    ('enfermeiras_instrutoras_ambulatorial', 'enfermeira_instrutora_ambulatorial', 'R.nome',
+     _documentos(_so_digitos('R.cpf'), 'R.numero_registro')),
+]
+TIPOS_BUSCA = {tipo: (origem, nome) for origem, tipo, nome, _ in BUSCA_TEXTUAL}
+BUSCA_LIMITE_PADRAO = 20
+BUSCA_LIMITE_MAXIMO = 100
+
+def consulta_fts(termo):
+    """Converte o texto digitado numa consulta FTS5 por prefixo.
+
+    Cada palavra vira um prefixo entre aspas ("ana silv" -> "ana"* "silv"*),
+    então operadores do FTS5 no texto não têm efeito. Um texto só de dígitos e
+    pontuação (CPF, cartão do SUS) vira um único prefixo com os dígitos.
+    Retorna None se não sobrar nada para buscar."""
+    if re.fullmatch(r'[\d.\-/\s]+', termo):
+        palavras = [re.sub(r'\D', '', termo)]
+    else:
+        palavras = re.findall(r'\w+', termo)
+    palavras = [palavra for palavra in palavras if palavra]
+    return ' '.join(f'"{palavra}"*' for palavra in palavras) or None
+
+def criar_triggers_busca_textual(cursor):
+    for origem, _, nome, documentos in BUSCA_TEXTUAL:
+        colunas = sorted(set(re.findall(r'\bR\.(\w+)', f'{nome} {documentos}')))
+        inserir = (
+            f'INSERT INTO busca_{origem} (rowid, nome, documentos) '
+            f"VALUES (NEW.id, {_sobre_linha(nome, 'NEW')}, {_sobre_linha(documentos, 'NEW')})"
+        )
+        remover = f'DELETE FROM busca_{origem} WHERE rowid = OLD.id'
+        eventos = [
+            ('insert', 'INSERT', [inserir]),
+            ('delete', 'DELETE', [remover]),
+            ('update', f"UPDATE OF id, {', '.join(colunas)}", [remover, inserir]),
+        ]
+        for sufixo, evento, comandos in eventos:
+            cursor.execute(f'DROP TRIGGER IF EXISTS busca_{origem}_{sufixo}')
+            corpo = ''.join(f'    {comando};\n' for comando in comandos)
+            cursor.execute(f'CREATE TRIGGER busca_{origem}_{sufixo} AFTER {evento} ON {origem}\nBEGIN\n{corpo}END')
+
+def reconstruir_busca_textual(cursor):
+    for origem, _, nome, documentos in BUSCA_TEXTUAL:
+        cursor.execute(f'DELETE FROM busca_{origem}')
+        cursor.execute(f'''
+            INSERT INTO busca_{origem} (rowid, nome, documentos)
+            SELECT R.id, {nome}, {documentos} FROM {origem} R
+        ''')
 
-    if 'nome_completo' not in colunas_existentes:
-        print("Adicionando coluna 'nome_completo' à tabela usuarios...")
-        cursor.execute("ALTER TABLE usuarios ADD COLUMN nome_completo TEXT")
-        conn.commit()
-        print("Coluna 'nome_completo' adicionada com sucesso")
+def migracao_busca_textual(cursor):
+    # Tabelas virtuais e as tabelas internas do FTS5 ficam fora das gerações
+    # de escrita: mudam junto com a tabela de origem, que já tem as suas
+    for origem, _, _, _ in BUSCA_TEXTUAL:
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS busca_{origem} USING fts5(
+                nome, documentos,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        ''')
+    criar_triggers_busca_textual(cursor)
+    reconstruir_busca_textual(cursor)
+    # Listagem de profissionais por categoria, já na ordem da página
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_cargo_nome ON usuarios (cargo, nome_completo)')
+
+# Resumo diário do ambulatório em ambulatorial_diario: uma linha por dia com os
+# totais de /api/ambulatorial/stats, que soma as linhas do período pedido (uma
+# busca por intervalo na chave). Mantido por triggers, como os agregados: cada
+# origem tem a expressão do dia, a coluna que aponta para a paciente (ou None)
+# e as condições de cada coluna, sobre a linha "R". Registros sem data ficam no
+# dia '' e só entram no total geral.
+#
+# Consultas e dados ginecológicos só contam enquanto a paciente existir, como
+# no JOIN com pacientes_ambulatorial da contagem antiga: cadastrar ou excluir
+# a paciente soma ou retira também as linhas dela.
+RESUMO_AMBULATORIAL = {
+    'pacientes_ambulatorial': ('R.created_at', None, {
+        'pacientes': '1',
+    }),
+    'consultas_ambulatorial': ('R.data_consulta', 'paciente_id', {
+        'consultas': '1',
+        'dius': "R.houve_insercao = 'Sim' AND R.tipo_insercao = 'DIU'",
+        'implanons': "R.houve_insercao = 'Sim' AND R.tipo_insercao = 'Implanon'",
+        'insercoes': "R.houve_insercao = 'Sim'",
+        'intercorrencias': "R.nova_intercorrencia = 'Sim'",
+    }),
+    'dados_ginecologicos_obstetricos': ('R.created_at', 'paciente_id', {
+        'usgs': "R.realizou_usg = 'Sim'",
+    }),
+}
+COLUNAS_RESUMO_AMBULATORIAL = [
+    coluna for _, _, colunas in RESUMO_AMBULATORIAL.values() for coluna in colunas
+]
+
+def _dia_resumo(data):
+    return f"COALESCE(substr({data}, 1, 10), '')"
+
+def _condicoes_resumo(paciente, colunas):
+    """Condições de cada coluna, só para linhas cuja paciente existe."""
+    if paciente is None:
+        return colunas
+    existe = f'R.{paciente} IN (SELECT id FROM pacientes_ambulatorial)'
+    return {coluna: f'({condicao}) AND {existe}' for coluna, condicao in colunas.items()}
+
+def _valores_resumo(colunas):
+    """Expressão de cada coluna do resumo para uma linha (0 nas de outra origem)."""
+    return [
+        f'CASE WHEN {colunas[coluna]} THEN 1 ELSE 0 END' if coluna in colunas else '0'
+        for coluna in COLUNAS_RESUMO_AMBULATORIAL
+    ]
 
-    if 'telefone' not in colunas_existentes:
-        print("Adicionando coluna 'telefone' à tabela usuarios...")
-        cursor.execute("ALTER TABLE usuarios ADD COLUMN telefone TEXT")
-        conn.commit()
-        print("Coluna 'telefone' adicionada com sucesso")
+def _somar_resumo(selecao, colunas):
+    """Upsert em ambulatorial_diario das linhas (dia, colunas...) de `selecao`."""
+    soma = ', '.join(f'{coluna} = {coluna} + excluded.{coluna}' for coluna in colunas)
+    return (
+        f"INSERT INTO ambulatorial_diario (dia, {', '.join(COLUNAS_RESUMO_AMBULATORIAL)}) "
+        f'{selecao} ON CONFLICT(dia) DO UPDATE SET {soma}'
+    )
+
+def _apagar_dias_zerados(dias):
+    zerada = ' AND '.join(f'{coluna} = 0' for coluna in COLUNAS_RESUMO_AMBULATORIAL)
+    return f'DELETE FROM ambulatorial_diario WHERE dia IN ({dias}) AND {zerada}'
+
+def _comandos_resumo(data, colunas, linha, sinal):
+    dia = _sobre_linha(_dia_resumo(data), linha)
+    valores = [_sobre_linha(valor, linha) for valor in _valores_resumo(colunas)]
+    # Linhas que não contam em nenhuma coluna não criam o dia no resumo
+    conta = ' OR '.join(f'({_sobre_linha(condicao, linha)})' for condicao in colunas.values())
+    comandos = [_somar_resumo(f"SELECT {dia}, {', '.join(sinal + valor for valor in valores)} WHERE {conta}", colunas)]
+    if sinal == '-':
+        comandos.append(_apagar_dias_zerados(dia))
+    return comandos
+
+def _comandos_resumo_paciente(origem, data, paciente, colunas, linha, sinal):
+    """SQL que soma ou retira do resumo as linhas de `origem` da paciente NEW/OLD."""
+    somas = ', '.join(
+        f'{sinal}SUM({valor}) AS {coluna}'
+        for valor, coluna in zip(_valores_resumo(colunas), COLUNAS_RESUMO_AMBULATORIAL)
+    )
+    conta = ' OR '.join(f'({condicao})' for condicao in colunas.values())
+    linhas = f'FROM {origem} R WHERE R.{paciente} = {linha}.id'
+    comandos = [_somar_resumo(
+        f'SELECT * FROM (SELECT {_dia_resumo(data)} AS dia, {somas} {linhas} AND ({conta}) GROUP BY 1) WHERE 1',
+        colunas,
+    )]
+    if sinal == '-':
+        comandos.append(_apagar_dias_zerados(f'SELECT {_dia_resumo(data)} {linhas}'))
+    return comandos
+
+def criar_triggers_resumo_ambulatorial(cursor):
+    for origem, (data, paciente, colunas) in RESUMO_AMBULATORIAL.items():
+        condicoes = _condicoes_resumo(paciente, colunas)
+        usadas = sorted(set(re.findall(r'\bR\.(\w+)', ' '.join([data, *condicoes.values()]))))
+        eventos = [
+            ('insert', 'INSERT', [('NEW', '')]),
+            ('delete', 'DELETE', [('OLD', '-')]),
+            ('update', f"UPDATE OF {', '.join(usadas)}", [('OLD', '-'), ('NEW', '')]),
+        ]
+        for sufixo, evento, passos in eventos:
+            comandos = [
+                comando
+                for linha, sinal in passos
+                for comando in _comandos_resumo(data, condicoes, linha, sinal)
+            ]
+            cursor.execute(f'DROP TRIGGER IF EXISTS resumo_{origem}_{sufixo}')
+            cursor.execute(
+                f'CREATE TRIGGER resumo_{origem}_{sufixo} AFTER {evento} ON {origem}\n'
+                f'BEGIN\n' + ''.join(f'    {comando};\n' for comando in comandos) + 'END'
+            )
 
-    if 'status' not in colunas_existentes:
-        print("Adicionando coluna 'status' à tabela usuarios...")
-        cursor.execute("ALTER TABLE usuarios ADD COLUMN status TEXT DEFAULT 'ativo'")
-        conn.commit()
-        print("Coluna 'status' adicionada com sucesso")
+        if paciente is None:
+            continue
+        # Linhas já gravadas passam a contar (ou deixam de contar) junto com a paciente
+        eventos = [
+            ('insert', 'INSERT', [('NEW', '')]),
+            ('delete', 'DELETE', [('OLD', '-')]),
+            ('update', 'UPDATE OF id', [('OLD', '-'), ('NEW', '')]),
+        ]
+        for sufixo, evento, passos in eventos:
+            comandos = [
+                comando
+                for linha, sinal in passos
+                for comando in _comandos_resumo_paciente(origem, data, paciente, colunas, linha, sinal)
+            ]
+            cursor.execute(f'DROP TRIGGER IF EXISTS resumo_{origem}_paciente_{sufixo}')
+            cursor.execute(
+                f'CREATE TRIGGER resumo_{origem}_paciente_{sufixo} AFTER {evento} ON pacientes_ambulatorial\n'
+                f'BEGIN\n' + ''.join(f'    {comando};\n' for comando in comandos) + 'END'
+            )
 
-    if 'primeiro_acesso' not in colunas_existentes:
-        print("Adicionando coluna 'primeiro_acesso' à tabela usuarios...")
-        cursor.execute("ALTER TABLE usuarios ADD COLUMN primeiro_acesso INTEGER DEFAULT 1")
-        conn.commit()
-        print("Coluna 'primeiro_acesso' adicionada com sucesso")
+def _select_resumo_ambulatorial():
+    partes = [
+        f"SELECT {_dia_resumo(data)} AS dia, "
+        + ', '.join(
+            f'{valor} AS {coluna}'
+            for valor, coluna in zip(_valores_resumo(_condicoes_resumo(paciente, colunas)), COLUNAS_RESUMO_AMBULATORIAL)
+        )
+        + f' FROM {origem} R'
+        for origem, (data, paciente, colunas) in RESUMO_AMBULATORIAL.items()
+    ]
+    somas = ', '.join(f'SUM({coluna}) AS {coluna}' for coluna in COLUNAS_RESUMO_AMBULATORIAL)
+    return f'SELECT dia, {somas} FROM ({" UNION ALL ".join(partes)}) GROUP BY dia'
+
+def verificar_resumo_ambulatorial(cursor):
+    """Compara ambulatorial_diario com um recálculo completo.
+
+    Retorna a lista de divergências (dia, gravado, esperado).
+    """
+    cursor.execute(_select_resumo_ambulatorial())
+    esperado = {row[0]: tuple(row[1:]) for row in cursor.fetchall() if any(row[1:])}
+    cursor.execute(f"SELECT dia, {', '.join(COLUNAS_RESUMO_AMBULATORIAL)} FROM ambulatorial_diario")
+    gravado = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    return [
+        (('ambulatorial_diario', dia), gravado.get(dia), esperado.get(dia))
+        for dia in sorted(set(esperado) | set(gravado))
+        if gravado.get(dia) != esperado.get(dia)
+    ]
 
-    if 'criado_por' not in colunas_existentes:
-        print("Adicionando coluna 'criado_por' à tabela usuarios...")
-        cursor.execute("ALTER TABLE usuarios ADD COLUMN criado_por INTEGER")
-        conn.commit()
-        print("Coluna 'criado_por' adicionada com sucesso")
+def reconstruir_resumo_ambulatorial(cursor):
+    cursor.execute('DELETE FROM ambulatorial_diario')
+    cursor.execute(
+        f"INSERT INTO ambulatorial_diario (dia, {', '.join(COLUNAS_RESUMO_AMBULATORIAL)}) "
+        f"SELECT * FROM ({_select_resumo_ambulatorial()}) "
+        f"WHERE {' OR '.join(f'{coluna} != 0' for coluna in COLUNAS_RESUMO_AMBULATORIAL)}"
+    )
 
-    if 'updated_at' not in colunas_existentes:
-        print("Adicionando coluna 'updated_at' à tabela usuarios...")
-        cursor.execute("ALTER TABLE usuarios ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-        conn.commit()
-        print("Coluna 'updated_at' adicionada com sucesso")
+def migracao_resumo_ambulatorial(cursor):
+    colunas = ''.join(f',\n            {coluna} INTEGER NOT NULL DEFAULT 0' for coluna in COLUNAS_RESUMO_AMBULATORIAL)
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS ambulatorial_diario (
+            dia TEXT PRIMARY KEY{colunas}
+        )
+    ''')
+    criar_triggers_geracao(cursor, ['ambulatorial_diario'])
+    criar_triggers_resumo_ambulatorial(cursor)
+    reconstruir_resumo_ambulatorial(cursor)
+
+# Indicadores de inserção de cada paciente do ambulatório, em colunas de
+# pacientes_ambulatorial. Cada escrita em consultas_ambulatorial recalcula, por
+# trigger, só as pacientes da linha (uma leitura no índice por paciente_id), e
+# cada filtro de pacientes_ambulatorial_filtrados tem um índice parcial.
+INDICADORES_PACIENTE_AMBULATORIAL = [
+    ('tem_diu', "COALESCE(MAX(houve_insercao = 'Sim' AND tipo_insercao = 'DIU'), 0)", 'INTEGER NOT NULL DEFAULT 0'),
+    ('tem_implanon', "COALESCE(MAX(houve_insercao = 'Sim' AND tipo_insercao = 'Implanon'), 0)",
+     'INTEGER NOT NULL DEFAULT 0'),
+    ('tem_insercao', "COALESCE(MAX(houve_insercao = 'Sim'), 0)", 'INTEGER NOT NULL DEFAULT 0'),
+    ('ultima_consulta', 'MAX(data_consulta)', 'TEXT'),
+]
+FILTROS_PACIENTES_AMBULATORIAL = {
+    'com_diu': 'tem_diu = 1',
+    'com_implanon': 'tem_implanon = 1',
+    'sem_insercao': 'tem_insercao = 0',
+}
+
+def _recalcular_indicadores_paciente(pacientes=None):
+    colunas = ', '.join(coluna for coluna, _, _ in INDICADORES_PACIENTE_AMBULATORIAL)
+    valores = ', '.join(expressao for _, expressao, _ in INDICADORES_PACIENTE_AMBULATORIAL)
+    onde = f' WHERE id IN ({pacientes})' if pacientes else ''
+    return (
+        f'UPDATE pacientes_ambulatorial SET ({colunas}) = '
+        f'(SELECT {valores} FROM consultas_ambulatorial WHERE paciente_id = pacientes_ambulatorial.id)'
+        f'{onde}'
+    )
+
+def criar_triggers_indicadores_paciente(cursor):
+    colunas = sorted(set(re.findall(
+        r'\b(houve_insercao|tipo_insercao|data_consulta)\b',
+        ' '.join(expressao for _, expressao, _ in INDICADORES_PACIENTE_AMBULATORIAL)
+    )))
+    eventos = [
+        ('insert', 'INSERT', 'NEW.paciente_id'),
+        ('delete', 'DELETE', 'OLD.paciente_id'),
+        # Consulta movida de paciente afeta a antiga e a nova
+        ('update', f"UPDATE OF paciente_id, {', '.join(colunas)}", 'OLD.paciente_id, NEW.paciente_id'),
+    ]
+    for sufixo, evento, pacientes in eventos:
+        cursor.execute(f'DROP TRIGGER IF EXISTS indicadores_paciente_ambulatorial_{sufixo}')
+        cursor.execute(
+            f'CREATE TRIGGER indicadores_paciente_ambulatorial_{sufixo} AFTER {evento} ON consultas_ambulatorial\n'
+            f'BEGIN\n    {_recalcular_indicadores_paciente(pacientes)};\nEND'
+        )
 
-    # Criar índices para melhor performance (após garantir que as colunas existem)
-    try:
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_email ON usuarios(email)')
-    except sqlite3.OperationalError as e:
-        print(f"Aviso ao criar índice idx_usuarios_email: {e}")
+    # Consultas já gravadas passam a contar para a paciente cadastrada (ou
+    # renumerada) depois delas
+    eventos = [
+        ('insert', 'INSERT'),
+        ('update', 'UPDATE OF id'),
+    ]
+    for sufixo, evento in eventos:
+        cursor.execute(f'DROP TRIGGER IF EXISTS indicadores_paciente_ambulatorial_paciente_{sufixo}')
+        cursor.execute(
+            f'CREATE TRIGGER indicadores_paciente_ambulatorial_paciente_{sufixo} AFTER {evento} ON pacientes_ambulatorial\n'
+            f"BEGIN\n    {_recalcular_indicadores_paciente('NEW.id')};\nEND"
+        )
 
-    try:
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_cpf ON usuarios(cpf)')
-    except sqlite3.OperationalError as e:
-        print(f"Aviso ao criar índice idx_usuarios_cpf: {e}")
+def verificar_indicadores_paciente(cursor):
+    """Compara os indicadores gravados em pacientes_ambulatorial com um recálculo.
+
+    Retorna a lista de divergências (paciente, gravado, esperado).
+    """
+    colunas = [coluna for coluna, _, _ in INDICADORES_PACIENTE_AMBULATORIAL]
+    valores = ', '.join(expressao for _, expressao, _ in INDICADORES_PACIENTE_AMBULATORIAL)
+    cursor.execute(f"SELECT id, {', '.join(colunas)} FROM pacientes_ambulatorial")
+    gravado = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    # Um agregado sem GROUP BY por paciente, como nos triggers: paciente sem
+    # consultas também tem uma linha (indicadores zerados)
+    esperado = {}
+    for paciente in gravado:
+        cursor.execute(f'SELECT {valores} FROM consultas_ambulatorial WHERE paciente_id = ?', (paciente,))
+        esperado[paciente] = tuple(cursor.fetchone())
+    return [
+        (('pacientes_ambulatorial', paciente), gravado[paciente], esperado[paciente])
+        for paciente in sorted(gravado)
+        if gravado[paciente] != esperado[paciente]
+    ]
 
-    try:
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_usuarios_cargo ON usuarios(cargo)')
-    except sqlite3.OperationalError as e:
-        print(f"Aviso ao criar índice idx_usuarios_cargo: {e}")
+def reconstruir_indicadores_paciente(cursor):
+    cursor.execute(_recalcular_indicadores_paciente())
+
+def migracao_indicadores_paciente_ambulatorial(cursor):
+    adicionar_colunas(cursor, 'pacientes_ambulatorial', [
+        (coluna, tipo) for coluna, _, tipo in INDICADORES_PACIENTE_AMBULATORIAL
+    ])
+    criar_triggers_indicadores_paciente(cursor)
+    reconstruir_indicadores_paciente(cursor)
+    for filtro, condicao in FILTROS_PACIENTES_AMBULATORIAL.items():
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS idx_pacientes_ambulatorial_{filtro} '
+            f'ON pacientes_ambulatorial(created_at) WHERE {condicao}'
+        )
+    cursor.execute('ANALYZE pacientes_ambulatorial')
+
+# Dia da solicitação (AAAA-MM-DD, '' se a data for inválida), calculado a partir
+# de data_solicitacao (até a migração 17, por trigger; depois, coluna gerada
+# DIA_SOLICITACAO). A listagem filtra e ordena por ele, comparando a coluna
+# direto com as datas, e cada combinação de filtros tem um índice terminado nele.
+INDICES_SOLICITACOES = [
+    ('idx_solicitacoes_dia', 'dia_solicitacao'),
+    ('idx_solicitacoes_status_dia', 'status, dia_solicitacao'),
+    ('idx_solicitacoes_status_tipo_dia', 'status, tipo_insumo, dia_solicitacao'),
+    ('idx_solicitacoes_tipo_dia', 'tipo_insumo, dia_solicitacao'),
+    ('idx_solicitacoes_municipio_dia', 'municipio_id, dia_solicitacao'),
+]
+
+def criar_triggers_dia_solicitacao(cursor):
+    eventos = [
+        ('insert', 'INSERT'),
+        ('update', 'UPDATE OF data_solicitacao'),
+    ]
+    for sufixo, evento in eventos:
+        cursor.execute(f'DROP TRIGGER IF EXISTS dia_solicitacao_{sufixo}')
+        cursor.execute(f'''
+            CREATE TRIGGER dia_solicitacao_{sufixo} AFTER {evento} ON solicitacoes_insumos
+            BEGIN
+                UPDATE solicitacoes_insumos SET dia_solicitacao = COALESCE(date(NEW.data_solicitacao), '')
+                WHERE id = NEW.id;
+            END
+        ''')
 
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_usuario_id ON logs_auditoria(usuario_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_created_at ON logs_auditoria(created_at)')
+def migracao_dia_solicitacao(cursor):
+    adicionar_colunas(cursor, 'solicitacoes_insumos', [('dia_solicitacao', 'TEXT')])
+    cursor.execute("UPDATE solicitacoes_insumos SET dia_solicitacao = COALESCE(date(data_solicitacao), '')")
+    criar_triggers_dia_solicitacao(cursor)
+    # Os índices antigos em data_solicitacao só atendiam a listagem
+    for nome in ('idx_solicitacoes_data', 'idx_solicitacoes_municipio', 'idx_solicitacoes_status'):
+        cursor.execute(f'DROP INDEX IF EXISTS {nome}')
+    for nome, colunas in INDICES_SOLICITACOES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON solicitacoes_insumos({colunas})')
+    cursor.execute('ANALYZE solicitacoes_insumos')
+
+DIA_SOLICITACAO = "COALESCE(date(data_solicitacao), '')"
+
+def migracao_dia_solicitacao_gerada(cursor):
+    # O trigger regravava a linha recém-escrita (e disparava de novo os demais
+    # triggers da tabela); a coluna gerada VIRTUAL é calculada na leitura e
+    # gravada só nos índices. DROP COLUMN exige que nenhum índice ou trigger
+    # use a coluna.
+    for sufixo in ('insert', 'update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS dia_solicitacao_{sufixo}')
+    for nome, _ in INDICES_SOLICITACOES:
+        cursor.execute(f'DROP INDEX IF EXISTS {nome}')
+    cursor.execute('ALTER TABLE solicitacoes_insumos DROP COLUMN dia_solicitacao')
+    cursor.execute(
+        'ALTER TABLE solicitacoes_insumos ADD COLUMN dia_solicitacao TEXT '
+        f'GENERATED ALWAYS AS ({DIA_SOLICITACAO}) VIRTUAL'
+    )
+    for nome, colunas in INDICES_SOLICITACOES:
+        cursor.execute(f'CREATE INDEX {nome} ON solicitacoes_insumos({colunas})')
+    cursor.execute('ANALYZE solicitacoes_insumos')
+
+# Estoque de insumos por município. movimentacoes_insumos é o livro de
+# movimentações, só de inserção (UPDATE e DELETE são recusados por trigger);
+# correções entram como novas movimentações. saldos_insumos guarda os totais de
+# cada (município, insumo), somados por trigger na mesma transação de cada
+# movimentação, então o saldo é uma busca pela chave.
+MOVIMENTACOES_INSUMOS = {
+    # tipo da movimentação: coluna somada em saldos_insumos
+    'autorizado': 'autorizado',
+    'entregue': 'entregue',
+    'consumido': 'consumido',
+    'ajuste': 'ajustes',
+}
+COLUNAS_SALDO_INSUMOS = list(MOVIMENTACOES_INSUMOS.values())
+# Estoque no município e o que ainda falta entregar do que foi autorizado
+SALDO_INSUMOS_CALCULADOS = {
+    'estoque': 'entregue - consumido + ajustes',
+    'a_entregar': 'autorizado - entregue',
+}
+
+def criar_triggers_estoque_insumos(cursor):
+    for evento in ('UPDATE', 'DELETE'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS movimentacoes_insumos_sem_{evento.lower()}')
+        cursor.execute(f'''
+            CREATE TRIGGER movimentacoes_insumos_sem_{evento.lower()} BEFORE {evento} ON movimentacoes_insumos
+            BEGIN
+                SELECT RAISE(ABORT, 'Movimentações de estoque não podem ser alteradas nem excluídas');
+            END
+        ''')
+    valores = ', '.join(
+        f"CASE WHEN NEW.tipo = '{tipo}' THEN NEW.quantidade ELSE 0 END"
+        for tipo in MOVIMENTACOES_INSUMOS
+    )
+    soma = ', '.join(f'{coluna} = {coluna} + excluded.{coluna}' for coluna in COLUNAS_SALDO_INSUMOS)
+    cursor.execute('DROP TRIGGER IF EXISTS saldos_insumos_insert')
+    cursor.execute(f'''
+        CREATE TRIGGER saldos_insumos_insert AFTER INSERT ON movimentacoes_insumos
+        BEGIN
+            INSERT INTO saldos_insumos (municipio_id, tipo_insumo, {', '.join(COLUNAS_SALDO_INSUMOS)}, atualizado_em)
+            VALUES (NEW.municipio_id, NEW.tipo_insumo, {valores}, NEW.created_at)
+            ON CONFLICT(municipio_id, tipo_insumo) DO UPDATE SET {soma}, atualizado_em = excluded.atualizado_em;
+        END
+    ''')
 
-    # Criar usuário administrador padrão se não existir
-    cursor.execute("SELECT COUNT(*) as count FROM usuarios WHERE cpf = '12345678909'")
-    if cursor.fetchone()['count'] == 0:
-        # CPF: 123.456.789-09 | Senha: Admin@123
-        senha_hash = hashlib.sha256('Admin@123'.encode()).hexdigest()
-        cursor.execute('''
-            INSERT INTO usuarios (nome_completo, email, senha_hash, cpf, telefone, cargo, status, primeiro_acesso)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', ('Administrador do Sistema', 'admin@decidiu.com', senha_hash, '12345678909', '(82) 99999-9999', 'Administrador', 'ativo', 1))
-        print("Usuário administrador padrão criado com sucesso - CPF: 123.456.789-09")
+def _select_saldos_insumos():
+    somas = ', '.join(
+        f"SUM(CASE WHEN tipo = '{tipo}' THEN quantidade ELSE 0 END) AS {coluna}"
+        for tipo, coluna in MOVIMENTACOES_INSUMOS.items()
+    )
+    return (
+        f'SELECT municipio_id, tipo_insumo, {somas}, MAX(created_at) AS atualizado_em '
+        f'FROM movimentacoes_insumos GROUP BY municipio_id, tipo_insumo'
+    )
+
+def verificar_saldos_insumos(cursor):
+    """Compara saldos_insumos com a soma do livro de movimentações.
+
+    Retorna a lista de divergências ((município, insumo), gravado, esperado).
+    """
+    colunas = ', '.join(COLUNAS_SALDO_INSUMOS)
+    cursor.execute(f'SELECT municipio_id, tipo_insumo, {colunas} FROM ({_select_saldos_insumos()})')
+    esperado = {(row[0], row[1]): tuple(row[2:]) for row in cursor.fetchall()}
+    cursor.execute(f'SELECT municipio_id, tipo_insumo, {colunas} FROM saldos_insumos')
+    gravado = {(row[0], row[1]): tuple(row[2:]) for row in cursor.fetchall()}
+    return [
+        (('saldos_insumos', *chave), gravado.get(chave), esperado.get(chave))
+        for chave in sorted(set(esperado) | set(gravado))
+        if gravado.get(chave) != esperado.get(chave)
+    ]
 
-    conn.commit()
-    conn.close()
+def reconstruir_saldos_insumos(cursor):
+    cursor.execute('DELETE FROM saldos_insumos')
+    cursor.execute(
+        f"INSERT INTO saldos_insumos (municipio_id, tipo_insumo, {', '.join(COLUNAS_SALDO_INSUMOS)}, atualizado_em) "
+        f'{_select_saldos_insumos()}'
+    )
+
+def migracao_estoque_insumos(cursor):
+    tipos = ', '.join(f"'{tipo}'" for tipo in MOVIMENTACOES_INSUMOS)
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS movimentacoes_insumos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            municipio_id INTEGER NOT NULL,
+            tipo_insumo TEXT NOT NULL,
+            tipo TEXT NOT NULL CHECK (tipo IN ({tipos})),
+            quantidade INTEGER NOT NULL,
+            solicitacao_id INTEGER,
+            observacao TEXT,
+            registrado_por TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (municipio_id) REFERENCES municipios(id),
+            FOREIGN KEY (solicitacao_id) REFERENCES solicitacoes_insumos(id)
+        )
+    ''')
+    colunas = ''.join(f',\n            {coluna} INTEGER NOT NULL DEFAULT 0' for coluna in COLUNAS_SALDO_INSUMOS)
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS saldos_insumos (
+            municipio_id INTEGER NOT NULL,
+            tipo_insumo TEXT NOT NULL{colunas},
+            atualizado_em TIMESTAMP,
+            PRIMARY KEY (municipio_id, tipo_insumo)
+        )
+    ''')
+    for nome, colunas in [
+        ('idx_movimentacoes_created_at', 'created_at'),
+        ('idx_movimentacoes_municipio', 'municipio_id, created_at'),
+        ('idx_movimentacoes_municipio_tipo', 'municipio_id, tipo_insumo, created_at'),
+        ('idx_movimentacoes_tipo_insumo', 'tipo_insumo, created_at'),
+        ('idx_movimentacoes_solicitacao', 'solicitacao_id, tipo'),
+    ]:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {nome} ON movimentacoes_insumos({colunas})')
+    criar_triggers_geracao(cursor, ['movimentacoes_insumos', 'saldos_insumos'])
+    criar_triggers_estoque_insumos(cursor)
+    # Solicitações já autorizadas abrem o livro
+    cursor.execute('''
+        INSERT INTO movimentacoes_insumos
+            (municipio_id, tipo_insumo, tipo, quantidade, solicitacao_id, registrado_por, created_at)
+        SELECT municipio_id, tipo_insumo, 'autorizado', quantidade_autorizada, id, respondido_por,
+            COALESCE(data_resposta, data_solicitacao)
+        FROM solicitacoes_insumos
+        WHERE status = 'Autorizado' AND quantidade_autorizada != 0
+        ORDER BY id
+    ''')
+
+def migracao_resumo_ambulatorial_paciente(cursor):
+    # O resumo passa a contar consultas e dados ginecológicos só de pacientes
+    # existentes (ver RESUMO_AMBULATORIAL)
+    criar_triggers_resumo_ambulatorial(cursor)
+    reconstruir_resumo_ambulatorial(cursor)
+
+def migracao_indicadores_paciente_cadastro(cursor):
+    # Os indicadores passam a ser recalculados também quando a paciente é
+    # cadastrada ou renumerada depois das suas consultas
+    criar_triggers_indicadores_paciente(cursor)
+    reconstruir_indicadores_paciente(cursor)
+
+def migracao_geracoes_tabelas_lidas(cursor):
+    # A migração 7 pôs triggers de geração em todas as tabelas; nas que
+    # nenhuma rota declara (logs_auditoria, sessoes, pacientes_distintos...)
+    # cada escrita pagava um UPDATE em geracoes_escrita à toa
+    cursor.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'trigger' AND name GLOB 'geracao_*'")
+    for nome, tabela in cursor.fetchall():
+        if tabela not in TABELAS_GERACAO:
+            cursor.execute(f'DROP TRIGGER {nome}')
+    marcadores = ', '.join('?' for _ in TABELAS_GERACAO)
+    cursor.execute(f'DELETE FROM geracoes_escrita WHERE tabela NOT IN ({marcadores})', sorted(TABELAS_GERACAO))
+    criar_triggers_geracao(cursor, sorted(TABELAS_GERACAO))
+
+def migracao_datas_movimentacoes_insumos(cursor):
+    # A abertura do livro (migração 14) copiou data_resposta, gravada com
+    # isoformat() ("2024-03-10T08:00:00.123456"), e as demais movimentações têm
+    # o CURRENT_TIMESTAMP ("2024-03-10 08:00:00"): a ordem e os filtros por
+    # created_at misturavam os dois formatos. O livro recusa UPDATE, então o
+    # trigger sai durante a correção e volta em seguida.
+    cursor.execute('DROP TRIGGER IF EXISTS movimentacoes_insumos_sem_update')
+    cursor.execute('''
+        UPDATE movimentacoes_insumos SET created_at = datetime(created_at)
+        WHERE datetime(created_at) IS NOT NULL AND created_at != datetime(created_at)
+    ''')
+    criar_triggers_estoque_insumos(cursor)
+    reconstruir_saldos_insumos(cursor)
+
+# Migrações do esquema, em ordem. A posição na lista (a partir de 1) é o número
+# da versão gravado em PRAGMA user_version. Para alterar o esquema, acrescente
+# uma nova função ao final - nunca edite nem reordene uma migração já publicada.
+MIGRACOES = [
+    migracao_esquema_inicial,
+    migracao_indices,
+    migracao_arquivos_externos,
+    migracao_agregados,
+    migracao_estatisticas_municipios,
+    migracao_indices_agregacao,
+    migracao_geracoes_escrita,
+    migracao_sessoes,
+    migracao_indices_auditoria,
+    migracao_busca_textual,
+    migracao_resumo_ambulatorial,
+    migracao_indicadores_paciente_ambulatorial,
+    migracao_dia_solicitacao,
+    migracao_estoque_insumos,
+    migracao_resumo_ambulatorial_paciente,
+    migracao_indicadores_paciente_cadastro,
+    migracao_dia_solicitacao_gerada,
+    migracao_geracoes_tabelas_lidas,
+    migracao_datas_movimentacoes_insumos,
+]
+
+def versao_esquema(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def init_db():
+    conn = get_db()
+    versao_final = len(MIGRACOES)
+
+    # Banco já atualizado: a inicialização é uma única leitura do cabeçalho
+    if versao_esquema(conn) >= versao_final:
+        conn.close()
+        return
+
+    cursor = conn.cursor()
+    try:
+        for numero in range(versao_esquema(conn) + 1, versao_final + 1):
+            # BEGIN IMMEDIATE serializa os workers que sobem ao mesmo tempo;
+            # quem chegar depois encontra a versão já aplicada e segue adiante
+            cursor.execute('BEGIN IMMEDIATE')
+            if versao_esquema(conn) >= numero:
+                conn.rollback()
+                continue
+            print(f"Aplicando migração {numero}: {MIGRACOES[numero - 1].__name__}")
+            MIGRACOES[numero - 1](cursor)
+            cursor.execute(f'PRAGMA user_version = {numero}')
+            conn.commit()
+            # VACUUM não roda dentro de transação, por isso fica para depois
+            if getattr(MIGRACOES[numero - 1], 'compactar', False):
+                cursor.execute('VACUUM')
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+_esquemas_verificados = set()
+
+@app.before_request
+def verificar_esquema():
+    # Sob o gunicorn o bloco __main__ não roda; cada worker confere a versão
+    # do esquema uma vez, na primeira requisição
+    if DB_PATH not in _esquemas_verificados:
+        init_db()
+        _esquemas_verificados.add(DB_PATH)
 
 @app.route("/")
 def home():
     return {"status": "API online"}
 
 @app.route('/api/pacientes', methods=['GET', 'POST'])
+@versionada('pacientes')
 def pacientes():
     if request.method == 'GET':
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM pacientes ORDER BY created_at DESC')
-        rows = cursor.fetchall()
+        resposta = lista_paginada(cursor, 'pacientes', 'created_at')
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return resposta
 
     elif request.method == 'POST':
         conn = get_db()
@@ -1000,12 +3256,16 @@ def paciente_detail(id):
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM pacientes WHERE id = ?', (id,))
-        row = cursor.fetchone()
+        try:
+            campos = campos_pedidos(cursor, 'pacientes')
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        paciente = ler_registro(cursor, 'pacientes', id, campos)
         conn.close()
 
-        if row:
-            return jsonify(dict(row))
+        if paciente:
+            return jsonify(projetar(paciente, campos))
         return jsonify({'error': 'Paciente não encontrado'}), 404
 
     elif request.method == 'PATCH':
@@ -1116,15 +3376,16 @@ def dados_ginecologicos(id):
         return jsonify({'message': 'Dados ginecológicos salvos com sucesso'})
 
 @app.route('/api/pacientes/<int:id>/consultas', methods=['GET', 'POST'])
+@versionada('consultas')
 def consultas_paciente(id):
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM consultas WHERE paciente_id = ? ORDER BY data_consulta DESC', (id,))
-        rows = cursor.fetchall()
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return resposta_lista(consulta_em_lotes(
+            'SELECT * FROM consultas WHERE paciente_id = ? ORDER BY data_consulta DESC', (id,)
+        ))
 
     elif request.method == 'POST':
         data = request.json
@@ -1163,126 +3424,56 @@ def finalizar_paciente(id):
 def health_check():
     return jsonify({'status': 'ok', 'message': 'Backend está funcionando'}), 200
 
-@app.route('/api/capacitacao/dashboard', methods=['GET'])
-def capacitacao_dashboard():
-    conn = get_db()
-    cursor = conn.cursor()
-
-    # Total de instrutoras - busca EXCLUSIVAMENTE da tabela de capacitação
-    cursor.execute("SELECT COUNT(*) as count FROM enfermeiras_instrutoras")
-    total_instrutoras = cursor.fetchone()['count']
-
-    # Total de alunas - busca EXCLUSIVAMENTE da tabela de capacitação
-    cursor.execute("SELECT COUNT(*) as count FROM enfermeiras_alunas")
-    total_alunas = cursor.fetchone()['count']
-
-    # Total de DIUs inseridos APENAS do módulo Capacitação
-    # Conta fichas com enfermeira_aluna_id (específico de capacitação)
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM fichas_atendimento_pdf
-        WHERE metodo_inserido = 'DIU'
-        AND enfermeira_aluna_id IS NOT NULL
-    """)
-    dius_fichas = cursor.fetchone()['count']
-
-    # Conta inserções vinculadas a alunas ou instrutoras de capacitação
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM insercoes_diu
-        WHERE (metodo_contraceptivo = 'DIU' OR tipo_diu != '')
-        AND (enfermeira_aluna_id IS NOT NULL OR enfermeira_instrutora_id IS NOT NULL)
-    """)
-    dius_insercoes = cursor.fetchone()['count']
-
-    # Conta atendimentos registrados com método escolhido = DIU
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM dados_ginecologicos_capacitacao
-        WHERE metodo_escolhido = 'DIU'
-        AND enfermeira_aluna_id IS NOT NULL
-    """)
-    dius_atendimentos = cursor.fetchone()['count']
-
-    total_dius = dius_fichas + dius_insercoes + dius_atendimentos
-
-    # Total de Implanons inseridos APENAS do módulo Capacitação
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM fichas_atendimento_pdf
-        WHERE metodo_inserido = 'Implanon'
-        AND enfermeira_aluna_id IS NOT NULL
-    """)
-    implanons_fichas = cursor.fetchone()['count']
-
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM insercoes_diu
-        WHERE metodo_contraceptivo = 'Implanon'
-        AND (enfermeira_aluna_id IS NOT NULL OR enfermeira_instrutora_id IS NOT NULL)
-    """)
-    implanons_insercoes = cursor.fetchone()['count']
+@app.route('/api/cache/estatisticas', methods=['GET'])
+def cache_estatisticas():
+    return jsonify(cache_respostas.estatisticas())
 
-    # Conta atendimentos registrados com método escolhido = Implanon
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM dados_ginecologicos_capacitacao
-        WHERE metodo_escolhido = 'Implanon'
-        AND enfermeira_aluna_id IS NOT NULL
-    """)
-    implanons_atendimentos = cursor.fetchone()['count']
+# Fontes de DIUs e Implanons do painel: fichas das alunas, inserções
+# vinculadas a alunas ou instrutoras e atendimentos com método escolhido
+INSERCOES_CAPACITACAO_DASHBOARD = ('fichas_atendimento_pdf', 'insercoes_diu', 'dados_ginecologicos_capacitacao')
 
-    total_implanons = implanons_fichas + implanons_insercoes + implanons_atendimentos
+def totais_capacitacao_dashboard(valores):
+    """Totais aditivos do painel a partir de contadores ou de agregar()."""
+    return {
+        'diu_inseridos': sum(valores.get(f'{origem}:DIU', 0) for origem in INSERCOES_CAPACITACAO_DASHBOARD),
+        'implanon_inseridos': sum(valores.get(f'{origem}:Implanon', 0) for origem in INSERCOES_CAPACITACAO_DASHBOARD),
+        'agendamentos': valores.get('agendamentos_municipios', 0),
+    }
 
-    # Total de pacientes com inserção APENAS do módulo Capacitação
-    # Conta apenas fichas vinculadas a enfermeiras alunas
-    cursor.execute("""
-        SELECT COUNT(DISTINCT cpf_paciente) as count
-        FROM fichas_atendimento_pdf
-        WHERE cpf_paciente IS NOT NULL
-        AND cpf_paciente != ''
-        AND enfermeira_aluna_id IS NOT NULL
-    """)
-    pacientes_fichas = cursor.fetchone()['count']
+@app.route('/api/capacitacao/dashboard', methods=['GET'])
+@em_cache('contadores', 'enfermeiras_alunas', 'fichas_por_aluna', 'agendamentos_municipios',
+          'fichas_atendimento_pdf', 'insercoes_diu', 'dados_ginecologicos_capacitacao')
+def capacitacao_dashboard():
+    try:
+        agrupar = dimensoes_pedidas()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    # Conta apenas inserções vinculadas a capacitação
-    cursor.execute("""
-        SELECT COUNT(DISTINCT paciente_id) as count
-        FROM insercoes_diu
-        WHERE paciente_id IS NOT NULL
-        AND (enfermeira_aluna_id IS NOT NULL OR enfermeira_instrutora_id IS NOT NULL)
-    """)
-    pacientes_insercoes = cursor.fetchone()['count']
+    conn = get_db()
+    cursor = conn.cursor()
 
-    # Conta pacientes que tiveram atendimentos registrados com método escolhido
-    cursor.execute("""
-        SELECT COUNT(DISTINCT paciente_id) as count
-        FROM dados_ginecologicos_capacitacao
-        WHERE metodo_escolhido IN ('DIU', 'Implanon')
-        AND enfermeira_aluna_id IS NOT NULL
-    """)
-    pacientes_atendimentos = cursor.fetchone()['count']
+    # Totais lidos dos contadores mantidos por triggers (ver AGREGADOS).
+    # Instrutoras e alunas vêm EXCLUSIVAMENTE das tabelas de capacitação
+    contadores = ler_contadores(cursor)
 
-    total_pacientes = pacientes_fichas + pacientes_insercoes + pacientes_atendimentos
+    total_instrutoras = contadores.get('enfermeiras_instrutoras', 0)
+    total_alunas = contadores.get('enfermeiras_alunas', 0)
 
-    # Total de agendamentos
-    cursor.execute('SELECT COUNT(*) as count FROM agendamentos_municipios')
-    total_agendamentos = cursor.fetchone()['count']
+    total_pacientes = (
+        contadores.get('pacientes:fichas_atendimento_pdf', 0)
+        + contadores.get('pacientes:insercoes_diu', 0)
+        + contadores.get('pacientes:dados_ginecologicos_capacitacao', 0)
+    )
 
     # Dados por município (profissionais capacitados e inserções)
     # Busca EXCLUSIVAMENTE da tabela enfermeiras_alunas do módulo Capacitação
     cursor.execute('''
         SELECT
             ea.municipio,
-            COUNT(DISTINCT CASE WHEN ficha_count >= 20 THEN ea.id END) as profissionais_capacitados,
-            SUM(COALESCE(ficha_count, 0)) as total_insercoes
+            COUNT(DISTINCT CASE WHEN fichas.total >= 20 THEN ea.id END) as profissionais_capacitados,
+            SUM(COALESCE(fichas.total, 0)) as total_insercoes
         FROM enfermeiras_alunas ea
-        LEFT JOIN (
-            SELECT enfermeira_aluna_id, COUNT(*) as ficha_count
-            FROM fichas_atendimento_pdf
-            WHERE enfermeira_aluna_id IS NOT NULL
-            GROUP BY enfermeira_aluna_id
-        ) fichas ON ea.id = fichas.enfermeira_aluna_id
+        LEFT JOIN fichas_por_aluna fichas ON ea.id = fichas.enfermeira_aluna_id
         WHERE ea.municipio IS NOT NULL AND ea.municipio != ''
         GROUP BY ea.municipio
         HAVING total_insercoes > 0
@@ -1294,21 +3485,39 @@ def capacitacao_dashboard():
             'nome': row['municipio'],
             'profissionais_capacitados': row['profissionais_capacitados'],
             'insercoes': row['total_insercoes']
-        })
-
-    conn.close()
+        })
 
-    return jsonify({
+    resposta = {
         'instrutores': total_instrutoras,
         'alunos': total_alunas,
-        'diu_inseridos': total_dius,
-        'implanon_inseridos': total_implanons,
+        **totais_capacitacao_dashboard(contadores),
         'pacientes_com_insercao': total_pacientes,
-        'agendamentos': total_agendamentos,
         'municipios': municipios
-    })
+    }
+
+    # Detalhamento opcional (?agrupar=municipio,mes), numa passada por tabela
+    if agrupar:
+        agregado = agregar_fontes(cursor, ('agendamentos_municipios',) + INSERCOES_CAPACITACAO_DASHBOARD, agrupar)
+        if 'municipio' in agrupar:
+            resposta['por_municipio'] = detalhamento(agregado, 'municipio', totais_capacitacao_dashboard)
+        if 'mes' in agrupar:
+            resposta['por_mes'] = detalhamento(agregado, 'mes', totais_capacitacao_dashboard)
+
+    conn.close()
+
+    return jsonify(resposta)
+
+# Chave de /api/capacitacao/mapa/dados no formato que o mapa já usa:
+# minúsculas, hífen no lugar de espaço, sem os acentos do português e com o
+# apóstrofo ("olho-d'agua-das-flores"). registro_municipios().buscar() também a
+# reconhece.
+_ACENTOS_CHAVE_MAPA = str.maketrans('áéíóúâêôãõç', 'aeiouaeoaoc')
+
+def chave_mapa_municipio(nome):
+    return nome.lower().replace(' ', '-').translate(_ACENTOS_CHAVE_MAPA)
 
 @app.route('/api/capacitacao/mapa/dados', methods=['GET'])
+@versionada('enfermeiras_alunas', 'fichas_atendimento_pdf')
 def mapa_capacitacao_dados():
     conn = get_db()
     cursor = conn.cursor()
@@ -1329,14 +3538,7 @@ def mapa_capacitacao_dados():
 
     dados_municipios = {}
     for row in cursor.fetchall():
-        municipio_nome = row['municipio'].lower().replace(' ', '-')
-        # Remove acentos para normalizar
-        municipio_nome = municipio_nome.replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u')
-        municipio_nome = municipio_nome.replace('â', 'a').replace('ê', 'e').replace('ô', 'o')
-        municipio_nome = municipio_nome.replace('ã', 'a').replace('õ', 'o')
-        municipio_nome = municipio_nome.replace('ç', 'c')
-
-        dados_municipios[municipio_nome] = {
+        dados_municipios[chave_mapa_municipio(row['municipio'])] = {
             'nome': row['municipio'],
             'profissionais_capacitados': row['profissionais_capacitados'],
             'insercoes_realizadas': row['insercoes_realizadas']
@@ -1346,11 +3548,9 @@ def mapa_capacitacao_dados():
     return jsonify(dados_municipios)
 
 @app.route('/api/capacitacao/mapa-municipios', methods=['GET'])
+@versionada('enfermeiras_alunas', 'fichas_atendimento_pdf')
 def mapa_municipios():
-    conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute('''
+    return resposta_lista(consulta_em_lotes('''
         SELECT
             ea.municipio,
             COUNT(DISTINCT ea.id) as profissionais_capacitados,
@@ -1360,236 +3560,128 @@ def mapa_municipios():
         WHERE ea.municipio IS NOT NULL AND ea.municipio != ''
         GROUP BY ea.municipio
         HAVING COUNT(fap.id) >= 20
-    ''')
-
-    municipios = []
-    for row in cursor.fetchall():
-        municipios.append({
-            'municipio': row['municipio'],
-            'capacitados': row['profissionais_capacitados'],
-            'insercoes': row['insercoes_realizadas']
-        })
-
-    conn.close()
-    return jsonify(municipios)
+    ''', transformar=lambda row: {
+        'municipio': row['municipio'],
+        'capacitados': row['profissionais_capacitados'],
+        'insercoes': row['insercoes_realizadas']
+    }))
+
+def estatisticas_municipio_json(row):
+    """Totais de um município no formato de /api/capacitacao/stats/municipio."""
+    return {
+        'totalAgendamentos': row['agendamentos'] if row else 0,
+        'totalAlunas': row['alunas'] if row else 0,
+        'totalProfissionaisCapacitados': row['profissionais_capacitados'] if row else 0,
+        'totalDius': row['dius'] if row else 0,
+        'totalImplanons': row['implanons'] if row else 0,
+        'totalPacientesComInsercao': row['pacientes_com_insercao'] if row else 0
+    }
 
 @app.route('/api/capacitacao/stats/municipio/<municipio>', methods=['GET'])
+@versionada('estatisticas_municipios')
 def capacitacao_stats_municipio(municipio):
+    # O mapa manda a chave do nome ("olho-d'agua-das-flores"); id, código IBGE
+    # e o nome também servem. Fora do cadastro vale o nome como o mapa o monta,
+    # e um município sem registros responde com os totais zerados.
+    encontrado = registro_municipios().buscar(municipio)
+    nome = encontrado['nome'] if encontrado else municipio.replace('-', ' ').title()
+
     conn = get_db()
     cursor = conn.cursor()
 
-    # Normalizar nome do município (capitalizar corretamente)
-    municipio_normalizado = municipio.replace('-', ' ').title()
-
-    # Total de agendamentos para o município
-    cursor.execute('SELECT COUNT(*) as count FROM agendamentos_municipios WHERE municipio = ?', (municipio_normalizado,))
-    agendamentos = cursor.fetchone()['count']
-
-    # Total de enfermeiras alunas do município - busca EXCLUSIVAMENTE da tabela de capacitação
-    cursor.execute("SELECT COUNT(*) as count FROM enfermeiras_alunas WHERE municipio = ?", (municipio_normalizado,))
-    alunas = cursor.fetchone()['count']
-
-    # Total de profissionais capacitados (alunas que completaram 20 fichas)
-    # Busca EXCLUSIVAMENTE da tabela enfermeiras_alunas
-    cursor.execute('''
-        SELECT COUNT(DISTINCT ea.id) as count
-        FROM enfermeiras_alunas ea
-        LEFT JOIN (
-            SELECT enfermeira_aluna_id, COUNT(*) as ficha_count
-            FROM fichas_atendimento_pdf
-            GROUP BY enfermeira_aluna_id
-        ) fichas ON ea.id = fichas.enfermeira_aluna_id
-        WHERE ea.municipio = ?
-        AND COALESCE(fichas.ficha_count, 0) >= 20
-    ''', (municipio_normalizado,))
-    result = cursor.fetchone()
-    profissionais_capacitados = result['count'] if result else 0
-
-    # Total de inserções DIU do município (fichas + insercoes_diu + atendimentos)
-    cursor.execute('''
-        SELECT COUNT(*) as count
-        FROM fichas_atendimento_pdf fap
-        JOIN enfermeiras_alunas ea ON fap.enfermeira_aluna_id = ea.id
-        WHERE ea.municipio = ? AND fap.metodo_inserido = 'DIU'
-    ''', (municipio_normalizado,))
-    dius_fichas = cursor.fetchone()['count']
-
-    cursor.execute('''
-        SELECT COUNT(*) as count
-        FROM insercoes_diu id
-        JOIN enfermeiras_alunas ea ON id.enfermeira_aluna_id = ea.id
-        WHERE ea.municipio = ? AND (id.metodo_contraceptivo = 'DIU' OR id.tipo_diu != '')
-    ''', (municipio_normalizado,))
-    dius_insercoes = cursor.fetchone()['count']
-
-    cursor.execute('''
-        SELECT COUNT(*) as count
-        FROM dados_ginecologicos_capacitacao dgc
-        JOIN enfermeiras_alunas ea ON dgc.enfermeira_aluna_id = ea.id
-        WHERE ea.municipio = ? AND dgc.metodo_escolhido = 'DIU'
-    ''', (municipio_normalizado,))
-    dius_atendimentos = cursor.fetchone()['count']
-
-    dius = dius_fichas + dius_insercoes + dius_atendimentos
-
-    # Total de inserções Implanon do município (fichas + insercoes_diu + atendimentos)
-    cursor.execute('''
-        SELECT COUNT(*) as count
-        FROM fichas_atendimento_pdf fap
-        JOIN enfermeiras_alunas ea ON fap.enfermeira_aluna_id = ea.id
-        WHERE ea.municipio = ? AND fap.metodo_inserido = 'Implanon'
-    ''', (municipio_normalizado,))
-    implanons_fichas = cursor.fetchone()['count']
-
-    cursor.execute('''
-        SELECT COUNT(*) as count
-        FROM insercoes_diu id
-        JOIN enfermeiras_alunas ea ON id.enfermeira_aluna_id = ea.id
-        WHERE ea.municipio = ? AND id.metodo_contraceptivo = 'Implanon'
-    ''', (municipio_normalizado,))
-    implanons_insercoes = cursor.fetchone()['count']
-
-    cursor.execute('''
-        SELECT COUNT(*) as count
-        FROM dados_ginecologicos_capacitacao dgc
-        JOIN enfermeiras_alunas ea ON dgc.enfermeira_aluna_id = ea.id
-        WHERE ea.municipio = ? AND dgc.metodo_escolhido = 'Implanon'
-    ''', (municipio_normalizado,))
-    implanons_atendimentos = cursor.fetchone()['count']
-
-    implanons = implanons_fichas + implanons_insercoes + implanons_atendimentos
-
-    # Total de pacientes com inserção do município (fichas + insercoes_diu + atendimentos)
-    cursor.execute('''
-        SELECT COUNT(DISTINCT fap.cpf_paciente) as count
-        FROM fichas_atendimento_pdf fap
-        JOIN enfermeiras_alunas ea ON fap.enfermeira_aluna_id = ea.id
-        WHERE ea.municipio = ? AND fap.cpf_paciente IS NOT NULL AND fap.cpf_paciente != ''
-    ''', (municipio_normalizado,))
-    pacientes_fichas = cursor.fetchone()['count']
-
-    cursor.execute('''
-        SELECT COUNT(DISTINCT id.paciente_id) as count
-        FROM insercoes_diu id
-        JOIN enfermeiras_alunas ea ON id.enfermeira_aluna_id = ea.id
-        WHERE ea.municipio = ? AND id.paciente_id IS NOT NULL
-    ''', (municipio_normalizado,))
-    pacientes_insercoes = cursor.fetchone()['count']
-
-    cursor.execute('''
-        SELECT COUNT(DISTINCT dgc.paciente_id) as count
-        FROM dados_ginecologicos_capacitacao dgc
-        JOIN enfermeiras_alunas ea ON dgc.enfermeira_aluna_id = ea.id
-        WHERE ea.municipio = ? AND dgc.metodo_escolhido IN ('DIU', 'Implanon')
-    ''', (municipio_normalizado,))
-    pacientes_atendimentos = cursor.fetchone()['count']
-
-    pacientes_com_insercao = pacientes_fichas + pacientes_insercoes + pacientes_atendimentos
+    # Totais mantidos por triggers (ver ESTATISTICAS_MUNICIPIO); município
+    # sem linha ainda não tem nenhum registro
+    cursor.execute('SELECT * FROM estatisticas_municipios WHERE municipio = ?', (nome,))
+    row = cursor.fetchone()
 
     conn.close()
 
-    return jsonify({
-        'totalAgendamentos': agendamentos,
-        'totalAlunas': alunas,
-        'totalProfissionaisCapacitados': profissionais_capacitados,
-        'totalDius': dius,
-        'totalImplanons': implanons,
-        'totalPacientesComInsercao': pacientes_com_insercao
-    })
+    return jsonify(estatisticas_municipio_json(row))
+
+@app.route('/api/capacitacao/stats/municipios', methods=['GET'])
+@versionada('municipios', 'estatisticas_municipios')
+def capacitacao_stats_municipios():
+    """Totais de todos os municípios de Alagoas numa única resposta."""
+    return resposta_lista(consulta_em_lotes('''
+        SELECT m.id, m.nome, m.codigo_ibge, e.*
+        FROM municipios m
+        LEFT JOIN estatisticas_municipios e ON e.municipio = m.nome
+        WHERE m.estado = 'AL'
+        ORDER BY m.nome
+    ''', transformar=lambda row: {
+        'id': row['id'],
+        'nome': row['nome'],
+        'codigo_ibge': row['codigo_ibge'],
+        **estatisticas_municipio_json(row if row['municipio'] is not None else None)
+    }))
+
+# DIUs e Implanons APENAS do módulo Capacitação: inserções vinculadas a
+# alunas ou instrutoras e fichas com enfermeira_aluna_id
+INSERCOES_CAPACITACAO_STATS = ('insercoes_diu', 'fichas_atendimento_pdf')
+
+def totais_capacitacao_stats(valores):
+    """Totais aditivos de /api/capacitacao/stats a partir de contadores ou de agregar()."""
+    return {
+        'totalAgendamentos': valores.get('agendamentos_municipios', 0),
+        'totalDius': sum(valores.get(f'{origem}:DIU', 0) for origem in INSERCOES_CAPACITACAO_STATS),
+        'totalImplanons': sum(valores.get(f'{origem}:Implanon', 0) for origem in INSERCOES_CAPACITACAO_STATS),
+    }
 
 @app.route('/api/capacitacao/stats', methods=['GET'])
+@em_cache('contadores', 'agendamentos_municipios', 'insercoes_diu', 'fichas_atendimento_pdf', 'enfermeiras_alunas')
 def capacitacao_stats():
+    try:
+        agrupar = dimensoes_pedidas()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db()
     cursor = conn.cursor()
 
-    cursor.execute('SELECT COUNT(*) as count FROM agendamentos_municipios')
-    agendamentos = cursor.fetchone()['count']
-
-    cursor.execute('SELECT COUNT(*) as count FROM enfermeiras_instrutoras')
-    instrutoras = cursor.fetchone()['count']
-
-    cursor.execute('SELECT COUNT(*) as count FROM enfermeiras_alunas')
-    alunas = cursor.fetchone()['count']
-
-    # Total de DIUs inseridos APENAS do módulo Capacitação
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM insercoes_diu
-        WHERE (metodo_contraceptivo = 'DIU' OR tipo_diu != '')
-        AND (enfermeira_aluna_id IS NOT NULL OR enfermeira_instrutora_id IS NOT NULL)
-    """)
-    dius_insercoes = cursor.fetchone()['count']
-
-    # Total de Implanons inseridos APENAS do módulo Capacitação
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM insercoes_diu
-        WHERE metodo_contraceptivo = 'Implanon'
-        AND (enfermeira_aluna_id IS NOT NULL OR enfermeira_instrutora_id IS NOT NULL)
-    """)
-    implanons_insercoes = cursor.fetchone()['count']
-
-    # Fichas apenas com enfermeira_aluna_id (específico de capacitação)
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM fichas_atendimento_pdf
-        WHERE metodo_inserido = 'DIU'
-        AND enfermeira_aluna_id IS NOT NULL
-    """)
-    dius_fichas = cursor.fetchone()['count']
+    # Totais lidos dos contadores mantidos por triggers (ver AGREGADOS)
+    contadores = ler_contadores(cursor)
 
-    cursor.execute("""
-        SELECT COUNT(*) as count
-        FROM fichas_atendimento_pdf
-        WHERE metodo_inserido = 'Implanon'
-        AND enfermeira_aluna_id IS NOT NULL
-    """)
-    implanons_fichas = cursor.fetchone()['count']
+    instrutoras = contadores.get('enfermeiras_instrutoras', 0)
+    alunas = contadores.get('enfermeiras_alunas', 0)
 
     # Pacientes com inserção APENAS do módulo Capacitação
     # Conta pacientes de consultas_capacitacao + fichas + insercoes_diu vinculadas a capacitação
-    cursor.execute("SELECT COUNT(DISTINCT paciente_id) as count FROM consultas_capacitacao WHERE houve_insercao = 'Sim'")
-    pacientes_consultas = cursor.fetchone()['count']
-
-    cursor.execute("""
-        SELECT COUNT(DISTINCT cpf_paciente) as count
-        FROM fichas_atendimento_pdf
-        WHERE cpf_paciente IS NOT NULL AND cpf_paciente != ''
-        AND enfermeira_aluna_id IS NOT NULL
-    """)
-    pacientes_fichas = cursor.fetchone()['count']
-
-    cursor.execute("""
-        SELECT COUNT(DISTINCT paciente_id) as count
-        FROM insercoes_diu
-        WHERE paciente_id IS NOT NULL
-        AND (enfermeira_aluna_id IS NOT NULL OR enfermeira_instrutora_id IS NOT NULL)
-    """)
-    pacientes_insercoes = cursor.fetchone()['count']
+    total_pacientes = (
+        contadores.get('pacientes:consultas_capacitacao', 0)
+        + contadores.get('pacientes:fichas_atendimento_pdf', 0)
+        + contadores.get('pacientes:insercoes_diu', 0)
+    )
+
+    resposta = {
+        **totais_capacitacao_stats(contadores),
+        'totalInstrutoras': instrutoras,
+        'totalAlunas': alunas,
+        'totalPacientesComInsercao': total_pacientes
+    }
 
-    total_pacientes = pacientes_consultas + pacientes_fichas + pacientes_insercoes
+    # Detalhamento opcional (?agrupar=municipio,mes), numa passada por tabela.
+    # Pacientes distintos não se somam entre grupos e ficam só no total
+    if agrupar:
+        agregado = agregar_fontes(cursor, ('agendamentos_municipios',) + INSERCOES_CAPACITACAO_STATS, agrupar)
+        if 'municipio' in agrupar:
+            resposta['porMunicipio'] = detalhamento(agregado, 'municipio', totais_capacitacao_stats)
+        if 'mes' in agrupar:
+            resposta['porMes'] = detalhamento(agregado, 'mes', totais_capacitacao_stats)
 
     conn.close()
 
-    return jsonify({
-        'totalAgendamentos': agendamentos,
-        'totalInstrutoras': instrutoras,
-        'totalAlunas': alunas,
-        'totalDius': dius_insercoes + dius_fichas,
-        'totalImplanons': implanons_insercoes + implanons_fichas,
-        'totalPacientesComInsercao': total_pacientes
-    })
+    return jsonify(resposta)
 
 @app.route('/api/capacitacao/agendamentos', methods=['GET', 'POST'])
+@versionada('agendamentos_municipios')
 def agendamentos():
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM agendamentos_municipios ORDER BY data_agendamento DESC')
-        rows = cursor.fetchall()
+        resposta = lista_paginada(cursor, 'agendamentos_municipios', 'data_agendamento')
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return resposta
 
     elif request.method == 'POST':
         data = request.json
@@ -1670,45 +3762,44 @@ def validar_instrutora_capacitacao():
     return jsonify({'valid': True}), 200
 
 @app.route('/api/capacitacao/enfermeiras-instrutoras', methods=['GET', 'POST'])
+@versionada('enfermeiras_instrutoras', 'insercoes_diu')
 def enfermeiras_instrutoras():
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM enfermeiras_instrutoras ORDER BY nome')
-        rows = cursor.fetchall()
-        instrutoras = []
-
-        for row in rows:
-            instrutora = dict(row)
-            cursor.execute('SELECT COUNT(*) as count FROM insercoes_diu WHERE enfermeira_instrutora_id = ?', (instrutora['id'],))
-            count_row = cursor.fetchone()
-            instrutora['total_dius'] = count_row['count'] if count_row else 0
-            instrutoras.append(instrutora)
-
+        try:
+            campos = campos_pedidos(cursor, 'enfermeiras_instrutoras', ['total_dius'])
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        colunas = colunas_select(cursor, 'enfermeiras_instrutoras', campos, 'ei')
+        if pede_campo(campos, 'total_dius'):
+            colunas += ', (SELECT COUNT(*) FROM insercoes_diu WHERE enfermeira_instrutora_id = ei.id) AS total_dius'
         conn.close()
-        return jsonify(instrutoras)
+        return resposta_lista(consulta_em_lotes(
+            f'SELECT {colunas} FROM enfermeiras_instrutoras ei ORDER BY ei.nome',
+            transformar=lambda row: projetar(dict(row), campos),
+        ))
 
     elif request.method == 'POST':
-        data = request.json
+        data = dados_envio()
         try:
             import base64
 
             senha = data.get('senha', '')
             senha_hash = hashlib.sha256(senha.encode()).hexdigest() if senha else None
 
-            diploma_content = None
-            diploma_filename = None
-            if data.get('diploma_content'):
-                diploma_content = decode_base64_safe(data.get('diploma_content'))
-                diploma_filename = data.get('diploma_filename', 'diploma.pdf')
+            diploma_filename, diploma_ref, diploma_tamanho, diploma_mime = guardar_arquivo_enviado(
+                data, 'diploma_content', 'diploma_filename', 'diploma.pdf'
+            )
 
             cursor.execute('''
                 INSERT INTO enfermeiras_instrutoras (
                     nome, cpf, coren, telefone, email, especialidade, unidade_saude,
                     cep, logradouro, municipio, bairro, numero, complemento,
-                    senha_hash, diploma_filename, diploma_content
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    senha_hash, diploma_filename, diploma_ref, diploma_tamanho, diploma_mime
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 data.get('nome'),
                 data.get('cpf'),
@@ -1725,7 +3816,9 @@ def enfermeiras_instrutoras():
                 data.get('complemento', ''),
                 senha_hash,
                 diploma_filename,
-                diploma_content
+                diploma_ref,
+                diploma_tamanho,
+                diploma_mime
             ))
             instrutora_id = cursor.lastrowid
 
@@ -1736,53 +3829,58 @@ def enfermeiras_instrutoras():
             conn.close()
             return jsonify({'error': 'CPF já cadastrado'}), 400
 
+# Campos que as rotas de alunas montam além das colunas da tabela
+CAMPOS_CALCULADOS_ALUNA = ['instrutora_nome', 'total_fichas', 'progresso', 'status']
+
 @app.route('/api/capacitacao/enfermeiras-alunas', methods=['GET', 'POST'])
+@versionada('enfermeiras_alunas', 'enfermeiras_instrutoras', 'fichas_por_aluna')
 def enfermeiras_alunas():
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('''
-            SELECT
-                ea.*,
-                ei.nome as instrutora_nome
-            FROM enfermeiras_alunas ea
-            LEFT JOIN enfermeiras_instrutoras ei ON ea.enfermeira_instrutora_id = ei.id
-            ORDER BY ea.nome
-        ''')
-        rows = cursor.fetchall()
-        alunas = []
+        try:
+            campos = campos_pedidos(cursor, 'enfermeiras_alunas', CAMPOS_CALCULADOS_ALUNA)
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        colunas = colunas_select(cursor, 'enfermeiras_alunas', campos, 'ea')
+        conn.close()
 
-        for row in rows:
+        def montar_aluna(row):
             aluna = dict(row)
-            cursor.execute('SELECT COUNT(*) as count FROM fichas_atendimento_pdf WHERE enfermeira_aluna_id = ?', (aluna['id'],))
-            count_row = cursor.fetchone()
-            total_fichas = count_row['count'] if count_row else 0
-            aluna['total_fichas'] = total_fichas
+            total_fichas = aluna['total_fichas']
             aluna['progresso'] = min(int((total_fichas / 20) * 100), 100)
             aluna['status'] = 'Concluído' if total_fichas >= 20 else 'Incompleto'
-            alunas.append(aluna)
+            return projetar(aluna, campos)
 
-        conn.close()
-        return jsonify(alunas)
+        return resposta_lista(consulta_em_lotes(f'''
+            SELECT
+                {colunas},
+                ei.nome as instrutora_nome,
+                COALESCE(fichas.total, 0) as total_fichas
+            FROM enfermeiras_alunas ea
+            LEFT JOIN enfermeiras_instrutoras ei ON ea.enfermeira_instrutora_id = ei.id
+            LEFT JOIN fichas_por_aluna fichas ON ea.id = fichas.enfermeira_aluna_id
+            ORDER BY ea.nome
+        ''', transformar=montar_aluna))
 
     elif request.method == 'POST':
-        data = request.json
+        data = dados_envio()
         try:
             import base64
 
-            certificado_content = None
-            certificado_filename = None
-            if data.get('certificado_content'):
-                certificado_content = decode_base64_safe(data.get('certificado_content'))
-                certificado_filename = data.get('certificado_filename', 'certificado.pdf')
+            certificado_filename, certificado_ref, certificado_tamanho, certificado_mime = guardar_arquivo_enviado(
+                data, 'certificado_content', 'certificado_filename', 'certificado.pdf'
+            )
 
             cursor.execute('''
                 INSERT INTO enfermeiras_alunas (
                     nome, cpf, coren, telefone, email, municipio,
                     cep, logradouro, bairro, numero, complemento,
-                    enfermeira_instrutora_id, certificado_filename, certificado_content
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    enfermeira_instrutora_id, certificado_filename, certificado_ref,
+                    certificado_tamanho, certificado_mime
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 data.get('nome'),
                 data.get('cpf'),
@@ -1797,7 +3895,9 @@ def enfermeiras_alunas():
                 data.get('complemento', ''),
                 data.get('enfermeira_instrutora_id') or None,
                 certificado_filename,
-                certificado_content
+                certificado_ref,
+                certificado_tamanho,
+                certificado_mime
             ))
             conn.commit()
             conn.close()
@@ -1807,15 +3907,15 @@ def enfermeiras_alunas():
             return jsonify({'error': 'CPF já cadastrado'}), 400
 
 @app.route('/api/capacitacao/pacientes', methods=['GET', 'POST'])
+@versionada('pacientes_capacitacao')
 def pacientes_capacitacao():
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM pacientes_capacitacao ORDER BY created_at DESC')
-        rows = cursor.fetchall()
+        resposta = lista_paginada(cursor, 'pacientes_capacitacao', 'created_at')
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return resposta
 
     elif request.method == 'POST':
         cursor.execute('INSERT INTO pacientes_capacitacao (status) VALUES (?)', ('rascunho',))
@@ -1830,47 +3930,50 @@ def paciente_capacitacao_detail(id):
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM pacientes_capacitacao WHERE id = ?', (id,))
-        paciente = cursor.fetchone()
+        try:
+            campos = campos_pedidos(cursor, 'pacientes_capacitacao', ['dados_ginecologicos', 'consultas', 'insercoes'])
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        result = ler_registro(cursor, 'pacientes_capacitacao', id, campos)
 
-        if not paciente:
+        if not result:
             conn.close()
             return jsonify({'error': 'Paciente não encontrado'}), 404
 
-        cursor.execute('''
-            SELECT
-                dgc.*,
-                ea.nome as enfermeira_aluna_nome
-            FROM dados_ginecologicos_capacitacao dgc
-            LEFT JOIN enfermeiras_alunas ea ON dgc.enfermeira_aluna_id = ea.id
-            WHERE dgc.paciente_id = ?
-        ''', (id,))
-        dados_gine = cursor.fetchone()
-
-        cursor.execute('SELECT * FROM consultas_capacitacao WHERE paciente_id = ? ORDER BY data_consulta DESC', (id,))
-        consultas = cursor.fetchall()
-
-        cursor.execute('''
-            SELECT
-                id.*,
-                ei.nome as instrutora_nome,
-                ea.nome as aluna_nome
-            FROM insercoes_diu id
-            LEFT JOIN enfermeiras_instrutoras ei ON id.enfermeira_instrutora_id = ei.id
-            LEFT JOIN enfermeiras_alunas ea ON id.enfermeira_aluna_id = ea.id
-            WHERE id.paciente_id = ?
-            ORDER BY id.data_insercao DESC
-        ''', (id,))
-        insercoes = cursor.fetchall()
+        if pede_campo(campos, 'dados_ginecologicos'):
+            cursor.execute('''
+                SELECT
+                    dgc.*,
+                    ea.nome as enfermeira_aluna_nome
+                FROM dados_ginecologicos_capacitacao dgc
+                LEFT JOIN enfermeiras_alunas ea ON dgc.enfermeira_aluna_id = ea.id
+                WHERE dgc.paciente_id = ?
+            ''', (id,))
+            dados_gine = cursor.fetchone()
+            result['dados_ginecologicos'] = dict(dados_gine) if dados_gine else None
+
+        if pede_campo(campos, 'consultas'):
+            cursor.execute('SELECT * FROM consultas_capacitacao WHERE paciente_id = ? ORDER BY data_consulta DESC', (id,))
+            result['consultas'] = [dict(c) for c in cursor.fetchall()]
+
+        if pede_campo(campos, 'insercoes'):
+            cursor.execute('''
+                SELECT
+                    id.*,
+                    ei.nome as instrutora_nome,
+                    ea.nome as aluna_nome
+                FROM insercoes_diu id
+                LEFT JOIN enfermeiras_instrutoras ei ON id.enfermeira_instrutora_id = ei.id
+                LEFT JOIN enfermeiras_alunas ea ON id.enfermeira_aluna_id = ea.id
+                WHERE id.paciente_id = ?
+                ORDER BY id.data_insercao DESC
+            ''', (id,))
+            result['insercoes'] = [dict(i) for i in cursor.fetchall()]
 
         conn.close()
 
-        result = dict(paciente)
-        result['dados_ginecologicos'] = dict(dados_gine) if dados_gine else None
-        result['consultas'] = [dict(c) for c in consultas]
-        result['insercoes'] = [dict(i) for i in insercoes]
-
-        return jsonify(result)
+        return jsonify(projetar(result, campos))
 
     elif request.method == 'PATCH':
         try:
@@ -2001,15 +4104,15 @@ def dados_ginecologicos_capacitacao(id):
         return jsonify({'message': 'Dados ginecológicos salvos com sucesso'}), 201
 
 @app.route('/api/ambulatorial/pacientes', methods=['GET', 'POST'])
+@versionada('pacientes_ambulatorial')
 def pacientes_ambulatorial():
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM pacientes_ambulatorial ORDER BY created_at DESC')
-        rows = cursor.fetchall()
+        resposta = lista_paginada(cursor, 'pacientes_ambulatorial', 'created_at')
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return resposta
 
     elif request.method == 'POST':
         data = request.json
@@ -2069,11 +4172,15 @@ def paciente_ambulatorial_detail(paciente_id):
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM pacientes_ambulatorial WHERE id = ?', (paciente_id,))
-        row = cursor.fetchone()
+        try:
+            campos = campos_pedidos(cursor, 'pacientes_ambulatorial')
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        paciente = ler_registro(cursor, 'pacientes_ambulatorial', paciente_id, campos)
         conn.close()
-        if row:
-            return jsonify(dict(row))
+        if paciente:
+            return jsonify(projetar(paciente, campos))
         return jsonify({'error': 'Paciente não encontrado'}), 404
 
     elif request.method == 'PUT':
@@ -2217,15 +4324,16 @@ def dados_ginecologicos_by_paciente(paciente_id):
             return jsonify({'error': str(e)}), 400
 
 @app.route('/api/ambulatorial/consultas/<int:paciente_id>', methods=['GET', 'POST'])
+@versionada('consultas_ambulatorial')
 def consultas_ambulatorial(paciente_id):
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM consultas_ambulatorial WHERE paciente_id = ? ORDER BY data_consulta DESC', (paciente_id,))
-        rows = cursor.fetchall()
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return resposta_lista(consulta_em_lotes(
+            'SELECT * FROM consultas_ambulatorial WHERE paciente_id = ? ORDER BY data_consulta DESC', (paciente_id,)
+        ))
 
     elif request.method == 'POST':
         data = request.json
@@ -2257,102 +4365,68 @@ def consultas_ambulatorial(paciente_id):
             conn.close()
             return jsonify({'error': str(e)}), 400
 
+def periodo_stats():
+    """(início, fim) de ?year= ou de ?inicio=/?fim= (AAAA-MM-DD), com None no
+    lado em aberto; levanta ValueError se algum for inválido."""
+    year = request.args.get('year')
+    if year and year != 'Todos':
+        if not (year.isdigit() and len(year) == 4):
+            raise ValueError('year deve ser um ano com 4 dígitos')
+        return f'{year}-01-01', f'{year}-12-31'
+    periodo = []
+    for parametro in ('inicio', 'fim'):
+        valor = request.args.get(parametro)
+        if valor:
+            try:
+                valor = datetime.strptime(valor, '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f'{parametro} deve estar no formato AAAA-MM-DD')
+        periodo.append(valor or None)
+    return tuple(periodo)
+
 @app.route('/api/ambulatorial/stats', methods=['GET'])
+@em_cache('ambulatorial_diario', 'pacientes_ambulatorial')
 def ambulatorial_stats():
+    """Totais do ambulatório no período de ?year= ou ?inicio=/?fim= (todo o
+    histórico sem eles), somados do resumo diário (ver RESUMO_AMBULATORIAL)."""
+    try:
+        inicio, fim = periodo_stats()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db()
     cursor = conn.cursor()
 
-    year = request.args.get('year', None)
-
     try:
-        if year and year != 'Todos':
-            cursor.execute('SELECT COUNT(*) as total FROM pacientes_ambulatorial WHERE strftime("%Y", created_at) = ?', (year,))
-            total_pacientes = cursor.fetchone()['total']
-
-            cursor.execute('''
-                SELECT COUNT(*) as total
-                FROM consultas_ambulatorial c
-                JOIN pacientes_ambulatorial p ON c.paciente_id = p.id
-                WHERE strftime("%Y", c.data_consulta) = ?
-            ''', (year,))
-            total_consultas = cursor.fetchone()['total']
-
-            cursor.execute('''
-                SELECT COUNT(*) as total
-                FROM consultas_ambulatorial c
-                JOIN pacientes_ambulatorial p ON c.paciente_id = p.id
-                WHERE strftime("%Y", c.data_consulta) = ? AND c.houve_insercao = 'Sim' AND c.tipo_insercao = 'DIU'
-            ''', (year,))
-            total_dius = cursor.fetchone()['total']
-
-            cursor.execute('''
-                SELECT COUNT(*) as total
-                FROM consultas_ambulatorial c
-                JOIN pacientes_ambulatorial p ON c.paciente_id = p.id
-                WHERE strftime("%Y", c.data_consulta) = ? AND c.houve_insercao = 'Sim' AND c.tipo_insercao = 'Implanon'
-            ''', (year,))
-            total_implanons = cursor.fetchone()['total']
-
-            cursor.execute('''
-                SELECT COUNT(*) as total
-                FROM consultas_ambulatorial c
-                JOIN pacientes_ambulatorial p ON c.paciente_id = p.id
-                WHERE strftime("%Y", c.data_consulta) = ? AND c.houve_insercao = 'Sim'
-            ''', (year,))
-            total_insercoes = cursor.fetchone()['total']
-
-            cursor.execute('''
-                SELECT COUNT(*) as total
-                FROM consultas_ambulatorial c
-                JOIN pacientes_ambulatorial p ON c.paciente_id = p.id
-                WHERE strftime("%Y", c.data_consulta) = ? AND c.nova_intercorrencia = 'Sim'
-            ''', (year,))
-            total_intercorrencias = cursor.fetchone()['total']
-
-            cursor.execute('''
-                SELECT COUNT(*) as total
-                FROM dados_ginecologicos_obstetricos d
-                JOIN pacientes_ambulatorial p ON d.paciente_id = p.id
-                WHERE strftime("%Y", d.created_at) = ? AND d.realizou_usg = 'Sim'
-            ''', (year,))
-            total_usgs = cursor.fetchone()['total']
-
-            cursor.execute('''
-                SELECT AVG(
-                    CAST((julianday('now') - julianday(data_nascimento)) / 365.25 AS INTEGER)
-                ) as media_idade
-                FROM pacientes_ambulatorial
-                WHERE strftime("%Y", created_at) = ? AND data_nascimento != ''
-            ''', (year,))
-        else:
-            cursor.execute('SELECT COUNT(*) as total FROM pacientes_ambulatorial')
-            total_pacientes = cursor.fetchone()['total']
-
-            cursor.execute('SELECT COUNT(*) as total FROM consultas_ambulatorial')
-            total_consultas = cursor.fetchone()['total']
-
-            cursor.execute("SELECT COUNT(*) as total FROM consultas_ambulatorial WHERE houve_insercao = 'Sim' AND tipo_insercao = 'DIU'")
-            total_dius = cursor.fetchone()['total']
-
-            cursor.execute("SELECT COUNT(*) as total FROM consultas_ambulatorial WHERE houve_insercao = 'Sim' AND tipo_insercao = 'Implanon'")
-            total_implanons = cursor.fetchone()['total']
-
-            cursor.execute("SELECT COUNT(*) as total FROM consultas_ambulatorial WHERE houve_insercao = 'Sim'")
-            total_insercoes = cursor.fetchone()['total']
-
-            cursor.execute("SELECT COUNT(*) as total FROM consultas_ambulatorial WHERE nova_intercorrencia = 'Sim'")
-            total_intercorrencias = cursor.fetchone()['total']
-
-            cursor.execute("SELECT COUNT(*) as total FROM dados_ginecologicos_obstetricos WHERE realizou_usg = 'Sim'")
-            total_usgs = cursor.fetchone()['total']
-
-            cursor.execute('''
-                SELECT AVG(
-                    CAST((julianday('now') - julianday(data_nascimento)) / 365.25 AS INTEGER)
-                ) as media_idade
-                FROM pacientes_ambulatorial
-                WHERE data_nascimento != ''
-            ''')
+        # Os dias são texto AAAA-MM-DD: o período é um intervalo na chave.
+        # Com período, o dia '' (registros sem data) fica de fora
+        condicoes_dia = []
+        condicoes_cadastro = []
+        parametros_dia = []
+        parametros_cadastro = []
+        if inicio or fim:
+            condicoes_dia.append('dia >= ?')
+            parametros_dia.append(inicio or '0000-00-00')
+        if inicio:
+            condicoes_cadastro.append('created_at >= ?')
+            parametros_cadastro.append(inicio)
+        if fim:
+            condicoes_dia.append('dia <= ?')
+            parametros_dia.append(fim)
+            condicoes_cadastro.append('created_at < ?')
+            parametros_cadastro.append((datetime.strptime(fim, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'))
+
+        somas = ', '.join(f'COALESCE(SUM({coluna}), 0) AS {coluna}' for coluna in COLUNAS_RESUMO_AMBULATORIAL)
+        cursor.execute(f'SELECT {somas} FROM ambulatorial_diario {_montar_where(condicoes_dia)}', parametros_dia)
+        totais = cursor.fetchone()
+
+        cursor.execute(f'''
+            SELECT AVG(
+                CAST((julianday('now') - julianday(data_nascimento)) / 365.25 AS INTEGER)
+            ) as media_idade
+            FROM pacientes_ambulatorial
+            {_montar_where(condicoes_cadastro + ["data_nascimento != ''"])}
+        ''', parametros_cadastro)
 
         media_idade_result = cursor.fetchone()
         media_idade = int(media_idade_result['media_idade']) if media_idade_result['media_idade'] else 0
@@ -2371,13 +4445,13 @@ def ambulatorial_stats():
         conn.close()
 
         return jsonify({
-            'totalPacientes': total_pacientes,
-            'totalConsultas': total_consultas,
-            'totalDius': total_dius,
-            'totalImplanons': total_implanons,
-            'totalInsercoes': total_insercoes,
-            'totalIntercorrencias': total_intercorrencias,
-            'totalUsgs': total_usgs,
+            'totalPacientes': totais['pacientes'],
+            'totalConsultas': totais['consultas'],
+            'totalDius': totais['dius'],
+            'totalImplanons': totais['implanons'],
+            'totalInsercoes': totais['insercoes'],
+            'totalIntercorrencias': totais['intercorrencias'],
+            'totalUsgs': totais['usgs'],
             'mediaIdade': media_idade,
             'percentualComorbidade': percentual_comorbidade
         })
@@ -2447,36 +4521,42 @@ def validar_instrutora_ambulatorial():
     return jsonify({'valid': True}), 200
 
 @app.route('/api/ambulatorial/enfermeiras-instrutoras', methods=['GET', 'POST'])
+@versionada('enfermeiras_instrutoras_ambulatorial')
 def enfermeiras_instrutoras_ambulatorial():
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM enfermeiras_instrutoras_ambulatorial ORDER BY nome')
-        rows = cursor.fetchall()
+        try:
+            campos = campos_pedidos(cursor, 'enfermeiras_instrutoras_ambulatorial')
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        colunas = colunas_select(cursor, 'enfermeiras_instrutoras_ambulatorial', campos)
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return resposta_lista(consulta_em_lotes(
+            f'SELECT {colunas} FROM enfermeiras_instrutoras_ambulatorial ORDER BY nome',
+            transformar=lambda row: projetar(dict(row), campos),
+        ))
 
     elif request.method == 'POST':
-        data = request.json
+        data = dados_envio()
         try:
             import base64
 
             senha = data.get('senha', '')
             senha_hash = hashlib.sha256(senha.encode()).hexdigest() if senha else None
 
-            diploma_content = None
-            diploma_filename = None
-            if data.get('diploma_content'):
-                diploma_content = decode_base64_safe(data.get('diploma_content'))
-                diploma_filename = data.get('diploma_filename', 'diploma.pdf')
+            diploma_filename, diploma_ref, diploma_tamanho, diploma_mime = guardar_arquivo_enviado(
+                data, 'diploma_content', 'diploma_filename', 'diploma.pdf'
+            )
 
             cursor.execute('''
                 INSERT INTO enfermeiras_instrutoras_ambulatorial (
                     nome, cpf, tipo_registro, numero_registro, telefone, email, especialidade,
                     unidade_saude, cep, logradouro, municipio, bairro, numero, complemento,
-                    senha_hash, diploma_filename, diploma_content
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    senha_hash, diploma_filename, diploma_ref, diploma_tamanho, diploma_mime
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 data.get('nome'),
                 data.get('cpf'),
@@ -2494,7 +4574,9 @@ def enfermeiras_instrutoras_ambulatorial():
                 data.get('complemento', ''),
                 senha_hash,
                 diploma_filename,
-                diploma_content
+                diploma_ref,
+                diploma_tamanho,
+                diploma_mime
             ))
             instrutora_id = cursor.lastrowid
 
@@ -2511,38 +4593,43 @@ def enfermeira_instrutora_ambulatorial_detail(id):
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM enfermeiras_instrutoras_ambulatorial WHERE id = ?', (id,))
-        row = cursor.fetchone()
+        try:
+            campos = campos_pedidos(cursor, 'enfermeiras_instrutoras_ambulatorial', ['diploma_content'])
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        instrutora = ler_registro(cursor, 'enfermeiras_instrutoras_ambulatorial', id, campos, ('id', 'diploma_ref'))
         conn.close()
 
-        if not row:
+        if not instrutora:
             return jsonify({'error': 'Profissional não encontrado'}), 404
 
-        instrutora = dict(row)
-        if instrutora.get('diploma_content'):
-            instrutora['diploma_content'] = encode_base64_safe(instrutora['diploma_content'])
-        return jsonify(instrutora)
+        if pede_campo(campos, 'diploma_content'):
+            instrutora['diploma_content'] = conteudo_base64(instrutora['diploma_ref'])
+        return jsonify(projetar(instrutora, campos))
 
     elif request.method == 'PATCH':
-        data = request.json
+        data = dados_envio()
+        # Fora do try: arquivo acima do limite responde 413
+        diploma_filename, diploma_ref, diploma_tamanho, diploma_mime = guardar_arquivo_enviado(
+            data, 'diploma_content', 'diploma_filename', 'diploma.pdf'
+        )
         try:
             import base64
 
             senha = data.get('senha', '')
-            diploma_content = data.get('diploma_content')
+            diploma_antigo = ref_arquivo(cursor, 'enfermeiras_instrutoras_ambulatorial', 'diploma', id) if diploma_ref else None
 
             if senha:
                 senha_hash = hashlib.sha256(senha.encode()).hexdigest()
 
-                if diploma_content:
-                    diploma_content_bytes = decode_base64_safe(diploma_content)
-                    diploma_filename = data.get('diploma_filename', 'diploma.pdf')
-
+                if diploma_ref:
                     cursor.execute('''
                         UPDATE enfermeiras_instrutoras_ambulatorial
                         SET nome = ?, cpf = ?, tipo_registro = ?, numero_registro = ?,
                             telefone = ?, email = ?, especialidade = ?, unidade_saude = ?,
-                            senha_hash = ?, diploma_filename = ?, diploma_content = ?
+                            senha_hash = ?, diploma_filename = ?,
+                            diploma_ref = ?, diploma_tamanho = ?, diploma_mime = ?
                         WHERE id = ?
                     ''', (
                         data.get('nome'),
@@ -2555,7 +4642,9 @@ def enfermeira_instrutora_ambulatorial_detail(id):
                         data.get('unidade_saude', ''),
                         senha_hash,
                         diploma_filename,
-                        diploma_content_bytes,
+                        diploma_ref,
+                        diploma_tamanho,
+                        diploma_mime,
                         id
                     ))
                 else:
@@ -2577,15 +4666,13 @@ def enfermeira_instrutora_ambulatorial_detail(id):
                         id
                     ))
             else:
-                if diploma_content:
-                    diploma_content_bytes = decode_base64_safe(diploma_content)
-                    diploma_filename = data.get('diploma_filename', 'diploma.pdf')
-
+                if diploma_ref:
                     cursor.execute('''
                         UPDATE enfermeiras_instrutoras_ambulatorial
                         SET nome = ?, cpf = ?, tipo_registro = ?, numero_registro = ?,
                             telefone = ?, email = ?, especialidade = ?, unidade_saude = ?,
-                            diploma_filename = ?, diploma_content = ?
+                            diploma_filename = ?,
+                            diploma_ref = ?, diploma_tamanho = ?, diploma_mime = ?
                         WHERE id = ?
                     ''', (
                         data.get('nome'),
@@ -2597,7 +4684,9 @@ def enfermeira_instrutora_ambulatorial_detail(id):
                         data.get('especialidade', ''),
                         data.get('unidade_saude', ''),
                         diploma_filename,
-                        diploma_content_bytes,
+                        diploma_ref,
+                        diploma_tamanho,
+                        diploma_mime,
                         id
                     ))
                 else:
@@ -2619,6 +4708,7 @@ def enfermeira_instrutora_ambulatorial_detail(id):
                     ))
 
             conn.commit()
+            remover_blobs_orfaos(cursor, [diploma_antigo])
             conn.close()
             return jsonify({'message': 'Profissional atualizado com sucesso'}), 200
         except sqlite3.IntegrityError:
@@ -2642,14 +4732,20 @@ def buscar_enfermeiras_ambulatoriais():
             ORDER BY nome
             LIMIT 50
         ''')
+    elif consulta_fts(termo) is None:
+        # Termo sem letras nem dígitos não encontra ninguém
+        conn.close()
+        return resposta_lista([])
     else:
+        # Busca por prefixo no índice FTS5, sem acentos, mais relevantes primeiro
         cursor.execute('''
-            SELECT id, nome, cpf, numero_registro, especialidade
-            FROM enfermeiras_instrutoras_ambulatorial
-            WHERE nome LIKE ? OR cpf LIKE ?
-            ORDER BY nome
+            SELECT R.id, R.nome, R.cpf, R.numero_registro, R.especialidade
+            FROM busca_enfermeiras_instrutoras_ambulatorial
+            JOIN enfermeiras_instrutoras_ambulatorial R ON R.id = busca_enfermeiras_instrutoras_ambulatorial.rowid
+            WHERE busca_enfermeiras_instrutoras_ambulatorial MATCH ?
+            ORDER BY busca_enfermeiras_instrutoras_ambulatorial.rank
             LIMIT 50
-        ''', (f'%{termo}%', f'%{termo}%'))
+        ''', (consulta_fts(termo),))
 
     enfermeiras = []
     for row in cursor.fetchall():
@@ -2662,48 +4758,21 @@ def buscar_enfermeiras_ambulatoriais():
         })
 
     conn.close()
-    return jsonify(enfermeiras)
+    return resposta_lista(enfermeiras)
 
 @app.route('/api/ambulatorial/pacientes/filtrados', methods=['GET'])
+@versionada('pacientes_ambulatorial')
 def pacientes_ambulatorial_filtrados():
-    conn = get_db()
-    cursor = conn.cursor()
-
+    # Indicadores mantidos por triggers (ver INDICADORES_PACIENTE_AMBULATORIAL);
+    # cada filtro lê o seu índice parcial, na ordem de created_at
     filtro = request.args.get('filtro', 'todos')
+    condicoes = [FILTROS_PACIENTES_AMBULATORIAL[filtro]] if filtro in FILTROS_PACIENTES_AMBULATORIAL else []
 
-    if filtro == 'com_diu':
-        cursor.execute('''
-            SELECT DISTINCT p.*
-            FROM pacientes_ambulatorial p
-            INNER JOIN consultas_ambulatorial c ON p.id = c.paciente_id
-            WHERE c.houve_insercao = 'Sim' AND c.tipo_insercao = 'DIU'
-            ORDER BY p.created_at DESC
-        ''')
-    elif filtro == 'com_implanon':
-        cursor.execute('''
-            SELECT DISTINCT p.*
-            FROM pacientes_ambulatorial p
-            INNER JOIN consultas_ambulatorial c ON p.id = c.paciente_id
-            WHERE c.houve_insercao = 'Sim' AND c.tipo_insercao = 'Implanon'
-            ORDER BY p.created_at DESC
-        ''')
-    elif filtro == 'sem_insercao':
-        cursor.execute('''
-            SELECT p.*
-            FROM pacientes_ambulatorial p
-            WHERE p.id NOT IN (
-                SELECT DISTINCT paciente_id
-                FROM consultas_ambulatorial
-                WHERE houve_insercao = 'Sim'
-            )
-            ORDER BY p.created_at DESC
-        ''')
-    else:
-        cursor.execute('SELECT * FROM pacientes_ambulatorial ORDER BY created_at DESC')
-
-    rows = cursor.fetchall()
+    conn = get_db()
+    cursor = conn.cursor()
+    resposta = lista_paginada(cursor, 'pacientes_ambulatorial', 'created_at', condicoes)
     conn.close()
-    return jsonify([dict(row) for row in rows])
+    return resposta
 
 @app.route('/api/capacitacao/enfermeiras-instrutoras/<int:id>', methods=['GET', 'PATCH'])
 def enfermeira_instrutora_capacitacao_detail(id):
@@ -2711,37 +4780,42 @@ def enfermeira_instrutora_capacitacao_detail(id):
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM enfermeiras_instrutoras WHERE id = ?', (id,))
-        row = cursor.fetchone()
+        try:
+            campos = campos_pedidos(cursor, 'enfermeiras_instrutoras', ['diploma_content'])
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        instrutora = ler_registro(cursor, 'enfermeiras_instrutoras', id, campos, ('id', 'diploma_ref'))
         conn.close()
 
-        if not row:
+        if not instrutora:
             return jsonify({'error': 'Instrutora não encontrada'}), 404
 
-        instrutora = dict(row)
-        if instrutora.get('diploma_content'):
-            instrutora['diploma_content'] = encode_base64_safe(instrutora['diploma_content'])
-        return jsonify(instrutora)
+        if pede_campo(campos, 'diploma_content'):
+            instrutora['diploma_content'] = conteudo_base64(instrutora['diploma_ref'])
+        return jsonify(projetar(instrutora, campos))
 
     elif request.method == 'PATCH':
-        data = request.json
+        data = dados_envio()
+        # Fora do try: arquivo acima do limite responde 413
+        diploma_filename, diploma_ref, diploma_tamanho, diploma_mime = guardar_arquivo_enviado(
+            data, 'diploma_content', 'diploma_filename', 'diploma.pdf'
+        )
         try:
             import base64
 
             senha = data.get('senha', '')
-            diploma_content = data.get('diploma_content')
+            diploma_antigo = ref_arquivo(cursor, 'enfermeiras_instrutoras', 'diploma', id) if diploma_ref else None
 
             if senha:
                 senha_hash = hashlib.sha256(senha.encode()).hexdigest()
 
-                if diploma_content:
-                    diploma_content_bytes = decode_base64_safe(diploma_content)
-                    diploma_filename = data.get('diploma_filename', 'diploma.pdf')
-
+                if diploma_ref:
                     cursor.execute('''
                         UPDATE enfermeiras_instrutoras
                         SET nome = ?, cpf = ?, coren = ?, telefone = ?, email = ?, especialidade = ?,
-                            unidade_saude = ?, senha_hash = ?, diploma_filename = ?, diploma_content = ?
+                            unidade_saude = ?, senha_hash = ?, diploma_filename = ?,
+                            diploma_ref = ?, diploma_tamanho = ?, diploma_mime = ?
                         WHERE id = ?
                     ''', (
                         data.get('nome'),
@@ -2753,7 +4827,9 @@ def enfermeira_instrutora_capacitacao_detail(id):
                         data.get('unidade_saude', ''),
                         senha_hash,
                         diploma_filename,
-                        diploma_content_bytes,
+                        diploma_ref,
+                        diploma_tamanho,
+                        diploma_mime,
                         id
                     ))
                 else:
@@ -2774,14 +4850,12 @@ def enfermeira_instrutora_capacitacao_detail(id):
                         id
                     ))
             else:
-                if diploma_content:
-                    diploma_content_bytes = decode_base64_safe(diploma_content)
-                    diploma_filename = data.get('diploma_filename', 'diploma.pdf')
-
+                if diploma_ref:
                     cursor.execute('''
                         UPDATE enfermeiras_instrutoras
                         SET nome = ?, cpf = ?, coren = ?, telefone = ?, email = ?, especialidade = ?,
-                            unidade_saude = ?, diploma_filename = ?, diploma_content = ?
+                            unidade_saude = ?, diploma_filename = ?,
+                            diploma_ref = ?, diploma_tamanho = ?, diploma_mime = ?
                         WHERE id = ?
                     ''', (
                         data.get('nome'),
@@ -2792,7 +4866,9 @@ def enfermeira_instrutora_capacitacao_detail(id):
                         data.get('especialidade', ''),
                         data.get('unidade_saude', ''),
                         diploma_filename,
-                        diploma_content_bytes,
+                        diploma_ref,
+                        diploma_tamanho,
+                        diploma_mime,
                         id
                     ))
                 else:
@@ -2812,6 +4888,7 @@ def enfermeira_instrutora_capacitacao_detail(id):
                     ))
 
             conn.commit()
+            remover_blobs_orfaos(cursor, [diploma_antigo])
             conn.close()
             return jsonify({'message': 'Instrutora atualizada com sucesso'}), 200
         except sqlite3.IntegrityError:
@@ -2827,9 +4904,14 @@ def enfermeira_aluna_detail(id):
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('''
+        try:
+            campos = campos_pedidos(cursor, 'enfermeiras_alunas', CAMPOS_CALCULADOS_ALUNA + ['certificado_content'])
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        cursor.execute(f'''
             SELECT
-                ea.*,
+                {colunas_select(cursor, 'enfermeiras_alunas', campos, 'ea', ('id', 'certificado_ref'))},
                 ei.nome as instrutora_nome
             FROM enfermeiras_alunas ea
             LEFT JOIN enfermeiras_instrutoras ei ON ea.enfermeira_instrutora_id = ei.id
@@ -2843,35 +4925,37 @@ def enfermeira_aluna_detail(id):
 
         aluna = dict(row)
 
-        cursor.execute('SELECT COUNT(*) as count FROM fichas_atendimento_pdf WHERE enfermeira_aluna_id = ?', (id,))
-        count_row = cursor.fetchone()
-        total_fichas = count_row['count'] if count_row else 0
-        aluna['total_fichas'] = total_fichas
-        aluna['progresso'] = min(int((total_fichas / 20) * 100), 100)
-        aluna['status'] = 'Concluído' if total_fichas >= 20 else 'Incompleto'
+        if campos is None or {'total_fichas', 'progresso', 'status'} & set(campos):
+            cursor.execute('SELECT total FROM fichas_por_aluna WHERE enfermeira_aluna_id = ?', (id,))
+            count_row = cursor.fetchone()
+            total_fichas = count_row['total'] if count_row else 0
+            aluna['total_fichas'] = total_fichas
+            aluna['progresso'] = min(int((total_fichas / 20) * 100), 100)
+            aluna['status'] = 'Concluído' if total_fichas >= 20 else 'Incompleto'
 
-        if aluna.get('certificado_content'):
-            import base64
-            aluna['certificado_content'] = base64.b64encode(aluna['certificado_content']).decode('utf-8')
+        if pede_campo(campos, 'certificado_content'):
+            aluna['certificado_content'] = conteudo_base64(aluna['certificado_ref'])
 
         conn.close()
-        return jsonify(aluna)
+        return jsonify(projetar(aluna, campos))
 
     elif request.method == 'PATCH':
-        data = request.json
+        data = dados_envio()
+        # Fora do try: arquivo acima do limite responde 413
+        certificado_filename, certificado_ref, certificado_tamanho, certificado_mime = guardar_arquivo_enviado(
+            data, 'certificado_content', 'certificado_filename', 'certificado.pdf'
+        )
         try:
             import base64
 
-            certificado_content = data.get('certificado_content')
-
-            if certificado_content:
-                certificado_content_bytes = decode_base64_safe(certificado_content)
-                certificado_filename = data.get('certificado_filename', 'certificado.pdf')
+            certificado_antigo = ref_arquivo(cursor, 'enfermeiras_alunas', 'certificado', id) if certificado_ref else None
 
+            if certificado_ref:
                 cursor.execute('''
                     UPDATE enfermeiras_alunas
                     SET nome = ?, cpf = ?, coren = ?, telefone = ?, email = ?, municipio = ?,
-                        enfermeira_instrutora_id = ?, certificado_filename = ?, certificado_content = ?
+                        enfermeira_instrutora_id = ?, certificado_filename = ?,
+                        certificado_ref = ?, certificado_tamanho = ?, certificado_mime = ?
                     WHERE id = ?
                 ''', (
                     data.get('nome'),
@@ -2882,7 +4966,9 @@ def enfermeira_aluna_detail(id):
                     data.get('municipio', ''),
                     data.get('enfermeira_instrutora_id') or None,
                     certificado_filename,
-                    certificado_content_bytes,
+                    certificado_ref,
+                    certificado_tamanho,
+                    certificado_mime,
                     id
                 ))
             else:
@@ -2901,6 +4987,7 @@ def enfermeira_aluna_detail(id):
                     id
                 ))
             conn.commit()
+            remover_blobs_orfaos(cursor, [certificado_antigo])
             conn.close()
             return jsonify({'message': 'Aluno(a) atualizado(a) com sucesso'}), 200
         except sqlite3.IntegrityError:
@@ -2911,41 +4998,47 @@ def enfermeira_aluna_detail(id):
             return jsonify({'error': str(e)}), 500
 
 @app.route('/api/capacitacao/enfermeiras-alunas/<int:aluna_id>/fichas', methods=['GET', 'POST'])
+@versionada('fichas_atendimento_pdf')
 def fichas_atendimento(aluna_id):
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('''
+        conn.close()
+        return resposta_lista(consulta_em_lotes('''
             SELECT id, enfermeira_aluna_id, nome_arquivo, nome_paciente, cpf_paciente,
                    data_nascimento_paciente, municipio_paciente, metodo_inserido, data_anexacao
             FROM fichas_atendimento_pdf
             WHERE enfermeira_aluna_id = ?
             ORDER BY data_anexacao DESC
-        ''', (aluna_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return jsonify([dict(row) for row in rows])
+        ''', (aluna_id,)))
 
     elif request.method == 'POST':
-        import base64
-        data = request.json
-        try:
-            if not data.get('nome_paciente') or not data.get('cpf_paciente') or not data.get('data_nascimento_paciente') or not data.get('municipio_paciente') or not data.get('metodo_inserido'):
-                return jsonify({'error': 'Todos os dados do paciente são obrigatórios'}), 400
+        data = dados_envio()
+        if not data.get('nome_paciente') or not data.get('cpf_paciente') or not data.get('data_nascimento_paciente') or not data.get('municipio_paciente') or not data.get('metodo_inserido'):
+            conn.close()
+            return jsonify({'error': 'Todos os dados do paciente são obrigatórios'}), 400
 
-            pdf_content_base64 = data.get('pdf_content')
-            pdf_content = decode_base64_safe(pdf_content_base64)
+        # Fora do try: arquivo acima do limite responde 413
+        nome_arquivo, pdf_ref, pdf_tamanho, pdf_mime = guardar_arquivo_enviado(
+            data, 'pdf_content', 'nome_arquivo', 'ficha.pdf'
+        )
+        if not pdf_ref:
+            conn.close()
+            return jsonify({'error': 'Arquivo PDF inválido'}), 400
 
+        try:
             cursor.execute('''
                 INSERT INTO fichas_atendimento_pdf
-                (enfermeira_aluna_id, nome_arquivo, pdf_content, nome_paciente, cpf_paciente,
-                 data_nascimento_paciente, municipio_paciente, metodo_inserido)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                (enfermeira_aluna_id, nome_arquivo, pdf_ref, pdf_tamanho, pdf_mime, nome_paciente,
+                 cpf_paciente, data_nascimento_paciente, municipio_paciente, metodo_inserido)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 aluna_id,
-                data.get('nome_arquivo'),
-                pdf_content,
+                nome_arquivo,
+                pdf_ref,
+                pdf_tamanho,
+                pdf_mime,
                 data.get('nome_paciente'),
                 data.get('cpf_paciente'),
                 data.get('data_nascimento_paciente'),
@@ -2967,9 +5060,13 @@ def ficha_atendimento_detail(aluna_id, ficha_id):
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        import base64
-        cursor.execute('''
-            SELECT *
+        try:
+            campos = campos_pedidos(cursor, 'fichas_atendimento_pdf', ['pdf_content'])
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        cursor.execute(f'''
+            SELECT {colunas_select(cursor, 'fichas_atendimento_pdf', campos, sempre=('id', 'pdf_ref'))}
             FROM fichas_atendimento_pdf
             WHERE id = ? AND enfermeira_aluna_id = ?
         ''', (ficha_id, aluna_id))
@@ -2980,86 +5077,173 @@ def ficha_atendimento_detail(aluna_id, ficha_id):
             return jsonify({'error': 'Ficha não encontrada'}), 404
 
         ficha = dict(row)
-        ficha['pdf_content'] = base64.b64encode(ficha['pdf_content']).decode('utf-8')
-        return jsonify(ficha)
+        if pede_campo(campos, 'pdf_content'):
+            ficha['pdf_content'] = conteudo_base64(ficha['pdf_ref'])
+        return jsonify(projetar(ficha, campos))
 
     elif request.method == 'DELETE':
         try:
+            pdf_ref = ref_arquivo(cursor, 'fichas_atendimento_pdf', 'pdf', ficha_id)
             cursor.execute('''
                 DELETE FROM fichas_atendimento_pdf
                 WHERE id = ? AND enfermeira_aluna_id = ?
             ''', (ficha_id, aluna_id))
             conn.commit()
+            remover_blobs_orfaos(cursor, [pdf_ref])
             conn.close()
             return jsonify({'message': 'Ficha removida com sucesso'}), 200
         except Exception as e:
             conn.close()
             return jsonify({'error': str(e)}), 400
 
-@app.route('/api/municipios', methods=['GET'])
-def get_municipios_geral():
+@app.route('/api/capacitacao/enfermeiras-alunas/<int:aluna_id>/fichas/<int:ficha_id>/download', methods=['GET'])
+def download_ficha_atendimento(aluna_id, ficha_id):
+    # PDF bruto, lido do disco em blocos. O send_file cuida de Content-Length,
+    # Range (206) e If-None-Match (304); o ETag forte é o próprio SHA-256
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM municipios WHERE estado = ? ORDER BY nome', ('AL',))
-    rows = cursor.fetchall()
+    cursor.execute('''
+        SELECT nome_arquivo, pdf_ref, pdf_mime
+        FROM fichas_atendimento_pdf
+        WHERE id = ? AND enfermeira_aluna_id = ?
+    ''', (ficha_id, aluna_id))
+    row = cursor.fetchone()
     conn.close()
-    return jsonify([dict(row) for row in rows])
+
+    if not row or not row['pdf_ref']:
+        return jsonify({'error': 'Ficha não encontrada'}), 404
+
+    caminho = caminho_blob(row['pdf_ref'])
+    if not os.path.exists(caminho):
+        print(f"Arquivo {row['pdf_ref']} não encontrado em {diretorio_blobs()}")
+        return jsonify({'error': 'Arquivo da ficha não encontrado'}), 404
+
+    response = send_file(
+        caminho,
+        mimetype=row['pdf_mime'] or 'application/pdf',
+        as_attachment=True,
+        download_name=row['nome_arquivo'] or f'ficha_{ficha_id}.pdf',
+        etag=row['pdf_ref'],
+        conditional=True,
+        max_age=0,
+    )
+    # Pode ser revalidado no navegador, mas não em caches compartilhados
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Registro de municípios: a tabela municipios é estática (preenchida na
+# criação do banco), então é lida uma única vez por banco e fica em memória,
+# indexada por id, código IBGE e slug do nome. A lista de /api/municipios já
+# fica serializada e comprimida, pronta para a resposta.
+def slug_municipio(nome):
+    """Nome sem acentos, em minúsculas, com hífen no lugar de espaços e
+    pontuação ("Olho d'Água das Flores" -> "olho-d-agua-das-flores")."""
+    return re.sub(r'[^a-z0-9]+', '-', sem_acentos(nome)).strip('-')
+
+class RegistroMunicipios:
+    def __init__(self, linhas):
+        self.municipios = tuple(MappingProxyType(dict(linha)) for linha in linhas)
+        self.por_id = MappingProxyType({m['id']: m for m in self.municipios})
+        self.por_ibge = MappingProxyType({m['codigo_ibge']: m for m in self.municipios if m['codigo_ibge']})
+        self.por_slug = MappingProxyType({slug_municipio(m['nome']): m for m in self.municipios})
+        self.json = app.json.dumps([dict(m) for m in self.municipios], separators=(',', ':')).encode()
+        self.comprimido = {'gzip': zlib.compress(self.json, 9, wbits=31)}
+        if brotli is not None:
+            self.comprimido['br'] = brotli.compress(self.json, quality=11)
+        self.etag = hashlib.sha256(self.json).hexdigest()[:32]
+
+    def buscar(self, chave):
+        """Município pelo id, código IBGE, nome ou slug; None se não existir."""
+        chave = str(chave).strip()
+        if chave.isdigit():
+            return self.por_id.get(int(chave)) or self.por_ibge.get(chave)
+        return self.por_slug.get(slug_municipio(chave))
+
+    def resposta(self):
+        """Resposta da lista inteira, já serializada e comprimida."""
+        resposta = nao_modificada(self.etag)
+        if resposta is not None:
+            return resposta
+        if request.args.get('formato', 'json') != 'json':
+            return marcar_versao(resposta_lista([dict(m) for m in self.municipios]), self.etag)
+        codificacao = request.accept_encodings.best_match(list(self.comprimido))
+        resposta = app.response_class(self.comprimido.get(codificacao, self.json), mimetype='application/json')
+        if codificacao:
+            resposta.headers['Content-Encoding'] = codificacao
+        resposta.vary.add('Accept-Encoding')
+        return marcar_versao(resposta, self.etag)
+
+_registros_municipios = {}
+
+def registro_municipios():
+    registro = _registros_municipios.get(DB_PATH)
+    if registro is None:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM municipios WHERE estado = 'AL' ORDER BY nome")
+        registro = RegistroMunicipios(cursor.fetchall())
+        conn.close()
+        _registros_municipios[DB_PATH] = registro
+    return registro
+
+@app.route('/api/municipios', methods=['GET'])
+def get_municipios_geral():
+    return registro_municipios().resposta()
 
 @app.route('/api/distribuicao/municipios', methods=['GET'])
 def get_municipios():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM municipios WHERE estado = ? ORDER BY nome', ('AL',))
-    rows = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in rows])
+    return registro_municipios().resposta()
+
+# Filtros da listagem de solicitações. O período vira um intervalo em
+# dia_solicitacao (ver INDICES_SOLICITACOES), sem função sobre a coluna.
+FILTROS_SOLICITACOES = {
+    'municipio': 's.municipio_id',
+    'tipoInsumo': 's.tipo_insumo',
+    'status': 's.status',
+}
+
+def filtros_solicitacoes():
+    """(condições, parâmetros) da listagem de solicitações; levanta ValueError
+    se dataInicio ou dataFim não estiverem no formato AAAA-MM-DD."""
+    condicoes = []
+    parametros = []
+    for argumento, coluna in FILTROS_SOLICITACOES.items():
+        valor = request.args.get(argumento)
+        if valor:
+            condicoes.append(f'{coluna} = ?')
+            parametros.append(valor)
+    for argumento, operador in (('dataInicio', '>='), ('dataFim', '<=')):
+        valor = request.args.get(argumento)
+        if valor:
+            try:
+                valor = datetime.strptime(valor, '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f'{argumento} deve estar no formato AAAA-MM-DD')
+            condicoes.append(f's.dia_solicitacao {operador} ?')
+            parametros.append(valor)
+    return condicoes, parametros
 
 @app.route('/api/distribuicao/solicitacoes', methods=['GET', 'POST'])
+@versionada('solicitacoes_insumos', 'municipios')
 def solicitacoes_insumos():
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        data_inicio = request.args.get('dataInicio')
-        data_fim = request.args.get('dataFim')
-        municipio_id = request.args.get('municipio')
-        tipo_insumo = request.args.get('tipoInsumo')
-        status = request.args.get('status')
-
-        query = '''
-            SELECT s.*, m.nome as municipio_nome
-            FROM solicitacoes_insumos s
-            JOIN municipios m ON s.municipio_id = m.id
-            WHERE 1=1
-        '''
-        params = []
-
-        if data_inicio:
-            query += ' AND DATE(s.data_solicitacao) >= DATE(?)'
-            params.append(data_inicio)
-
-        if data_fim:
-            query += ' AND DATE(s.data_solicitacao) <= DATE(?)'
-            params.append(data_fim)
-
-        if municipio_id:
-            query += ' AND s.municipio_id = ?'
-            params.append(municipio_id)
-
-        if tipo_insumo:
-            query += ' AND s.tipo_insumo = ?'
-            params.append(tipo_insumo)
-
-        if status:
-            query += ' AND s.status = ?'
-            params.append(status)
-
-        query += ' ORDER BY s.data_solicitacao DESC'
+        try:
+            condicoes, params = filtros_solicitacoes()
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
 
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        resposta = lista_paginada(
+            cursor, 'solicitacoes_insumos', 's.dia_solicitacao', condicoes, params,
+            alias='s', juncoes='JOIN municipios m ON s.municipio_id = m.id',
+            calculados={'municipio_nome': 'm.nome'},
+        )
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return resposta
 
     elif request.method == 'POST':
         data = request.json
@@ -3117,75 +5301,234 @@ def solicitacao_detail(id):
                 data.get('respondido_por', ''),
                 id
             ))
+            # Na mesma transação: o estoque nunca vê uma autorização pela metade
+            registrar_autorizacao(cursor, id, data.get('respondido_por', ''))
             conn.commit()
             conn.close()
             return jsonify({'message': 'Solicitação atualizada com sucesso'}), 200
-        except Exception as e:
+        except ValueError as e:
+            conn.rollback()
             conn.close()
             return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            conn.rollback()
+            conn.close()
+            return jsonify({'error': str(e)}), 500
+
+def registrar_movimentacao(cursor, municipio_id, tipo_insumo, tipo, quantidade, solicitacao_id=None,
+                           observacao='', registrado_por=''):
+    """Acrescenta uma movimentação ao livro de estoque (sem commit); o saldo é
+    somado pelo trigger. Levanta ValueError se a movimentação for inválida."""
+    if tipo not in MOVIMENTACOES_INSUMOS:
+        raise ValueError(f"tipo deve ser um de: {', '.join(MOVIMENTACOES_INSUMOS)}")
+    if not municipio_id or not tipo_insumo:
+        raise ValueError('municipio_id e tipo_insumo são obrigatórios')
+    try:
+        quantidade = int(quantidade)
+    except (TypeError, ValueError):
+        raise ValueError('quantidade deve ser um número inteiro')
+    if quantidade == 0 or (quantidade < 0 and tipo in ('entregue', 'consumido')):
+        raise ValueError('quantidade deve ser maior que zero')
+    if tipo == 'consumido':
+        # Trava de escrita antes de ler o saldo: duas baixas simultâneas não
+        # passam ambas pela conferência
+        if not cursor.connection.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(f'''
+            SELECT {SALDO_INSUMOS_CALCULADOS['estoque']} AS estoque
+            FROM saldos_insumos WHERE municipio_id = ? AND tipo_insumo = ?
+        ''', (municipio_id, tipo_insumo))
+        row = cursor.fetchone()
+        estoque = row['estoque'] if row else 0
+        if quantidade > estoque:
+            raise ValueError(f'Estoque insuficiente: {estoque} {tipo_insumo} disponível(is)')
+    cursor.execute('''
+        INSERT INTO movimentacoes_insumos
+            (municipio_id, tipo_insumo, tipo, quantidade, solicitacao_id, observacao, registrado_por)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (municipio_id, tipo_insumo, tipo, quantidade, solicitacao_id, observacao, registrado_por))
+    return cursor.lastrowid
+
+def registrar_autorizacao(cursor, solicitacao_id, registrado_por=''):
+    """Lança no livro a diferença entre o que a solicitação autoriza agora e o
+    que já foi lançado para ela (sem commit). Reeditar ou negar uma solicitação
+    autorizada gera um estorno, sem alterar o lançamento anterior."""
+    cursor.execute('''
+        SELECT s.municipio_id, s.tipo_insumo,
+            CASE WHEN s.status = 'Autorizado' THEN COALESCE(s.quantidade_autorizada, 0) ELSE 0 END AS autorizado,
+            (SELECT COALESCE(SUM(quantidade), 0) FROM movimentacoes_insumos
+             WHERE solicitacao_id = s.id AND tipo = 'autorizado') AS lancado
+        FROM solicitacoes_insumos s
+        WHERE s.id = ?
+    ''', (solicitacao_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    try:
+        diferenca = int(row['autorizado']) - row['lancado']
+    except (TypeError, ValueError):
+        raise ValueError('quantidade_autorizada deve ser um número inteiro')
+    if diferenca:
+        registrar_movimentacao(
+            cursor, row['municipio_id'], row['tipo_insumo'], 'autorizado', diferenca,
+            solicitacao_id=solicitacao_id, registrado_por=registrado_por
+        )
+
+def saldo_json(row):
+    return {
+        'municipio_id': row['municipio_id'],
+        'municipio_nome': row['municipio_nome'],
+        'tipo_insumo': row['tipo_insumo'],
+        **{coluna: row[coluna] for coluna in COLUNAS_SALDO_INSUMOS},
+        **{nome: row[nome] for nome in SALDO_INSUMOS_CALCULADOS},
+        'atualizado_em': row['atualizado_em'],
+    }
+
+def _select_saldos(onde=''):
+    calculados = ', '.join(f'{expressao} AS {nome}' for nome, expressao in SALDO_INSUMOS_CALCULADOS.items())
+    return f'''
+        SELECT s.*, {calculados}, m.nome AS municipio_nome
+        FROM saldos_insumos s
+        JOIN municipios m ON m.id = s.municipio_id
+        {onde}
+        ORDER BY s.municipio_id, s.tipo_insumo
+    '''
+
+@app.route('/api/distribuicao/estoque', methods=['GET'])
+@versionada('saldos_insumos', 'municipios')
+def estoque_insumos():
+    """Saldos de todos os municípios, lidos de saldos_insumos (?tipoInsumo= filtra)."""
+    tipo_insumo = request.args.get('tipoInsumo')
+    if tipo_insumo:
+        return resposta_lista(consulta_em_lotes(
+            _select_saldos('WHERE s.tipo_insumo = ?'), (tipo_insumo,), transformar=saldo_json
+        ))
+    return resposta_lista(consulta_em_lotes(_select_saldos(), transformar=saldo_json))
+
+@app.route('/api/distribuicao/estoque/<municipio>', methods=['GET'])
+@versionada('saldos_insumos')
+def estoque_municipio(municipio):
+    """Saldo de cada insumo do município (slug, nome, id ou código IBGE); com
+    ?tipoInsumo= devolve só o saldo daquele insumo, zerado se não houver
+    movimentação."""
+    encontrado = registro_municipios().buscar(municipio)
+    if encontrado is None:
+        return jsonify({'error': 'Município não encontrado'}), 404
 
-@app.route('/api/distribuicao/stats', methods=['GET'])
-def distribuicao_stats():
     conn = get_db()
     cursor = conn.cursor()
+    tipo_insumo = request.args.get('tipoInsumo')
+    if tipo_insumo:
+        cursor.execute(
+            _select_saldos('WHERE s.municipio_id = ? AND s.tipo_insumo = ?'), (encontrado['id'], tipo_insumo)
+        )
+        row = cursor.fetchone()
+        conn.close()
+        if row:
+            return jsonify(saldo_json(row))
+        return jsonify({
+            'municipio_id': encontrado['id'],
+            'municipio_nome': encontrado['nome'],
+            'tipo_insumo': tipo_insumo,
+            **{coluna: 0 for coluna in COLUNAS_SALDO_INSUMOS},
+            **{nome: 0 for nome in SALDO_INSUMOS_CALCULADOS},
+            'atualizado_em': None,
+        })
 
-    cursor.execute('SELECT COUNT(*) as count FROM solicitacoes_insumos')
-    total_solicitacoes = cursor.fetchone()['count']
-
-    cursor.execute("SELECT COUNT(*) as count FROM solicitacoes_insumos WHERE status = 'Autorizado'")
-    total_autorizadas = cursor.fetchone()['count']
+    cursor.execute(_select_saldos('WHERE s.municipio_id = ?'), (encontrado['id'],))
+    saldos = [saldo_json(row) for row in cursor.fetchall()]
+    conn.close()
+    return jsonify(saldos)
 
-    cursor.execute("SELECT COUNT(*) as count FROM solicitacoes_insumos WHERE status = 'Não autorizado'")
-    total_negadas = cursor.fetchone()['count']
+@app.route('/api/distribuicao/movimentacoes', methods=['GET', 'POST'])
+@versionada('movimentacoes_insumos', 'municipios')
+def movimentacoes_insumos():
+    conn = get_db()
+    cursor = conn.cursor()
 
-    cursor.execute("SELECT COUNT(*) as count FROM solicitacoes_insumos WHERE status = 'Aguardando confirmação'")
-    total_aguardando = cursor.fetchone()['count']
+    if request.method == 'GET':
+        condicoes = []
+        params = []
+        for argumento, coluna in (('municipio', 'v.municipio_id'), ('tipoInsumo', 'v.tipo_insumo')):
+            valor = request.args.get(argumento)
+            if valor:
+                condicoes.append(f'{coluna} = ?')
+                params.append(valor)
+
+        resposta = lista_paginada(
+            cursor, 'movimentacoes_insumos', 'v.created_at', condicoes, params,
+            alias='v', juncoes='JOIN municipios m ON v.municipio_id = m.id',
+            calculados={'municipio_nome': 'm.nome'},
+        )
+        conn.close()
+        return resposta
 
-    cursor.execute("SELECT SUM(quantidade_solicitada) as total FROM solicitacoes_insumos WHERE tipo_insumo = 'DIU'")
-    total_dius_solicitados = cursor.fetchone()['total'] or 0
+    elif request.method == 'POST':
+        # Autorizações entram pelo PATCH da solicitação (ver registrar_autorizacao)
+        data = request.json or {}
+        try:
+            if data.get('tipo') == 'autorizado':
+                raise ValueError('Autorizações são registradas pela resposta à solicitação')
+            movimentacao_id = registrar_movimentacao(
+                cursor,
+                data.get('municipio_id'),
+                data.get('tipo_insumo'),
+                data.get('tipo'),
+                data.get('quantidade'),
+                observacao=data.get('observacao', ''),
+                registrado_por=data.get('registrado_por', ''),
+            )
+            conn.commit()
+            conn.close()
+            return jsonify({'message': 'Movimentação registrada com sucesso', 'id': movimentacao_id}), 201
+        except ValueError as e:
+            conn.rollback()
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            conn.rollback()
+            conn.close()
+            return jsonify({'error': str(e)}), 500
 
-    cursor.execute("SELECT SUM(quantidade_autorizada) as total FROM solicitacoes_insumos WHERE tipo_insumo = 'DIU' AND status = 'Autorizado'")
-    total_dius_autorizados = cursor.fetchone()['total'] or 0
+@app.route('/api/distribuicao/stats', methods=['GET'])
+@em_cache('solicitacoes_insumos', 'municipios')
+def distribuicao_stats():
+    try:
+        agrupar = dimensoes_pedidas()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    cursor.execute("SELECT SUM(quantidade_solicitada) as total FROM solicitacoes_insumos WHERE tipo_insumo = 'Implanon'")
-    total_implanons_solicitados = cursor.fetchone()['total'] or 0
+    conn = get_db()
+    cursor = conn.cursor()
 
-    cursor.execute("SELECT SUM(quantidade_autorizada) as total FROM solicitacoes_insumos WHERE tipo_insumo = 'Implanon' AND status = 'Autorizado'")
-    total_implanons_autorizados = cursor.fetchone()['total'] or 0
+    # Todos os totais numa única passada por solicitacoes_insumos
+    # (ver FONTES_AGREGACAO), com detalhamento opcional na mesma leitura
+    agregado = agregar(cursor, 'solicitacoes_insumos', agrupar)
 
     conn.close()
 
-    return jsonify({
-        'totalSolicitacoes': total_solicitacoes,
-        'totalAutorizadas': total_autorizadas,
-        'totalNegadas': total_negadas,
-        'totalAguardando': total_aguardando,
-        'totalDiusSolicitados': total_dius_solicitados,
-        'totalDiusAutorizados': total_dius_autorizados,
-        'totalImplanonsSolicitados': total_implanons_solicitados,
-        'totalImplanonsAutorizados': total_implanons_autorizados
-    })
+    resposta = dict(agregado['total'])
+    if 'municipio' in agrupar:
+        resposta['porMunicipio'] = detalhamento(agregado, 'municipio', dict)
+    if 'mes' in agrupar:
+        resposta['porMes'] = detalhamento(agregado, 'mes', dict)
+    return jsonify(resposta)
 
 # Endpoints de Responsáveis
 
 @app.route('/api/distribuicao/responsaveis', methods=['GET', 'POST'])
+@versionada('responsaveis_municipios')
 def responsaveis():
     conn = get_db()
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        try:
-            cursor.execute('''
-                SELECT id, nome, cpf, cargo, telefone, email, municipio, status
-                FROM responsaveis_municipios
-                ORDER BY nome
-            ''')
-            responsaveis = [dict(row) for row in cursor.fetchall()]
-            conn.close()
-            return jsonify(responsaveis)
-        except Exception as e:
-            conn.close()
-            return jsonify({'error': f'Erro ao buscar responsáveis: {str(e)}'}), 500
+        conn.close()
+        return resposta_lista(consulta_em_lotes('''
+            SELECT id, nome, cpf, cargo, telefone, email, municipio, status
+            FROM responsaveis_municipios
+            ORDER BY nome
+        '''))
 
     elif request.method == 'POST':
         data = request.json
@@ -3300,57 +5643,67 @@ def login():
 
     usuario_dict = dict(usuario)
     senha_hash = hashlib.sha256(senha.encode()).hexdigest()
-    senha_valida = False
     usando_provisoria = False
 
-    if usuario_dict['senha_hash'] == senha_hash:
-        senha_valida = True
-    elif validar_senha_provisoria(usuario_dict, senha):
-        senha_valida = True
+    if usuario_dict['senha_hash'] != senha_hash:
+        if not validar_senha_provisoria(usuario_dict, senha):
+            conn.close()
+            return jsonify({'error': 'Credenciais inválidas'}), 401
         usando_provisoria = True
 
-        cursor.execute('''
-            UPDATE usuarios SET temporary_password_used = 1 WHERE id = ?
-        ''', (usuario_dict['id'],))
+    # Uma única transação: marca a senha provisória como usada (a condição
+    # impede dois logins com a mesma senha provisória) e cria a sessão. O
+    # RETURNING devolve a linha atualizada, sem reler o usuário.
+    with trava_escrita:
+        if usando_provisoria:
+            cursor.execute('''
+                UPDATE usuarios SET temporary_password_used = 1
+                WHERE id = ? AND temporary_password_used = 0
+                RETURNING *
+            ''', (usuario_dict['id'],))
+            atualizado = cursor.fetchone()
+            if not atualizado:
+                conn.rollback()
+                conn.close()
+                return jsonify({'error': 'Credenciais inválidas'}), 401
+            usuario_dict = dict(atualizado)
+
+        token, token_expira_em = criar_sessao(cursor, usuario_dict['id'])
         conn.commit()
-
-    if not senha_valida:
-        conn.close()
-        return jsonify({'error': 'Credenciais inválidas'}), 401
-
-    cursor.execute('''
-        INSERT INTO logs_auditoria (usuario_id, acao, descricao)
-        VALUES (?, ?, ?)
-    ''', (usuario_dict['id'], 'login', f"Login realizado por {usuario_dict['nome_completo']}"))
-    conn.commit()
-
-    cursor.execute('SELECT * FROM usuarios WHERE id = ?', (usuario_dict['id'],))
-    usuario_atualizado = dict(cursor.fetchone())
     conn.close()
 
-    senha_expirada = verificar_expiracao_senha(usuario_atualizado)
-    must_change = usuario_atualizado.get('must_change_password', 0) == 1 or usando_provisoria or senha_expirada
+    registrar_auditoria(usuario_dict['id'], 'login', f"Login realizado por {usuario_dict['nome_completo']}")
 
-    usuario_atualizado['must_change_password'] = 1 if must_change else 0
-    usuario_atualizado['password_expired'] = senha_expirada
-    usuario_atualizado['using_temporary'] = usando_provisoria
+    senha_expirada = verificar_expiracao_senha(usuario_dict)
+    must_change = usuario_dict.get('must_change_password', 0) == 1 or usando_provisoria or senha_expirada
 
-    return jsonify(usuario_atualizado)
+    # A linha veio de SELECT * / RETURNING *: os hashes de senha ficam de fora
+    resposta = {k: v for k, v in usuario_dict.items() if k not in COLUNAS_OCULTAS}
+    resposta['must_change_password'] = 1 if must_change else 0
+    resposta['password_expired'] = senha_expirada
+    resposta['using_temporary'] = usando_provisoria
+    resposta['token'] = token
+    resposta['token_expira_em'] = token_expira_em
+
+    return jsonify(resposta)
 
 @app.route('/api/auth/logout', methods=['POST'])
 def logout():
     data = request.json
     usuario_id = data.get('usuario_id')
+    token = token_da_requisicao()
 
-    if usuario_id:
+    if token:
+        # Encerra a sessão: o token deixa de valer em todos os workers
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs_auditoria (usuario_id, acao, descricao)
-            VALUES (?, ?, ?)
-        ''', (usuario_id, 'logout', 'Logout realizado'))
+        cursor.execute('DELETE FROM sessoes WHERE token_hash = ?', (hash_token(token),))
         conn.commit()
         conn.close()
+        cache_autenticacao.remover(('sessao', hash_token(token)))
+
+    if usuario_id:
+        registrar_auditoria(usuario_id, 'logout', 'Logout realizado')
 
     return jsonify({'message': 'Logout realizado com sucesso'})
 
@@ -3391,14 +5744,11 @@ def recuperar_senha():
         WHERE id = ?
     ''', (senha_provisoria_hash, expira_em.isoformat(), usuario['id']))
 
-    cursor.execute('''
-        INSERT INTO logs_auditoria (usuario_id, acao, descricao)
-        VALUES (?, ?, ?)
-    ''', (usuario['id'], 'recuperacao_senha', f"Senha provisória gerada para {usuario['nome_completo']}"))
-
     conn.commit()
     conn.close()
 
+    registrar_auditoria(usuario['id'], 'recuperacao_senha', f"Senha provisória gerada para {usuario['nome_completo']}")
+
     return jsonify({
         'message': 'Senha provisória gerada com sucesso',
         'senha_provisoria': senha_provisoria,
@@ -3466,17 +5816,17 @@ def alterar_senha():
             temporary_password_used = 0
         WHERE id = ?
     ''', (nova_senha_hash, expira_em.isoformat(), usuario_id))
-
-    cursor.execute('''
-        INSERT INTO logs_auditoria (usuario_id, acao, descricao)
-        VALUES (?, ?, ?)
-    ''', (usuario_id, 'alteracao_senha', f"Senha alterada por {usuario_dict['nome_completo']}"))
+    # Tokens emitidos com a senha antiga deixam de valer; quem alterou
+    # continua com a sessão desta requisição
+    revogar_sessoes(cursor, usuario_id, exceto=token_da_requisicao())
 
     conn.commit()
+    invalidar_autenticacao(usuario_id)
     print('[BACKEND] Senha atualizada e commit realizado')
 
-    cursor.execute('SELECT * FROM usuarios WHERE id = ?', (usuario_id,))
-    usuario_atualizado = dict(cursor.fetchone())
+    registrar_auditoria(usuario_id, 'alteracao_senha', f"Senha alterada por {usuario_dict['nome_completo']}")
+
+    usuario_atualizado = ler_registro(cursor, 'usuarios', usuario_id)
     conn.close()
 
     print('[BACKEND] Sucesso: Senha alterada com sucesso!')
@@ -3520,28 +5870,27 @@ def redefinir_senha_admin(usuario_id):
             temporary_password_used = 0
         WHERE id = ?
     ''', (nova_senha_hash, agora.isoformat(), expira_em.isoformat(), usuario_id))
-
-    admin = request.usuario_autenticado
-    cursor.execute('''
-        INSERT INTO logs_auditoria (usuario_id, acao, descricao)
-        VALUES (?, ?, ?)
-    ''', (admin['id'], 'redefinicao_senha_admin',
-          f"Admin {admin['nome_completo']} redefiniu senha de {usuario['nome_completo']}"))
+    revogar_sessoes(cursor, usuario_id)
 
     conn.commit()
     conn.close()
+    invalidar_autenticacao(usuario_id)
+
+    admin = request.usuario_autenticado
+    registrar_auditoria(admin['id'], 'redefinicao_senha_admin',
+                        f"Admin {admin['nome_completo']} redefiniu senha de {usuario['nome_completo']}")
 
     return jsonify({'message': 'Senha redefinida com sucesso. O usuário deverá alterá-la no próximo login.'})
 
 @app.route('/api/usuarios', methods=['GET', 'POST'])
+@versionada('usuarios')
 def usuarios():
     if request.method == 'GET':
         conn = get_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM usuarios ORDER BY created_at DESC')
-        rows = cursor.fetchall()
+        resposta = lista_paginada(cursor, 'usuarios', 'created_at')
         conn.close()
-        return jsonify([dict(row) for row in rows])
+        return resposta
 
     elif request.method == 'POST':
         data = request.json
@@ -3644,27 +5993,23 @@ def usuarios():
                     senha_hash
                 ))
 
+            conn.commit()
+
             # Registrar log de criação
             if data.get('criado_por'):
-                cursor.execute('''
-                    INSERT INTO logs_auditoria (usuario_id, acao, tabela_afetada, registro_id, descricao)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
+                registrar_auditoria(
                     data['criado_por'],
                     'criacao_usuario',
+                    f"Criação do usuário {data['nome_completo']} com cargo {data['cargo']}",
                     'usuarios',
-                    str(usuario_id),
-                    f"Criação do usuário {data['nome_completo']} com cargo {data['cargo']}"
-                ))
-
-            conn.commit()
+                    str(usuario_id)
+                )
 
             # Buscar o usuário criado
-            cursor.execute('SELECT * FROM usuarios WHERE id = ?', (usuario_id,))
-            novo_usuario = cursor.fetchone()
+            novo_usuario = ler_registro(cursor, 'usuarios', usuario_id)
             conn.close()
 
-            return jsonify(dict(novo_usuario)), 201
+            return jsonify(novo_usuario), 201
 
         except sqlite3.IntegrityError as e:
             conn.rollback()
@@ -3683,14 +6028,18 @@ def usuario_especifico(id):
     cursor = conn.cursor()
 
     if request.method == 'GET':
-        cursor.execute('SELECT * FROM usuarios WHERE id = ?', (id,))
-        usuario = cursor.fetchone()
+        try:
+            campos = campos_pedidos(cursor, 'usuarios')
+        except ValueError as e:
+            conn.close()
+            return jsonify({'error': str(e)}), 400
+        usuario = ler_registro(cursor, 'usuarios', id, campos)
         conn.close()
 
         if not usuario:
             return jsonify({'error': 'Usuário não encontrado'}), 404
 
-        return jsonify(dict(usuario))
+        return jsonify(projetar(usuario, campos))
 
     elif request.method == 'PUT':
         data = request.json
@@ -3702,6 +6051,9 @@ def usuario_especifico(id):
             conn.close()
             return jsonify({'error': 'Usuário não encontrado'}), 404
 
+        # Entradas de auditoria (acao, descricao), registradas após o commit
+        auditoria = []
+
         # Atualizar senha se fornecida
         if data.get('senha_hash'):
             senha_hash = hashlib.sha256(data['senha_hash'].encode()).hexdigest()
@@ -3713,16 +6065,7 @@ def usuario_especifico(id):
 
             # Registrar log de alteração de senha
             if data.get('usuario_id'):
-                cursor.execute('''
-                    INSERT INTO logs_auditoria (usuario_id, acao, tabela_afetada, registro_id, descricao)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    data['usuario_id'],
-                    'alteracao_senha',
-                    'usuarios',
-                    str(id),
-                    f"Senha alterada para {usuario_anterior['nome_completo']}"
-                ))
+                auditoria.append(('alteracao_senha', f"Senha alterada para {usuario_anterior['nome_completo']}"))
 
         # Atualizar outros campos se fornecidos
         if data.get('cargo') and data['cargo'] != usuario_anterior['cargo']:
@@ -3734,16 +6077,7 @@ def usuario_especifico(id):
 
             # Registrar log de alteração de hierarquia
             if data.get('usuario_id'):
-                cursor.execute('''
-                    INSERT INTO logs_auditoria (usuario_id, acao, tabela_afetada, registro_id, descricao)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    data['usuario_id'],
-                    'alteracao_hierarquia',
-                    'usuarios',
-                    str(id),
-                    f"Hierarquia alterada de {usuario_anterior['cargo']} para {data['cargo']}"
-                ))
+                auditoria.append(('alteracao_hierarquia', f"Hierarquia alterada de {usuario_anterior['cargo']} para {data['cargo']}"))
 
         if 'status' in data:
             cursor.execute('''
@@ -3751,14 +6085,18 @@ def usuario_especifico(id):
                 SET status = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
             ''', (data['status'], id))
+            if data['status'] != 'ativo':
+                revogar_sessoes(cursor, id)
 
         conn.commit()
+        invalidar_autenticacao(id)
+        for acao, descricao in auditoria:
+            registrar_auditoria(data['usuario_id'], acao, descricao, 'usuarios', str(id))
 
-        cursor.execute('SELECT * FROM usuarios WHERE id = ?', (id,))
-        usuario_atualizado = cursor.fetchone()
+        usuario_atualizado = ler_registro(cursor, 'usuarios', id)
         conn.close()
 
-        return jsonify(dict(usuario_atualizado))
+        return jsonify(usuario_atualizado)
 
     elif request.method == 'DELETE':
         cursor.execute('SELECT * FROM usuarios WHERE id = ?', (id,))
@@ -3768,40 +6106,229 @@ def usuario_especifico(id):
             conn.close()
             return jsonify({'error': 'Usuário não encontrado'}), 404
 
+        revogar_sessoes(cursor, id)
+        cursor.execute('DELETE FROM usuarios WHERE id = ?', (id,))
+        conn.commit()
+        conn.close()
+        invalidar_autenticacao(id)
+
         # Registrar log de exclusão
         data = request.json
         if data and data.get('usuario_id'):
-            cursor.execute('''
-                INSERT INTO logs_auditoria (usuario_id, acao, tabela_afetada, registro_id, descricao)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
+            registrar_auditoria(
                 data['usuario_id'],
                 'exclusao_usuario',
+                f"Exclusão do usuário {usuario['nome_completo']} ({usuario['email']})",
                 'usuarios',
-                str(id),
-                f"Exclusão do usuário {usuario['nome_completo']} ({usuario['email']})"
-            ))
-
-        cursor.execute('DELETE FROM usuarios WHERE id = ?', (id,))
-        conn.commit()
-        conn.close()
+                str(id)
+            )
 
         return jsonify({'message': 'Usuário excluído com sucesso'})
 
+# Consulta do log de auditoria: filtros por igualdade e por período, em ordem
+# (created_at, id) decrescente, paginada por cursor. Cada filtro tem um índice
+# (coluna, created_at, id), então cada página é uma busca no índice.
+FILTROS_AUDITORIA = ('usuario_id', 'acao', 'tabela_afetada')
+COLUNAS_EXPORTACAO_AUDITORIA = [
+    'id', 'created_at', 'usuario_id', 'usuario_nome', 'acao', 'tabela_afetada',
+    'registro_id', 'descricao', 'ip_address', 'dados_anteriores', 'dados_novos',
+]
+
+def filtros_auditoria():
+    """Filtros da URL já validados; levanta ValueError se algum for inválido."""
+    filtros = {}
+    for campo in FILTROS_AUDITORIA:
+        valor = request.args.get(campo)
+        if valor:
+            filtros[campo] = valor
+    if 'usuario_id' in filtros:
+        try:
+            filtros['usuario_id'] = int(filtros['usuario_id'])
+        except ValueError:
+            raise ValueError('usuario_id deve ser um número inteiro')
+    for parametro in ('dataInicio', 'dataFim'):
+        valor = request.args.get(parametro)
+        if valor:
+            try:
+                filtros[parametro] = datetime.strptime(valor, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f'{parametro} deve estar no formato AAAA-MM-DD')
+    return filtros
+
+def consultar_auditoria(cursor, filtros, apos=None, limite=LIMITE_PAGINA_PADRAO):
+    """Uma página do log: linhas depois do cursor (created_at, id), mais recentes primeiro.
+
+    Começa pelo banco principal e desce pelos meses arquivados só enquanto
+    eles ainda podem entrar na página e no período pedido."""
+    logs = _consultar_auditoria(cursor, 'logs_auditoria', filtros, apos, limite)
+    inicio_periodo = filtros['dataInicio'].strftime('%Y-%m-%d') if 'dataInicio' in filtros else None
+    fim_periodo = (filtros['dataFim'] + timedelta(days=1)).strftime('%Y-%m-%d') if 'dataFim' in filtros else None
+
+    for mes in meses_arquivados():
+        inicio, fim = f'{mes}-01', f'{proximo_mes(mes)}-01'
+        if (fim_periodo and inicio >= fim_periodo) or (apos and inicio > apos[0]):
+            continue
+        if inicio_periodo and fim <= inicio_periodo:
+            break
+        # Página já cheia só com linhas mais novas que tudo o que está neste mês
+        # (e nos anteriores)
+        if len(logs) >= limite and (logs[limite - 1]['created_at'] or '') >= fim:
+            break
+        anexar_arquivo_auditoria(cursor, mes, 'arquivo_auditoria')
+        try:
+            logs += _consultar_auditoria(cursor, 'arquivo_auditoria.logs_auditoria', filtros, apos, limite)
+        finally:
+            cursor.execute('DETACH DATABASE arquivo_auditoria')
+        logs.sort(key=lambda log: (log['created_at'] or '', log['id']), reverse=True)
+        del logs[limite:]
+    return logs
+
+def _consultar_auditoria(cursor, tabela, filtros, apos, limite):
+    condicoes = []
+    parametros = []
+    for campo in FILTROS_AUDITORIA:
+        if campo in filtros:
+            condicoes.append(f'l.{campo} = ?')
+            parametros.append(filtros[campo])
+    # Período comparado direto com a coluna (formato de CURRENT_TIMESTAMP),
+    # para o filtro usar o índice
+    if 'dataInicio' in filtros:
+        condicoes.append('l.created_at >= ?')
+        parametros.append(filtros['dataInicio'].strftime('%Y-%m-%d'))
+    if 'dataFim' in filtros:
+        condicoes.append('l.created_at < ?')
+        parametros.append((filtros['dataFim'] + timedelta(days=1)).strftime('%Y-%m-%d'))
+    if apos:
+        condicoes.append('(l.created_at, l.id) < (?, ?)')
+        parametros.extend(apos)
+
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+    cursor.execute(f'''
+        SELECT l.*, u.nome_completo as usuario_nome
+        FROM {tabela} l
+        LEFT JOIN main.usuarios u ON l.usuario_id = u.id
+        {where}
+        ORDER BY l.created_at DESC, l.id DESC
+        LIMIT ?
+    ''', parametros + [limite])
+    return [dict(row) for row in cursor.fetchall()]
+
 @app.route('/api/logs-auditoria', methods=['GET'])
 def logs_auditoria():
+    try:
+        filtros = filtros_auditoria()
+        limite = limite_pagina()
+        apos = decodificar_cursor(request.args['cursor'], 2) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT l.*, u.nome_completo as usuario_nome
-        FROM logs_auditoria l
-        LEFT JOIN usuarios u ON l.usuario_id = u.id
-        ORDER BY l.created_at DESC
-        LIMIT 1000
-    ''')
-    rows = cursor.fetchall()
+    # Uma linha a mais indica se existe próxima página
+    logs = consultar_auditoria(cursor, filtros, apos, limite + 1)
+    conn.close()
+
+    proximo_cursor = None
+    if len(logs) > limite:
+        logs = logs[:limite]
+        proximo_cursor = codificar_cursor([logs[-1]['created_at'], logs[-1]['id']])
+    return resposta_paginada(logs, proximo_cursor)
+
+@app.route('/api/logs-auditoria/exportar', methods=['GET'])
+def exportar_logs_auditoria():
+    """Exporta o log filtrado em NDJSON (padrão) ou CSV, página por página.
+
+    Cada página é uma consulta curta pelo cursor, então a exportação não
+    guarda o log inteiro em memória nem segura uma leitura aberta no banco."""
+    formato = request.args.get('formato', 'ndjson')
+    if formato not in ('ndjson', 'csv'):
+        return jsonify({'error': 'formato deve ser ndjson ou csv'}), 400
+    try:
+        filtros = filtros_auditoria()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def paginas():
+        apos = None
+        while True:
+            conn = get_db()
+            logs = consultar_auditoria(conn.cursor(), filtros, apos, LIMITE_PAGINA_MAXIMO)
+            conn.close()
+            if not logs:
+                return
+            yield logs
+            apos = (logs[-1]['created_at'], logs[-1]['id'])
+
+    def gerar_ndjson():
+        for logs in paginas():
+            yield ''.join(json.dumps(log, ensure_ascii=False) + '\n' for log in logs)
+
+    def gerar_csv():
+        saida = io.StringIO()
+        escritor = csv.DictWriter(saida, fieldnames=COLUNAS_EXPORTACAO_AUDITORIA, extrasaction='ignore')
+        escritor.writeheader()
+        for logs in paginas():
+            escritor.writerows(logs)
+            yield saida.getvalue()
+            saida.seek(0)
+            saida.truncate()
+        yield saida.getvalue()
+
+    if formato == 'csv':
+        resposta = app.response_class(stream_with_context(gerar_csv()), mimetype='text/csv')
+    else:
+        resposta = app.response_class(stream_with_context(gerar_ndjson()), mimetype='application/x-ndjson')
+    resposta.headers['Content-Disposition'] = f'attachment; filename=logs-auditoria.{formato}'
+    return resposta
+
+@app.route('/api/busca', methods=['GET'])
+@verificar_permissao_gestao
+def busca_unificada():
+    """Busca pacientes e profissionais pelo nome ou documento, em todas as
+    tabelas de BUSCA_TEXTUAL (ou só nas de ?tipos=), mais relevantes primeiro."""
+    termo = request.args.get('q', '').strip()
+    if len(termo) < 2:
+        return jsonify({'error': 'Informe ao menos 2 caracteres para a busca'}), 400
+    tipos = [tipo for tipo in request.args.get('tipos', '').split(',') if tipo] or list(TIPOS_BUSCA)
+    invalidos = [tipo for tipo in tipos if tipo not in TIPOS_BUSCA]
+    if invalidos:
+        return jsonify({'error': f"Tipo(s) de busca inválido(s): {', '.join(invalidos)}"}), 400
+    try:
+        limite = max(1, min(int(request.args.get('limite', BUSCA_LIMITE_PADRAO)), BUSCA_LIMITE_MAXIMO))
+    except ValueError:
+        return jsonify({'error': 'limite deve ser um número inteiro'}), 400
+
+    consulta = consulta_fts(termo)
+    if consulta is None:
+        return jsonify([])
+
+    conn = get_db()
+    cursor = conn.cursor()
+    por_tipo = []
+    # Cada tabela devolve só os seus `limite` melhores, na ordem do bm25 dela
+    for tipo in tipos:
+        origem, nome = TIPOS_BUSCA[tipo]
+        cursor.execute(f'''
+            SELECT R.id, {nome} AS nome, R.cpf
+            FROM busca_{origem}
+            JOIN {origem} R ON R.id = busca_{origem}.rowid
+            WHERE busca_{origem} MATCH ?
+            ORDER BY busca_{origem}.rank
+            LIMIT ?
+        ''', (consulta, limite))
+        por_tipo.append([{'tipo': tipo, **dict(row)} for row in cursor.fetchall()])
     conn.close()
-    return jsonify([dict(row) for row in rows])
+
+    # O bm25 depende das estatísticas de cada índice (número de linhas, tamanho
+    # médio dos campos) e não se compara entre tabelas: a junção intercala as
+    # listas pela posição, o 1º de cada tipo, depois o 2º, e assim por diante
+    resultados = [
+        grupo[posicao]
+        for posicao in range(limite)
+        for grupo in por_tipo
+        if posicao < len(grupo)
+    ]
+    return resposta_lista(resultados[:limite])
 
 @app.route('/api/profissionais', methods=['GET'])
 @verificar_permissao_gestao
@@ -3812,9 +6339,12 @@ def listar_profissionais():
     # Parâmetros de busca e paginação
     busca = request.args.get('busca', '')
     categoria = request.args.get('categoria', 'Todos')
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 10))
-    offset = (page - 1) * per_page
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = max(1, min(int(request.args.get('per_page', 10)), LIMITE_PAGINA_MAXIMO))
+    except ValueError:
+        conn.close()
+        return jsonify({'error': 'page e per_page devem ser números inteiros'}), 400
 
     usuario = request.usuario_autenticado
     cargo = usuario.get('cargo', '')
@@ -3823,38 +6353,47 @@ def listar_profissionais():
     if cargo == 'Enfermeiro(a) Instrutor(a)':
         categoria = 'Enfermeiro(a) Aluno(a)'
 
-    # Query base
-    query_conditions = ['(nome_completo LIKE ? OR cpf LIKE ? OR cargo LIKE ?)']
-    params = [f'%{busca}%', f'%{busca}%', f'%{busca}%']
+    # Buscar todas as categorias existentes
+    cursor.execute('SELECT DISTINCT cargo FROM usuarios ORDER BY cargo')
+    todas_categorias = [row['cargo'] for row in cursor.fetchall()]
+
+    # Query base: nome e CPF pelo índice FTS5 (prefixo, sem acentos); o cargo
+    # é comparado aqui mesmo, contra a lista curta de cargos existentes
+    query_conditions = []
+    params = []
+    busca = busca.strip()
+    if busca:
+        consulta = consulta_fts(busca)
+        cargos = [c for c in todas_categorias if c and sem_acentos(busca) in sem_acentos(c)]
+        alternativas = []
+        if consulta:
+            alternativas.append('id IN (SELECT rowid FROM busca_usuarios WHERE busca_usuarios MATCH ?)')
+            params.append(consulta)
+        if cargos:
+            alternativas.append(f"cargo IN ({', '.join('?' for _ in cargos)})")
+            params.extend(cargos)
+        query_conditions.append(f"({' OR '.join(alternativas) or '0'})")
 
     # Adicionar filtro por categoria se não for "Todos"
     if categoria != 'Todos':
         query_conditions.append('cargo = ?')
         params.append(categoria)
 
-    query_base = f'''
-        FROM usuarios
-        WHERE {' AND '.join(query_conditions)}
-    '''
-
-    # Contar total de registros
-    cursor.execute(f'SELECT COUNT(*) as total {query_base}', params)
-    total = cursor.fetchone()['total']
-
-    # Buscar registros paginados
-    cursor.execute(f'''
-        SELECT id, nome_completo, cpf, cargo, status, profissao, telefone,
-               email, municipio, created_at
-        {query_base}
-        ORDER BY nome_completo ASC
-        LIMIT ? OFFSET ?
-    ''', params + [per_page, offset])
-
-    profissionais = [dict(row) for row in cursor.fetchall()]
+    # Total contado até LIMITE_CONTAGEM, para a paginação numerada
+    total = min(contar_ate_limite(cursor, 'usuarios', 'nome_completo', query_conditions, params), LIMITE_CONTAGEM)
 
-    # Buscar todas as categorias existentes
-    cursor.execute('SELECT DISTINCT cargo FROM usuarios ORDER BY cargo')
-    todas_categorias = [row['cargo'] for row in cursor.fetchall()]
+    # Página seguinte pelo cursor devolvido na anterior; OFFSET só quando a
+    # tela salta direto para uma página ainda não visitada
+    try:
+        profissionais, proximo_cursor = ler_pagina(
+            cursor,
+            'id, nome_completo, cpf, cargo, status, profissao, telefone, email, municipio, created_at',
+            'usuarios', 'nome_completo', query_conditions, params, crescente=True,
+            limite=per_page, deslocamento=(page - 1) * per_page,
+        )
+    except ValueError as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
 
     # Filtrar categorias baseado no cargo do usuário
     if cargo == 'Enfermeiro(a) Instrutor(a)':
@@ -3865,11 +6404,12 @@ def listar_profissionais():
     conn.close()
 
     return jsonify({
-        'profissionais': profissionais,
+        'profissionais': list(profissionais),
         'total': total,
         'page': page,
         'per_page': per_page,
         'total_pages': (total + per_page - 1) // per_page,
+        'proximo_cursor': proximo_cursor,
         'categorias': categorias,
         'cargo_usuario': cargo
     })
@@ -3880,14 +6420,18 @@ def obter_profissional(id):
     conn = get_db()
     cursor = conn.cursor()
 
-    cursor.execute('SELECT * FROM usuarios WHERE id = ?', (id,))
-    profissional = cursor.fetchone()
+    try:
+        campos = campos_pedidos(cursor, 'usuarios')
+    except ValueError as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 400
+    profissional = ler_registro(cursor, 'usuarios', id, campos)
     conn.close()
 
     if not profissional:
         return jsonify({'error': 'Profissional não encontrado'}), 404
 
-    return jsonify(dict(profissional))
+    return jsonify(projetar(profissional, campos))
 
 @app.route('/api/profissionais/<int:id>/status', methods=['PUT'])
 @verificar_permissao_admin
@@ -3913,27 +6457,26 @@ def atualizar_status_profissional(id):
         SET status = ?, updated_at = CURRENT_TIMESTAMP
         WHERE id = ?
     ''', (novo_status, id))
+    if novo_status != 'ativo':
+        revogar_sessoes(cursor, id)
+
+    conn.commit()
+    invalidar_autenticacao(id)
 
     # Registrar log
     if data.get('usuario_id'):
-        cursor.execute('''
-            INSERT INTO logs_auditoria (usuario_id, acao, tabela_afetada, registro_id, descricao)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
+        registrar_auditoria(
             data['usuario_id'],
             'alteracao_status',
+            f"Status alterado de {usuario['status']} para {novo_status} para {usuario['nome_completo']}",
             'usuarios',
-            str(id),
-            f"Status alterado de {usuario['status']} para {novo_status} para {usuario['nome_completo']}"
-        ))
-
-    conn.commit()
+            str(id)
+        )
 
-    cursor.execute('SELECT * FROM usuarios WHERE id = ?', (id,))
-    usuario_atualizado = cursor.fetchone()
+    usuario_atualizado = ler_registro(cursor, 'usuarios', id)
     conn.close()
 
-    return jsonify(dict(usuario_atualizado))
+    return jsonify(usuario_atualizado)
 
 @app.route('/api/profissionais/<int:id>', methods=['PUT'])
 @verificar_permissao_gestao
@@ -3977,26 +6520,23 @@ def editar_profissional(id):
     query = f"UPDATE usuarios SET {', '.join(campos_atualizacao)} WHERE id = ?"
     cursor.execute(query, valores)
 
+    conn.commit()
+    invalidar_autenticacao(id)
+
     # Registrar log
     if data.get('usuario_id'):
-        cursor.execute('''
-            INSERT INTO logs_auditoria (usuario_id, acao, tabela_afetada, registro_id, descricao)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
+        registrar_auditoria(
             data['usuario_id'],
             'edicao',
+            f"Edição do profissional {usuario['nome_completo']}",
             'usuarios',
-            str(id),
-            f"Edição do profissional {usuario['nome_completo']}"
-        ))
-
-    conn.commit()
+            str(id)
+        )
 
-    cursor.execute('SELECT * FROM usuarios WHERE id = ?', (id,))
-    usuario_atualizado = cursor.fetchone()
+    usuario_atualizado = ler_registro(cursor, 'usuarios', id)
     conn.close()
 
-    return jsonify(dict(usuario_atualizado))
+    return jsonify(usuario_atualizado)
 
 @app.route('/api/profissionais/<int:id>', methods=['DELETE'])
 @verificar_permissao_gestao
@@ -4012,27 +6552,27 @@ def excluir_profissional(id):
         conn.close()
         return jsonify({'error': 'Profissional não encontrado'}), 404
 
-    # Registrar log antes de excluir
-    if data and data.get('usuario_id'):
-        cursor.execute('''
-            INSERT INTO logs_auditoria (usuario_id, acao, tabela_afetada, registro_id, descricao)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            data['usuario_id'],
-            'exclusao',
-            'usuarios',
-            str(id),
-            f"Profissional {usuario['nome_completo']} (CPF: {usuario['cpf']}) foi excluído"
-        ))
-
     # Excluir o profissional
+    revogar_sessoes(cursor, id)
     cursor.execute('DELETE FROM usuarios WHERE id = ?', (id,))
     conn.commit()
     conn.close()
+    invalidar_autenticacao(id)
+
+    # Registrar log da exclusão
+    if data and data.get('usuario_id'):
+        registrar_auditoria(
+            data['usuario_id'],
+            'exclusao',
+            f"Profissional {usuario['nome_completo']} (CPF: {usuario['cpf']}) foi excluído",
+            'usuarios',
+            str(id)
+        )
 
     return jsonify({'message': 'Profissional excluído com sucesso'})
 
 @app.route('/api/dashboard/gestao', methods=['GET'])
+@em_cache('usuarios', 'contadores', 'agendamentos_por_status')
 def dashboard_gestao():
     conn = get_db()
     cursor = conn.cursor()
@@ -4085,24 +6625,18 @@ def dashboard_gestao():
     """)
     profissionais_por_modulo = {row['modulo']: row['total'] for row in cursor.fetchall()}
 
-    # Total de pacientes ambulatoriais
-    cursor.execute("SELECT COUNT(*) as total FROM pacientes")
-    total_pacientes_ambulatorial = cursor.fetchone()['total']
-
-    # Total de pacientes de capacitação
-    cursor.execute("SELECT COUNT(*) as total FROM pacientes_capacitacao")
-    total_pacientes_capacitacao = cursor.fetchone()['total']
+    # Total de pacientes ambulatoriais e de capacitação (contadores mantidos por triggers)
+    contadores = ler_contadores(cursor)
+    total_pacientes_ambulatorial = contadores.get('pacientes', 0)
+    total_pacientes_capacitacao = contadores.get('pacientes_capacitacao', 0)
 
     # Total geral de pacientes
     total_pacientes = total_pacientes_ambulatorial + total_pacientes_capacitacao
 
     # Agendamentos pendentes
-    cursor.execute("""
-        SELECT COUNT(*) as total
-        FROM agendamentos_municipios
-        WHERE status = 'agendado'
-    """)
-    agendamentos_pendentes = cursor.fetchone()['total']
+    cursor.execute("SELECT total FROM agendamentos_por_status WHERE status = 'agendado'")
+    row = cursor.fetchone()
+    agendamentos_pendentes = row['total'] if row else 0
 
     conn.close()
 
@@ -4118,6 +6652,89 @@ def dashboard_gestao():
         'agendamentos_pendentes': agendamentos_pendentes
     })
 
+def comando_verificar_agregados():
+    conn = get_db()
+    cursor = conn.cursor()
+    divergencias = (verificar_agregados(cursor) + verificar_estatisticas_municipios(cursor)
+                    + verificar_resumo_ambulatorial(cursor) + verificar_indicadores_paciente(cursor)
+                    + verificar_saldos_insumos(cursor))
+    conn.close()
+
+    for chave, gravado, esperado in divergencias:
+        print(f"  {chave}: gravado={gravado} esperado={esperado}")
+    if divergencias:
+        print(f"✗ {len(divergencias)} agregado(s) divergente(s); rode 'python app.py reconstruir-agregados'")
+        return 1
+    print("✓ Agregados conferem com as tabelas de origem")
+    return 0
+
+def comando_reconstruir_agregados():
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        divergencias = (verificar_agregados(cursor) + verificar_estatisticas_municipios(cursor)
+                        + verificar_resumo_ambulatorial(cursor) + verificar_indicadores_paciente(cursor)
+                        + verificar_saldos_insumos(cursor))
+        for chave, gravado, esperado in divergencias:
+            print(f"  {chave}: gravado={gravado} esperado={esperado}")
+        reconstruir_agregados(cursor)
+        reconstruir_estatisticas_municipios(cursor)
+        reconstruir_resumo_ambulatorial(cursor)
+        reconstruir_indicadores_paciente(cursor)
+        reconstruir_saldos_insumos(cursor)
+        if (verificar_agregados(cursor) or verificar_estatisticas_municipios(cursor)
+                or verificar_resumo_ambulatorial(cursor) or verificar_indicadores_paciente(cursor)
+                or verificar_saldos_insumos(cursor)):
+            raise RuntimeError('agregados ainda divergem depois da reconstrução')
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        print(f"✗ Erro ao reconstruir agregados: {e}")
+        return 1
+    conn.close()
+    print(f"✓ Agregados reconstruídos ({len(divergencias)} divergência(s) corrigida(s))")
+    return 0
+
+def comando_arquivar_auditoria():
+    try:
+        dias = int(sys.argv[2]) if len(sys.argv) > 2 else AUDITORIA_RETENCAO_DIAS
+    except ValueError:
+        print(f"✗ Número de dias inválido: {sys.argv[2]}")
+        return 2
+    try:
+        arquivados = arquivar_auditoria(dias)
+    except (sqlite3.Error, OSError, RuntimeError) as e:
+        print(f"✗ Erro ao arquivar a auditoria: {e}")
+        return 1
+    for mes, removidas in arquivados:
+        print(f"  {mes}: {removidas} entrada(s) em {arquivo_auditoria_mes(mes)}")
+    print(f"✓ Auditoria com mais de {dias} dias arquivada ({len(arquivados)} mês(es))")
+    return 0
+
+def comando_limpar_arquivos():
+    try:
+        apagados = limpar_blobs_orfaos()
+    except (sqlite3.Error, OSError) as e:
+        print(f"✗ Erro ao limpar os arquivos: {e}")
+        return 1
+    print(f"✓ {apagados} arquivo(s) sem referência apagado(s) de {diretorio_blobs()}")
+    return 0
+
+# Comandos de manutenção: python app.py <comando>
+COMANDOS = {
+    'verificar-agregados': comando_verificar_agregados,
+    'reconstruir-agregados': comando_reconstruir_agregados,
+    'arquivar-auditoria': comando_arquivar_auditoria,
+    'limpar-arquivos': comando_limpar_arquivos,
+}
+
 if __name__ == '__main__':
     init_db()
+    if len(sys.argv) > 1:
+        if sys.argv[1] not in COMANDOS:
+            print(f"Comando desconhecido: {sys.argv[1]}. Disponíveis: {', '.join(COMANDOS)}")
+            sys.exit(2)
+        sys.exit(COMANDOS[sys.argv[1]]())
     app.run(debug=True, port=5000, host='0.0.0.0')
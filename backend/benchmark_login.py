@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark do login sob rajada (o pico de acessos do início do expediente).
+
+Sobe o app contra um banco temporário com usuários de teste e dispara logins
+simultâneos por várias threads, como um worker do gunicorn com --threads.
+Mostra p50/p95/p99 da latência e a taxa de logins por segundo do worker.
+
+Uso:
+    cd backend && python benchmark_login.py [--usuarios 500] [--logins 2000] [--threads 8]
+"""
+
+import argparse
+import hashlib
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as backend
+
+SENHA = 'Senha@123'
+
+
+def preparar_banco(total_usuarios):
+    backend.DB_PATH = os.path.join(tempfile.mkdtemp(), 'database.db')
+    backend.init_db()
+    conn = backend.get_db()
+    senha_hash = hashlib.sha256(SENHA.encode()).hexdigest()
+    conn.executemany('''
+        INSERT INTO usuarios (nome_completo, email, cpf, senha_hash, cargo, status, password_last_changed_at)
+        VALUES (?, ?, ?, ?, 'Enfermeiro(a) Aluno(a)', 'ativo', ?)
+    ''', [
+        (f'Usuário {i}', f'usuario{i}@teste.com', f'{i:011d}', senha_hash, backend.datetime.now().isoformat())
+        for i in range(1, total_usuarios + 1)
+    ])
+    conn.commit()
+    conn.close()
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def rajada(total_usuarios, total_logins, total_threads):
+    latencias = []
+    erros = []
+    lock = threading.Lock()
+    proximo = iter(range(total_logins))
+
+    def trabalhador():
+        client = backend.app.test_client()
+        while True:
+            with lock:
+                i = next(proximo, None)
+            if i is None:
+                return
+            cpf = f'{i % total_usuarios + 1:011d}'
+            inicio = time.perf_counter()
+            resposta = client.post('/api/auth/login', json={'cpf': cpf, 'senha': SENHA})
+            duracao = time.perf_counter() - inicio
+            with lock:
+                latencias.append(duracao)
+                if resposta.status_code != 200:
+                    erros.append(resposta.status_code)
+
+    threads = [threading.Thread(target=trabalhador) for _ in range(total_threads)]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencias, erros, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--usuarios', type=int, default=500)
+    parser.add_argument('--logins', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    preparar_banco(args.usuarios)
+    # Aquece conexões e caches antes de medir
+    rajada(args.usuarios, args.threads * 5, args.threads)
+
+    latencias, erros, duracao = rajada(args.usuarios, args.logins, args.threads)
+    inicio_auditoria = time.perf_counter()
+    backend.descarregar_auditoria()
+    drenagem = time.perf_counter() - inicio_auditoria
+
+    ms = [latencia * 1000 for latencia in latencias]
+    print(f"{args.logins} logins, {args.threads} threads, {args.usuarios} usuários")
+    print(f"  p50  {percentil(ms, 50):7.2f} ms")
+    print(f"  p95  {percentil(ms, 95):7.2f} ms")
+    print(f"  p99  {percentil(ms, 99):7.2f} ms")
+    print(f"  máx  {max(ms):7.2f} ms   média {statistics.mean(ms):.2f} ms")
+    print(f"  {args.logins / duracao:.0f} logins/s por worker")
+    print(f"  auditoria gravada {drenagem * 1000:.0f} ms depois da rajada")
+    if erros:
+        print(f"✗ {len(erros)} login(s) com erro: {sorted(set(erros))}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Fixtures dos testes do backend.
+
+Cada teste recebe um banco novo em tmp_path, com todas as migrações aplicadas;
+DB_PATH volta ao valor original no fim do teste. Para rodar:
+    cd backend && python -m pytest -q
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as backend
+
+# Scripts que testam um servidor já rodando (python test_connection.py etc.)
+collect_ignore = ['test_api.py', 'test_connection.py', 'test_cors.py']
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Caminho de um banco novo, já migrado, usado por get_db() durante o teste."""
+    backend.fechar_conexoes()
+    monkeypatch.setattr(backend, 'DB_PATH', str(tmp_path / 'database.db'))
+    backend.init_db()
+    yield backend.DB_PATH
+    # A auditoria enfileirada pelo teste vai para este banco, não para o próximo
+    backend.descarregar_auditoria()
+    backend.fechar_conexoes()
+
+
+@pytest.fixture
+def client(banco):
+    return backend.app.test_client()
+
+
+@pytest.fixture
+def executar(banco):
+    """Roda um comando no banco do teste, com commit; devolve o cursor."""
+    def executar(sql, parametros=()):
+        conn = backend.get_db()
+        cursor = conn.execute(sql, parametros)
+        conn.commit()
+        conn.close()
+        return cursor
+    return executar
+
+
+@pytest.fixture
+def cabecalhos_admin(client):
+    """Authorization com o token do administrador criado por init_db()."""
+    resposta = client.post('/api/auth/login', json={'cpf': '123.456.789-09', 'senha': 'Admin@123'})
+    return {'Authorization': f"Bearer {resposta.get_json()['token']}"}
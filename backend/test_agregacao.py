@@ -0,0 +1,94 @@
+"""
+Teste da agregação condicional em uma passada (FONTES_AGREGACAO).
+
+/api/distribuicao/stats e o detalhamento de /api/capacitacao/stats
+(?agrupar=municipio,mes) calculam todas as métricas numa única leitura de cada
+tabela, com os mesmos valores de contagens separadas, e os grupos somam o
+total.
+"""
+
+import app as backend
+
+
+def municipio_id(nome):
+    conn = backend.get_db()
+    encontrado = conn.execute('SELECT id FROM municipios WHERE nome = ?', (nome,)).fetchone()['id']
+    conn.close()
+    return encontrado
+
+
+def inserir_solicitacao(executar, municipio, tipo, solicitada, status, autorizada, data):
+    executar('''
+        INSERT INTO solicitacoes_insumos
+            (municipio_id, tipo_insumo, quantidade_solicitada, status, quantidade_autorizada, data_solicitacao)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (municipio_id(municipio), tipo, solicitada, status, autorizada, data))
+
+
+def somar_grupos(grupos, dimensao):
+    soma = {}
+    for grupo in grupos:
+        for chave, valor in grupo.items():
+            if chave != dimensao:
+                soma[chave] = soma.get(chave, 0) + valor
+    return soma
+
+
+def test_distribuicao_em_uma_passada(client, executar):
+    inserir_solicitacao(executar, 'Maceió', 'DIU', 10, 'Autorizado', 8, '2024-01-05 10:00:00')
+    inserir_solicitacao(executar, 'Maceió', 'Implanon', 5, 'Não autorizado', 0, '2024-01-20 10:00:00')
+    inserir_solicitacao(executar, 'Arapiraca', 'DIU', 7, 'Aguardando confirmação', 0, '2024-02-01 10:00:00')
+    inserir_solicitacao(executar, 'Arapiraca', 'Implanon', 4, 'Autorizado', 4, '2024-02-03 10:00:00')
+
+    comandos = []
+    backend.DB_TRACE = comandos.append
+    backend.fechar_conexoes()
+    try:
+        resposta = client.get('/api/distribuicao/stats?agrupar=municipio,mes')
+    finally:
+        backend.DB_TRACE = None
+        backend.fechar_conexoes()
+    assert resposta.status_code == 200
+    dados = resposta.get_json()
+    assert len([sql for sql in comandos if 'FROM solicitacoes_insumos' in sql]) == 1
+
+    total = {chave: valor for chave, valor in dados.items() if chave not in ('porMunicipio', 'porMes')}
+    assert total == {
+        'totalSolicitacoes': 4, 'totalAutorizadas': 2, 'totalNegadas': 1, 'totalAguardando': 1,
+        'totalDiusSolicitados': 17, 'totalDiusAutorizados': 8,
+        'totalImplanonsSolicitados': 9, 'totalImplanonsAutorizados': 4,
+    }
+    assert [grupo['municipio'] for grupo in dados['porMunicipio']] == ['Arapiraca', 'Maceió']
+    assert [grupo['mes'] for grupo in dados['porMes']] == ['2024-01', '2024-02']
+    assert somar_grupos(dados['porMunicipio'], 'municipio') == total
+    assert somar_grupos(dados['porMes'], 'mes') == total
+    assert dados['porMunicipio'][1]['totalDiusAutorizados'] == 8
+
+    assert client.get('/api/distribuicao/stats?agrupar=ano').status_code == 400
+
+
+def test_capacitacao_detalhada_soma_o_total(client, executar):
+    ana = executar("INSERT INTO enfermeiras_alunas (nome, cpf, municipio) VALUES ('Ana', '111', 'Maceió')").lastrowid
+    bia = executar("INSERT INTO enfermeiras_alunas (nome, cpf, municipio) VALUES ('Bia', '222', 'Arapiraca')").lastrowid
+    for aluna, metodo, data in ((ana, 'DIU', '2024-01-10'), (ana, 'Implanon', '2024-02-10'), (bia, 'DIU', '2024-02-11')):
+        executar('''
+            INSERT INTO fichas_atendimento_pdf (enfermeira_aluna_id, nome_arquivo, metodo_inserido, data_anexacao)
+            VALUES (?, 'ficha.pdf', ?, ?)
+        ''', (aluna, metodo, data))
+    executar('''
+        INSERT INTO insercoes_diu (enfermeira_aluna_id, metodo_contraceptivo, tipo_diu, data_insercao)
+        VALUES (?, 'DIU', '', '2024-01-15')
+    ''', (bia,))
+    executar("INSERT INTO agendamentos_municipios (municipio, data_agendamento) VALUES ('Maceió', '2024-01-03')")
+
+    simples = client.get('/api/capacitacao/stats').get_json()
+    dados = client.get('/api/capacitacao/stats?agrupar=municipio,mes').get_json()
+    # Os totais vêm dos contadores; o detalhamento, da agregação
+    assert {chave: dados[chave] for chave in simples} == simples
+    assert (simples['totalDius'], simples['totalImplanons'], simples['totalAgendamentos']) == (3, 1, 1)
+
+    aditivos = ('totalAgendamentos', 'totalDius', 'totalImplanons')
+    for dimensao, grupos in (('municipio', dados['porMunicipio']), ('mes', dados['porMes'])):
+        assert somar_grupos(grupos, dimensao) == {chave: simples[chave] for chave in aditivos}
+    assert {grupo['municipio']: grupo['totalDius'] for grupo in dados['porMunicipio']} == {'Arapiraca': 2, 'Maceió': 1}
+    assert {grupo['mes']: grupo['totalDius'] for grupo in dados['porMes']} == {'2024-01': 2, '2024-02': 1}
@@ -0,0 +1,112 @@
+"""
+Teste dos agregados dos painéis mantidos por triggers (AGREGADOS).
+
+Depois de qualquer sequência de inserções, alterações e exclusões, os
+contadores batem com uma recontagem nas tabelas de origem, e
+/api/capacitacao/stats devolve os mesmos totais que uma contagem direta.
+"""
+
+import app as backend
+
+
+def inserir_aluna(executar, nome, cpf, municipio):
+    return executar('INSERT INTO enfermeiras_alunas (nome, cpf, municipio) VALUES (?, ?, ?)',
+                    (nome, cpf, municipio)).lastrowid
+
+
+def inserir_ficha(executar, aluna_id, metodo, cpf_paciente):
+    return executar('''
+        INSERT INTO fichas_atendimento_pdf (enfermeira_aluna_id, nome_arquivo, metodo_inserido, cpf_paciente)
+        VALUES (?, 'ficha.pdf', ?, ?)
+    ''', (aluna_id, metodo, cpf_paciente)).lastrowid
+
+
+def inserir_insercao(executar, aluna_id, paciente_id, metodo):
+    return executar('''
+        INSERT INTO insercoes_diu (enfermeira_aluna_id, paciente_id, metodo_contraceptivo, tipo_diu, data_insercao)
+        VALUES (?, ?, ?, '', '2024-01-10')
+    ''', (aluna_id, paciente_id, metodo)).lastrowid
+
+
+def inserir_agendamento(executar, status):
+    return executar('''
+        INSERT INTO agendamentos_municipios (municipio, data_agendamento, status) VALUES ('Maceió', '2024-01-10', ?)
+    ''', (status,)).lastrowid
+
+
+def consultar(sql):
+    conn = backend.get_db()
+    resultado = dict(conn.execute(sql).fetchall())
+    conn.close()
+    return resultado
+
+
+def divergencias():
+    conn = backend.get_db()
+    resultado = backend.verificar_agregados(conn.cursor())
+    conn.close()
+    return resultado
+
+
+def stats(client):
+    resposta = client.get('/api/capacitacao/stats')
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def test_contadores_seguem_as_escritas(client, executar):
+    ana = inserir_aluna(executar, 'Ana', '111', 'Maceió')
+    bia = inserir_aluna(executar, 'Bia', '222', 'Arapiraca')
+    repetida = inserir_ficha(executar, ana, 'DIU', '900')
+    outra_repetida = inserir_ficha(executar, ana, 'DIU', '900')
+    inserir_ficha(executar, ana, 'Implanon', '901')
+    da_bia = inserir_ficha(executar, bia, 'DIU', '902')
+    inserir_insercao(executar, ana, 1, 'DIU')
+    inserir_insercao(executar, bia, 1, 'Implanon')
+    # Sem aluna nem instrutora: fora da capacitação
+    inserir_insercao(executar, None, 2, 'DIU')
+    agendado = inserir_agendamento(executar, 'Agendado')
+    inserir_agendamento(executar, 'Agendado')
+    inserir_agendamento(executar, 'Realizado')
+    assert divergencias() == []
+
+    assert stats(client) == {
+        'totalAgendamentos': 3, 'totalDius': 4, 'totalImplanons': 2, 'totalInstrutoras': 0,
+        'totalAlunas': 2, 'totalPacientesComInsercao': 4,
+    }
+    assert consultar('SELECT enfermeira_aluna_id, total FROM fichas_por_aluna') == {ana: 3, bia: 1}
+    assert consultar('SELECT status, total FROM agendamentos_por_status') == {'Agendado': 2, 'Realizado': 1}
+
+    # Método corrigido, paciente repetida apagada e ficha passada para outra aluna
+    executar("UPDATE fichas_atendimento_pdf SET metodo_inserido = 'Implanon' WHERE id = ?", (outra_repetida,))
+    executar('DELETE FROM fichas_atendimento_pdf WHERE id = ?', (repetida,))
+    executar('UPDATE fichas_atendimento_pdf SET enfermeira_aluna_id = ? WHERE id = ?', (ana, da_bia))
+    executar("UPDATE agendamentos_municipios SET status = 'Realizado' WHERE id = ?", (agendado,))
+    assert divergencias() == []
+
+    atual = stats(client)
+    assert (atual['totalDius'], atual['totalImplanons']) == (2, 3)
+    # A paciente 900 continua com uma ficha
+    assert atual['totalPacientesComInsercao'] == 4
+    assert consultar('SELECT enfermeira_aluna_id, total FROM fichas_por_aluna') == {ana: 3}
+    assert consultar('SELECT status, total FROM agendamentos_por_status') == {'Agendado': 1, 'Realizado': 2}
+
+    executar('DELETE FROM fichas_atendimento_pdf')
+    executar('DELETE FROM insercoes_diu')
+    assert divergencias() == []
+    atual = stats(client)
+    assert (atual['totalDius'], atual['totalImplanons'], atual['totalPacientesComInsercao']) == (0, 0, 0)
+    # Linhas zeradas são apagadas
+    assert consultar('SELECT enfermeira_aluna_id, total FROM fichas_por_aluna') == {}
+
+
+def test_verificacao_aponta_e_reconstrucao_corrige(executar):
+    inserir_agendamento(executar, 'Agendado')
+    executar("UPDATE contadores SET valor = 7 WHERE chave = 'agendamentos_municipios'")
+    assert divergencias() == [(('contadores', 'agendamentos_municipios'), 7, 1)]
+
+    conn = backend.get_db()
+    backend.reconstruir_agregados(conn.cursor())
+    conn.commit()
+    conn.close()
+    assert divergencias() == []
@@ -0,0 +1,101 @@
+"""
+Teste do arquivamento mensal da auditoria.
+
+Os meses antigos saem do banco principal para um arquivo SQLite somente
+leitura por mês, e a consulta paginada continua enxergando todas as entradas,
+na mesma ordem, anexando os arquivos só quando precisa.
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture(autouse=True)
+def log_vazio(banco):
+    # Sem as entradas gravadas por init_db()
+    backend.descarregar_auditoria()
+    conn = sqlite3.connect(banco)
+    conn.execute('DELETE FROM logs_auditoria')
+    conn.commit()
+    conn.close()
+
+
+def inserir_logs(datas):
+    conn = sqlite3.connect(backend.DB_PATH)
+    conn.executemany(
+        "INSERT INTO logs_auditoria (usuario_id, acao, descricao, created_at) VALUES (1, 'teste', ?, ?)",
+        [(f'entrada {data}', data) for data in datas],
+    )
+    conn.commit()
+    conn.close()
+
+
+def contar_principal():
+    conn = sqlite3.connect(backend.DB_PATH)
+    total = conn.execute('SELECT COUNT(*) FROM logs_auditoria').fetchone()[0]
+    conn.close()
+    return total
+
+
+def todas_as_paginas(client, parametros=''):
+    datas, paginas = [], 0
+    url = f'/api/logs-auditoria?limite=2{parametros}'
+    while url:
+        resposta = client.get(url)
+        assert resposta.status_code == 200, resposta.get_json()
+        datas += [log['created_at'] for log in resposta.get_json()]
+        paginas += 1
+        cursor = resposta.headers.get('X-Proximo-Cursor')
+        url = f'/api/logs-auditoria?limite=2{parametros}&cursor={cursor}' if cursor else None
+    assert paginas >= len(datas) // 2
+    return datas
+
+
+DATAS_ANTIGAS = ['2020-01-05 10:00:00', '2020-01-20 09:00:00', '2020-02-03 08:00:00', '2020-03-15 12:00:00']
+DATAS_RECENTES = ['2999-01-01 00:00:00', '2999-01-02 00:00:00']
+
+
+def test_meses_antigos_vao_para_arquivos():
+    inserir_logs(DATAS_ANTIGAS + DATAS_RECENTES)
+
+    arquivados = backend.arquivar_auditoria(dias=30)
+    assert arquivados == [('2020-01', 2), ('2020-02', 1), ('2020-03', 1)]
+    assert backend.meses_arquivados() == ['2020-03', '2020-02', '2020-01']
+    assert contar_principal() == len(DATAS_RECENTES)
+
+    # O arquivo do mês é somente leitura
+    caminho = backend.arquivo_auditoria_mes('2020-01')
+    assert not os.stat(caminho).st_mode & 0o222
+
+    # Rodar de novo não muda nada
+    assert backend.arquivar_auditoria(dias=30) == []
+
+
+def test_consulta_atravessa_os_arquivos(client):
+    inserir_logs(DATAS_ANTIGAS + DATAS_RECENTES)
+    backend.arquivar_auditoria(dias=30)
+
+    # Páginas de 2 cruzam o banco principal e os três meses, sem repetir nem pular
+    assert todas_as_paginas(client) == sorted(DATAS_ANTIGAS + DATAS_RECENTES, reverse=True)
+
+    # Período dentro de um mês arquivado
+    assert todas_as_paginas(client, '&dataInicio=2020-01-01&dataFim=2020-01-31') == [
+        '2020-01-20 09:00:00', '2020-01-05 10:00:00',
+    ]
+
+
+def test_entrada_atrasada_junta_ao_mes_arquivado(client):
+    inserir_logs(DATAS_ANTIGAS)
+    backend.arquivar_auditoria(dias=30)
+
+    # Uma entrada antiga que chegou depois (reimportada, por exemplo)
+    inserir_logs(['2020-01-25 15:00:00'])
+    assert backend.arquivar_auditoria(dias=30) == [('2020-01', 1)]
+    assert contar_principal() == 0
+    assert todas_as_paginas(client, '&dataFim=2020-01-31') == [
+        '2020-01-25 15:00:00', '2020-01-20 09:00:00', '2020-01-05 10:00:00',
+    ]
@@ -0,0 +1,109 @@
+"""
+Teste do armazenamento de arquivos enviados (pasta blobs/).
+
+Um envio que falha depois de gravar o arquivo (CPF repetido, por exemplo) não
+pode deixar no disco um arquivo que nenhuma linha referencia; um arquivo que
+outra linha usa continua lá. O que fica para trás dentro da carência é apagado
+depois por limpar_blobs_orfaos() (python app.py limpar-arquivos).
+"""
+
+import base64
+import hashlib
+import os
+import time
+
+import app as backend
+
+
+def enviar_instrutora(client, cpf, conteudo):
+    return client.post('/api/capacitacao/enfermeiras-instrutoras', json={
+        'nome': 'Maria', 'cpf': cpf, 'diploma_filename': 'diploma.pdf',
+        'diploma_content': base64.b64encode(conteudo).decode(),
+    })
+
+
+def caminho(conteudo):
+    return backend.caminho_blob(hashlib.sha256(conteudo).hexdigest())
+
+
+def arquivo_existe(conteudo):
+    return os.path.exists(caminho(conteudo))
+
+
+def envelhecer(arquivo):
+    antigo = time.time() - backend.BLOB_CARENCIA - 60
+    os.utime(arquivo, (antigo, antigo))
+
+
+def test_envio_recusado_nao_deixa_arquivo(client):
+    primeiro = b'%PDF-1.4 primeiro diploma'
+    segundo = b'%PDF-1.4 segundo diploma'
+
+    assert enviar_instrutora(client, '11122233344', primeiro).status_code == 201
+    assert arquivo_existe(primeiro)
+
+    # CPF repetido: o INSERT falha depois do arquivo gravado
+    assert enviar_instrutora(client, '11122233344', segundo).status_code == 400
+    assert not arquivo_existe(segundo)
+
+    # O mesmo conteúdo de uma linha existente continua no disco
+    assert enviar_instrutora(client, '11122233344', primeiro).status_code == 400
+    assert arquivo_existe(primeiro)
+
+
+def test_limpeza_apaga_arquivo_trocado_dentro_da_carencia(client, executar):
+    antigo = b'%PDF-1.4 diploma antigo'
+    novo = b'%PDF-1.4 diploma novo'
+    assert enviar_instrutora(client, '11122233344', antigo).status_code == 201
+    id = executar("SELECT id FROM enfermeiras_instrutoras WHERE cpf = '11122233344'").fetchone()[0]
+
+    # Trocado logo depois do envio: a carência deixa o antigo no disco
+    resposta = client.patch(f'/api/capacitacao/enfermeiras-instrutoras/{id}', json={
+        'nome': 'Maria', 'cpf': '11122233344', 'diploma_filename': 'diploma.pdf',
+        'diploma_content': base64.b64encode(novo).decode(),
+    })
+    assert resposta.status_code == 200
+    assert arquivo_existe(antigo)
+
+    # Ainda novo: a limpeza também respeita a carência
+    assert backend.limpar_blobs_orfaos() == 0
+    assert arquivo_existe(antigo)
+
+    envelhecer(caminho(antigo))
+    envelhecer(caminho(novo))
+    assert backend.limpar_blobs_orfaos() == 1
+    assert not arquivo_existe(antigo)
+    # Referenciado continua, por mais velho que seja
+    assert arquivo_existe(novo)
+
+
+def test_limpeza_apaga_temporario_de_envio_interrompido(banco):
+    diretorio = backend.diretorio_blobs()
+    os.makedirs(diretorio, exist_ok=True)
+    temporario = os.path.join(diretorio, 'envio.1.1.tmp')
+    outro = os.path.join(diretorio, 'LEIA-ME')
+    for arquivo in (temporario, outro):
+        with open(arquivo, 'wb') as f:
+            f.write(b'parcial')
+        envelhecer(arquivo)
+
+    assert backend.limpar_blobs_orfaos() == 1
+    assert not os.path.exists(temporario)
+    # Só apaga o que o armazenamento criou
+    assert os.path.exists(outro)
+
+
+def test_reaproveitado_no_meio_do_envio_fica(banco):
+    conteudo = b'%PDF-1.4 diploma compartilhado'
+    with backend.app.test_request_context():
+        backend.salvar_blob(conteudo)
+        # Outra requisição grava o mesmo conteúdo antes desta desistir
+        backend.marcar_blob_reaproveitado(caminho(conteudo))
+        backend.descartar_blobs_novos()
+    assert arquivo_existe(conteudo)
+
+    sozinho = b'%PDF-1.4 diploma abandonado'
+    with backend.app.test_request_context():
+        backend.salvar_blob(sozinho)
+        backend.descartar_blobs_novos()
+    assert not arquivo_existe(sozinho)
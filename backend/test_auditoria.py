@@ -0,0 +1,101 @@
+"""
+Teste da gravação da auditoria fora da requisição.
+
+As entradas enfileiradas são gravadas em grupo; com o banco travado vão para
+auditoria-pendente.jsonl e voltam ao banco uma vez só, mesmo com duas
+reimportações ao mesmo tempo; um erro inesperado não encerra a thread.
+"""
+
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture(autouse=True)
+def fila_vazia(banco):
+    # O que init_db() enfileirou já está no banco
+    backend.descarregar_auditoria()
+
+
+def contar(acao):
+    conn = sqlite3.connect(backend.DB_PATH)
+    total = conn.execute('SELECT COUNT(*) FROM logs_auditoria WHERE acao = ?', (acao,)).fetchone()[0]
+    conn.close()
+    return total
+
+
+def test_entradas_gravadas_em_grupo():
+    for i in range(1200):
+        backend.registrar_auditoria(1, 'teste_grupo', f'entrada {i}')
+    backend.descarregar_auditoria()
+    assert contar('teste_grupo') == 1200
+
+
+def test_banco_travado_desvia_e_reimporta(monkeypatch):
+    pendente = backend.arquivo_auditoria_pendente(backend.DB_PATH)
+    monkeypatch.setattr(backend, 'AUDITORIA_TIMEOUT', 0.1)
+    travado = sqlite3.connect(backend.DB_PATH)
+    travado.execute('BEGIN EXCLUSIVE')
+    for i in range(3):
+        backend.registrar_auditoria(1, 'teste_desvio', f'entrada {i}')
+    backend.descarregar_auditoria()
+    travado.rollback()
+    travado.close()
+    assert os.path.exists(pendente)
+    assert contar('teste_desvio') == 0
+
+    # A próxima gravação bem-sucedida traz o arquivo de volta
+    backend.registrar_auditoria(1, 'teste_desvio', 'depois')
+    backend.descarregar_auditoria()
+    assert contar('teste_desvio') == 4
+    assert not os.path.exists(pendente)
+
+
+def test_reimportacoes_simultaneas_nao_duplicam():
+    pendente = backend.arquivo_auditoria_pendente(backend.DB_PATH)
+    with open(pendente, 'w', encoding='utf-8') as destino:
+        for i in range(50):
+            destino.write(f'[1, "teste_simultaneo", null, null, "entrada {i}", "2026-01-01 00:00:00"]\n')
+
+    erros = []
+
+    def reimportar():
+        conn = sqlite3.connect(backend.DB_PATH, timeout=5)
+        try:
+            backend._reimportar_auditoria_pendente(conn, backend.DB_PATH)
+        except Exception as e:
+            erros.append(e)
+        finally:
+            conn.close()
+
+    workers = [threading.Thread(target=reimportar) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert not erros, erros
+    assert contar('teste_simultaneo') == 50
+
+
+def test_erro_inesperado_nao_encerra_a_thread(monkeypatch):
+    original = backend._gravar_lote_auditoria
+    falhas = []
+
+    def falhar_uma_vez(*args):
+        if not falhas:
+            falhas.append(1)
+            raise RuntimeError('falha simulada')
+        return original(*args)
+
+    monkeypatch.setattr(backend, '_gravar_lote_auditoria', falhar_uma_vez)
+    backend.registrar_auditoria(1, 'teste_erro', 'perdida')
+    backend.descarregar_auditoria()
+    backend.registrar_auditoria(1, 'teste_erro', 'gravada')
+    backend.descarregar_auditoria()
+    assert backend._gravador_auditoria.is_alive()
+    assert contar('teste_erro') == 1
@@ -0,0 +1,105 @@
+"""
+Teste da busca textual (FTS5) de pacientes e profissionais.
+
+A busca ignora acentos e maiúsculas, aceita prefixos e documentos com ou sem
+pontuação, traz primeiro os resultados mais relevantes de cada tabela e
+acompanha as alterações das tabelas de origem.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def inserir_paciente(executar):
+    def inserir_paciente(nome, cpf=None):
+        executar('INSERT INTO pacientes_ambulatorial (nome_completo, cpf) VALUES (?, ?)', (nome, cpf))
+    return inserir_paciente
+
+
+@pytest.fixture
+def buscar(client, cabecalhos_admin):
+    def buscar(termo, tipos='paciente_ambulatorial', **parametros):
+        resposta = client.get('/api/busca', query_string={'q': termo, 'tipos': tipos, **parametros},
+                              headers=cabecalhos_admin)
+        assert resposta.status_code == 200, resposta.get_json()
+        return [resultado['nome'] for resultado in resposta.get_json()]
+    return buscar
+
+
+def test_acentos_maiusculas_e_prefixos(buscar, inserir_paciente):
+    inserir_paciente('Conceição Araújo')
+    inserir_paciente('Maria Conceicao Silva')
+    inserir_paciente('João Souza')
+
+    for termo in ('conceicao', 'CONCEIÇÃO', 'conc', 'araujo'):
+        assert 'Conceição Araújo' in buscar(termo), termo
+    assert sorted(buscar('conceição')) == ['Conceição Araújo', 'Maria Conceicao Silva']
+    assert buscar('joao sou') == ['João Souza']
+
+
+def test_documentos_com_ou_sem_pontuacao(buscar, inserir_paciente):
+    inserir_paciente('Ana Lima', '123.456.789-00')
+    for termo in ('12345678900', '123.456.789-00', '123.456'):
+        assert buscar(termo) == ['Ana Lima'], termo
+
+
+def test_mais_relevantes_primeiro(client, cabecalhos_admin, buscar, inserir_paciente):
+    inserir_paciente('Maria das Dores Conceição Ferreira dos Santos')
+    inserir_paciente('Conceição Lima')
+    inserir_paciente('Ana Lima')
+
+    # Nome mais curto com o termo é mais relevante; sem o termo, fica de fora
+    assert buscar('conceicao') == ['Conceição Lima', 'Maria das Dores Conceição Ferreira dos Santos']
+    assert client.get('/api/busca?q=ana&tipos=inexistente', headers=cabecalhos_admin).status_code == 400
+
+
+def test_tabelas_intercaladas_pela_posicao(executar, buscar, inserir_paciente):
+    inserir_paciente('Conceição Lima')
+    inserir_paciente('Conceição Maria das Dores Ferreira')
+    inserir_paciente('Conceição Ana Beatriz Souza Santos Rocha')
+    # Numa tabela pequena o bm25 de um nome longo pode superar o do nome mais
+    # curto da outra; a posição em cada tabela é que decide
+    executar("""
+        INSERT INTO enfermeiras_alunas (nome, cpf) VALUES
+            ('Conceição Rocha Albuquerque Cavalcanti', '55566677788'),
+            ('Outra Aluna', '55566677789')
+    """)
+
+    tipos = 'paciente_ambulatorial,enfermeira_aluna'
+    assert buscar('conceicao', tipos) == [
+        'Conceição Lima',
+        'Conceição Rocha Albuquerque Cavalcanti',
+        'Conceição Maria das Dores Ferreira',
+        'Conceição Ana Beatriz Souza Santos Rocha',
+    ]
+    assert buscar('conceicao', tipos, limite=2) == ['Conceição Lima', 'Conceição Rocha Albuquerque Cavalcanti']
+
+
+def test_indice_acompanha_alteracoes(executar, buscar, inserir_paciente):
+    inserir_paciente('Beatriz Nunes')
+    executar("UPDATE pacientes_ambulatorial SET nome_completo = 'Beatriz Moura' WHERE nome_completo = 'Beatriz Nunes'")
+    assert buscar('nunes') == []
+    assert buscar('moura') == ['Beatriz Moura']
+
+    executar("DELETE FROM pacientes_ambulatorial WHERE nome_completo = 'Beatriz Moura'")
+    assert buscar('beatriz') == []
+
+
+def test_operadores_do_fts_sem_efeito(client, cabecalhos_admin, buscar, inserir_paciente):
+    inserir_paciente('Ana Lima')
+    assert buscar('ana OR "lima') == []
+    assert buscar('NEAR(ana lima)') == []
+    assert client.get('/api/busca?q=a', headers=cabecalhos_admin).status_code == 400
+
+
+def test_busca_de_instrutoras_com_termo_sem_palavras(client, executar):
+    executar("""
+        INSERT INTO enfermeiras_instrutoras_ambulatorial (nome, cpf, numero_registro)
+        VALUES ('Ana Lima', '11122233344', '123')
+    """)
+    url = '/api/ambulatorial/enfermeiras-instrutoras/buscar'
+    assert [e['nome'] for e in client.get(url, query_string={'termo': 'ana'}).get_json()] == ['Ana Lima']
+    # Só pontuação: nenhuma consulta ao índice, lista vazia
+    resposta = client.get(url, query_string={'termo': '*-!'})
+    assert resposta.status_code == 200
+    assert resposta.get_json() == []
@@ -0,0 +1,61 @@
+"""
+Teste do cache de respostas das rotas de totais.
+
+A segunda leitura vem do cache (X-Cache: HIT) até uma das tabelas lidas pela
+rota ser alterada - inclusive por fora da API -, e o cache de um banco não
+responde por outro. Só as tabelas lidas por rotas têm triggers de geração.
+"""
+
+import app as backend
+
+
+def inserir_agendamento(executar):
+    executar("INSERT INTO agendamentos_municipios (municipio, data_agendamento) VALUES ('Maceió', '2026-05-04')")
+
+
+def test_escrita_invalida_o_cache(client, executar):
+    primeira = client.get('/api/capacitacao/stats')
+    assert primeira.headers['X-Cache'] == 'MISS'
+    segunda = client.get('/api/capacitacao/stats')
+    assert segunda.headers['X-Cache'] == 'HIT'
+    assert segunda.get_json() == primeira.get_json()
+
+    inserir_agendamento(executar)
+    depois = client.get('/api/capacitacao/stats')
+    assert depois.headers['X-Cache'] == 'MISS'
+    assert depois.get_json()['totalAgendamentos'] == primeira.get_json()['totalAgendamentos'] + 1
+
+
+def test_parametros_tem_entradas_proprias(client):
+    assert client.get('/api/ambulatorial/stats?year=2025').headers['X-Cache'] == 'MISS'
+    assert client.get('/api/ambulatorial/stats?year=2026').headers['X-Cache'] == 'MISS'
+    assert client.get('/api/ambulatorial/stats?year=2025').headers['X-Cache'] == 'HIT'
+
+
+def test_cache_separado_por_banco(client, executar, tmp_path, monkeypatch):
+    inserir_agendamento(executar)
+    assert client.get('/api/capacitacao/stats').get_json()['totalAgendamentos'] == 1
+
+    # Outro banco, mesma rota e mesmos parâmetros: nada vem do cache do primeiro
+    backend.fechar_conexoes()
+    monkeypatch.setattr(backend, 'DB_PATH', str(tmp_path / 'outro.db'))
+    backend.init_db()
+    resposta = client.get('/api/capacitacao/stats')
+    assert resposta.headers['X-Cache'] == 'MISS'
+    assert resposta.get_json()['totalAgendamentos'] == 0
+
+
+def test_geracao_so_nas_tabelas_lidas_por_rotas(client, executar):
+    triggers = {}
+    for row in executar("SELECT tbl_name FROM sqlite_master WHERE type = 'trigger' AND name GLOB 'geracao_*'"):
+        triggers[row['tbl_name']] = triggers.get(row['tbl_name'], 0) + 1
+    # Cada tabela declarada num @versionada/@em_cache tem os três triggers
+    assert triggers == {tabela: 3 for tabela in backend.TABELAS_GERACAO}
+    assert {'logs_auditoria', 'sessoes'}.isdisjoint(triggers)
+
+    # Login grava sessão e auditoria sem mexer nas gerações
+    antes = executar('SELECT tabela, geracao FROM geracoes_escrita ORDER BY tabela').fetchall()
+    assert client.post('/api/auth/login', json={'cpf': '123.456.789-09', 'senha': 'Admin@123'}).status_code == 200
+    backend.descarregar_auditoria()
+    assert executar('SELECT COUNT(*) FROM sessoes').fetchone()[0] == 1
+    assert executar('SELECT tabela, geracao FROM geracoes_escrita ORDER BY tabela').fetchall() == antes
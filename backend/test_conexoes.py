@@ -0,0 +1,75 @@
+"""
+Teste do pool de conexões SQLite (get_db).
+
+Cada thread reutiliza a mesma conexão, já configurada pelos DB_PRAGMAS;
+conn.close() só devolve a conexão ao pool e descarta o que não foi confirmado.
+"""
+
+import os
+import threading
+
+import app as backend
+
+
+def test_mesma_conexao_na_thread(banco):
+    primeira = backend.get_db()
+    primeira.close()
+    segunda = backend.get_db()
+    assert segunda is primeira
+    # close() não fechou a conexão de fato
+    assert segunda.execute('SELECT 1').fetchone()[0] == 1
+    segunda.close()
+
+    outras = []
+    thread = threading.Thread(target=lambda: outras.append(backend.get_db()))
+    thread.start()
+    thread.join()
+    assert outras[0] is not primeira
+
+
+def test_pragmas_aplicados(banco):
+    conn = backend.get_db()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+    assert conn.execute('PRAGMA cache_size').fetchone()[0] == -65536
+    assert conn.execute('PRAGMA temp_store').fetchone()[0] == 2
+    conn.close()
+
+
+def test_close_descarta_o_que_nao_foi_confirmado(banco):
+    conn = backend.get_db()
+    conn.execute("INSERT INTO pacientes (status) VALUES ('rascunho')")
+    conn.close()
+
+    conn = backend.get_db()
+    assert not conn.in_transaction
+    assert conn.execute('SELECT COUNT(*) FROM pacientes').fetchone()[0] == 0
+
+    # Uso aninhado: o close() interno não desfaz a transação de quem chamou
+    conn.execute("INSERT INTO pacientes (status) VALUES ('rascunho')")
+    backend.get_db().close()
+    assert conn.in_transaction
+    conn.commit()
+    conn.close()
+    assert backend.get_db().execute('SELECT COUNT(*) FROM pacientes').fetchone()[0] == 1
+
+
+def test_fim_da_requisicao_libera_a_escrita(banco):
+    # Rota que falhou no meio de uma escrita, sem chegar ao conn.close()
+    conn = backend.get_db()
+    conn.execute("INSERT INTO pacientes (status) VALUES ('rascunho')")
+    with backend.app.test_request_context():
+        backend.liberar_conexao(None)
+    assert not conn.in_transaction
+    assert conn.em_uso == 0
+
+
+def test_outro_banco_outra_conexao(banco, tmp_path, monkeypatch):
+    anterior = backend.get_db()
+    anterior.close()
+    # Sem fechar_conexoes(): basta DB_PATH apontar para outro arquivo
+    monkeypatch.setattr(backend, 'DB_PATH', str(tmp_path / 'outro.db'))
+    atual = backend.get_db()
+    assert atual is not anterior
+    assert atual.execute('PRAGMA database_list').fetchone()['file'] == os.path.realpath(backend.DB_PATH)
+    atual.close()
@@ -0,0 +1,115 @@
+"""
+Teste da coluna dia_solicitacao e dos filtros de período das solicitações.
+
+O dia é uma coluna gerada a partir de data_solicitacao, em qualquer formato de
+data/hora aceito pelo SQLite, e o filtro dataInicio/dataFim inclui o dia
+inteiro das duas pontas.
+"""
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def primeiro_municipio(executar):
+    return executar('SELECT id FROM municipios ORDER BY id LIMIT 1').fetchone()['id']
+
+
+@pytest.fixture
+def inserir_solicitacao(executar, primeiro_municipio):
+    def inserir_solicitacao(data_solicitacao, tipo='DIU', status='Aguardando confirmação'):
+        return executar('''
+            INSERT INTO solicitacoes_insumos (municipio_id, tipo_insumo, quantidade_solicitada, status, data_solicitacao)
+            VALUES (?, ?, 10, ?, ?)
+        ''', (primeiro_municipio, tipo, status, data_solicitacao)).lastrowid
+    return inserir_solicitacao
+
+
+def dia(executar, solicitacao_id):
+    return executar('SELECT dia_solicitacao FROM solicitacoes_insumos WHERE id = ?',
+                    (solicitacao_id,)).fetchone()['dia_solicitacao']
+
+
+def listar(client, parametros):
+    resposta = client.get(f'/api/distribuicao/solicitacoes?{parametros}')
+    assert resposta.status_code == 200, resposta.get_json()
+    return [solicitacao['data_solicitacao'] for solicitacao in resposta.get_json()]
+
+
+def test_dia_calculado_da_data(client, executar, primeiro_municipio, inserir_solicitacao):
+    assert client.post('/api/distribuicao/solicitacoes', json={
+        'municipio_id': primeiro_municipio, 'tipo_insumo': 'DIU', 'quantidade_solicitada': 5,
+    }).status_code == 201
+    criada = executar('SELECT date(data_solicitacao) AS esperado, dia_solicitacao FROM solicitacoes_insumos').fetchone()
+    assert criada['dia_solicitacao'] == criada['esperado']
+
+    assert dia(executar, inserir_solicitacao('2024-03-10 14:30:00')) == '2024-03-10'
+    assert dia(executar, inserir_solicitacao('2024-03-10T23:59:59.123456')) == '2024-03-10'
+    assert dia(executar, inserir_solicitacao('data inválida')) == ''
+
+    solicitacao = inserir_solicitacao('2024-03-10 08:00:00')
+    executar("UPDATE solicitacoes_insumos SET data_solicitacao = '2024-04-01 09:00:00' WHERE id = ?", (solicitacao,))
+    assert dia(executar, solicitacao) == '2024-04-01'
+
+
+def test_coluna_gerada_sem_trigger(executar):
+    # Coluna gerada: nenhum trigger regrava a solicitação recém-inserida
+    coluna = [c for c in executar('PRAGMA table_xinfo(solicitacoes_insumos)') if c['name'] == 'dia_solicitacao']
+    assert coluna[0]['hidden'] == 2
+    gatilhos = executar("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'dia_solicitacao%'")
+    assert gatilhos.fetchall() == []
+
+
+def test_migracao_troca_o_trigger_pela_coluna_gerada(tmp_path, monkeypatch):
+    backend.fechar_conexoes()
+    monkeypatch.setattr(backend, 'DB_PATH', str(tmp_path / 'database.db'))
+    todas = backend.MIGRACOES
+    monkeypatch.setattr(backend, 'MIGRACOES', todas[:todas.index(backend.migracao_dia_solicitacao_gerada)])
+    backend.init_db()
+    conn = backend.get_db()
+    conn.execute('''
+        INSERT INTO solicitacoes_insumos (municipio_id, tipo_insumo, quantidade_solicitada, data_solicitacao)
+        VALUES (1, 'DIU', 10, '2024-03-10T08:00:00')
+    ''')
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(backend, 'MIGRACOES', todas)
+    backend.init_db()
+    conn = backend.get_db()
+    try:
+        assert conn.execute('SELECT dia_solicitacao FROM solicitacoes_insumos').fetchone()[0] == '2024-03-10'
+        indices = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'solicitacoes_insumos'"
+        )}
+        assert {nome for nome, _ in backend.INDICES_SOLICITACOES} <= indices
+    finally:
+        conn.close()
+        backend.fechar_conexoes()
+
+
+def test_periodo_inclui_o_dia_inteiro(client, inserir_solicitacao):
+    for data in ('2024-03-09 23:59:59', '2024-03-10 00:00:00', '2024-03-10T23:59:59',
+                 '2024-03-11 12:00:00', '2024-03-12 00:00:00'):
+        inserir_solicitacao(data)
+
+    assert listar(client, 'dataInicio=2024-03-10&dataFim=2024-03-11') == [
+        '2024-03-11 12:00:00', '2024-03-10T23:59:59', '2024-03-10 00:00:00',
+    ]
+    assert listar(client, 'dataFim=2024-03-09') == ['2024-03-09 23:59:59']
+    assert client.get('/api/distribuicao/solicitacoes?dataInicio=10/03/2024').status_code == 400
+
+
+def test_periodo_com_os_outros_filtros(client, primeiro_municipio, inserir_solicitacao):
+    inserir_solicitacao('2024-03-10 10:00:00', 'DIU', 'Autorizado')
+    inserir_solicitacao('2024-03-10 11:00:00', 'Implanon', 'Autorizado')
+    inserir_solicitacao('2024-03-10 12:00:00', 'DIU', 'Negado')
+    inserir_solicitacao('2024-05-10 10:00:00', 'DIU', 'Autorizado')
+
+    periodo = 'dataInicio=2024-03-01&dataFim=2024-03-31'
+    assert listar(client, f'{periodo}&status=Autorizado&tipoInsumo=DIU') == ['2024-03-10 10:00:00']
+    assert listar(client, f'{periodo}&tipoInsumo=DIU') == ['2024-03-10 12:00:00', '2024-03-10 10:00:00']
+    assert listar(client, f'{periodo}&municipio={primeiro_municipio}&status=Autorizado') == [
+        '2024-03-10 11:00:00', '2024-03-10 10:00:00',
+    ]
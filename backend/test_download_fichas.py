@@ -0,0 +1,78 @@
+"""
+Teste do download binário das fichas de atendimento.
+
+O PDF sai do disco como está (sem base64), com ETag forte igual ao SHA-256 do
+conteúdo, respeitando Range (206/416) e If-None-Match (304).
+"""
+
+import base64
+import hashlib
+import os
+
+import app as backend
+
+CONTEUDO = b'%PDF-1.4\n' + bytes(range(256)) * 40
+
+
+def anexar_ficha(client, conteudo=CONTEUDO):
+    conn = backend.get_db()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO enfermeiras_alunas (nome, cpf) VALUES ('Aluna', '11122233344')")
+    aluna_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    resposta = client.post(f'/api/capacitacao/enfermeiras-alunas/{aluna_id}/fichas', json={
+        'nome_paciente': 'Ana', 'cpf_paciente': '12345678900', 'data_nascimento_paciente': '1990-01-01',
+        'municipio_paciente': 'Maceió', 'metodo_inserido': 'DIU',
+        'nome_arquivo': 'ficha-ana.pdf', 'pdf_content': base64.b64encode(conteudo).decode(),
+    })
+    assert resposta.status_code == 201, resposta.get_json()
+    return aluna_id, resposta.get_json()['ficha_id']
+
+
+def url_download(aluna_id, ficha_id):
+    return f'/api/capacitacao/enfermeiras-alunas/{aluna_id}/fichas/{ficha_id}/download'
+
+
+def test_download_completo(client):
+    url = url_download(*anexar_ficha(client))
+
+    resposta = client.get(url)
+    assert resposta.status_code == 200
+    assert resposta.data == CONTEUDO
+    assert resposta.mimetype == 'application/pdf'
+    assert resposta.headers['Content-Length'] == str(len(CONTEUDO))
+    assert 'ficha-ana.pdf' in resposta.headers['Content-Disposition']
+    assert resposta.headers['Accept-Ranges'] == 'bytes'
+    assert resposta.headers['ETag'] == f'"{hashlib.sha256(CONTEUDO).hexdigest()}"'
+    assert 'private' in resposta.headers['Cache-Control']
+
+
+def test_range_e_if_none_match(client):
+    url = url_download(*anexar_ficha(client))
+
+    parcial = client.get(url, headers={'Range': 'bytes=100-199'})
+    assert parcial.status_code == 206
+    assert parcial.data == CONTEUDO[100:200]
+    assert parcial.headers['Content-Range'] == f'bytes 100-199/{len(CONTEUDO)}'
+
+    final = client.get(url, headers={'Range': 'bytes=-10'})
+    assert final.status_code == 206
+    assert final.data == CONTEUDO[-10:]
+
+    assert client.get(url, headers={'Range': f'bytes={len(CONTEUDO)}-'}).status_code == 416
+
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get(url, headers={'If-None-Match': '"outro"'}).status_code == 200
+
+
+def test_ficha_ou_arquivo_inexistente(client):
+    aluna_id, ficha_id = anexar_ficha(client)
+    assert client.get(url_download(aluna_id, ficha_id + 1)).status_code == 404
+    assert client.get(url_download(aluna_id + 1, ficha_id)).status_code == 404
+
+    os.remove(backend.caminho_blob(hashlib.sha256(CONTEUDO).hexdigest()))
+    resposta = client.get(url_download(aluna_id, ficha_id))
+    assert resposta.status_code == 404
+    assert resposta.get_json()['error'] == 'Arquivo da ficha não encontrado'
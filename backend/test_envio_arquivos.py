@@ -0,0 +1,96 @@
+"""
+Teste do envio de arquivos em multipart/form-data e application/octet-stream.
+
+O arquivo é copiado em blocos para a pasta blobs/, com o mesmo resultado do
+envio antigo em base64; acima de LIMITE_ARQUIVO a resposta é 413 e nada fica
+no disco.
+"""
+
+import base64
+import hashlib
+import io
+import os
+
+import pytest
+
+import app as backend
+
+CONTEUDO = b'%PDF-1.4\n' + os.urandom(200 * 1024)
+URL_FICHAS = '/api/capacitacao/enfermeiras-alunas/1/fichas'
+DADOS_PACIENTE = {
+    'nome_paciente': 'Ana', 'cpf_paciente': '12345678900', 'data_nascimento_paciente': '1990-01-01',
+    'municipio_paciente': 'Maceió', 'metodo_inserido': 'DIU',
+}
+
+
+@pytest.fixture(autouse=True)
+def aluna(executar):
+    # Dona das fichas de URL_FICHAS
+    executar("INSERT INTO enfermeiras_alunas (nome, cpf) VALUES ('Aluna', '11122233344')")
+
+
+def ficha(ficha_id):
+    conn = backend.get_db()
+    row = conn.execute(
+        'SELECT nome_arquivo, pdf_ref, pdf_tamanho, pdf_mime FROM fichas_atendimento_pdf WHERE id = ?', (ficha_id,)
+    ).fetchone()
+    conn.close()
+    return dict(row)
+
+
+def arquivos_no_disco():
+    encontrados = []
+    for raiz, _, nomes in os.walk(backend.diretorio_blobs()):
+        encontrados += [os.path.join(raiz, nome) for nome in nomes]
+    return encontrados
+
+
+def test_multipart(client):
+    resposta = client.post(URL_FICHAS, data={
+        **DADOS_PACIENTE, 'pdf_content': (io.BytesIO(CONTEUDO), 'ficha-ana.pdf'),
+    }, content_type='multipart/form-data')
+    assert resposta.status_code == 201, resposta.get_json()
+
+    gravada = ficha(resposta.get_json()['ficha_id'])
+    assert gravada == {
+        'nome_arquivo': 'ficha-ana.pdf', 'pdf_ref': hashlib.sha256(CONTEUDO).hexdigest(),
+        'pdf_tamanho': len(CONTEUDO), 'pdf_mime': 'application/pdf',
+    }
+    with open(backend.caminho_blob(gravada['pdf_ref']), 'rb') as f:
+        assert f.read() == CONTEUDO
+
+    # Sem a parte do arquivo
+    assert client.post(URL_FICHAS, data=DADOS_PACIENTE, content_type='multipart/form-data').status_code == 400
+
+
+def test_octet_stream_e_base64_gravam_o_mesmo_arquivo(client):
+    bruto = client.post(URL_FICHAS, query_string={**DADOS_PACIENTE, 'nome_arquivo': 'ficha.pdf'},
+                        data=CONTEUDO, content_type='application/octet-stream')
+    assert bruto.status_code == 201, bruto.get_json()
+    antigo = client.post(URL_FICHAS, json={
+        **DADOS_PACIENTE, 'nome_arquivo': 'ficha.pdf', 'pdf_content': base64.b64encode(CONTEUDO).decode(),
+    })
+    assert antigo.status_code == 201
+
+    assert ficha(bruto.get_json()['ficha_id']) == ficha(antigo.get_json()['ficha_id'])
+    # Mesmo conteúdo, um arquivo só
+    assert len(arquivos_no_disco()) == 1
+
+
+def test_acima_do_limite(client, monkeypatch):
+    monkeypatch.setattr(backend, 'LIMITE_ARQUIVO', 64 * 1024)
+    multipart = client.post(URL_FICHAS, data={
+        **DADOS_PACIENTE, 'pdf_content': (io.BytesIO(CONTEUDO), 'ficha.pdf'),
+    }, content_type='multipart/form-data')
+    assert multipart.status_code == 413
+    assert 'limite' in multipart.get_json()['error']
+
+    bruto = client.post(URL_FICHAS, query_string=DADOS_PACIENTE,
+                        data=CONTEUDO, content_type='application/octet-stream')
+    assert bruto.status_code == 413
+
+    # Nem o arquivo nem o temporário do envio ficam no disco
+    assert arquivos_no_disco() == []
+    conn = backend.get_db()
+    assert conn.execute('SELECT COUNT(*) FROM fichas_atendimento_pdf').fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,97 @@
+"""
+Teste das estatísticas de capacitação por município (estatisticas_municipios).
+
+Cada escrita recalcula só a linha do município afetado; a rota de um
+município e a de todos os municípios devolvem os mesmos totais que as
+consultas de ESTATISTICAS_MUNICIPIO rodadas na hora.
+"""
+
+import app as backend
+
+
+def inserir_aluna(executar, cpf, municipio):
+    return executar("INSERT INTO enfermeiras_alunas (nome, cpf, municipio) VALUES ('Aluna', ?, ?)",
+                    (cpf, municipio)).lastrowid
+
+
+def inserir_fichas(executar, aluna_id, metodo, quantidade):
+    for i in range(quantidade):
+        executar('''
+            INSERT INTO fichas_atendimento_pdf (enfermeira_aluna_id, nome_arquivo, metodo_inserido, cpf_paciente)
+            VALUES (?, 'ficha.pdf', ?, ?)
+        ''', (aluna_id, metodo, f'{aluna_id}-{metodo}-{i}'))
+
+
+def totais(client, municipio):
+    resposta = client.get(f'/api/capacitacao/stats/municipio/{municipio}')
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def divergencias():
+    conn = backend.get_db()
+    resultado = backend.verificar_estatisticas_municipios(conn.cursor())
+    conn.close()
+    return resultado
+
+
+def test_totais_por_municipio(client, executar):
+    ana = inserir_aluna(executar, '111', 'Maceió')
+    inserir_aluna(executar, '222', 'Maceió')
+    bia = inserir_aluna(executar, '333', 'Arapiraca')
+    inserir_fichas(executar, ana, 'DIU', 20)
+    inserir_fichas(executar, bia, 'Implanon', 3)
+    executar('''
+        INSERT INTO insercoes_diu (enfermeira_aluna_id, paciente_id, metodo_contraceptivo, tipo_diu, data_insercao)
+        VALUES (?, 1, 'DIU', '', '2024-01-10')
+    ''', (bia,))
+    executar("INSERT INTO agendamentos_municipios (municipio, data_agendamento) VALUES ('Arapiraca', '2024-01-10')")
+    assert divergencias() == []
+
+    assert totais(client, 'maceio') == {
+        'totalAgendamentos': 0, 'totalAlunas': 2, 'totalProfissionaisCapacitados': 1,
+        'totalDius': 20, 'totalImplanons': 0, 'totalPacientesComInsercao': 20,
+    }
+    assert totais(client, 'arapiraca') == {
+        'totalAgendamentos': 1, 'totalAlunas': 1, 'totalProfissionaisCapacitados': 0,
+        'totalDius': 1, 'totalImplanons': 3, 'totalPacientesComInsercao': 4,
+    }
+
+    # Aluna que muda de município leva as fichas: as duas linhas são recalculadas
+    executar("UPDATE enfermeiras_alunas SET municipio = 'Arapiraca' WHERE id = ?", (ana,))
+    assert divergencias() == []
+    assert totais(client, 'maceio')['totalDius'] == 0
+    assert totais(client, 'maceio')['totalAlunas'] == 1
+    assert totais(client, 'arapiraca')['totalDius'] == 21
+    assert totais(client, 'arapiraca')['totalProfissionaisCapacitados'] == 1
+
+    # Uma ficha a menos: a aluna deixa de contar como capacitada
+    executar('DELETE FROM fichas_atendimento_pdf WHERE id = (SELECT MAX(id) FROM fichas_atendimento_pdf '
+             'WHERE enfermeira_aluna_id = ?)', (ana,))
+    assert totais(client, 'arapiraca')['totalProfissionaisCapacitados'] == 0
+    assert divergencias() == []
+
+
+def test_todos_os_municipios_numa_resposta(client, executar):
+    inserir_fichas(executar, inserir_aluna(executar, '111', 'Maceió'), 'DIU', 2)
+
+    todos = client.get('/api/capacitacao/stats/municipios').get_json()
+    conn = backend.get_db()
+    assert len(todos) == conn.execute("SELECT COUNT(*) FROM municipios WHERE estado = 'AL'").fetchone()[0]
+    conn.close()
+    for municipio in todos:
+        esperado = totais(client, municipio['id'])
+        assert {chave: municipio[chave] for chave in esperado} == esperado, municipio['nome']
+    assert next(m for m in todos if m['nome'] == 'Maceió')['totalDius'] == 2
+
+
+def test_verificacao_aponta_e_reconstrucao_corrige(executar):
+    inserir_aluna(executar, '111', 'Maceió')
+    executar("UPDATE estatisticas_municipios SET alunas = 5 WHERE municipio = 'Maceió'")
+    assert divergencias() == [('Maceió', (0, 5, 0, 0, 0, 0), (0, 1, 0, 0, 0, 0))]
+
+    conn = backend.get_db()
+    backend.reconstruir_estatisticas_municipios(conn.cursor())
+    conn.commit()
+    conn.close()
+    assert divergencias() == []
@@ -0,0 +1,186 @@
+"""
+Teste do livro de estoque de insumos e dos saldos por município.
+
+O saldo de cada (município, insumo) em saldos_insumos é sempre a soma das
+movimentações do livro; o livro não aceita alteração nem exclusão, e correções
+entram como novas movimentações.
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def municipio(executar):
+    return executar('SELECT id FROM municipios ORDER BY id LIMIT 1').fetchone()['id']
+
+
+def movimentar(client, municipio_id, tipo, quantidade, tipo_insumo='DIU'):
+    return client.post('/api/distribuicao/movimentacoes', json={
+        'municipio_id': municipio_id, 'tipo_insumo': tipo_insumo,
+        'tipo': tipo, 'quantidade': quantidade,
+    })
+
+
+def criar_solicitacao(client, municipio_id, quantidade=100):
+    return client.post('/api/distribuicao/solicitacoes', json={
+        'municipio_id': municipio_id, 'tipo_insumo': 'DIU', 'quantidade_solicitada': quantidade,
+    }).get_json()['id']
+
+
+def responder(client, solicitacao_id, status, quantidade):
+    return client.patch(f'/api/distribuicao/solicitacoes/{solicitacao_id}', json={
+        'status': status, 'quantidade_autorizada': quantidade, 'respondido_por': 'Gestora',
+    })
+
+
+def saldo(client, municipio_id, tipo_insumo='DIU'):
+    resposta = client.get(f'/api/distribuicao/estoque/{municipio_id}?tipoInsumo={tipo_insumo}')
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def soma_do_livro(executar, municipio_id, tipo):
+    return executar(
+        'SELECT COALESCE(SUM(quantidade), 0) FROM movimentacoes_insumos WHERE municipio_id = ? AND tipo = ?',
+        (municipio_id, tipo)
+    ).fetchone()[0]
+
+
+def divergencias():
+    conn = backend.get_db()
+    resultado = backend.verificar_saldos_insumos(conn.cursor())
+    conn.close()
+    return resultado
+
+
+def test_saldo_e_a_soma_do_livro(client, executar, municipio):
+    solicitacao = criar_solicitacao(client, municipio)
+
+    assert responder(client, solicitacao, 'Autorizado', 100).status_code == 200
+    # Reeditar a autorização lança um estorno, não altera o lançamento anterior
+    assert responder(client, solicitacao, 'Autorizado', 80).status_code == 200
+    assert movimentar(client, municipio, 'entregue', 50).status_code == 201
+    assert movimentar(client, municipio, 'consumido', 20).status_code == 201
+    assert movimentar(client, municipio, 'ajuste', -5).status_code == 201
+
+    atual = saldo(client, municipio)
+    for tipo, coluna in backend.MOVIMENTACOES_INSUMOS.items():
+        assert atual[coluna] == soma_do_livro(executar, municipio, tipo), coluna
+    assert (atual['autorizado'], atual['estoque'], atual['a_entregar']) == (80, 25, 30)
+
+    # Negar depois de autorizar estorna o que faltava
+    assert responder(client, solicitacao, 'Negado', 0).status_code == 200
+    assert saldo(client, municipio)['autorizado'] == 0 == soma_do_livro(executar, municipio, 'autorizado')
+    assert divergencias() == []
+
+    # Insumo sem movimentação: saldo zerado
+    assert saldo(client, municipio, 'Implanon')['estoque'] == 0
+
+
+def test_resposta_invalida_ou_com_erro_nao_fica_pela_metade(client, executar, municipio, monkeypatch):
+    solicitacao = criar_solicitacao(client, municipio)
+
+    # Quantidade inválida: erro do pedido, nada gravado
+    resposta = responder(client, solicitacao, 'Autorizado', 'muitos')
+    assert resposta.status_code == 400
+    assert 'número inteiro' in resposta.get_json()['error']
+    assert executar('SELECT status FROM solicitacoes_insumos WHERE id = ?',
+                    (solicitacao,)).fetchone()[0] == 'Aguardando confirmação'
+
+    # Falha inesperada depois do UPDATE: 500, e a resposta é desfeita
+    def falhar(*args, **kwargs):
+        raise RuntimeError('disco cheio')
+    monkeypatch.setattr(backend, 'registrar_autorizacao', falhar)
+    assert responder(client, solicitacao, 'Autorizado', 10).status_code == 500
+    assert executar('SELECT status FROM solicitacoes_insumos WHERE id = ?',
+                    (solicitacao,)).fetchone()[0] == 'Aguardando confirmação'
+    assert soma_do_livro(executar, municipio, 'autorizado') == 0
+
+
+def test_livro_so_de_insercao(client, banco, municipio):
+    movimentar(client, municipio, 'entregue', 10)
+    conn = sqlite3.connect(banco)
+    for comando in ('UPDATE movimentacoes_insumos SET quantidade = 99', 'DELETE FROM movimentacoes_insumos'):
+        with pytest.raises(sqlite3.IntegrityError, match='não podem ser alteradas'):
+            conn.execute(comando)
+    conn.close()
+
+    assert movimentar(client, municipio, 'autorizado', 10).status_code == 400
+    assert movimentar(client, municipio, 'entregue', -3).status_code == 400
+    assert movimentar(client, municipio, 'desconhecido', 3).status_code == 400
+    assert divergencias() == []
+
+
+def test_baixa_sem_estoque_recusada(client, executar, municipio):
+    movimentar(client, municipio, 'entregue', 25)
+    resposta = movimentar(client, municipio, 'consumido', 30)
+    assert resposta.status_code == 400
+    assert 'Estoque insuficiente' in resposta.get_json()['error']
+    assert soma_do_livro(executar, municipio, 'consumido') == 0
+
+    # Duas baixas ao mesmo tempo: só uma cabe no estoque
+    resultados = []
+
+    def baixar():
+        resultados.append(movimentar(backend.app.test_client(), municipio, 'consumido', 20).status_code)
+
+    threads = [threading.Thread(target=baixar) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(resultados) == [201, 400]
+    assert saldo(client, municipio)['estoque'] == 5
+    assert divergencias() == []
+
+
+def test_verificacao_aponta_e_reconstrucao_corrige(client, municipio):
+    movimentar(client, municipio, 'entregue', 10)
+    conn = backend.get_db()
+    conn.execute('UPDATE saldos_insumos SET entregue = 7')
+    conn.commit()
+    chave = ('saldos_insumos', municipio, 'DIU')
+    assert backend.verificar_saldos_insumos(conn.cursor()) == [(chave, (0, 7, 0, 0), (0, 10, 0, 0))]
+
+    backend.reconstruir_saldos_insumos(conn.cursor())
+    conn.commit()
+    conn.close()
+    assert divergencias() == []
+    assert saldo(client, municipio)['estoque'] == 10
+
+
+def test_abertura_do_livro_com_datas_no_formato_do_sqlite(tmp_path, monkeypatch):
+    backend.fechar_conexoes()
+    monkeypatch.setattr(backend, 'DB_PATH', str(tmp_path / 'database.db'))
+    todas = backend.MIGRACOES
+    monkeypatch.setattr(backend, 'MIGRACOES', todas[:todas.index(backend.migracao_estoque_insumos)])
+    backend.init_db()
+    conn = backend.get_db()
+    # Autorizada antes do livro existir, com data_resposta de isoformat()
+    conn.execute('''
+        INSERT INTO solicitacoes_insumos
+            (municipio_id, tipo_insumo, quantidade_solicitada, quantidade_autorizada, status, data_resposta)
+        VALUES (1, 'DIU', 10, 10, 'Autorizado', '2024-03-10T08:00:00.123456')
+    ''')
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(backend, 'MIGRACOES', todas)
+    backend.init_db()
+    conn = backend.get_db()
+    try:
+        assert conn.execute('SELECT created_at FROM movimentacoes_insumos').fetchone()[0] == '2024-03-10 08:00:00'
+        assert conn.execute('SELECT atualizado_em FROM saldos_insumos').fetchone()[0] == '2024-03-10 08:00:00'
+        # O livro continua só de inserção
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute('UPDATE movimentacoes_insumos SET quantidade = 99')
+        assert backend.verificar_saldos_insumos(conn.cursor()) == []
+    finally:
+        conn.rollback()
+        conn.close()
+        backend.fechar_conexoes()
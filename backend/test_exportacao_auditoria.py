@@ -0,0 +1,70 @@
+"""
+Teste da exportação do log de auditoria em NDJSON e CSV.
+
+A exportação percorre o log página por página pelo cursor: tem que trazer
+todas as entradas do filtro, uma vez cada, mais recentes primeiro, inclusive
+as dos meses arquivados.
+"""
+
+import csv
+import io
+import json
+import sqlite3
+
+import app as backend
+
+
+def inserir_logs(linhas):
+    conn = sqlite3.connect(backend.DB_PATH)
+    conn.executemany(
+        'INSERT INTO logs_auditoria (usuario_id, acao, descricao, created_at) VALUES (1, ?, ?, ?)',
+        linhas,
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_ndjson_traz_todas_as_paginas(client):
+    # Mais de uma página de LIMITE_PAGINA_MAXIMO, com horários repetidos
+    total = backend.LIMITE_PAGINA_MAXIMO * 2 + 10
+    inserir_logs([('login', f'entrada {i}', f'2999-01-01 00:00:{i % 7:02d}') for i in range(total)])
+
+    resposta = client.get('/api/logs-auditoria/exportar')
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'application/x-ndjson'
+    assert 'logs-auditoria.ndjson' in resposta.headers['Content-Disposition']
+
+    logs = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+    assert len(logs) == total
+    assert len({log['id'] for log in logs}) == total
+    chaves = [(log['created_at'], log['id']) for log in logs]
+    assert chaves == sorted(chaves, reverse=True)
+    assert logs[0]['usuario_nome']
+
+
+def test_csv_com_filtro_e_texto_especial(client):
+    inserir_logs([
+        ('login', 'Entrou, "de novo"\nna mesma hora', '2999-01-01 10:00:00'),
+        ('logout', 'Saiu', '2999-01-01 11:00:00'),
+        ('login', 'Ação com acento', '2020-01-10 10:00:00'),
+    ])
+    backend.arquivar_auditoria(dias=30)
+
+    resposta = client.get('/api/logs-auditoria/exportar?formato=csv&acao=login')
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'text/csv'
+
+    linhas = list(csv.DictReader(io.StringIO(resposta.get_data(as_text=True))))
+    assert [linha['descricao'] for linha in linhas] == ['Entrou, "de novo"\nna mesma hora', 'Ação com acento']
+    assert list(linhas[0].keys()) == backend.COLUNAS_EXPORTACAO_AUDITORIA
+
+
+def test_parametros_invalidos(client):
+    assert client.get('/api/logs-auditoria/exportar?formato=xlsx').status_code == 400
+    assert client.get('/api/logs-auditoria/exportar?dataInicio=01/02/2020').status_code == 400
+    assert client.get('/api/logs-auditoria/exportar?usuario_id=abc').status_code == 400
+
+    # Sem entradas: NDJSON vazio e CSV só com o cabeçalho
+    assert client.get('/api/logs-auditoria/exportar').get_data(as_text=True) == ''
+    csv_vazio = client.get('/api/logs-auditoria/exportar?formato=csv').get_data(as_text=True)
+    assert csv_vazio.strip() == ','.join(backend.COLUNAS_EXPORTACAO_AUDITORIA)
@@ -0,0 +1,121 @@
+"""
+Teste dos indicadores de inserção das pacientes do ambulatório.
+
+tem_diu, tem_implanon, tem_insercao e ultima_consulta são mantidos por
+triggers a cada consulta gravada, alterada, movida ou apagada (e a cada
+paciente cadastrada ou renumerada), e os filtros de
+/api/ambulatorial/pacientes/filtrados leem essas colunas.
+"""
+
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def inserir_paciente(executar):
+    def inserir_paciente(nome, id=None):
+        return executar('INSERT INTO pacientes_ambulatorial (id, nome_completo) VALUES (?, ?)', (id, nome)).lastrowid
+    return inserir_paciente
+
+
+def registrar_consulta(client, paciente_id, data, insercao=None):
+    resposta = client.post(f'/api/ambulatorial/consultas/{paciente_id}', json={
+        'data_consulta': data,
+        'houve_insercao': 'Sim' if insercao else 'Não',
+        'tipo_insercao': insercao or '',
+    })
+    assert resposta.status_code == 201, resposta.get_json()
+    return resposta.get_json()['consulta_id']
+
+
+def filtradas(client, filtro):
+    resposta = client.get(f'/api/ambulatorial/pacientes/filtrados?filtro={filtro}')
+    assert resposta.status_code == 200
+    return sorted(paciente['nome_completo'] for paciente in resposta.get_json())
+
+
+def indicadores(paciente_id):
+    conn = backend.get_db()
+    linha = conn.execute(
+        'SELECT tem_diu, tem_implanon, tem_insercao, ultima_consulta FROM pacientes_ambulatorial WHERE id = ?',
+        (paciente_id,)
+    ).fetchone()
+    conn.close()
+    return tuple(linha)
+
+
+def divergencias():
+    conn = backend.get_db()
+    resultado = backend.verificar_indicadores_paciente(conn.cursor())
+    conn.close()
+    return resultado
+
+
+def test_filtros_seguem_as_consultas(client, inserir_paciente):
+    ana = inserir_paciente('Ana')
+    bia = inserir_paciente('Bia')
+    inserir_paciente('Carla')
+
+    registrar_consulta(client, ana, '2024-01-10', 'DIU')
+    registrar_consulta(client, ana, '2024-03-01')
+    registrar_consulta(client, bia, '2024-02-05', 'Implanon')
+
+    assert indicadores(ana) == (1, 0, 1, '2024-03-01')
+    assert filtradas(client, 'com_diu') == ['Ana']
+    assert filtradas(client, 'com_implanon') == ['Bia']
+    assert filtradas(client, 'sem_insercao') == ['Carla']
+    assert filtradas(client, 'todos') == ['Ana', 'Bia', 'Carla']
+    assert divergencias() == []
+
+
+def test_alterar_mover_e_apagar_consultas(client, executar, inserir_paciente):
+    ana = inserir_paciente('Ana')
+    bia = inserir_paciente('Bia')
+    consulta = registrar_consulta(client, ana, '2024-01-10', 'DIU')
+
+    # Tipo de inserção corrigido
+    executar("UPDATE consultas_ambulatorial SET tipo_insercao = 'Implanon' WHERE id = ?", (consulta,))
+    assert indicadores(ana) == (0, 1, 1, '2024-01-10')
+
+    # Consulta lançada na paciente errada: as duas são recalculadas
+    executar('UPDATE consultas_ambulatorial SET paciente_id = ? WHERE id = ?', (bia, consulta))
+    assert indicadores(ana) == (0, 0, 0, None)
+    assert indicadores(bia) == (0, 1, 1, '2024-01-10')
+    assert filtradas(client, 'sem_insercao') == ['Ana']
+
+    executar('DELETE FROM consultas_ambulatorial WHERE id = ?', (consulta,))
+    assert indicadores(bia) == (0, 0, 0, None)
+    assert filtradas(client, 'sem_insercao') == ['Ana', 'Bia']
+    assert divergencias() == []
+
+
+def test_paciente_cadastrada_ou_renumerada_depois_das_consultas(client, executar, inserir_paciente):
+    # Consultas importadas antes do cadastro da paciente
+    executar("""
+        INSERT INTO consultas_ambulatorial (paciente_id, data_consulta, houve_insercao, tipo_insercao)
+        VALUES (10, '2024-01-10', 'Sim', 'DIU'), (20, '2024-02-05', 'Sim', 'Implanon')
+    """)
+    inserir_paciente('Ana', id=10)
+    assert indicadores(10) == (1, 0, 1, '2024-01-10')
+
+    bia = inserir_paciente('Bia')
+    assert indicadores(bia) == (0, 0, 0, None)
+    # Renumerada para o id das consultas dela
+    executar('UPDATE pacientes_ambulatorial SET id = 20 WHERE id = ?', (bia,))
+    assert indicadores(20) == (0, 1, 1, '2024-02-05')
+
+    assert filtradas(client, 'com_implanon') == ['Bia']
+    assert divergencias() == []
+
+
+def test_verificacao_aponta_e_reconstrucao_corrige(banco, inserir_paciente, executar):
+    ana = inserir_paciente('Ana')
+    executar('UPDATE pacientes_ambulatorial SET tem_diu = 1 WHERE id = ?', (ana,))
+    assert divergencias() == [(('pacientes_ambulatorial', ana), (1, 0, 0, None), (0, 0, 0, None))]
+
+    conn = backend.get_db()
+    backend.reconstruir_indicadores_paciente(conn.cursor())
+    conn.commit()
+    conn.close()
+    assert divergencias() == []
@@ -0,0 +1,101 @@
+"""
+Teste das migrações versionadas do esquema (MIGRACOES e PRAGMA user_version).
+
+Um banco novo e um banco antigo chegam à mesma versão, uma migração que falha
+não deixa nada pela metade, e rodar init_db() de novo (ou em paralelo) não
+aplica nada duas vezes.
+"""
+
+import os
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+import app as backend
+
+BANCO_EXEMPLO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.db')
+
+
+@pytest.fixture
+def caminho(tmp_path, monkeypatch):
+    """Caminho de um banco ainda não criado (sem init_db()), usado por get_db()."""
+    backend.fechar_conexoes()
+    monkeypatch.setattr(backend, 'DB_PATH', str(tmp_path / 'database.db'))
+    yield backend.DB_PATH
+    backend.fechar_conexoes()
+
+
+def versao():
+    conn = sqlite3.connect(backend.DB_PATH)
+    numero = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.close()
+    return numero
+
+
+def tabelas():
+    conn = sqlite3.connect(backend.DB_PATH)
+    nomes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    return nomes
+
+
+def test_banco_novo_chega_a_ultima_versao(caminho):
+    backend.init_db()
+    assert versao() == len(backend.MIGRACOES)
+    assert {'pacientes', 'usuarios', 'sessoes', 'movimentacoes_insumos'} <= tabelas()
+
+    # Já atualizado: nada é aplicado de novo
+    antes = tabelas()
+    backend.init_db()
+    assert versao() == len(backend.MIGRACOES)
+    assert tabelas() == antes
+
+
+def test_banco_antigo_migrado_sem_perder_dados(caminho):
+    # Cópia do banco de exemplo (versão 0, esquema anterior às migrações)
+    shutil.copy(BANCO_EXEMPLO, caminho)
+    conn = sqlite3.connect(caminho)
+    usuarios = conn.execute('SELECT id, cpf FROM usuarios ORDER BY id').fetchall()
+    conn.close()
+
+    backend.init_db()
+    assert versao() == len(backend.MIGRACOES)
+    conn = sqlite3.connect(caminho)
+    assert conn.execute('SELECT id, cpf FROM usuarios ORDER BY id').fetchall() == usuarios
+    conn.close()
+
+
+def test_migracao_com_erro_nao_fica_pela_metade(caminho, monkeypatch):
+    backend.init_db()
+
+    def migracao_com_erro(cursor):
+        cursor.execute('CREATE TABLE tabela_pela_metade (id INTEGER)')
+        raise RuntimeError('falha no meio da migração')
+
+    monkeypatch.setattr(backend, 'MIGRACOES', backend.MIGRACOES + [migracao_com_erro])
+    with pytest.raises(RuntimeError):
+        backend.init_db()
+    assert versao() == len(backend.MIGRACOES) - 1
+    assert 'tabela_pela_metade' not in tabelas()
+
+
+def test_inicializacao_em_paralelo(caminho):
+    erros = []
+
+    def iniciar():
+        try:
+            backend.init_db()
+        except Exception as e:
+            erros.append(e)
+        finally:
+            backend.fechar_conexoes()
+
+    threads = [threading.Thread(target=iniciar) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert erros == []
+    assert versao() == len(backend.MIGRACOES)
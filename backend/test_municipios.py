@@ -0,0 +1,55 @@
+"""
+Teste do registro de municípios em memória.
+
+O registro encontra o município pelo id, código IBGE, nome ou slug (inclusive
+a chave que o mapa monta, com apóstrofo); /api/capacitacao/mapa/dados mantém
+essas chaves e um município desconhecido recebe os totais zerados.
+"""
+
+
+import app as backend
+
+
+def test_busca_por_qualquer_chave(banco):
+    registro = backend.registro_municipios()
+    for chave in ('Maceió', 'maceio', '2704302', "olho-d'agua-das-flores", 'olho-d-agua-das-flores',
+                  "Olho d'Água das Flores"):
+        assert registro.buscar(chave) is not None, chave
+    assert registro.buscar('maceio')['nome'] == 'Maceió'
+    assert registro.buscar(registro.buscar('Maceió')['id'])['codigo_ibge'] == '2704302'
+    assert registro.buscar('atlantida') is None
+
+
+def test_lista_servida_do_registro(client):
+    resposta = client.get('/api/municipios')
+    assert resposta.status_code == 200
+    assert len(resposta.get_json()) == 102
+    assert client.get('/api/municipios', headers={'If-None-Match': resposta.headers['ETag']}).status_code == 304
+
+
+def test_chaves_do_mapa(client):
+    conn = backend.get_db()
+    cursor = conn.cursor()
+    cursor.execute('INSERT INTO enfermeiras_alunas (nome, cpf, municipio) VALUES (?, ?, ?)',
+                   ('Ana', '11122233344', "Olho d'Água das Flores"))
+    aluna_id = cursor.lastrowid
+    cursor.executemany(
+        'INSERT INTO fichas_atendimento_pdf (enfermeira_aluna_id, nome_arquivo) VALUES (?, ?)',
+        [(aluna_id, f'ficha{i}.pdf') for i in range(20)],
+    )
+    conn.commit()
+    conn.close()
+
+    dados = client.get('/api/capacitacao/mapa/dados').get_json()
+    assert list(dados) == ["olho-d'agua-das-flores"]
+    assert dados["olho-d'agua-das-flores"]['insercoes_realizadas'] == 20
+
+    # A chave do mapa leva aos totais do município
+    stats = client.get("/api/capacitacao/stats/municipio/olho-d'agua-das-flores").get_json()
+    assert stats['totalAlunas'] == 1
+
+
+def test_municipio_desconhecido_zerado(client):
+    resposta = client.get('/api/capacitacao/stats/municipio/atlantida')
+    assert resposta.status_code == 200
+    assert set(resposta.get_json().values()) == {0}
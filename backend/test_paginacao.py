@@ -0,0 +1,84 @@
+"""
+Teste da paginação por cursor (keyset) das listagens.
+
+Percorrer as páginas pelo X-Proximo-Cursor devolve cada linha uma vez só, na
+ordem (created_at, id), também com muitas linhas no mesmo created_at e com
+inserções entre uma página e outra. A página sai em streaming.
+"""
+
+import json
+
+import app as backend
+
+
+def inserir_pacientes(quantidade, created_at):
+    conn = backend.get_db()
+    conn.executemany(
+        'INSERT INTO pacientes (nome_completo, status, created_at) VALUES (?, ?, ?)',
+        [(f'Paciente {i}', 'rascunho', created_at) for i in range(quantidade)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def todos_os_ids():
+    conn = backend.get_db()
+    ids = [row['id'] for row in conn.execute('SELECT id FROM pacientes ORDER BY created_at DESC, id DESC')]
+    conn.close()
+    return ids
+
+
+def percorrer(client, url, antes_da_pagina=None):
+    ids, paginas = [], 0
+    while url:
+        if antes_da_pagina:
+            antes_da_pagina(paginas)
+        resposta = client.get(url)
+        assert resposta.status_code == 200, resposta.get_data(as_text=True)
+        ids += [item['id'] for item in resposta.get_json()]
+        cursor = resposta.headers.get('X-Proximo-Cursor')
+        url = f'/api/pacientes?limite=40&cursor={cursor}' if cursor else None
+        paginas += 1
+    return ids, paginas
+
+
+def test_paginas_sem_repeticao_nem_buraco(client):
+    # Muitas linhas com o mesmo created_at: o id desempata
+    inserir_pacientes(90, '2026-01-01 10:00:00')
+    inserir_pacientes(70, '2026-01-02 10:00:00')
+
+    ids, paginas = percorrer(client, '/api/pacientes?limite=40')
+    assert ids == todos_os_ids()
+    assert paginas == 4
+
+
+def test_insercao_entre_paginas(client):
+    inserir_pacientes(100, '2026-01-01 10:00:00')
+    esperados = todos_os_ids()
+
+    def inserir_mais_recente(pagina):
+        if pagina == 1:
+            inserir_pacientes(5, '2026-02-01 10:00:00')
+
+    # As linhas novas entram antes da primeira página e não aparecem nas seguintes
+    ids, _ = percorrer(client, '/api/pacientes?limite=40', inserir_mais_recente)
+    assert ids == esperados
+
+
+def test_pagina_em_streaming(client):
+    inserir_pacientes(30, '2026-01-01 10:00:00')
+
+    resposta = client.get('/api/pacientes?limite=20&formato=ndjson&fields=nome_completo')
+    assert resposta.is_streamed
+    linhas = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+    assert len(linhas) == 20
+    assert all(set(linha) == {'nome_completo'} for linha in linhas)
+    assert resposta.headers.get('X-Proximo-Cursor')
+
+    ultima = client.get(f"/api/pacientes?limite=20&cursor={resposta.headers['X-Proximo-Cursor']}")
+    assert len(ultima.get_json()) == 10
+    assert 'X-Proximo-Cursor' not in ultima.headers
+
+
+def test_cursor_invalido(client):
+    assert client.get('/api/pacientes?cursor=nao-e-cursor').status_code == 400
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Teste de regressão dos planos de consulta.
+
+Sobe o app contra um banco temporário, exercita as rotas da API, captura todo
+SQL emitido e roda EXPLAIN QUERY PLAN em cada comando. Falha quando algum
+comando faz SCAN completo (sem índice) de uma tabela que cresce com o uso.
+
+Uso:
+    cd backend && python test_planos_consulta.py
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as backend
+
+# Tabelas pequenas e de tamanho limitado, que podem ser lidas por inteiro; os
+# resumos diários crescem uma linha por dia, não por registro
+TABELAS_ESTATICAS = {'municipios', 'sqlite_master', 'sqlite_sequence', 'contadores', 'ambulatorial_diario'}
+
+# Consultas que ainda fazem SCAN completo de propósito: (trecho do SQL, motivo)
+PERMITIDOS = [
+    ("LIKE '%", 'busca por substring; não há índice que atenda LIKE com curinga inicial'),
+]
+
+PALAVRAS_SQL = {
+    'where', 'left', 'right', 'inner', 'outer', 'cross', 'join', 'on', 'order',
+    'group', 'limit', 'having', 'union', 'set', 'values', 'select', 'using',
+}
+
+PDF_TESTE = 'JVBERi0xLjQKJcOkw7zDtsOfCg=='  # "%PDF-1.4..." em base64
+
+
+def exercitar_rotas(client):
+    """Cadastra alguns registros pela API e chama todas as rotas de leitura."""
+    token = client.post('/api/auth/login', json={'cpf': '123.456.789-09', 'senha': 'Admin@123'}).get_json()['token']
+    h = {'Authorization': f'Bearer {token}'}
+
+    client.post('/api/usuarios', json={
+        'nome_completo': 'Aluna Teste', 'email': 'aluna@teste.com', 'cpf': '11122233344',
+        'senha_hash': 'Senha@123', 'cargo': 'Enfermeiro(a) Aluno(a)', 'municipio': 'Maceió',
+        'profissao': 'Enfermeiro', 'criado_por': 1,
+    })
+    client.post('/api/usuarios', json={
+        'nome_completo': 'Instrutora Teste', 'email': 'instrutora@teste.com', 'cpf': '55566677788',
+        'senha_hash': 'Senha@123', 'cargo': 'Enfermeiro(a) Instrutor(a)', 'criado_por': 1,
+    })
+    client.post('/api/capacitacao/enfermeiras-instrutoras', json={
+        'nome': 'Maria', 'cpf': '12345678900', 'coren': '123', 'email': 'maria@teste.com',
+        'diploma_filename': 'diploma.pdf', 'diploma_content': PDF_TESTE,
+    })
+    client.post('/api/capacitacao/enfermeiras-alunas', json={
+        'nome': 'Ana', 'cpf': '98765432100', 'municipio': 'Maceió', 'enfermeira_instrutora_id': 1,
+        'certificado_filename': 'certificado.pdf', 'certificado_content': PDF_TESTE,
+    })
+    client.post('/api/capacitacao/agendamentos', json={'municipio': 'Maceió', 'data_agendamento': '2026-03-01'})
+    client.post('/api/capacitacao/pacientes')
+    client.patch('/api/capacitacao/pacientes/1', json={'nome_completo': 'Paciente', 'cpf': '00011122233'})
+    client.post('/api/capacitacao/pacientes/1/dados-ginecologicos', json={'metodo_escolhido': 'DIU', 'enfermeira_aluna_id': 1})
+    client.post('/api/capacitacao/enfermeiras-alunas/1/fichas', json={
+        'nome_arquivo': 'ficha.pdf', 'pdf_content': PDF_TESTE, 'nome_paciente': 'Paciente',
+        'cpf_paciente': '00011122233', 'data_nascimento_paciente': '1990-01-01',
+        'municipio_paciente': 'Maceió', 'metodo_inserido': 'DIU',
+    })
+    client.post('/api/pacientes')
+    client.post('/api/pacientes/1/identificacao', json={'nome_completo': 'Paciente', 'cpf': '00011122233'})
+    client.post('/api/pacientes/1/dados-ginecologicos', json={'paridade': 1})
+    client.post('/api/pacientes/1/consultas', json={'consultas': [{'data_consulta': '2026-01-10'}]})
+    client.patch('/api/pacientes/1/finalizar')
+    client.post('/api/ambulatorial/pacientes', json={'nome_completo': 'Paciente Amb', 'cpf': '44455566677'})
+    client.post('/api/ambulatorial/dados-ginecologicos', json={'paciente_id': 1, 'realizou_usg': 'Sim'})
+    client.put('/api/ambulatorial/dados-ginecologicos/1', json={'realizou_usg': 'Sim'})
+    client.post('/api/ambulatorial/consultas/1', json={
+        'data_consulta': '2026-02-01', 'houve_insercao': 'Sim', 'tipo_insercao': 'DIU',
+    })
+    client.post('/api/ambulatorial/enfermeiras-instrutoras', json={
+        'nome': 'Joana', 'cpf': '99988877766', 'diploma_filename': 'diploma.pdf', 'diploma_content': PDF_TESTE,
+    })
+    client.post('/api/distribuicao/solicitacoes', json={'municipio_id': 1, 'tipo_insumo': 'DIU', 'quantidade_solicitada': 10})
+    client.patch('/api/distribuicao/solicitacoes/1', json={'status': 'Autorizado', 'quantidade_autorizada': 8})
+    client.post('/api/distribuicao/movimentacoes', json={
+        'municipio_id': 1, 'tipo_insumo': 'DIU', 'tipo': 'entregue', 'quantidade': 8,
+    })
+    client.post('/api/distribuicao/movimentacoes', json={
+        'municipio_id': 1, 'tipo_insumo': 'DIU', 'tipo': 'consumido', 'quantidade': 2,
+    })
+    client.post('/api/distribuicao/responsaveis', json={'nome': 'Resp', 'cpf': '12312312312', 'municipio': 'Maceió'})
+    client.post('/api/auth/login', json={'cpf': '123.456.789-09', 'senha': 'Admin@123'})
+    client.post('/api/auth/logout', json={'usuario_id': 1})
+
+    leituras = [
+        '/api/pacientes', '/api/pacientes/1', '/api/pacientes/buscar?cpf=00011122233',
+        '/api/pacientes/buscar?sus=1', '/api/pacientes/1/dados-ginecologicos', '/api/pacientes/1/consultas',
+        '/api/capacitacao/dashboard', '/api/capacitacao/mapa/dados', '/api/capacitacao/mapa-municipios',
+        '/api/capacitacao/stats/municipio/maceio', '/api/capacitacao/stats/municipios', '/api/capacitacao/stats',
+        '/api/capacitacao/stats?agrupar=municipio,mes', '/api/capacitacao/dashboard?agrupar=municipio,mes',
+        '/api/distribuicao/stats?agrupar=municipio,mes',
+        '/api/capacitacao/agendamentos', '/api/capacitacao/enfermeiras-instrutoras',
+        '/api/capacitacao/enfermeiras-instrutoras/1', '/api/capacitacao/enfermeiras-alunas',
+        '/api/capacitacao/enfermeiras-alunas/1', '/api/capacitacao/enfermeiras-alunas/1/fichas',
+        '/api/capacitacao/enfermeiras-alunas/1/fichas/1', '/api/capacitacao/enfermeiras-alunas/1/fichas/1/download',
+        '/api/capacitacao/pacientes',
+        '/api/capacitacao/pacientes/1', '/api/capacitacao/pacientes/1/dados-ginecologicos',
+        '/api/ambulatorial/pacientes', '/api/ambulatorial/pacientes/1',
+        '/api/ambulatorial/dados-ginecologicos/1', '/api/ambulatorial/consultas/1',
+        '/api/ambulatorial/stats', '/api/ambulatorial/stats?year=2026',
+        '/api/ambulatorial/stats?inicio=2026-01-01', '/api/ambulatorial/stats?inicio=2025-06-01&fim=2026-05-31',
+        '/api/ambulatorial/enfermeiras-instrutoras', '/api/ambulatorial/enfermeiras-instrutoras/1',
+        '/api/ambulatorial/enfermeiras-instrutoras/buscar', '/api/ambulatorial/enfermeiras-instrutoras/buscar?termo=jo',
+        '/api/ambulatorial/pacientes/filtrados', '/api/ambulatorial/pacientes/filtrados?filtro=com_diu',
+        '/api/ambulatorial/pacientes/filtrados?filtro=com_implanon',
+        '/api/ambulatorial/pacientes/filtrados?filtro=sem_insercao',
+        '/api/municipios', '/api/distribuicao/municipios', '/api/distribuicao/solicitacoes',
+        '/api/distribuicao/solicitacoes?dataInicio=2026-01-01&dataFim=2026-12-31&municipio=1&tipoInsumo=DIU&status=Autorizado',
+        '/api/distribuicao/solicitacoes?dataInicio=2026-01-01&status=Autorizado',
+        '/api/distribuicao/solicitacoes?dataFim=2026-12-31&tipoInsumo=DIU',
+        '/api/distribuicao/solicitacoes?municipio=1&dataInicio=2026-01-01&total=1',
+        '/api/distribuicao/solicitacoes/1', '/api/distribuicao/stats', '/api/distribuicao/responsaveis',
+        '/api/distribuicao/estoque', '/api/distribuicao/estoque?tipoInsumo=DIU', '/api/distribuicao/estoque/1',
+        '/api/distribuicao/estoque/agua-branca?tipoInsumo=DIU', '/api/distribuicao/movimentacoes',
+        '/api/distribuicao/movimentacoes?municipio=1&tipoInsumo=DIU', '/api/distribuicao/movimentacoes?tipoInsumo=DIU',
+        '/api/distribuicao/movimentacoes?municipio=1&cursor=' + backend.codificar_cursor(['2026-01-01 00:00:00', 5]),
+        '/api/distribuicao/responsaveis/1', '/api/distribuicao/responsaveis/validar-cpf?cpf=1',
+        '/api/distribuicao/responsaveis/validar-cpf?cpf=1&excludeId=1',
+        '/api/usuarios', '/api/usuarios/1', '/api/logs-auditoria', '/api/profissionais',
+        '/api/logs-auditoria?acao=login&limite=10', '/api/logs-auditoria?tabela_afetada=usuarios',
+        '/api/logs-auditoria?usuario_id=1&dataInicio=2026-01-01&dataFim=2026-12-31',
+        '/api/logs-auditoria?cursor=' + backend.codificar_cursor(['2026-01-01 00:00:00', 10]),
+        '/api/logs-auditoria/exportar?acao=login', '/api/logs-auditoria/exportar?formato=csv',
+        '/api/profissionais?busca=ana&categoria=Enfermeiro(a)%20Aluno(a)', '/api/profissionais/1',
+        '/api/profissionais?busca=instrutor', '/api/profissionais?categoria=Enfermeiro(a)%20Aluno(a)',
+        '/api/busca?q=mar', '/api/busca?q=111.222&tipos=usuario,paciente_ambulatorial',
+        '/api/ambulatorial/pacientes?total=1&limite=10', '/api/pacientes?total=1',
+        '/api/capacitacao/pacientes?cursor=' + backend.codificar_cursor(['2026-01-01 00:00:00', 5]),
+        '/api/usuarios?total=1&cursor=' + backend.codificar_cursor(['2026-01-01 00:00:00', 5]),
+        '/api/capacitacao/agendamentos?total=1&cursor=' + backend.codificar_cursor(['2026-01-01', 5]),
+        '/api/distribuicao/solicitacoes?total=1&cursor=' + backend.codificar_cursor(['2026-01-01', 5]),
+        '/api/profissionais?page=2&cursor=' + backend.codificar_cursor(['Ana', 5]),
+        '/api/usuarios?fields=nome_completo,cpf', '/api/distribuicao/solicitacoes?fields=status,municipio_nome',
+        '/api/capacitacao/enfermeiras-alunas?fields=nome,status', '/api/capacitacao/enfermeiras-alunas/1?fields=nome,progresso',
+        '/api/capacitacao/pacientes/1?fields=nome_completo,insercoes', '/api/ambulatorial/pacientes/1?fields=cpf',
+        '/api/dashboard/gestao',
+    ]
+    for url in leituras:
+        resposta = client.get(url, headers=h)
+        resposta.get_data()  # consome respostas em streaming
+        assert resposta.status_code < 500, f'{url} retornou {resposta.status_code}'
+
+    client.post('/api/capacitacao/enfermeiras-instrutoras/validar', json={'cpf': '1', 'email': 'a', 'coren': '1', 'id': 1})
+    client.post('/api/ambulatorial/enfermeiras-instrutoras/validar', json={'cpf': '1', 'email': 'a', 'numero_registro': '1', 'id': 1})
+    client.patch('/api/capacitacao/enfermeiras-instrutoras/1', json={
+        'nome': 'Maria', 'cpf': '12345678900', 'diploma_content': PDF_TESTE, 'diploma_filename': 'novo.pdf',
+    })
+    client.patch('/api/ambulatorial/enfermeiras-instrutoras/1', json={
+        'nome': 'Joana', 'cpf': '99988877766', 'senha': 'Senha@123', 'diploma_content': PDF_TESTE,
+    })
+    client.patch('/api/capacitacao/enfermeiras-alunas/1', json={
+        'nome': 'Ana', 'cpf': '98765432100', 'certificado_content': PDF_TESTE,
+    })
+    client.put('/api/profissionais/2', json={'telefone': '82999990000', 'usuario_id': 1}, headers=h)
+    client.put('/api/profissionais/2/status', json={'status': 'ativo', 'usuario_id': 1}, headers=h)
+    client.put('/api/usuarios/2', json={'cargo': 'Coordenador', 'status': 'ativo', 'usuario_id': 1})
+    client.post('/api/auth/recuperar-senha', json={'cpf': '12345678909', 'data_nascimento': '1990-01-01'})
+    client.post('/api/auth/alterar-senha', json={'usuario_id': 3, 'nova_senha': 'Nova@1234'})
+    client.post('/api/auth/redefinir-senha/3', json={'nova_senha': 'Nova@1234'}, headers=h)
+    client.delete('/api/capacitacao/enfermeiras-alunas/1/fichas/1')
+    client.delete('/api/profissionais/3', json={'usuario_id': 1}, headers=h)
+
+
+def tabelas_por_alias(sql):
+    aliases = {}
+    for tabela, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+        aliases[tabela] = tabela
+        if alias and alias.lower() not in PALAVRAS_SQL:
+            aliases[alias] = tabela
+    return aliases
+
+
+def scans_completos(conn, sql):
+    """Retorna as tabelas lidas por inteiro (SCAN sem índice) pelo comando."""
+    aliases = tabelas_por_alias(sql)
+    tabelas = []
+    for linha in conn.execute(f'EXPLAIN QUERY PLAN {sql}'):
+        detalhe = linha[3]
+        encontrado = re.match(r'SCAN (\w+)$', detalhe)
+        if not encontrado:
+            continue
+        tabela = aliases.get(encontrado.group(1), encontrado.group(1))
+        if tabela not in TABELAS_ESTATICAS:
+            tabelas.append(tabela)
+    return tabelas
+
+
+def coletar_sql():
+    """SQL distinto emitido pelas rotas no banco de backend.DB_PATH (já migrado)."""
+    comandos = []
+    # Só o SQL das rotas interessa; as migrações já rodaram
+    backend.fechar_conexoes()
+    backend.DB_TRACE = comandos.append
+    try:
+        exercitar_rotas(backend.app.test_client())
+    finally:
+        backend.DB_TRACE = None
+        backend.fechar_conexoes()
+
+    vistos = []
+    for sql in comandos:
+        sql = sql.strip()
+        if re.match(r'(SELECT|UPDATE|DELETE|WITH)\b', sql, re.I) and sql not in vistos:
+            vistos.append(sql)
+    return vistos
+
+
+def verificar_planos():
+    comandos = coletar_sql()
+    conn = sqlite3.connect(backend.DB_PATH)
+    falhas = []
+    for sql in comandos:
+        if any(trecho in sql for trecho, _ in PERMITIDOS):
+            continue
+        tabelas = scans_completos(conn, sql)
+        if tabelas:
+            falhas.append((sql, tabelas))
+    conn.close()
+    return comandos, falhas
+
+
+def test_planos_sem_scan_completo(banco):
+    comandos, falhas = verificar_planos()
+    assert comandos, 'nenhum SQL capturado'
+    assert not falhas, '\n\n'.join(f"SCAN de {', '.join(t)}:\n{sql}" for sql, t in falhas)
+
+
+if __name__ == '__main__':
+    print("Verificando planos de consulta...")
+    with tempfile.TemporaryDirectory() as diretorio:
+        backend.DB_PATH = os.path.join(diretorio, 'database.db')
+        backend.init_db()
+        comandos, falhas = verificar_planos()
+        backend.descarregar_auditoria()
+        backend.fechar_conexoes()
+    print(f"{len(comandos)} comandos distintos capturados")
+
+    for sql, tabelas in falhas:
+        print(f"\n✗ SCAN completo de {', '.join(tabelas)}:")
+        print('  ' + ' '.join(sql.split()))
+
+    if falhas:
+        print(f"\n✗ {len(falhas)} comando(s) sem índice adequado")
+        sys.exit(1)
+    print("✓ Nenhum SCAN completo em tabelas que crescem")
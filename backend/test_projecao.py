@@ -0,0 +1,75 @@
+"""
+Teste da projeção de colunas (?fields=) nas listagens e nos detalhes.
+
+Só os campos pedidos saem na resposta e entram no SELECT; campos
+desconhecidos ou ocultos (hashes de senha) respondem 400, e o conteúdo dos
+arquivos só vem quando pedido.
+"""
+
+import base64
+
+import app as backend
+
+
+def sql_emitido(client, url):
+    comandos = []
+    backend.DB_TRACE = comandos.append
+    backend.fechar_conexoes()
+    try:
+        resposta = client.get(url)
+        # As listagens só consultam o banco enquanto a resposta é lida
+        resposta.get_data()
+    finally:
+        backend.DB_TRACE = None
+        backend.fechar_conexoes()
+    return resposta, [sql for sql in comandos if 'FROM usuarios' in sql]
+
+
+def test_listagem_e_detalhe_com_campos(client):
+
+    lista = client.get('/api/usuarios?fields=nome_completo,cargo').get_json()
+    assert lista and all(set(usuario) == {'nome_completo', 'cargo'} for usuario in lista)
+
+    detalhe = client.get('/api/usuarios/1?fields=email').get_json()
+    assert set(detalhe) == {'email'}
+
+    # Sem ?fields=: todas as colunas públicas, nunca os hashes
+    completo = client.get('/api/usuarios/1').get_json()
+    assert {'id', 'nome_completo', 'email', 'cpf'} <= set(completo)
+    assert not set(completo) & backend.COLUNAS_OCULTAS
+
+
+def test_select_so_com_as_colunas_pedidas(client):
+    resposta, comandos = sql_emitido(client, '/api/usuarios/1?fields=nome_completo')
+    assert set(resposta.get_json()) == {'nome_completo'}
+    assert comandos and all('email' not in sql and '*' not in sql for sql in comandos)
+
+    resposta, comandos = sql_emitido(client, '/api/usuarios?fields=nome_completo')
+    assert resposta.status_code == 200
+    assert comandos and all('email' not in sql for sql in comandos)
+
+
+def test_campos_invalidos_ou_ocultos(client):
+    for url in ('/api/usuarios?fields=nome_completo,inexistente', '/api/usuarios/1?fields=senha_hash',
+                '/api/usuarios?fields=temporary_password_hash'):
+        resposta = client.get(url)
+        assert resposta.status_code == 400, url
+        assert 'desconhecido' in resposta.get_json()['error']
+
+
+def test_conteudo_do_arquivo_so_quando_pedido(client):
+    diploma = b'%PDF-1.4 diploma'
+    criada = client.post('/api/capacitacao/enfermeiras-instrutoras', json={
+        'nome': 'Maria', 'cpf': '11122233344', 'diploma_filename': 'diploma.pdf',
+        'diploma_content': base64.b64encode(diploma).decode(),
+    })
+    assert criada.status_code == 201
+    conn = backend.get_db()
+    instrutora_id = conn.execute("SELECT id FROM enfermeiras_instrutoras WHERE cpf = '11122233344'").fetchone()['id']
+    conn.close()
+    url = f'/api/capacitacao/enfermeiras-instrutoras/{instrutora_id}'
+
+    assert 'diploma_content' not in client.get(url).get_json()
+    pedido = client.get(f'{url}?fields=nome,diploma_content').get_json()
+    assert set(pedido) == {'nome', 'diploma_content'}
+    assert base64.b64decode(pedido['diploma_content']) == diploma
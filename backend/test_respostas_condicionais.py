@@ -0,0 +1,68 @@
+"""
+Teste dos GETs condicionais e da compressão das respostas.
+
+Com o ETag da última resposta em If-None-Match a API responde 304 até a
+tabela mudar; respostas grandes vão em gzip (também as listas em streaming) e
+as pequenas, sem compressão.
+"""
+
+import gzip
+import json
+
+import app as backend
+
+
+def inserir_pacientes(quantidade):
+    conn = backend.get_db()
+    conn.executemany('INSERT INTO pacientes (nome_completo, status) VALUES (?, ?)',
+                     [(f'Paciente {i}', 'rascunho') for i in range(quantidade)])
+    conn.commit()
+    conn.close()
+
+
+def test_304_ate_a_tabela_mudar(client):
+    inserir_pacientes(3)
+    primeira = client.get('/api/pacientes')
+    etag = primeira.headers['ETag']
+
+    repetida = client.get('/api/pacientes', headers={'If-None-Match': etag})
+    assert repetida.status_code == 304
+    assert repetida.get_data() == b''
+
+    inserir_pacientes(1)
+    depois = client.get('/api/pacientes', headers={'If-None-Match': etag})
+    assert depois.status_code == 200
+    assert depois.headers['ETag'] != etag
+    assert len(depois.get_json()) == 4
+
+
+def test_etag_do_corpo_nas_demais_rotas(client):
+    # Rota sem gerações declaradas: o ETag é o hash do corpo
+    primeira = client.get('/api/usuarios/1')
+    assert client.get('/api/usuarios/1', headers={'If-None-Match': primeira.headers['ETag']}).status_code == 304
+
+    conn = backend.get_db()
+    conn.execute("UPDATE usuarios SET telefone = '82999990000' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    assert client.get('/api/usuarios/1', headers={'If-None-Match': primeira.headers['ETag']}).status_code == 200
+
+
+def test_compressao(client):
+    inserir_pacientes(200)
+
+    # Lista em streaming, comprimida aos poucos
+    resposta = client.get('/api/pacientes', headers={'Accept-Encoding': 'gzip'})
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resposta.headers['Vary']
+    assert len(json.loads(gzip.decompress(resposta.get_data()))) == 100
+
+    # Resposta já pronta
+    resposta = client.get('/api/municipios', headers={'Accept-Encoding': 'gzip'})
+    assert resposta.headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(resposta.get_data()))) == 102
+
+    # Abaixo de LIMITE_COMPRESSAO e sem Accept-Encoding vai como está
+    pequena = client.get('/api/ambulatorial/stats', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in pequena.headers
+    assert 'Content-Encoding' not in client.get('/api/pacientes').headers
@@ -0,0 +1,98 @@
+"""
+Teste do resumo diário do ambulatório (ambulatorial_diario).
+
+Depois de inserções, alterações e exclusões, /api/ambulatorial/stats devolve o
+mesmo que uma contagem direta nas tabelas, com consultas e USGs só de
+pacientes existentes (o JOIN com pacientes_ambulatorial da contagem antiga).
+"""
+
+import app as backend
+
+
+def recontar(ano=None):
+    """Os totais de /api/ambulatorial/stats contados direto nas tabelas."""
+    conn = backend.get_db()
+
+    def contar(sql, condicao, parametros=()):
+        if ano:
+            sql += f" AND substr({condicao}, 1, 4) = ?"
+            parametros += (ano,)
+        return conn.execute(sql, parametros).fetchone()[0]
+
+    consultas = ('SELECT COUNT(*) FROM consultas_ambulatorial c '
+                 'JOIN pacientes_ambulatorial p ON c.paciente_id = p.id WHERE 1')
+    totais = {
+        'totalPacientes': contar('SELECT COUNT(*) FROM pacientes_ambulatorial WHERE 1', 'created_at'),
+        'totalConsultas': contar(consultas, 'c.data_consulta'),
+        'totalDius': contar(consultas + " AND c.houve_insercao = 'Sim' AND c.tipo_insercao = 'DIU'", 'c.data_consulta'),
+        'totalImplanons': contar(consultas + " AND c.houve_insercao = 'Sim' AND c.tipo_insercao = 'Implanon'",
+                                 'c.data_consulta'),
+        'totalInsercoes': contar(consultas + " AND c.houve_insercao = 'Sim'", 'c.data_consulta'),
+        'totalIntercorrencias': contar(consultas + " AND c.nova_intercorrencia = 'Sim'", 'c.data_consulta'),
+        'totalUsgs': contar('SELECT COUNT(*) FROM dados_ginecologicos_obstetricos d '
+                            "JOIN pacientes_ambulatorial p ON d.paciente_id = p.id WHERE d.realizou_usg = 'Sim'",
+                            'd.created_at'),
+    }
+    conn.close()
+    return totais
+
+
+def conferir(client):
+    for ano in (None, '2025', '2026'):
+        url = f'/api/ambulatorial/stats?year={ano}' if ano else '/api/ambulatorial/stats'
+        resposta = client.get(url).get_json()
+        esperado = recontar(ano)
+        assert {chave: resposta[chave] for chave in esperado} == esperado, (ano, resposta, esperado)
+    conn = backend.get_db()
+    assert backend.verificar_resumo_ambulatorial(conn.cursor()) == []
+    conn.close()
+
+
+def inserir_paciente(executar, created_at, id=None):
+    return executar('INSERT INTO pacientes_ambulatorial (id, nome_completo, created_at) VALUES (?, ?, ?)',
+                    (id, 'Paciente', created_at)).lastrowid
+
+
+def inserir_consulta(executar, paciente_id, data, tipo=None, intercorrencia='Não'):
+    return executar(
+        'INSERT INTO consultas_ambulatorial (paciente_id, data_consulta, houve_insercao, tipo_insercao, '
+        'nova_intercorrencia) VALUES (?, ?, ?, ?, ?)',
+        (paciente_id, data, 'Sim' if tipo else 'Não', tipo, intercorrencia),
+    ).lastrowid
+
+
+def test_resumo_acompanha_insercoes_e_exclusoes(client, executar):
+    ana = inserir_paciente(executar, '2025-03-10 09:00:00')
+    bia = inserir_paciente(executar, '2026-01-05 09:00:00')
+    inserir_consulta(executar, ana, '2025-03-10', 'DIU')
+    inserir_consulta(executar, ana, '2026-02-01', intercorrencia='Sim')
+    consulta_bia = inserir_consulta(executar, bia, '2026-01-05', 'Implanon')
+    executar("INSERT INTO dados_ginecologicos_obstetricos (paciente_id, realizou_usg, created_at) "
+             "VALUES (?, 'Sim', '2026-01-05 10:00:00')", (bia,))
+    conferir(client)
+
+    executar("UPDATE consultas_ambulatorial SET tipo_insercao = 'DIU', data_consulta = '2025-12-31' WHERE id = ?",
+             (consulta_bia,))
+    conferir(client)
+
+    executar('DELETE FROM consultas_ambulatorial WHERE id = ?', (consulta_bia,))
+    conferir(client)
+
+
+def test_so_conta_pacientes_existentes(client, executar):
+    ana = inserir_paciente(executar, '2026-01-05 09:00:00')
+    inserir_consulta(executar, ana, '2026-01-05', 'DIU')
+    executar("INSERT INTO dados_ginecologicos_obstetricos (paciente_id, realizou_usg, created_at) "
+             "VALUES (?, 'Sim', '2026-01-05 10:00:00')", (ana,))
+
+    # Excluir a paciente retira as consultas e a USG dela
+    executar('DELETE FROM pacientes_ambulatorial WHERE id = ?', (ana,))
+    conferir(client)
+    assert client.get('/api/ambulatorial/stats').get_json()['totalDius'] == 0
+
+    # Consulta de paciente inexistente não conta; passa a contar com o cadastro
+    inserir_consulta(executar, 999, '2026-03-01', 'Implanon')
+    conferir(client)
+    inserir_paciente(executar, '2026-03-01 08:00:00', id=999)
+    conferir(client)
+    assert client.get('/api/ambulatorial/stats?year=2026').get_json()['totalImplanons'] == 1
@@ -0,0 +1,118 @@
+"""
+Teste das sessões por token.
+
+As rotas protegidas exigem o token do login; o id do usuário sozinho
+(X-User-Id) não autentica, a não ser com AUTH_ID_LEGADO ligado, e mesmo assim
+só para usuário ativo. Desativar o usuário, trocar a senha ou fazer logout
+derruba o token, e a resposta do login não traz os hashes de senha.
+"""
+
+import hashlib
+
+import app as backend
+
+
+def entrar(client, cpf, senha):
+    resposta = client.post('/api/auth/login', json={'cpf': cpf, 'senha': senha})
+    assert resposta.status_code == 200, resposta.get_json()
+    return resposta.get_json()
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def criar_administrador(client):
+    resposta = client.post('/api/usuarios', json={
+        'nome_completo': 'Segunda Administradora', 'email': 'segunda@example.com',
+        'cpf': '98765432100', 'senha_hash': 'Senha@123', 'cargo': 'Administrador',
+    })
+    assert resposta.status_code == 201, resposta.get_json()
+    return entrar(client, '98765432100', 'Senha@123')
+
+
+def test_token_autentica_e_id_sozinho_nao(client):
+    admin = entrar(client, '123.456.789-09', 'Admin@123')
+
+    assert client.get('/api/profissionais', headers=bearer(admin['token'])).status_code == 200
+    assert client.get('/api/profissionais').status_code == 401
+    assert client.get('/api/profissionais', headers={'X-User-Id': str(admin['id'])}).status_code == 401
+    assert client.get(f"/api/profissionais?usuario_id={admin['id']}").status_code == 401
+
+
+def test_desativar_usuario_derruba_o_token(client):
+    admin = entrar(client, '123.456.789-09', 'Admin@123')
+    segunda = criar_administrador(client)
+    assert client.get('/api/profissionais', headers=bearer(segunda['token'])).status_code == 200
+
+    resposta = client.put(f"/api/profissionais/{segunda['id']}/status",
+                          json={'status': 'inativo'}, headers=bearer(admin['token']))
+    assert resposta.status_code == 200
+    assert client.get('/api/profissionais', headers=bearer(segunda['token'])).status_code == 401
+
+
+def test_logout_encerra_a_sessao(client):
+    admin = entrar(client, '123.456.789-09', 'Admin@123')
+
+    client.post('/api/auth/logout', json={'usuario_id': admin['id']}, headers=bearer(admin['token']))
+    assert client.get('/api/profissionais', headers=bearer(admin['token'])).status_code == 401
+
+
+def test_id_legado_exige_usuario_ativo(client, monkeypatch):
+    admin = entrar(client, '123.456.789-09', 'Admin@123')
+    segunda = criar_administrador(client)
+    monkeypatch.setattr(backend, 'AUTH_ID_LEGADO', True)
+    assert client.get('/api/profissionais', headers={'X-User-Id': str(segunda['id'])}).status_code == 200
+    client.put(f"/api/profissionais/{segunda['id']}/status",
+               json={'status': 'inativo'}, headers=bearer(admin['token']))
+    assert client.get('/api/profissionais', headers={'X-User-Id': str(segunda['id'])}).status_code == 401
+
+
+def test_login_nao_devolve_hashes_de_senha(client, executar):
+    admin = entrar(client, '123.456.789-09', 'Admin@123')
+    assert 'senha_hash' not in admin and 'temporary_password_hash' not in admin
+
+    # Senha provisória: a resposta vem do UPDATE ... RETURNING *
+    executar('UPDATE usuarios SET temporary_password_hash = ?, temporary_password_used = 0 WHERE id = ?',
+             (hashlib.sha256(b'Provisoria@1').hexdigest(), admin['id']))
+    provisoria = entrar(client, '123.456.789-09', 'Provisoria@1')
+    assert provisoria['using_temporary']
+    assert 'senha_hash' not in provisoria and 'temporary_password_hash' not in provisoria
+
+
+def test_troca_de_senha_derruba_os_outros_tokens(client):
+    antigo = entrar(client, '123.456.789-09', 'Admin@123')
+    atual = entrar(client, '123.456.789-09', 'Admin@123')
+
+    resposta = client.post('/api/auth/alterar-senha', headers=bearer(atual['token']), json={
+        'usuario_id': atual['id'], 'senha_atual': 'Admin@123', 'nova_senha': 'Nova@1234',
+    })
+    assert resposta.status_code == 200
+    # O token que alterou a senha continua valendo; o anterior, já em cache, não
+    assert client.get('/api/profissionais', headers=bearer(atual['token'])).status_code == 200
+    assert client.get('/api/profissionais', headers=bearer(antigo['token'])).status_code == 401
+
+
+def test_redefinicao_pelo_admin_derruba_todos_os_tokens(client):
+    admin = entrar(client, '123.456.789-09', 'Admin@123')
+    segunda = criar_administrador(client)
+    assert client.get('/api/profissionais', headers=bearer(segunda['token'])).status_code == 200
+
+    resposta = client.post(f"/api/auth/redefinir-senha/{segunda['id']}", headers=bearer(admin['token']),
+                           json={'nova_senha': 'Redefinida@1'})
+    assert resposta.status_code == 200
+    assert client.get('/api/profissionais', headers=bearer(segunda['token'])).status_code == 401
+    assert client.get('/api/profissionais', headers=bearer(admin['token'])).status_code == 200
+
+
+def test_respostas_com_o_usuario_nao_devolvem_hashes(client):
+    admin = entrar(client, '123.456.789-09', 'Admin@123')
+    criado = client.post('/api/usuarios', json={
+        'nome_completo': 'Outra', 'email': 'outra@example.com',
+        'cpf': '98765432100', 'senha_hash': 'Senha@123', 'cargo': 'Coordenador',
+    }).get_json()
+    alterado = client.post('/api/auth/alterar-senha', headers=bearer(admin['token']), json={
+        'usuario_id': admin['id'], 'senha_atual': 'Admin@123', 'nova_senha': 'Nova@1234',
+    }).get_json()['usuario']
+    for usuario in (criado, alterado):
+        assert usuario['id'] and not set(usuario) & backend.COLUNAS_OCULTAS
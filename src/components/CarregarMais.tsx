@@ -0,0 +1,21 @@
+interface CarregarMaisProps {
+  temMais: boolean;
+  carregando: boolean;
+  onCarregarMais: () => void;
+}
+
+export default function CarregarMais({ temMais, carregando, onCarregarMais }: CarregarMaisProps) {
+  if (!temMais) return null;
+
+  return (
+    <div className="flex justify-center py-4">
+      <button
+        onClick={onCarregarMais}
+        disabled={carregando}
+        className="px-4 py-2 border border-gray-300 rounded-lg text-gray-700 font-semibold hover:bg-gray-50 disabled:opacity-50 disabled:cursor-not-allowed transition-colors"
+      >
+        {carregando ? 'Carregando...' : 'Carregar mais'}
+      </button>
+    </div>
+  );
+}
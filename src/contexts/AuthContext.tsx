@@ -22,6 +22,7 @@ export interface Usuario {
   status: string;
   primeiro_acesso: number;
   created_at: string;
+  token?: string;
 }
 
 export interface Permissoes {
@@ -239,7 +240,10 @@ export function AuthProvider({ children }: { children: ReactNode }) {
     if (usuario) {
       await fetch(`${API_URL}/auth/logout`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          ...(usuario.token ? { Authorization: `Bearer ${usuario.token}` } : {}),
+        },
         body: JSON.stringify({ usuario_id: usuario.id }),
       });
     }
@@ -264,7 +268,7 @@ export function AuthProvider({ children }: { children: ReactNode }) {
       throw new Error('Erro ao atualizar senha');
     }
 
-    const usuarioAtualizado = await response.json();
+    const usuarioAtualizado = { ...(await response.json()), token: usuario.token };
     setUsuario(usuarioAtualizado);
     localStorage.setItem('usuario', JSON.stringify(usuarioAtualizado));
   };
@@ -1,14 +1,56 @@
 const API_URL = import.meta.env.VITE_API_BASE_URL || '/api';
 
+// As listagens da API vêm em páginas; o cursor da próxima chega no cabeçalho
+// X-Proximo-Cursor. As telas de lista carregam uma página por vez com
+// fetchPagina() e pedem a seguinte no "Carregar mais".
+export interface Pagina<T = any> {
+  itens: T[];
+  proximoCursor: string | null;
+}
+
+export async function fetchPagina(url: string, cursor?: string | null, init?: RequestInit): Promise<Pagina> {
+  const separador = url.includes('?') ? '&' : '?';
+  const response = await fetch(`${url}${cursor ? `${separador}cursor=${encodeURIComponent(cursor)}` : ''}`, init);
+  const data = await response.json();
+  if (!response.ok || !Array.isArray(data)) {
+    throw new Error(data?.error || 'Erro ao carregar a lista');
+  }
+  return { itens: data, proximoCursor: response.headers.get('X-Proximo-Cursor') };
+}
+
+// Lista completa, página por página. Só para exportações e relatórios, que
+// precisam de todas as linhas; as telas de lista usam fetchPagina().
+export async function fetchTodasPaginas(url: string, init?: RequestInit) {
+  const itens: any[] = [];
+  const separador = url.includes('?') ? '&' : '?';
+  let cursor: string | null = null;
+
+  do {
+    const pagina = `${url}${separador}limite=1000${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`;
+    const response = await fetch(pagina, init);
+    const data = await response.json();
+    if (!response.ok || !Array.isArray(data)) {
+      return data;
+    }
+    itens.push(...data);
+    cursor = response.headers.get('X-Proximo-Cursor');
+  } while (cursor);
+
+  return itens;
+}
+
 export const capacitacaoAPI = {
   async getStats() {
     const response = await fetch(`${API_URL}/capacitacao/stats`);
     return response.json();
   },
 
-  async getAgendamentos() {
-    const response = await fetch(`${API_URL}/capacitacao/agendamentos`);
-    return response.json();
+  async getAgendamentos(cursor?: string | null) {
+    return fetchPagina(`${API_URL}/capacitacao/agendamentos`, cursor);
+  },
+
+  async getTodosAgendamentos() {
+    return fetchTodasPaginas(`${API_URL}/capacitacao/agendamentos`);
   },
 
   async createAgendamento(data: any) {
@@ -90,9 +132,12 @@ export const capacitacaoAPI = {
     return response.json();
   },
 
-  async getPacientes() {
-    const response = await fetch(`${API_URL}/capacitacao/pacientes`);
-    return response.json();
+  async getPacientes(cursor?: string | null) {
+    return fetchPagina(`${API_URL}/capacitacao/pacientes`, cursor);
+  },
+
+  async getTodosPacientes() {
+    return fetchTodasPaginas(`${API_URL}/capacitacao/pacientes`);
   },
 
   async createPaciente() {
@@ -127,8 +172,9 @@ export const capacitacaoAPI = {
     return response.json();
   },
 
-  async getEnfermeiraAluna(id: string) {
-    const response = await fetch(`${API_URL}/capacitacao/enfermeiras-alunas/${id}`);
+  async getEnfermeiraAluna(id: string, fields?: string[]) {
+    const query = fields ? `?fields=${fields.join(',')}` : '';
+    const response = await fetch(`${API_URL}/capacitacao/enfermeiras-alunas/${id}${query}`);
     if (!response.ok) {
       throw new Error('Erro ao buscar aluna');
     }
@@ -153,18 +199,22 @@ export const capacitacaoAPI = {
     return response.json();
   },
 
-  async uploadFicha(alunaId: string, fichaData: {
-    nome_arquivo: string;
-    pdf_content: string;
+  async uploadFicha(alunaId: string, arquivo: File, fichaData: {
     nome_paciente: string;
     cpf_paciente: string;
     data_nascimento_paciente: string;
     municipio_paciente: string;
+    metodo_inserido: string;
   }) {
+    // Envio em multipart: o PDF segue como arquivo, sem conversão para base64
+    const formData = new FormData();
+    Object.entries(fichaData).forEach(([campo, valor]) => formData.append(campo, valor));
+    formData.append('nome_arquivo', arquivo.name);
+    formData.append('pdf_content', arquivo);
+
     const response = await fetch(`${API_URL}/capacitacao/enfermeiras-alunas/${alunaId}/fichas`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(fichaData),
+      body: formData,
     });
     if (!response.ok) {
       const error = await response.json();
@@ -181,6 +231,10 @@ export const capacitacaoAPI = {
     return response.json();
   },
 
+  getFichaDownloadUrl(alunaId: string, fichaId: string) {
+    return `${API_URL}/capacitacao/enfermeiras-alunas/${alunaId}/fichas/${fichaId}/download`;
+  },
+
   async deleteFicha(alunaId: string, fichaId: string) {
     const response = await fetch(`${API_URL}/capacitacao/enfermeiras-alunas/${alunaId}/fichas/${fichaId}`, {
       method: 'DELETE',
@@ -194,9 +248,16 @@ export const capacitacaoAPI = {
 };
 
 export const ambulatorialAPI = {
-  async getPacientesFiltrados(filtro: string = 'todos') {
-    const response = await fetch(`${API_URL}/ambulatorial/pacientes/filtrados?filtro=${filtro}`);
-    return response.json();
+  async getPacientesFiltrados(filtro: string = 'todos', cursor?: string | null) {
+    return fetchPagina(`${API_URL}/ambulatorial/pacientes/filtrados?filtro=${filtro}`, cursor);
+  },
+
+  async getTodosPacientesFiltrados(filtro: string = 'todos') {
+    return fetchTodasPaginas(`${API_URL}/ambulatorial/pacientes/filtrados?filtro=${filtro}`);
+  },
+
+  async getPacientes(cursor?: string | null) {
+    return fetchPagina(`${API_URL}/ambulatorial/pacientes`, cursor);
   },
 
   async getPaciente(id: string) {
@@ -307,28 +368,36 @@ export const ambulatorialAPI = {
   },
 };
 
+interface FiltrosSolicitacoes {
+  dataInicio?: string;
+  dataFim?: string;
+  municipio?: string;
+  tipoInsumo?: string;
+  status?: string;
+}
+
+function parametrosSolicitacoes(filtros?: FiltrosSolicitacoes) {
+  const params = new URLSearchParams();
+  if (filtros?.dataInicio) params.append('dataInicio', filtros.dataInicio);
+  if (filtros?.dataFim) params.append('dataFim', filtros.dataFim);
+  if (filtros?.municipio) params.append('municipio', filtros.municipio);
+  if (filtros?.tipoInsumo) params.append('tipoInsumo', filtros.tipoInsumo);
+  if (filtros?.status) params.append('status', filtros.status);
+  return params.toString();
+}
+
 export const distribuicaoAPI = {
   async getMunicipios() {
     const response = await fetch(`${API_URL}/distribuicao/municipios`);
     return response.json();
   },
 
-  async getSolicitacoes(filtros?: {
-    dataInicio?: string;
-    dataFim?: string;
-    municipio?: string;
-    tipoInsumo?: string;
-    status?: string;
-  }) {
-    const params = new URLSearchParams();
-    if (filtros?.dataInicio) params.append('dataInicio', filtros.dataInicio);
-    if (filtros?.dataFim) params.append('dataFim', filtros.dataFim);
-    if (filtros?.municipio) params.append('municipio', filtros.municipio);
-    if (filtros?.tipoInsumo) params.append('tipoInsumo', filtros.tipoInsumo);
-    if (filtros?.status) params.append('status', filtros.status);
+  async getSolicitacoes(filtros?: FiltrosSolicitacoes, cursor?: string | null) {
+    return fetchPagina(`${API_URL}/distribuicao/solicitacoes?${parametrosSolicitacoes(filtros)}`, cursor);
+  },
 
-    const response = await fetch(`${API_URL}/distribuicao/solicitacoes?${params.toString()}`);
-    return response.json();
+  async getTodasSolicitacoes(filtros?: FiltrosSolicitacoes) {
+    return fetchTodasPaginas(`${API_URL}/distribuicao/solicitacoes?${parametrosSolicitacoes(filtros)}`);
   },
 
   async createSolicitacao(data: any) {
@@ -370,6 +439,38 @@ export const distribuicaoAPI = {
     return response.json();
   },
 
+  async getEstoque(municipio?: string, tipoInsumo?: string) {
+    const params = new URLSearchParams();
+    if (tipoInsumo) params.append('tipoInsumo', tipoInsumo);
+    const caminho = municipio ? `estoque/${encodeURIComponent(municipio)}` : 'estoque';
+    const response = await fetch(`${API_URL}/distribuicao/${caminho}?${params.toString()}`);
+    if (!response.ok) {
+      throw new Error('Erro ao buscar estoque');
+    }
+    return response.json();
+  },
+
+  async getMovimentacoes(filtros?: { municipio?: string; tipoInsumo?: string }, cursor?: string | null) {
+    const params = new URLSearchParams();
+    if (filtros?.municipio) params.append('municipio', filtros.municipio);
+    if (filtros?.tipoInsumo) params.append('tipoInsumo', filtros.tipoInsumo);
+
+    return fetchPagina(`${API_URL}/distribuicao/movimentacoes?${params.toString()}`, cursor);
+  },
+
+  async createMovimentacao(data: any) {
+    const response = await fetch(`${API_URL}/distribuicao/movimentacoes`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(data),
+    });
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.error || 'Erro ao registrar movimentação');
+    }
+    return response.json();
+  },
+
   async getResponsaveis() {
     const response = await fetch(`${API_URL}/distribuicao/responsaveis`);
     return response.json();
@@ -438,9 +539,11 @@ function getHeaders() {
   if (usuario) {
     try {
       const user = JSON.parse(usuario);
-      headers['X-User-Id'] = user.id.toString();
+      if (user.token) {
+        headers['Authorization'] = `Bearer ${user.token}`;
+      }
     } catch (error) {
-      console.error('Erro ao obter ID do usuário:', error);
+      console.error('Erro ao obter token do usuário:', error);
     }
   }
 
@@ -4,10 +4,13 @@ import { Eye, Edit, Search, UserPlus, FileDown, FileSpreadsheet, FileText } from
 import { ambulatorialAPI } from '../../lib/api';
 import { exportarCSV, exportarPDF } from '../../utils/exportUtils';
 import Pagination from '../../components/Pagination';
+import CarregarMais from '../../components/CarregarMais';
 
 export default function ListaPacientes() {
   const navigate = useNavigate();
   const [pacientes, setPacientes] = useState<any[]>([]);
+  const [proximoCursor, setProximoCursor] = useState<string | null>(null);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [filtro, setFiltro] = useState('todos');
   const [loading, setLoading] = useState(true);
   const [busca, setBusca] = useState('');
@@ -21,8 +24,9 @@ export default function ListaPacientes() {
   const carregarPacientes = async () => {
     setLoading(true);
     try {
-      const data = await ambulatorialAPI.getPacientesFiltrados(filtro);
-      setPacientes(data);
+      const pagina = await ambulatorialAPI.getPacientesFiltrados(filtro);
+      setPacientes(pagina.itens);
+      setProximoCursor(pagina.proximoCursor);
     } catch (error) {
       console.error('Erro ao carregar pacientes:', error);
     } finally {
@@ -30,7 +34,20 @@ export default function ListaPacientes() {
     }
   };
 
-  const pacientesFiltrados = pacientes.filter(p => {
+  const carregarMais = async () => {
+    setCarregandoMais(true);
+    try {
+      const pagina = await ambulatorialAPI.getPacientesFiltrados(filtro, proximoCursor);
+      setPacientes((anteriores) => [...anteriores, ...pagina.itens]);
+      setProximoCursor(pagina.proximoCursor);
+    } catch (error) {
+      console.error('Erro ao carregar pacientes:', error);
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
+  const correspondeABusca = (p: any) => {
     if (!busca) return true;
     const termo = busca.toLowerCase();
     return (
@@ -38,7 +55,9 @@ export default function ListaPacientes() {
       p.cpf?.includes(busca) ||
       p.cartao_sus?.includes(busca)
     );
-  });
+  };
+
+  const pacientesFiltrados = pacientes.filter(correspondeABusca);
 
   const totalPages = Math.ceil(pacientesFiltrados.length / itemsPerPage);
   const startIndex = (currentPage - 1) * itemsPerPage;
@@ -59,12 +78,18 @@ export default function ListaPacientes() {
     setCurrentPage(1);
   };
 
-  const handleExportarCSV = () => {
-    exportarCSV(pacientesFiltrados, 'pacientes_ambulatorial.csv');
+  // A exportação leva todas as pacientes do filtro, não só as páginas carregadas
+  const pacientesParaExportar = async () => {
+    const todos = await ambulatorialAPI.getTodosPacientesFiltrados(filtro);
+    return (todos || []).filter(correspondeABusca);
   };
 
-  const handleExportarPDF = () => {
-    exportarPDF(pacientesFiltrados, 'pacientes_ambulatorial.pdf');
+  const handleExportarCSV = async () => {
+    exportarCSV(await pacientesParaExportar(), 'pacientes_ambulatorial.csv');
+  };
+
+  const handleExportarPDF = async () => {
+    exportarPDF(await pacientesParaExportar(), 'pacientes_ambulatorial.pdf');
   };
 
   if (loading) {
@@ -208,10 +233,12 @@ export default function ListaPacientes() {
             />
           </div>
         )}
+
+        <CarregarMais temMais={!!proximoCursor} carregando={carregandoMais} onCarregarMais={carregarMais} />
       </div>
 
       <div className="text-sm text-gray-600">
-        Total: {pacientesFiltrados.length} {pacientesFiltrados.length === 1 ? 'paciente' : 'pacientes'}
+        Total: {pacientesFiltrados.length}{proximoCursor ? '+' : ''} {pacientesFiltrados.length === 1 ? 'paciente' : 'pacientes'}
       </div>
     </div>
   );
@@ -1,6 +1,8 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Search, Eye } from 'lucide-react';
+import { ambulatorialAPI } from '../../lib/api';
+import CarregarMais from '../../components/CarregarMais';
 
 interface Paciente {
   id: number;
@@ -16,6 +18,8 @@ export default function RetornoPaciente() {
   const navigate = useNavigate();
   const [pacientes, setPacientes] = useState<Paciente[]>([]);
   const [filteredPacientes, setFilteredPacientes] = useState<Paciente[]>([]);
+  const [proximoCursor, setProximoCursor] = useState<string | null>(null);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [loading, setLoading] = useState(true);
 
@@ -39,10 +43,10 @@ export default function RetornoPaciente() {
 
   const loadPacientes = async () => {
     try {
-      const response = await fetch('/api/ambulatorial/pacientes');
-      const data = await response.json();
-      setPacientes(data || []);
-      setFilteredPacientes(data || []);
+      const pagina = await ambulatorialAPI.getPacientes();
+      setPacientes(pagina.itens);
+      setFilteredPacientes(pagina.itens);
+      setProximoCursor(pagina.proximoCursor);
     } catch (error) {
       console.error('Erro ao carregar pacientes:', error);
     } finally {
@@ -50,6 +54,19 @@ export default function RetornoPaciente() {
     }
   };
 
+  const carregarMais = async () => {
+    setCarregandoMais(true);
+    try {
+      const pagina = await ambulatorialAPI.getPacientes(proximoCursor);
+      setPacientes((anteriores) => [...anteriores, ...pagina.itens]);
+      setProximoCursor(pagina.proximoCursor);
+    } catch (error) {
+      console.error('Erro ao carregar pacientes:', error);
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
   const handleViewPaciente = (pacienteId: number) => {
     navigate(`/ambulatorial/pacientes/${pacienteId}/consultas`);
   };
@@ -120,6 +137,10 @@ export default function RetornoPaciente() {
             </table>
           </div>
         )}
+
+        {!loading && (
+          <CarregarMais temMais={!!proximoCursor} carregando={carregandoMais} onCarregarMais={carregarMais} />
+        )}
       </div>
     </div>
   );
@@ -4,6 +4,7 @@ import { Plus, Calendar, CheckCircle, XCircle, Clock, FileDown, FileSpreadsheet
 import { capacitacaoAPI } from '../../lib/api';
 import { exportarAgendamentosCSV, exportarAgendamentosPDF } from '../../utils/exportUtils';
 import Pagination from '../../components/Pagination';
+import CarregarMais from '../../components/CarregarMais';
 
 interface Agendamento {
   id: number;
@@ -18,6 +19,8 @@ interface Agendamento {
 export default function ListaAgendamentos() {
   const navigate = useNavigate();
   const [agendamentos, setAgendamentos] = useState<Agendamento[]>([]);
+  const [proximoCursor, setProximoCursor] = useState<string | null>(null);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [loading, setLoading] = useState(true);
   const [filtroMunicipio, setFiltroMunicipio] = useState('');
   const [currentPage, setCurrentPage] = useState(1);
@@ -29,8 +32,9 @@ export default function ListaAgendamentos() {
 
   const loadAgendamentos = async () => {
     try {
-      const data = await capacitacaoAPI.getAgendamentos();
-      setAgendamentos(data || []);
+      const pagina = await capacitacaoAPI.getAgendamentos();
+      setAgendamentos(pagina.itens);
+      setProximoCursor(pagina.proximoCursor);
     } catch (error) {
       console.error('Erro ao carregar agendamentos:', error);
     } finally {
@@ -38,6 +42,19 @@ export default function ListaAgendamentos() {
     }
   };
 
+  const carregarMais = async () => {
+    setCarregandoMais(true);
+    try {
+      const pagina = await capacitacaoAPI.getAgendamentos(proximoCursor);
+      setAgendamentos((anteriores) => [...anteriores, ...pagina.itens]);
+      setProximoCursor(pagina.proximoCursor);
+    } catch (error) {
+      console.error('Erro ao carregar agendamentos:', error);
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
   const getStatusIcon = (status: string) => {
     switch (status) {
       case 'confirmado':
@@ -63,9 +80,10 @@ export default function ListaAgendamentos() {
     }
   };
 
-  const agendamentosFiltrados = agendamentos.filter((agendamento) =>
-    agendamento.municipio.toLowerCase().includes(filtroMunicipio.toLowerCase())
-  );
+  const correspondeAoFiltro = (agendamento: Agendamento) =>
+    agendamento.municipio.toLowerCase().includes(filtroMunicipio.toLowerCase());
+
+  const agendamentosFiltrados = agendamentos.filter(correspondeAoFiltro);
 
   const totalPages = Math.ceil(agendamentosFiltrados.length / itemsPerPage);
   const startIndex = (currentPage - 1) * itemsPerPage;
@@ -81,12 +99,18 @@ export default function ListaAgendamentos() {
     setCurrentPage(1);
   };
 
-  const handleExportarCSV = () => {
-    exportarAgendamentosCSV(agendamentosFiltrados, 'agendamentos_municipios.csv');
+  // A exportação leva todos os agendamentos do filtro, não só as páginas carregadas
+  const agendamentosParaExportar = async () => {
+    const todos: Agendamento[] = await capacitacaoAPI.getTodosAgendamentos();
+    return (todos || []).filter(correspondeAoFiltro);
+  };
+
+  const handleExportarCSV = async () => {
+    exportarAgendamentosCSV(await agendamentosParaExportar(), 'agendamentos_municipios.csv');
   };
 
-  const handleExportarPDF = () => {
-    exportarAgendamentosPDF(agendamentosFiltrados, 'agendamentos_municipios.pdf');
+  const handleExportarPDF = async () => {
+    exportarAgendamentosPDF(await agendamentosParaExportar(), 'agendamentos_municipios.pdf');
   };
 
   return (
@@ -199,6 +223,10 @@ export default function ListaAgendamentos() {
           />
         </div>
       )}
+
+      {!loading && (
+        <CarregarMais temMais={!!proximoCursor} carregando={carregandoMais} onCarregarMais={carregarMais} />
+      )}
     </div>
   );
 }
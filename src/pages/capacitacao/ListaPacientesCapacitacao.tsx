@@ -3,6 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import { Plus, Users, Eye, FileEdit, FileDown, FileSpreadsheet } from 'lucide-react';
 import { capacitacaoAPI } from '../../lib/api';
 import Pagination from '../../components/Pagination';
+import CarregarMais from '../../components/CarregarMais';
 import { exportarPacientesCapacitacaoCSV, exportarPacientesCapacitacaoPDF } from '../../utils/exportUtils';
 
 interface Paciente {
@@ -18,6 +19,8 @@ interface Paciente {
 export default function ListaPacientesCapacitacao() {
   const navigate = useNavigate();
   const [pacientes, setPacientes] = useState<Paciente[]>([]);
+  const [proximoCursor, setProximoCursor] = useState<string | null>(null);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [loading, setLoading] = useState(true);
   const [filtroNome, setFiltroNome] = useState('');
   const [currentPage, setCurrentPage] = useState(1);
@@ -29,8 +32,9 @@ export default function ListaPacientesCapacitacao() {
 
   const loadPacientes = async () => {
     try {
-      const data = await capacitacaoAPI.getPacientes();
-      setPacientes(data || []);
+      const pagina = await capacitacaoAPI.getPacientes();
+      setPacientes(pagina.itens);
+      setProximoCursor(pagina.proximoCursor);
     } catch (error) {
       console.error('Erro ao carregar pacientes:', error);
     } finally {
@@ -38,6 +42,19 @@ export default function ListaPacientesCapacitacao() {
     }
   };
 
+  const carregarMais = async () => {
+    setCarregandoMais(true);
+    try {
+      const pagina = await capacitacaoAPI.getPacientes(proximoCursor);
+      setPacientes((anteriores) => [...anteriores, ...pagina.itens]);
+      setProximoCursor(pagina.proximoCursor);
+    } catch (error) {
+      console.error('Erro ao carregar pacientes:', error);
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
   const handleNovoPaciente = async () => {
     try {
       const data = await capacitacaoAPI.createPaciente();
@@ -48,9 +65,10 @@ export default function ListaPacientesCapacitacao() {
     }
   };
 
-  const pacientesFiltrados = pacientes.filter((paciente) =>
-    paciente.nome_completo?.toLowerCase().includes(filtroNome.toLowerCase())
-  );
+  const correspondeAoFiltro = (paciente: Paciente) =>
+    paciente.nome_completo?.toLowerCase().includes(filtroNome.toLowerCase());
+
+  const pacientesFiltrados = pacientes.filter(correspondeAoFiltro);
 
   const totalPages = Math.ceil(pacientesFiltrados.length / itemsPerPage);
   const startIndex = (currentPage - 1) * itemsPerPage;
@@ -66,6 +84,20 @@ export default function ListaPacientesCapacitacao() {
     setCurrentPage(1);
   };
 
+  // A exportação leva todos os pacientes do filtro, não só as páginas carregadas
+  const pacientesParaExportar = async () => {
+    const todos: Paciente[] = await capacitacaoAPI.getTodosPacientes();
+    return (todos || []).filter(correspondeAoFiltro);
+  };
+
+  const handleExportarPDF = async () => {
+    exportarPacientesCapacitacaoPDF(await pacientesParaExportar());
+  };
+
+  const handleExportarCSV = async () => {
+    exportarPacientesCapacitacaoCSV(await pacientesParaExportar());
+  };
+
   return (
     <div className="p-8">
       <div className="flex items-center justify-between mb-8">
@@ -92,14 +124,14 @@ export default function ListaPacientesCapacitacao() {
 
         <div className="flex flex-wrap gap-3 pt-6 border-t border-gray-200">
           <button
-            onClick={() => exportarPacientesCapacitacaoPDF(pacientesFiltrados)}
+            onClick={handleExportarPDF}
             className="flex items-center gap-2 bg-red-600 hover:bg-red-700 text-white px-4 py-2 rounded-lg font-semibold transition-colors"
           >
             <FileDown size={18} />
             PDF
           </button>
           <button
-            onClick={() => exportarPacientesCapacitacaoCSV(pacientesFiltrados)}
+            onClick={handleExportarCSV}
             className="flex items-center gap-2 bg-green-600 hover:bg-green-700 text-white px-4 py-2 rounded-lg font-semibold transition-colors"
           >
             <FileSpreadsheet size={18} />
@@ -186,6 +218,10 @@ export default function ListaPacientesCapacitacao() {
           />
         </div>
       )}
+
+      {!loading && (
+        <CarregarMais temMais={!!proximoCursor} carregando={carregandoMais} onCarregarMais={carregarMais} />
+      )}
     </div>
   );
 }
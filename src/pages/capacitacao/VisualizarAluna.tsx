@@ -17,7 +17,6 @@ interface Aluna {
   progresso: number;
   status: string;
   certificado_filename?: string;
-  certificado_content?: string;
 }
 
 interface Ficha {
@@ -104,24 +103,7 @@ export default function VisualizarAluna() {
 
     setUploading(true);
     try {
-      const reader = new FileReader();
-      await new Promise((resolve, reject) => {
-        reader.onload = async () => {
-          try {
-            const base64 = (reader.result as string).split(',')[1];
-            await capacitacaoAPI.uploadFicha(id!, {
-              nome_arquivo: selectedFile.name,
-              pdf_content: base64,
-              ...pacienteData
-            });
-            resolve(true);
-          } catch (error) {
-            reject(error);
-          }
-        };
-        reader.onerror = reject;
-        reader.readAsDataURL(selectedFile);
-      });
+      await capacitacaoAPI.uploadFicha(id!, selectedFile, pacienteData);
 
       await loadData();
       setShowModal(false);
@@ -158,20 +140,10 @@ export default function VisualizarAluna() {
 
   const handleDownload = async (fichaId: number, nomeArquivo: string) => {
     try {
-      const ficha = await capacitacaoAPI.getFicha(id!, fichaId.toString());
-      const byteCharacters = atob(ficha.pdf_content);
-      const byteNumbers = new Array(byteCharacters.length);
-      for (let i = 0; i < byteCharacters.length; i++) {
-        byteNumbers[i] = byteCharacters.charCodeAt(i);
-      }
-      const byteArray = new Uint8Array(byteNumbers);
-      const blob = new Blob([byteArray], { type: 'application/pdf' });
-      const url = URL.createObjectURL(blob);
       const link = document.createElement('a');
-      link.href = url;
+      link.href = capacitacaoAPI.getFichaDownloadUrl(id!, fichaId.toString());
       link.download = nomeArquivo;
       link.click();
-      URL.revokeObjectURL(url);
     } catch (error) {
       console.error('Erro ao baixar ficha:', error);
       alert('Erro ao baixar ficha.');
@@ -199,11 +171,17 @@ export default function VisualizarAluna() {
     );
   }
 
-  const handleDownloadCertificado = () => {
-    if (!aluna?.certificado_content) return;
+  const handleDownloadCertificado = async () => {
+    if (!aluna?.certificado_filename) return;
 
     try {
-      const byteCharacters = atob(aluna.certificado_content);
+      // O conteúdo do arquivo só vem quando pedido em ?fields=
+      const certificado = await capacitacaoAPI.getEnfermeiraAluna(id!, ['certificado_filename', 'certificado_content']);
+      if (!certificado.certificado_content) {
+        alert('Certificado não encontrado.');
+        return;
+      }
+      const byteCharacters = atob(certificado.certificado_content);
       const byteNumbers = new Array(byteCharacters.length);
       for (let i = 0; i < byteCharacters.length; i++) {
         byteNumbers[i] = byteCharacters.charCodeAt(i);
@@ -213,7 +191,7 @@ export default function VisualizarAluna() {
       const url = URL.createObjectURL(blob);
       const link = document.createElement('a');
       link.href = url;
-      link.download = aluna.certificado_filename || 'certificado.pdf';
+      link.download = certificado.certificado_filename || 'certificado.pdf';
       link.click();
       URL.revokeObjectURL(url);
     } catch (error) {
@@ -108,7 +108,7 @@ export default function DistribuicaoDashboard() {
   const aplicarFiltros = async () => {
     setLoading(true);
     try {
-      const data = await distribuicaoAPI.getSolicitacoes({
+      const data = await distribuicaoAPI.getTodasSolicitacoes({
         dataInicio: filtros.dataInicio || undefined,
         dataFim: filtros.dataFim || undefined,
         municipio: filtros.municipio || undefined,
@@ -38,7 +38,7 @@ export default function DistribuicaoMunicipios() {
     try {
       const [municipiosData, solicitacoesData] = await Promise.all([
         distribuicaoAPI.getMunicipios(),
-        distribuicaoAPI.getSolicitacoes(),
+        distribuicaoAPI.getTodasSolicitacoes(),
       ]);
 
       setMunicipios(municipiosData || []);
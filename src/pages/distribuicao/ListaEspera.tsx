@@ -4,6 +4,7 @@ import { CheckCircle, XCircle, ArrowLeft, FileDown, FileSpreadsheet } from 'luci
 import { distribuicaoAPI } from '../../lib/api';
 import { exportarSolicitacoesCSV, exportarSolicitacoesPDF } from '../../utils/exportUtils';
 import Pagination from '../../components/Pagination';
+import CarregarMais from '../../components/CarregarMais';
 
 interface Solicitacao {
   id: number;
@@ -23,6 +24,8 @@ interface Solicitacao {
 export default function ListaEspera() {
   const navigate = useNavigate();
   const [solicitacoes, setSolicitacoes] = useState<Solicitacao[]>([]);
+  const [proximoCursor, setProximoCursor] = useState<string | null>(null);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [loading, setLoading] = useState(true);
   const [showModal, setShowModal] = useState(false);
   const [selectedSolicitacao, setSelectedSolicitacao] = useState<number | null>(null);
@@ -39,8 +42,9 @@ export default function ListaEspera() {
 
   const loadSolicitacoes = async () => {
     try {
-      const data = await distribuicaoAPI.getSolicitacoes();
-      setSolicitacoes(data || []);
+      const pagina = await distribuicaoAPI.getSolicitacoes();
+      setSolicitacoes(pagina.itens);
+      setProximoCursor(pagina.proximoCursor);
     } catch (error) {
       console.error('Erro ao carregar solicitações:', error);
     } finally {
@@ -48,6 +52,28 @@ export default function ListaEspera() {
     }
   };
 
+  const carregarMais = async () => {
+    setCarregandoMais(true);
+    try {
+      const pagina = await distribuicaoAPI.getSolicitacoes(undefined, proximoCursor);
+      setSolicitacoes((anteriores) => [...anteriores, ...pagina.itens]);
+      setProximoCursor(pagina.proximoCursor);
+    } catch (error) {
+      console.error('Erro ao carregar solicitações:', error);
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
+  // A exportação leva todas as solicitações, não só as páginas carregadas
+  const handleExportarPDF = async () => {
+    exportarSolicitacoesPDF(await distribuicaoAPI.getTodasSolicitacoes());
+  };
+
+  const handleExportarCSV = async () => {
+    exportarSolicitacoesCSV(await distribuicaoAPI.getTodasSolicitacoes());
+  };
+
   const handleAutorizarClick = (solicitacao: Solicitacao) => {
     setSelectedSolicitacao(solicitacao.id);
     setQuantidadeAutorizada(solicitacao.quantidade_solicitada.toString());
@@ -167,14 +193,14 @@ export default function ListaEspera() {
 
           <div className="flex gap-3">
             <button
-              onClick={() => exportarSolicitacoesPDF(solicitacoes)}
+              onClick={handleExportarPDF}
               className="flex items-center gap-2 bg-red-600 hover:bg-red-700 text-white px-4 py-2 rounded-lg font-semibold transition-colors"
             >
               <FileDown size={18} />
               PDF
             </button>
             <button
-              onClick={() => exportarSolicitacoesCSV(solicitacoes)}
+              onClick={handleExportarCSV}
               className="flex items-center gap-2 bg-green-600 hover:bg-green-700 text-white px-4 py-2 rounded-lg font-semibold transition-colors"
             >
               <FileSpreadsheet size={18} />
@@ -281,6 +307,8 @@ export default function ListaEspera() {
               totalPages={totalPages}
               onPageChange={handlePageChange}
             />
+
+            <CarregarMais temMais={!!proximoCursor} carregando={carregandoMais} onCarregarMais={carregarMais} />
           </div>
         )}
       </div>
@@ -27,6 +27,7 @@ interface PaginationData {
   page: number;
   per_page: number;
   total_pages: number;
+  proximo_cursor: string | null;
   categorias: string[];
 }
 
@@ -41,6 +42,9 @@ export default function ListaProfissionais() {
   const [categoriaSelecionada, setCategoriaSelecionada] = useState('Todos');
   const [currentPage, setCurrentPage] = useState(1);
   const [totalPages, setTotalPages] = useState(1);
+  // Cursor de cada página já alcançada pela página anterior: a navegação
+  // sequencial usa o cursor e só o salto direto cai na página numerada
+  const [cursores, setCursores] = useState<Record<number, string>>({});
   const [total, setTotal] = useState(0);
   const [profissionalSelecionado, setProfissionalSelecionado] = useState<Profissional | null>(null);
   const [showDetalhesModal, setShowDetalhesModal] = useState(false);
@@ -65,11 +69,15 @@ export default function ListaProfissionais() {
           page: currentPage,
           per_page: 10,
           busca: busca,
-          categoria: categoriaSelecionada
+          categoria: categoriaSelecionada,
+          cursor: cursores[currentPage]
         }
       });
 
       setProfissionais(data.profissionais);
+      if (data.proximo_cursor) {
+        setCursores((anteriores) => ({ ...anteriores, [currentPage + 1]: data.proximo_cursor as string }));
+      }
       setTotalPages(data.total_pages);
       setTotal(data.total);
       if (data.categorias && data.categorias.length > 0) {
@@ -93,11 +101,13 @@ export default function ListaProfissionais() {
 
   const handleBuscaChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     setBusca(e.target.value);
+    setCursores({});
     setCurrentPage(1);
   };
 
   const handleCategoriaChange = (e: React.ChangeEvent<HTMLSelectElement>) => {
     setCategoriaSelecionada(e.target.value);
+    setCursores({});
     setCurrentPage(1);
   };
 
@@ -18,9 +18,11 @@ function getHeaders(): HeadersInit {
   if (usuario) {
     try {
       const user = JSON.parse(usuario);
-      headers['X-User-Id'] = user.id.toString();
+      if (user.token) {
+        headers['Authorization'] = `Bearer ${user.token}`;
+      }
     } catch (error) {
-      console.error('Erro ao obter ID do usuário:', error);
+      console.error('Erro ao obter token do usuário:', error);
     }
   }
 